@@ -1,4 +1,4 @@
-# Copyright 2012-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2012-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """MAAS Server application."""
@@ -7,6 +7,7 @@ __all__ = [
     'DefaultMeta',
     'DefaultViewMeta',
     'is_master_process',
+    'is_worker_process',
     'logger',
 ]
 
@@ -53,6 +54,16 @@ def is_master_process():
         return int(worker_id) == 1
 
 
+def is_worker_process():
+    """Return True if this is one of the region controller's regiond workers.
+
+    Each worker -- the master included -- is started by systemd with its own
+    `MAAS_REGIOND_WORKER_ID`. A regiond started by hand, as in development,
+    has no worker ID and so stands alone.
+    """
+    return environ.get("MAAS_REGIOND_WORKER_ID") is not None
+
+
 def execute_from_command_line():
     # Limit concurrency in all thread-pools to ONE.
     from maasserver.utils import threads
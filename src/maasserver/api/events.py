@@ -1,14 +1,17 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 __all__ = [
     "EventsHandler",
 ]
 
+import http.client
 import urllib.error
 import urllib.parse
 import urllib.request
 
+from django.db.models import Max
+from django.http import HttpResponse
 from formencode.validators import Int
 from maasserver.api.nodes import filtered_nodes_list_from_request
 from maasserver.api.support import (
@@ -16,6 +19,7 @@ from maasserver.api.support import (
     OperationsHandler,
 )
 from maasserver.api.utils import (
+    get_mandatory_param,
     get_optional_param,
     get_overridden_query_dict,
 )
@@ -23,11 +27,19 @@ from maasserver.enum import NODE_TYPE
 from maasserver.exceptions import MAASAPIBadRequest
 from maasserver.models import Event
 from maasserver.models.eventtype import LOGGING_LEVELS_BY_NAME
+from maasserver.regiondservices.event_watcher import (
+    get_event_watcher,
+    TooManyWaiters,
+)
 from maasserver.utils.django_urls import reverse
 
 
 MAX_EVENT_LOG_COUNT = 1000
 DEFAULT_EVENT_LOG_LIMIT = 100
+MAX_EVENT_WATCH_TIMEOUT = 120
+DEFAULT_EVENT_WATCH_TIMEOUT = 30
+# 'Retry-After' header sent when too many clients are already watching.
+RETRY_AFTER_EVENT_WATCH = 10
 
 
 def event_to_dict(event):
@@ -43,6 +55,14 @@ def event_to_dict(event):
     )
 
 
+def make_events_uri(params):
+    """Return a URI for the events handler with the given query `params`."""
+    base = reverse('events_handler')
+    query = urllib.parse.urlencode(params, doseq=True)
+    url = urllib.parse.urlparse(base)._replace(query=query)
+    return url.geturl()
+
+
 class EventsHandler(OperationsHandler):
     """Retrieve filtered node events.
 
@@ -166,27 +186,21 @@ class EventsHandler(OperationsHandler):
         # into a list now so that len() is cheap.
         node_events = list(node_events)
 
-        # Helper for building prev_uri and next_uri.
-        def make_uri(params, base=reverse('events_handler')):
-            query = urllib.parse.urlencode(params, doseq=True)
-            url = urllib.parse.urlparse(base)._replace(query=query)
-            return url.geturl()
-
         # Figure out a URI to obtain a set of newer events.
         next_uri_params = get_overridden_query_dict(
             request.GET, {"before": []}, self.all_params)
         if len(node_events) == 0:
             if before is None:
                 # There are no newer events NOW, but there may be later.
-                next_uri = make_uri(next_uri_params)
+                next_uri = make_events_uri(next_uri_params)
             else:
                 # Without limiting to `before`, we might find some more events.
                 next_uri_params["after"] = before - 1
-                next_uri = make_uri(next_uri_params)
+                next_uri = make_events_uri(next_uri_params)
         else:
             # The first event is the newest.
             next_uri_params["after"] = str(node_events[0].id)
-            next_uri = make_uri(next_uri_params)
+            next_uri = make_events_uri(next_uri_params)
 
         # Figure out a URI to obtain a set of older events.
         prev_uri_params = get_overridden_query_dict(
@@ -198,11 +212,11 @@ class EventsHandler(OperationsHandler):
             else:
                 # Without limiting to `after`, we might find some more events.
                 prev_uri_params["before"] = after + 1
-                prev_uri = make_uri(prev_uri_params)
+                prev_uri = make_events_uri(prev_uri_params)
         else:
             # The last event is the oldest.
             prev_uri_params["before"] = str(node_events[-1].id)
-            prev_uri = make_uri(prev_uri_params)
+            prev_uri = make_events_uri(prev_uri_params)
 
         return {
             "count": len(node_events),
@@ -212,3 +226,74 @@ class EventsHandler(OperationsHandler):
         }
 
     query.__doc__ %= {"log_levels": ", ".join(sorted(LOGGING_LEVELS_BY_NAME))}
+
+    @operation(idempotent=True)
+    def watch(self, request):
+        """Wait for new Node events, optionally filtered by various criteria
+        via URL query parameters.
+
+        This is a long-polling version of `query`. When there are matching
+        events newer than `after` they are returned straight away. Otherwise
+        the request waits, without querying the database, until the region
+        is told about a new event or until `timeout` expires. In both cases
+        the response has no events; follow `next_uri` to fetch the new
+        events, or to wait for more.
+
+        Only a few requests can wait at once. When that many are already
+        waiting the response is 503 (Service Unavailable), with a
+        Retry-After header.
+
+        Accepts the same filtering parameters as `query`, except `before`.
+
+        :param after: Event id. Only events newer than this are returned.
+        :param timeout: Optional number of seconds to wait for new events.
+            Default %(default_timeout)d. Maximum: %(max_timeout)d.
+        """
+        after = get_mandatory_param(request.GET, 'after', Int)
+        timeout = get_optional_param(
+            request.GET, 'timeout', DEFAULT_EVENT_WATCH_TIMEOUT, Int)
+        if 'before' in request.GET:
+            raise MAASAPIBadRequest(
+                "`before` cannot be specified when watching for events.")
+        if timeout > MAX_EVENT_WATCH_TIMEOUT:
+            raise MAASAPIBadRequest((
+                "Requested timeout %d is greater than"
+                " limit: %d") % (timeout, MAX_EVENT_WATCH_TIMEOUT))
+
+        # The newest event of any kind visible to this transaction. Events
+        # created after this cannot be seen until the client comes back in
+        # a new request.
+        newest = Event.objects.aggregate(Max('id'))['id__max']
+        newest = after if newest is None else max(after, newest)
+
+        result = self.query(request)
+        if result["count"] != 0:
+            return result
+
+        # Nothing matches up to `newest`, so the client can skip ahead to
+        # there, saving a rescan of events that have already been checked.
+        next_uri_params = get_overridden_query_dict(
+            request.GET, {"before": [], "after": str(newest)},
+            self.all_params)
+        if 'timeout' in request.GET:
+            next_uri_params["timeout"] = request.GET["timeout"]
+        result["next_uri"] = make_events_uri(next_uri_params)
+
+        watcher = get_event_watcher()
+        if watcher is not None and timeout > 0:
+            try:
+                watcher.wait_for_event_after(newest, timeout)
+            except TooManyWaiters as error:
+                encoding = 'utf-8'
+                response = HttpResponse(
+                    status=int(http.client.SERVICE_UNAVAILABLE),
+                    content=str(error).encode(encoding),
+                    content_type="text/plain; charset=%s" % encoding)
+                response['Retry-After'] = RETRY_AFTER_EVENT_WATCH
+                return response
+        return result
+
+    watch.__doc__ %= {
+        "default_timeout": DEFAULT_EVENT_WATCH_TIMEOUT,
+        "max_timeout": MAX_EVENT_WATCH_TIMEOUT,
+    }
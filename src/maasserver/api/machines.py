@@ -45,6 +45,7 @@ from maasserver.api.utils import (
     get_optional_list,
     get_optional_param,
 )
+from maasserver.clusterrpc.power import batched_power_changes
 from maasserver.enum import (
     BMC_TYPE,
     NODE_PERMISSION,
@@ -1192,17 +1193,18 @@ class MachinesHandler(NodesHandler, PowersMixin):
 
         released_ids = []
         failed = []
-        for machine in machines:
-            if machine.status == NODE_STATUS.READY:
-                # Nothing to do.
-                pass
-            elif machine.status in RELEASABLE_STATUSES:
-                machine.release_or_erase(request.user, comment)
-                released_ids.append(machine.system_id)
-            else:
-                failed.append(
-                    "%s ('%s')"
-                    % (machine.system_id, machine.display_status()))
+        with batched_power_changes():
+            for machine in machines:
+                if machine.status == NODE_STATUS.READY:
+                    # Nothing to do.
+                    pass
+                elif machine.status in RELEASABLE_STATUSES:
+                    machine.release_or_erase(request.user, comment)
+                    released_ids.append(machine.system_id)
+                else:
+                    failed.append(
+                        "%s ('%s')"
+                        % (machine.system_id, machine.display_status()))
 
         if any(failed):
             raise NodeStateViolation(
@@ -1210,6 +1212,83 @@ class MachinesHandler(NodesHandler, PowersMixin):
                 % ', '.join(failed))
         return released_ids
 
+    def _call_for_each_machine(self, request, method):
+        """Call `method` of `MachineHandler` for each of the `machines`.
+
+        Power changes are batched, so that each rack controller is asked to
+        make them all at once, after commit.
+
+        :return: The system_ids of the machines.
+        """
+        system_ids = set(request.POST.getlist('machines'))
+        # Check the existence of these nodes first.
+        self._check_system_ids_exist(system_ids)
+        handler = MachineHandler()
+        with batched_power_changes():
+            for system_id in sorted(system_ids):
+                method(handler, request, system_id)
+        return sorted(system_ids)
+
+    @operation(idempotent=False)
+    def deploy(self, request):
+        """Deploy multiple machines.
+
+        Each machine is deployed as by the `deploy` operation on a single
+        machine, which takes the same optional parameters, but the machines
+        are powered on with a single request to each rack controller.
+
+        :param machines: system_ids of the machines which are to be deployed.
+        :return: The system_ids of the machines being deployed.
+
+        Returns 400 if any of the machines cannot be found.
+        Returns 403 if the user does not have permission to deploy any of
+        the machines.
+        Returns 503 if the start-up attempted to allocate an IP address,
+        and there were no IP addresses available on the relevant cluster
+        interface.
+        """
+        return self._call_for_each_machine(request, MachineHandler.deploy)
+
+    @operation(idempotent=False)
+    def power_on(self, request):
+        """Turn on multiple machines.
+
+        :param machines: system_ids of the machines which are to be turned
+            on.
+        :param user_data: If present, this blob of user-data to be made
+            available to the machines through the metadata service.
+        :type user_data: base64-encoded unicode
+        :param comment: Optional comment for the event log.
+        :type comment: unicode
+        :return: The system_ids of the machines being turned on.
+
+        Returns 400 if any of the machines cannot be found.
+        Returns 403 if the user does not have permission to start any of
+        the machines.
+        Returns 409 if any of the machines has not been allocated.
+        """
+        return self._call_for_each_machine(request, MachineHandler.power_on)
+
+    @operation(idempotent=False)
+    def power_off(self, request):
+        """Power off multiple machines.
+
+        :param machines: system_ids of the machines which are to be powered
+            off.
+        :param stop_mode: An optional power off mode. If 'soft', perform a
+            soft power down if the machines' power types support it,
+            otherwise perform a hard power off.
+        :type stop_mode: unicode
+        :param comment: Optional comment for the event log.
+        :type comment: unicode
+        :return: The system_ids of the machines being powered off.
+
+        Returns 400 if any of the machines cannot be found.
+        Returns 403 if the user does not have permission to stop any of
+        the machines.
+        """
+        return self._call_for_each_machine(request, MachineHandler.power_off)
+
     @operation(idempotent=True)
     def list_allocated(self, request):
         """Fetch Machines that were allocated to the User/oauth token."""
@@ -1,4 +1,4 @@
-# Copyright 2012-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2012-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 __all__ = [
@@ -9,12 +9,21 @@ __all__ = [
 ]
 
 from base64 import b64decode
-from itertools import chain
+from heapq import merge
+from itertools import (
+    chain,
+    islice,
+)
 import json
+from operator import attrgetter
 
 import bson
-from django.http import HttpResponse
+from django.http import (
+    HttpResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404
+from formencode.validators import Int
 from maasserver.api.support import (
     admin_method,
     AnonymousOperationsHandler,
@@ -44,6 +53,7 @@ from maasserver.exceptions import (
 from maasserver.fields import MAC_RE
 from maasserver.forms import BulkNodeActionForm
 from maasserver.forms.ephemeral import TestForm
+from maasserver.json import MAASJSONEncoder
 from maasserver.models import (
     Interface,
     Node,
@@ -51,7 +61,12 @@ from maasserver.models import (
 )
 from maasserver.models.nodeprobeddetails import get_single_probed_details
 from maasserver.utils.orm import prefetch_queryset
-from piston3.utils import rc
+from piston3.emitters import JSONEmitter
+from piston3.handler import typemapper
+from piston3.utils import (
+    HttpStatusCode,
+    rc,
+)
 from provisioningserver.drivers.power import UNKNOWN_POWER_TYPE
 
 
@@ -108,6 +123,114 @@ NODES_PREFETCH = [
     'tags',
 ]
 
+# The relations prefetched by `NODES_PREFETCH` that each displayed field
+# relies upon. When a projection of fields is requested only the prefetches
+# that those fields need are made.
+NODES_PREFETCH_BY_FIELD = {
+    'domain': ('domain',),
+    'fqdn': ('domain',),
+    'owner_data': ('ownerdata_set',),
+    'special_filesystems': ('special_filesystems',),
+    'default_gateways': (
+        'gateway_link_ipv4', 'gateway_link_ipv6', 'interface_set'),
+    'boot_interface': ('boot_interface', 'interface_set'),
+    'ip_addresses': ('interface_set',),
+    'interface_set': ('interface_set',),
+    'storage': ('blockdevice_set',),
+    'boot_disk': ('blockdevice_set',),
+    'blockdevice_set': ('blockdevice_set',),
+    'iscsiblockdevice_set': ('blockdevice_set',),
+    'physicalblockdevice_set': ('blockdevice_set',),
+    'virtualblockdevice_set': ('blockdevice_set',),
+    'tag_names': ('tags',),
+}
+
+
+def get_field_name(field):
+    """Return the name of a handler's field.
+
+    Fields are names, or pairs of a name and the fields of a related object.
+    """
+    return field[0] if isinstance(field, (list, tuple)) else field
+
+
+def get_prefetches_for_fields(fields):
+    """Return the members of `NODES_PREFETCH` needed to display `fields`."""
+    relations = set(chain.from_iterable(
+        NODES_PREFETCH_BY_FIELD.get(field, ()) for field in fields))
+    return [
+        prefetch for prefetch in NODES_PREFETCH
+        if prefetch.split('__', 1)[0] in relations
+    ]
+
+
+class ProjectedHandler:
+    """Stand-in for a handler in piston's typemapper, with fewer fields.
+
+    Piston emits an object with the `fields` of the handler it finds for the
+    object's model in the typemapper, whatever the calling handler says, so
+    a projection is made by emitting with a copy of the typemapper in which
+    the node handlers are replaced by these.
+
+    The system_id is always included: it identifies each node, and is the
+    key for fetching the next page. This also stops piston from falling back
+    to every field of the model when none of `fields` apply to a handler.
+    """
+
+    def __init__(self, handler, fields):
+        super(ProjectedHandler, self).__init__()
+        self._handler = handler
+        fields = set(fields) | {'system_id'}
+        self.fields = tuple(
+            field for field in handler.fields
+            if get_field_name(field) in fields)
+
+    def __getattr__(self, name):
+        return getattr(self._handler, name)
+
+
+def get_node_handlers(model):
+    """Return the registered handlers that emit `model` or its subclasses.
+
+    Anonymous handlers are not included.
+    """
+    return [
+        handler for handler, (handler_model, anonymous) in typemapper.items()
+        if not anonymous and isinstance(handler_model, type) and
+        issubclass(handler_model, model)
+    ]
+
+
+def stream_nodes(nodes, fields=None):
+    """Return a response that streams `nodes` as a JSON list.
+
+    Each node is emitted as piston would, but only with the given `fields`,
+    if any. The nodes are turned into plain objects straight away, inside
+    the request's transaction, but the JSON is encoded and written out one
+    node at a time rather than as a single document. Callers bound the
+    number of `nodes`; see `MAX_NODES_LIMIT`.
+    """
+    mapper = typemapper
+    if fields is not None:
+        mapper = dict(typemapper)
+        for handler in get_node_handlers(Node):
+            mapper[ProjectedHandler(handler, fields)] = mapper.pop(handler)
+    nodes = [
+        JSONEmitter(node, mapper, None, anonymous=False).construct()
+        for node in nodes
+    ]
+
+    def generate():
+        yield "["
+        for index, node in enumerate(nodes):
+            if index != 0:
+                yield ", "
+            yield json.dumps(node, cls=MAASJSONEncoder, ensure_ascii=False)
+        yield "]"
+
+    return StreamingHttpResponse(
+        generate(), content_type="application/json; charset=utf-8")
+
 
 def store_node_power_parameters(node, request):
     """Store power parameters in request.
@@ -192,6 +315,40 @@ def filtered_nodes_list_from_request(request, model=None):
     return nodes.order_by('id')
 
 
+# The most nodes returned by a streamed listing, i.e. one with `fields`,
+# `limit`, or `after`. Their nodes are turned into plain objects in the
+# request's transaction, all at once, so the size of a page is bounded.
+MAX_NODES_LIMIT = 1000
+
+
+def get_page_params(request):
+    """Return the `limit` and `after` parameters from `request`.
+
+    Either may be `None`. The `limit` must be a positive integer.
+    """
+    limit = get_optional_param(request.GET, 'limit', None, Int(min=1))
+    after = get_optional_param(request.GET, 'after', None)
+    return limit, after
+
+
+def paginate_nodes(nodes, limit=None, after=None):
+    """Return a page of `nodes`, sorted by system_id.
+
+    This uses the system_id as the key, rather than an offset, so the
+    database can find the start of each page with the system_id index, and
+    a page is not shifted when nodes are added or removed before it.
+
+    :param limit: The maximum number of nodes to return, or `None`.
+    :param after: Return only nodes with a greater system_id, or `None`.
+    """
+    nodes = nodes.order_by('system_id')
+    if after is not None:
+        nodes = nodes.filter(system_id__gt=after)
+    if limit is not None:
+        nodes = nodes[:limit]
+    return nodes
+
+
 def is_registered(request):
     """Used by both `NodesHandler` and `AnonNodesHandler`."""
     mac_address = get_mandatory_param(request.GET, 'mac_address')
@@ -376,7 +533,11 @@ class NodesHandler(OperationsHandler):
     def read(self, request):
         """List Nodes visible to the user, optionally filtered by criteria.
 
-        Nodes are sorted by id (i.e. most recent last) and grouped by type.
+        Nodes are sorted by id (i.e. most recent last) and grouped by type,
+        unless `fields`, `limit`, or `after` are given, in which case they
+        are sorted by system_id, whatever their type, and at most 1000 are
+        returned, however large `limit` is. To fetch the next page, pass the
+        system_id of the last node in this page as `after`.
 
         :param hostname: An optional hostname. Only nodes relating to the node
             with the matching hostname will be returned. This can be specified
@@ -403,8 +564,59 @@ class NodesHandler(OperationsHandler):
         :param agent_name: An optional agent name.  Only nodes relating to the
             nodes with matching agent names will be returned.
         :type agent_name: unicode
+
+        :param limit: An optional maximum number of nodes to return, up to
+            1000. This is 1000 if not given along with `fields` or `after`.
+        :type limit: int
+
+        :param after: An optional system_id. Only nodes with a greater
+            system_id will be returned.
+        :type after: unicode
+
+        :param fields: An optional field name. Only the given fields of each
+            node will be returned, and the information needed for the others
+            is not fetched. This can be specified multiple times to see
+            multiple fields.
+        :type fields: unicode
         """
+        fields = self._get_fields(request)
+        limit, after = get_page_params(request)
+        if fields is None and limit is None and after is None:
+            return self._get_nodes(request)
+        else:
+            if limit is None or limit > MAX_NODES_LIMIT:
+                limit = MAX_NODES_LIMIT
+            nodes = self._get_nodes(request, fields, limit, after)
+            raise HttpStatusCode(stream_nodes(nodes, fields))
 
+    def _get_fields(self, request):
+        """Return the field names requested with `fields`, or `None`.
+
+        :raises MAASAPIValidationError: if a field is not one displayed for
+            this handler's nodes.
+        """
+        fields = get_optional_list(request.GET, 'fields')
+        if fields is None:
+            return None
+        known_fields = {
+            get_field_name(field)
+            for handler in get_node_handlers(self.base_model)
+            for field in handler.fields
+        }
+        unknown_fields = sorted(set(fields) - known_fields)
+        if len(unknown_fields) != 0:
+            raise MAASAPIValidationError(
+                "Unknown field(s): %s" % ", ".join(unknown_fields))
+        return set(fields)
+
+    def _get_nodes(self, request, fields=None, limit=None, after=None):
+        """Return the nodes for `read`, with related objects prefetched.
+
+        :param fields: The names of the fields that will be displayed, or
+            `None` for all of them.
+        :param limit: The maximum number of nodes, or `None`.
+        :param after: Only nodes with a greater system_id, or `None`.
+        """
         if self.base_model == Node:
             # Avoid circular dependencies
             from maasserver.api.devices import DevicesHandler
@@ -413,26 +625,58 @@ class NodesHandler(OperationsHandler):
             from maasserver.api.regioncontrollers import (
                 RegionControllersHandler
             )
-            racks = RackControllersHandler().read(request).order_by("id")
-            nodes = list(chain(
-                DevicesHandler().read(request).order_by("id"),
-                MachinesHandler().read(request).order_by("id"),
-                racks,
-                RegionControllersHandler().read(request).exclude(
-                    id__in=racks).order_by("id"),
-            ))
+            if limit is None and after is None:
+                racks = RackControllersHandler()._get_nodes(
+                    request, fields).order_by("id")
+                nodes = list(chain(
+                    DevicesHandler()._get_nodes(
+                        request, fields).order_by("id"),
+                    MachinesHandler()._get_nodes(
+                        request, fields).order_by("id"),
+                    racks,
+                    RegionControllersHandler()._get_nodes(
+                        request, fields).exclude(
+                            id__in=racks).order_by("id"),
+                ))
+            else:
+                # Each handler returns up to `limit` of its nodes, sorted by
+                # system_id, so the first `limit` of them all is the page.
+                racks = RackControllersHandler()._get_nodes(
+                    request, fields, limit, after)
+                rack_ids = {rack.id for rack in racks}
+                regions = (
+                    region for region in RegionControllersHandler()._get_nodes(
+                        request, fields, None if limit is None
+                        else limit + len(rack_ids), after)
+                    if region.id not in rack_ids)
+                nodes = list(islice(merge(
+                    DevicesHandler()._get_nodes(request, fields, limit, after),
+                    MachinesHandler()._get_nodes(
+                        request, fields, limit, after),
+                    racks, regions, key=attrgetter("system_id")), limit))
             return nodes
         else:
             nodes = filtered_nodes_list_from_request(request, self.base_model)
             nodes = nodes.select_related(*NODES_SELECT_RELATED)
-            nodes = prefetch_queryset(
-                nodes, NODES_PREFETCH).order_by('id')
+            if fields is None:
+                prefetches = NODES_PREFETCH
+            else:
+                prefetches = get_prefetches_for_fields(fields)
+            nodes = prefetch_queryset(nodes, prefetches)
+            if limit is None and after is None:
+                nodes = nodes.order_by('id')
+            else:
+                nodes = paginate_nodes(nodes, limit, after)
             # Set related node parents so no extra queries are needed.
+            prefetched = {
+                prefetch.split('__', 1)[0] for prefetch in prefetches}
             for node in nodes:
-                for interface in node.interface_set.all():
-                    interface.node = node
-                for block_device in node.blockdevice_set.all():
-                    block_device.node = node
+                if 'interface_set' in prefetched:
+                    for interface in node.interface_set.all():
+                        interface.node = node
+                if 'blockdevice_set' in prefetched:
+                    for block_device in node.blockdevice_set.all():
+                        block_device.node = node
             return nodes
 
     @operation(idempotent=True)
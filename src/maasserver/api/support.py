@@ -1,4 +1,4 @@
-# Copyright 2012-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2012-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Supporting infrastructure for Piston-based APIs in MAAS."""
@@ -56,7 +56,11 @@ class OperationsResource(Resource):
 
     def __call__(self, request, *args, **kwargs):
         upcall = super(OperationsResource, self).__call__
-        response = upcall(request, *args, **kwargs)
+        try:
+            response = upcall(request, *args, **kwargs)
+        except HttpStatusCode as e:
+            # A streaming response, passed up by `error_handler`.
+            response = e.response
         response["X-MAAS-API-Hash"] = get_api_description_hash()
         return response
 
@@ -68,6 +72,12 @@ class OperationsResource(Resource):
         if isinstance(e, Http404):
             return rc.NOT_FOUND
         elif isinstance(e, HttpStatusCode):
+            if e.response.streaming:
+                # Piston passes whatever is returned here to its emitter,
+                # which would read a streaming response's content into a
+                # string, so pass it up to `__call__` instead. Handlers
+                # raise `HttpStatusCode` to return a streaming response.
+                raise
             return e.response
         else:
             raise
@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for the events API."""
@@ -13,6 +13,8 @@ from itertools import (
 import logging
 import random
 from random import randint
+import threading
+from unittest.mock import Mock
 from urllib.parse import (
     parse_qsl,
     urlparse,
@@ -22,12 +24,20 @@ from django.conf import settings
 from maasserver.api import events as events_module
 from maasserver.api.tests.test_nodes import RequestFixture
 from maasserver.enum import NODE_TYPE
+from maasserver.regiondservices.event_watcher import EventWatcherService
+from maasserver.regiondservices.tests.test_event_watcher import (
+    wait_for_waiters,
+)
 from maasserver.testing.api import APITestCase
 from maasserver.testing.factory import factory
 from maasserver.utils import ignore_unused
 from maasserver.utils.converters import json_load_bytes
 from maasserver.utils.django_urls import reverse
 from maastesting.djangotestcase import count_queries
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
 from testtools.matchers import (
     AfterPreprocessing,
     Contains,
@@ -660,6 +670,127 @@ class TestEventsURIs(APITestCase.ForUser):
         self.assertThat(next_params, ContainsDict(params_expected))
 
 
+class TestEventsWatchAPI(APITestCase.ForUser):
+    """Tests for /api/2.0/events/?op=watch."""
+
+    def setUp(self):
+        super(TestEventsWatchAPI, self).setUp()
+        self.watcher = Mock()
+        self.patch(
+            events_module, "get_event_watcher").return_value = self.watcher
+
+    def test_GET_watch_returns_newer_events_without_waiting(self):
+        events = make_events(4)
+        response = self.client.get(
+            reverse('events_handler'), {
+                'op': 'watch',
+                'after': str(events[1].id),
+                'level': 'DEBUG',
+            })
+        self.assertEqual(http.client.OK, response.status_code)
+        parsed_result = json_load_bytes(response.content)
+        self.assertSequenceEqual(
+            [events[3].id, events[2].id], extract_event_ids(parsed_result))
+        self.assertThat(
+            self.watcher.wait_for_event_after, MockNotCalled())
+
+    def test_GET_watch_waits_for_newer_events(self):
+        node = factory.make_Node()
+        events = make_events(3)
+        response = self.client.get(
+            reverse('events_handler'), {
+                'op': 'watch',
+                'after': str(events[0].id),
+                'hostname': node.hostname,
+                'timeout': '5',
+            })
+        self.assertEqual(http.client.OK, response.status_code)
+        parsed_result = json_load_bytes(response.content)
+        self.assertEqual(0, parsed_result['count'])
+        # Events up to the newest are skipped; they're not for `node`.
+        self.assertThat(
+            self.watcher.wait_for_event_after,
+            MockCalledOnceWith(events[2].id, 5))
+        next_uri_params = dict(
+            parse_qsl(urlparse(parsed_result["next_uri"]).query))
+        self.assertThat(next_uri_params, ContainsDict({
+            "op": Equals("watch"),
+            "after": Equals(str(events[2].id)),
+            "timeout": Equals("5"),
+        }))
+
+    def test_GET_watch_with_zero_timeout_does_not_wait(self):
+        response = self.client.get(
+            reverse('events_handler'), {
+                'op': 'watch',
+                'after': '0',
+                'timeout': '0',
+            })
+        self.assertEqual(http.client.OK, response.status_code)
+        self.assertThat(
+            self.watcher.wait_for_event_after, MockNotCalled())
+
+    def test_GET_watch_serves_other_requests_while_watchers_wait(self):
+        watcher = EventWatcherService()
+        watcher.max_waiters = 1
+        watcher.startService()
+        self.patch(events_module, "get_event_watcher").return_value = watcher
+        event = factory.make_Event()
+        # Park a watcher, as if another client were waiting for events.
+        waiter = threading.Thread(
+            target=watcher.wait_for_event_after, args=(event.id, 30))
+        waiter.start()
+        self.addCleanup(waiter.join, 30)
+        self.addCleanup(watcher.stopService)
+        wait_for_waiters(watcher, 1)
+        # Other requests are still served.
+        response = self.client.get(
+            reverse('events_handler'), {'op': 'query'})
+        self.assertEqual(http.client.OK, response.status_code)
+        # Another watcher is turned away rather than left holding a thread
+        # and a database connection.
+        response = self.client.get(
+            reverse('events_handler'), {
+                'op': 'watch',
+                'after': str(event.id),
+            })
+        self.assertEqual(
+            http.client.SERVICE_UNAVAILABLE, response.status_code)
+        self.assertEqual(
+            str(events_module.RETRY_AFTER_EVENT_WATCH),
+            response['Retry-After'])
+        self.assertThat(watcher.waiters, Equals(1))
+
+    def test_GET_watch_requires_after(self):
+        response = self.client.get(
+            reverse('events_handler'), {'op': 'watch'})
+        self.assertEqual(http.client.BAD_REQUEST, response.status_code)
+
+    def test_GET_watch_with_before_is_forbidden(self):
+        response = self.client.get(
+            reverse('events_handler'), {
+                'op': 'watch',
+                'after': '1',
+                'before': '3',
+            })
+        self.assertEqual(http.client.BAD_REQUEST, response.status_code)
+        self.assertThat(response.content, AfterBeingDecoded(Equals(
+            "`before` cannot be specified when watching for events.")))
+
+    def test_GET_watch_with_timeout_over_limit_raises_error_with_msg(self):
+        timeout = events_module.MAX_EVENT_WATCH_TIMEOUT + 1
+        response = self.client.get(
+            reverse('events_handler'), {
+                'op': 'watch',
+                'after': '1',
+                'timeout': str(timeout),
+            })
+        self.assertEqual(http.client.BAD_REQUEST, response.status_code)
+        self.assertThat(response.content, AfterBeingDecoded(Equals(
+            "Requested timeout %d is greater than limit: %d" % (
+                timeout, events_module.MAX_EVENT_WATCH_TIMEOUT))))
+
+
 # Parameters used in queries, excluding "op", which
 # is a detail of MAAS's Web API machinery.
 parameters = sorted(events_module.EventsHandler.all_params)
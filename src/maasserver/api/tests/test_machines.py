@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for the machines API."""
@@ -16,6 +16,7 @@ from maasserver import (
     middleware,
 )
 from maasserver.api import machines as machines_module
+from maasserver.clusterrpc.power import get_power_change_batch
 from maasserver.enum import (
     INTERFACE_TYPE,
     NODE_STATUS,
@@ -1741,6 +1742,47 @@ class TestMachinesAPI(APITestCase.ForUser):
         machine = reload_object(machine)
         self.assertEqual(NODE_STATUS.DISK_ERASING, machine.status)
 
+    def test_POST_power_off_powers_off_machines_in_one_batch(self):
+        machines = [
+            factory.make_Node(status=NODE_STATUS.DEPLOYED, owner=self.user)
+            for _ in range(3)
+        ]
+        batches = []
+
+        def power_off(handler, request, system_id):
+            batches.append((system_id, get_power_change_batch()))
+        self.patch(
+            machines_module.MachineHandler, "power_off", power_off)
+        response = self.client.post(
+            reverse('machines_handler'), {
+                'op': 'power_off',
+                'machines': [machine.system_id for machine in machines],
+            })
+        self.assertEqual(http.client.OK, response.status_code)
+        system_ids = sorted(machine.system_id for machine in machines)
+        self.assertEqual(
+            system_ids, json.loads(
+                response.content.decode(settings.DEFAULT_CHARSET)))
+        self.assertEqual(
+            system_ids, [system_id for system_id, _ in batches])
+        [batch] = {batch for _, batch in batches}
+        self.assertIsNotNone(batch)
+
+    def test_POST_deploy_fails_if_machines_do_not_exist(self):
+        deploy = self.patch(machines_module.MachineHandler, "deploy")
+        machine = factory.make_Node(
+            status=NODE_STATUS.ALLOCATED, owner=self.user)
+        response = self.client.post(
+            reverse('machines_handler'), {
+                'op': 'deploy',
+                'machines': [machine.system_id, factory.make_string()],
+            })
+        self.assertEqual(http.client.BAD_REQUEST, response.status_code)
+        self.assertIn(
+            "Unknown machine(s): ",
+            response.content.decode(settings.DEFAULT_CHARSET))
+        self.assertThat(deploy, MockNotCalled())
+
     def test_POST_set_zone_sets_zone_on_machines(self):
         self.become_admin()
         machine = factory.make_Node()
@@ -1,4 +1,4 @@
-# Copyright 2013-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2013-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for the nodes API."""
@@ -526,6 +526,96 @@ class TestNodesAPI(APITestCase.ForUser):
             [node.system_id for node in nodes],
             extract_system_ids(parsed_result))
 
+    def test_GET_with_limit_streams_nodes_by_system_id(self):
+        nodes = [factory.make_Node() for _ in range(3)]
+        response = self.client.get(reverse('nodes_handler'), {'limit': 2})
+        self.assertEqual(http.client.OK, response.status_code)
+        self.assertTrue(response.streaming)
+        parsed_result = json.loads(
+            b"".join(response.streaming_content).decode(
+                settings.DEFAULT_CHARSET))
+        self.assertSequenceEqual(
+            sorted(node.system_id for node in nodes)[:2],
+            extract_system_ids(parsed_result))
+
+    def test_GET_with_after_returns_next_page(self):
+        system_ids = sorted(
+            factory.make_Node(node_type=node_type).system_id
+            for node_type in (NODE_TYPE.MACHINE, NODE_TYPE.DEVICE) * 2)
+        response = self.client.get(reverse('nodes_handler'), {
+            'limit': 2,
+            'after': system_ids[0],
+        })
+        self.assertEqual(http.client.OK, response.status_code)
+        parsed_result = json.loads(
+            b"".join(response.streaming_content).decode(
+                settings.DEFAULT_CHARSET))
+        self.assertSequenceEqual(
+            system_ids[1:3], extract_system_ids(parsed_result))
+
+    def test_GET_with_fields_returns_at_most_MAX_NODES_LIMIT(self):
+        self.patch(nodes_module, "MAX_NODES_LIMIT", 2)
+        nodes = [factory.make_Node() for _ in range(3)]
+        response = self.client.get(reverse('nodes_handler'), {
+            'fields': 'system_id',
+        })
+        self.assertEqual(http.client.OK, response.status_code)
+        parsed_result = json.loads(
+            b"".join(response.streaming_content).decode(
+                settings.DEFAULT_CHARSET))
+        self.assertSequenceEqual(
+            sorted(node.system_id for node in nodes)[:2],
+            extract_system_ids(parsed_result))
+
+    def test_GET_with_limit_returns_at_most_MAX_NODES_LIMIT(self):
+        self.patch(nodes_module, "MAX_NODES_LIMIT", 2)
+        for _ in range(3):
+            factory.make_Node()
+        response = self.client.get(reverse('nodes_handler'), {'limit': 3})
+        self.assertEqual(http.client.OK, response.status_code)
+        parsed_result = json.loads(
+            b"".join(response.streaming_content).decode(
+                settings.DEFAULT_CHARSET))
+        self.assertEqual(2, len(extract_system_ids(parsed_result)))
+
+    def test_GET_with_invalid_limit_returns_sensible_error(self):
+        response = self.client.get(reverse('nodes_handler'), {'limit': 0})
+        self.assertEqual(http.client.BAD_REQUEST, response.status_code)
+
+    def test_GET_with_fields_returns_only_those_fields(self):
+        node = factory.make_Node()
+        response = self.client.get(reverse('nodes_handler'), {
+            'fields': ['system_id', 'hostname'],
+        })
+        self.assertEqual(http.client.OK, response.status_code)
+        parsed_result = json.loads(
+            b"".join(response.streaming_content).decode(
+                settings.DEFAULT_CHARSET))
+        self.assertEqual(
+            [{
+                'system_id': node.system_id,
+                'hostname': node.hostname,
+                'resource_uri': reverse(
+                    'machine_handler', args=[node.system_id]),
+            }],
+            parsed_result)
+
+    def test_GET_with_unknown_fields_returns_sensible_error(self):
+        response = self.client.get(reverse('nodes_handler'), {
+            'fields': ['system_id', 'unknown'],
+        })
+        self.assertEqual(
+            (http.client.BAD_REQUEST, b"Unknown field(s): unknown"),
+            (response.status_code, response.content))
+
+    def test_GET_with_fields_does_not_prefetch_for_other_fields(self):
+        factory.make_Node()
+        self.patch(nodes_module, "prefetch_queryset").side_effect = (
+            lambda nodes, prefetches: nodes)
+        self.client.get(reverse('nodes_handler'), {'fields': 'tag_names'})
+        self.assertEqual(
+            ['tags'], nodes_module.prefetch_queryset.call_args[0][1])
+
     def test_POST_set_zone_sets_zone_on_nodes(self):
         self.become_admin()
         node = factory.make_Node()
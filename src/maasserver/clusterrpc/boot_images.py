@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Obtain list of boot images from rack controllers."""
@@ -27,6 +27,7 @@ from maasserver.rpc import (
     getAllClients,
     getClientFor,
 )
+from maasserver.rpc.capabilities import rack_capabilities
 from maasserver.utils import async
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
@@ -92,6 +93,9 @@ def get_boot_images(rack_controller):
     :raises crochet.TimeoutError: If a response has not been received within
         30 seconds.
     """
+    capabilities = rack_capabilities.get(rack_controller.system_id)
+    if capabilities is not None:
+        return [dict(image) for image in capabilities.images]
     client = getClientFor(rack_controller.system_id, timeout=1)
     try:
         call = client(ListBootImagesV2)
@@ -103,10 +107,22 @@ def get_boot_images(rack_controller):
 
 @synchronous
 def _get_available_boot_images():
-    """Obtain boot images available on connected rack controllers."""
+    """Obtain boot images available on connected rack controllers.
+
+    Rack controllers that have reported their capabilities are not asked.
+    """
     listimages_v1 = lambda client: partial(client, ListBootImages)
     listimages_v2 = lambda client: partial(client, ListBootImagesV2)
-    clients_v2 = getAllClients()
+    clients_v2 = []
+    for client in getAllClients():
+        capabilities = rack_capabilities.get(client.ident)
+        if capabilities is None:
+            clients_v2.append(client)
+        else:
+            yield frozenset(
+                frozenset(image.items())
+                for image in capabilities.images
+            )
     responses_v2 = async.gather(map(listimages_v2, clients_v2))
     clients_v1 = []
     for i, response in enumerate(responses_v2):
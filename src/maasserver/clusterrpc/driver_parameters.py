@@ -1,4 +1,4 @@
-# Copyright 2012-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2012-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """
@@ -36,6 +36,8 @@ from jsonschema import validate
 from maasserver.clusterrpc.utils import call_clusters
 from maasserver.config_forms import DictCharField
 from maasserver.fields import MACAddressFormField
+from maasserver.models.node import RackController
+from maasserver.rpc.capabilities import rack_capabilities
 from maasserver.utils.forms import compose_invalid_choice_text
 from provisioningserver.drivers import SETTING_PARAMETER_FIELD_SCHEMA
 from provisioningserver.drivers.nos import JSON_NOS_DRIVERS_SCHEMA
@@ -214,6 +216,26 @@ def get_driver_types(
     return types
 
 
+def _gen_power_types_responses(controllers, ignore_errors):
+    """Yield `DescribePowerTypes` responses for `controllers`.
+
+    Rack controllers that have reported their capabilities are not asked.
+    """
+    if controllers is None:
+        controllers = RackController.objects.all()
+    uncached = []
+    for controller in controllers:
+        capabilities = rack_capabilities.get(controller.system_id)
+        if capabilities is None:
+            uncached.append(controller)
+        else:
+            yield {'power_types': capabilities.power_types}
+    if len(uncached) > 0:
+        yield from call_clusters(
+            cluster.DescribePowerTypes, controllers=uncached,
+            ignore_errors=ignore_errors)
+
+
 def get_all_power_types_from_racks(controllers=None, ignore_errors=True):
     """Query every rack controller and obtain all known power driver types.
 
@@ -222,10 +244,7 @@ def get_all_power_types_from_racks(controllers=None, ignore_errors=True):
         provisioningserver.drivers.pod.JSON_POD_DRIVERS_SCHEMA
     """
     merged_types = []
-    responses = call_clusters(
-        cluster.DescribePowerTypes, controllers=controllers,
-        ignore_errors=ignore_errors)
-    for response in responses:
+    for response in _gen_power_types_responses(controllers, ignore_errors):
         power_types = response['power_types']
         for power_type in power_types:
             driver_type = power_type.get('driver_type', 'power')
@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Obtain OS information from clusters."""
@@ -10,6 +10,7 @@ __all__ = [
 ]
 
 from collections import defaultdict
+from copy import deepcopy
 from functools import partial
 from urllib.parse import urlparse
 
@@ -19,6 +20,7 @@ from maasserver.rpc import (
     getAllClients,
     getClientFor,
 )
+from maasserver.rpc.capabilities import rack_capabilities
 from maasserver.utils import async
 from maasserver.utils.orm import get_one
 from provisioningserver.rpc.cluster import (
@@ -59,6 +61,22 @@ def suppress_failures(responses):
             yield response
 
 
+def _gen_operating_systems_responses():
+    """Yield `ListOperatingSystems` responses for every connected rack.
+
+    Rack controllers that have reported their capabilities are not asked.
+    """
+    calls = []
+    for client in getAllClients():
+        capabilities = rack_capabilities.get(client.ident)
+        if capabilities is None:
+            calls.append(partial(client, ListOperatingSystems))
+        else:
+            # The registry's copy must not be modified.
+            yield {"osystems": deepcopy(capabilities.osystems)}
+    yield from suppress_failures(async.gather(calls))
+
+
 @synchronous
 def gen_all_known_operating_systems():
     """Generator yielding details on OSes supported by any cluster.
@@ -68,10 +86,7 @@ def gen_all_known_operating_systems():
     RPC command. Exactly matching duplicates are suppressed.
     """
     seen = defaultdict(list)
-    responses = async.gather(
-        partial(client, ListOperatingSystems)
-        for client in getAllClients())
-    for response in suppress_failures(responses):
+    for response in _gen_operating_systems_responses():
         for osystem in response["osystems"]:
             name = osystem["name"]
             if osystem not in seen[name]:
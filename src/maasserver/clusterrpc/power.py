@@ -4,33 +4,62 @@
 """RPC helpers relating to nodes."""
 
 __all__ = [
+    "batched_power_changes",
+    "power_change_many",
     "power_off_node",
     "power_on_node",
 ]
 
+from collections import namedtuple
+from contextlib import contextmanager
 from functools import partial
 import logging
+import threading
 
 from maasserver.enum import POWER_STATE
 from maasserver.exceptions import PowerProblem
-from maasserver.rpc import getAllClients
+from maasserver.rpc import (
+    getAllClients,
+    getClientFromIdentifiers,
+)
+from maasserver.utils.orm import (
+    post_commit_do,
+    post_commit_hooks,
+    transactional,
+)
+from maasserver.utils.threads import deferToDatabase
 from provisioningserver.logger import get_maas_logger
 from provisioningserver.rpc.cluster import (
+    PowerChangeMany,
     PowerCycle,
     PowerDriverCheck,
     PowerOff,
     PowerOn,
     PowerQuery,
 )
-from provisioningserver.rpc.exceptions import PowerActionAlreadyInProgress
+from provisioningserver.rpc.exceptions import (
+    NoConnectionsAvailable,
+    PowerActionAlreadyInProgress,
+)
 from provisioningserver.utils.twisted import (
     asynchronous,
     callOut,
     FOREVER,
 )
 from twisted.internet import reactor
-from twisted.internet.defer import DeferredList
-from twisted.protocols.amp import UnhandledCommand
+from twisted.internet.defer import (
+    Deferred,
+    DeferredList,
+    inlineCallbacks,
+    maybeDeferred,
+    succeed,
+)
+from twisted.protocols.amp import (
+    MAX_VALUE_LENGTH,
+    TooLong,
+    UnhandledCommand,
+)
+from twisted.python.failure import Failure
 
 
 logger = logging.getLogger(__name__)
@@ -274,3 +303,316 @@ def power_query_all(system_id, hostname, power_info, timeout=30):
     # Cancel the canceller once finished.
     dList.addBoth(callOut, done)
     return dList
+
+
+# The power changes that may be batched, by the helper that would otherwise
+# make each of them.
+BATCHABLE_POWER_CHANGES = {
+    power_on_node: "on",
+    power_off_node: "off",
+    power_cycle: "cycle",
+}
+
+
+# The most nodes to change in one `PowerChangeMany` call. This bounds the
+# size of the response too, which has a result for each node.
+MAX_POWER_CHANGES = 100
+
+
+def make_power_change_node(system_id, hostname, power_info):
+    """Return a node's entry in the arguments to `PowerChangeMany`."""
+    return {
+        "system_id": system_id,
+        "hostname": hostname,
+        "power_type": power_info.power_type,
+        "context": power_info.power_parameters,
+    }
+
+
+def get_power_change_node_size(system_id, hostname, power_info):
+    """Return the encoded size of a node's entry in `PowerChangeMany`.
+
+    The encoded list of nodes is the concatenation of its entries.
+    """
+    nodes = dict(PowerChangeMany.arguments)[b"nodes"]
+    node = make_power_change_node(system_id, hostname, power_info)
+    try:
+        return len(nodes.toStringProto([node], None))
+    except TooLong:
+        # It cannot be sent in any batch; it's sent, and fails, on its own.
+        return MAX_VALUE_LENGTH + 1
+
+
+@asynchronous(timeout=30)
+def power_change_many(client, power_change, nodes):
+    """Change the power state of many nodes with one call.
+
+    The power call will be directed to the provided `client`.
+
+    :param client: The `rpc.common.Client` of the rack controller to perform
+        the power actions.
+    :param power_change: One of "on", "off", or "cycle".
+    :param nodes: An iterable of ``(system_id, hostname, power_info)``
+        tuples.
+    :return: A :py:class:`twisted.internet.defer.Deferred` that will fire
+        with a dict mapping each node's system_id to an error message, or
+        to `None` if its power change was started.
+    """
+    nodes = [
+        make_power_change_node(system_id, hostname, power_info)
+        for system_id, hostname, power_info in nodes
+    ]
+    maaslog.debug(
+        "Asking rack controller to power %s %d node(s).",
+        power_change, len(nodes))
+    d = client(PowerChangeMany, power_change=power_change, nodes=nodes)
+    d.addCallback(lambda response: {
+        result["system_id"]: result.get("error")
+        for result in response["results"]
+    })
+    return d
+
+
+PowerChange = namedtuple("PowerChange", (
+    "node", "power_method", "power_info", "hook", "done"))
+
+
+class PowerChangeBatch:
+    """Power changes for many nodes, made together after commit.
+
+    Changes are grouped by the rack controller that will make them and by
+    the kind of change, and each group is sent in one `PowerChangeMany` call
+    instead of one call per node. See `batched_power_changes`.
+    """
+
+    def __init__(self):
+        super(PowerChangeBatch, self).__init__()
+        self.changes = []
+
+    def can_add(self, power_method):
+        """Can changes made by `power_method` be batched?"""
+        return power_method in BATCHABLE_POWER_CHANGES
+
+    def add(self, node, power_method, power_info, hook):
+        """Add a change to the power state of `node`.
+
+        :param power_method: One of `power_on_node`, `power_off_node`, or
+            `power_cycle`.
+        :param hook: The post-commit hook that will wait for the change. If
+            it has been cancelled by the time the batch is sent, by the
+            rollback of a savepoint for example, the change is not made.
+        :return: A `Deferred` that fires once the change has been started,
+            or fails if it could not be.
+        """
+        done = Deferred()
+        self.changes.append(
+            PowerChange(node, power_method, power_info, hook, done))
+        return done
+
+    @asynchronous
+    @inlineCallbacks
+    def send(self):
+        """Send the changes to rack controllers.
+
+        This runs as a post-commit hook ahead of the hooks waiting for the
+        changes, so it reports every error through those instead of failing.
+        """
+        changes = [
+            change for change in self.changes
+            if not change.hook.called
+        ]
+        self.changes = []
+        if len(changes) == 0:
+            return
+        try:
+            routes = yield deferToDatabase(self._get_routes, changes)
+        except:
+            failure = Failure()
+            for change in changes:
+                change.done.errback(failure)
+            return
+
+        groups = {}
+        for change, route in zip(changes, routes):
+            if isinstance(route, Exception):
+                change.done.errback(route)
+            elif route is None:
+                # The BMC is not known to be accessible from any rack
+                # controller, so find out as for a single node.
+                d = change.node._power_control_node(
+                    succeed(None), change.power_method, change.power_info)
+                d.chainDeferred(change.done)
+            else:
+                try:
+                    client = yield self._get_client(*route)
+                except:
+                    change.done.errback()
+                else:
+                    key = client.ident, change.power_method
+                    groups.setdefault(key, (client, []))[1].append(change)
+
+        yield DeferredList([
+            self._send_group(client, changes)
+            for client, changes in groups.values()
+        ], consumeErrors=True)
+
+    @staticmethod
+    @transactional
+    def _get_routes(changes):
+        """Find the rack controllers that can reach each node's BMC.
+
+        :return: A list with, for each change, a ``(client_idents,
+            fallback_idents)`` tuple, `None` if the node's BMC is not known
+            to be accessible, or the `PowerProblem` preventing the change.
+        """
+        routes = []
+        for change in changes:
+            node = change.node
+            if node.bmc is None or not node.bmc.is_accessible():
+                routes.append(None)
+            else:
+                try:
+                    routes.append(node._get_bmc_client_connection_info())
+                except PowerProblem as error:
+                    routes.append(error)
+        return routes
+
+    @staticmethod
+    def _get_client(client_idents, fallback_idents):
+        """Get a client for one of `client_idents`, or `fallback_idents`."""
+        if len(client_idents) == 0:
+            return maybeDeferred(getClientFromIdentifiers, fallback_idents)
+
+        def eb_fallback_clients(failure):
+            failure.trap(NoConnectionsAvailable)
+            return getClientFromIdentifiers(fallback_idents)
+
+        d = maybeDeferred(getClientFromIdentifiers, client_idents)
+        return d.addErrback(eb_fallback_clients)
+
+    @inlineCallbacks
+    def _send_group(self, client, changes):
+        """Make `changes`, all of the same kind, with `client`."""
+        # Avoid circular imports.
+        from maasserver.models.node import Node
+
+        # Check that the rack controller can use each power type once, not
+        # once for every node.
+        power_types = {change.power_info.power_type for change in changes}
+        for power_type in power_types:
+            try:
+                yield Node.confirm_power_driver_operable(
+                    client, power_type, client.ident)
+            except:
+                failure = Failure()
+                for change in changes:
+                    if change.power_info.power_type == power_type:
+                        change.done.errback(failure)
+                changes = [
+                    change for change in changes
+                    if change.power_info.power_type != power_type
+                ]
+        if len(changes) == 0:
+            return
+
+        yield DeferredList([
+            self._send_part(client, part)
+            for part in self._split_group(changes)
+        ], consumeErrors=True)
+
+    @staticmethod
+    def _split_group(changes):
+        """Split `changes` into parts that each fit in one `PowerChangeMany`.
+
+        AMP limits each value to `MAX_VALUE_LENGTH` bytes, and the list of
+        nodes is one value, so a part holds as many changes as fit in that,
+        up to `MAX_POWER_CHANGES`.
+        """
+        part, part_size = [], 0
+        for change in changes:
+            size = get_power_change_node_size(
+                change.node.system_id, change.node.hostname,
+                change.power_info)
+            if len(part) != 0 and (
+                    part_size + size > MAX_VALUE_LENGTH or
+                    len(part) >= MAX_POWER_CHANGES):
+                yield part
+                part, part_size = [], 0
+            part.append(change)
+            part_size += size
+        if len(part) != 0:
+            yield part
+
+    @inlineCallbacks
+    def _send_part(self, client, changes):
+        """Make `changes`, all of the same kind, in one call to `client`."""
+        power_method = changes[0].power_method
+        try:
+            errors = yield power_change_many(
+                client, BATCHABLE_POWER_CHANGES[power_method], (
+                    (change.node.system_id, change.node.hostname,
+                     change.power_info)
+                    for change in changes))
+        except:
+            # The rack controller has not been upgraded to support batches,
+            # or the batch could not be sent -- a node's power parameters
+            # alone may be too big for it -- so make each change on its own.
+            failure = Failure()
+            if not failure.check(UnhandledCommand):
+                maaslog.warning(
+                    "Failed to power %s %d node(s) in one call; powering "
+                    "each on its own: %s",
+                    BATCHABLE_POWER_CHANGES[power_method], len(changes),
+                    failure.getErrorMessage())
+            for change in changes:
+                d = maybeDeferred(
+                    power_method, client, change.node.system_id,
+                    change.node.hostname, change.power_info)
+                d.chainDeferred(change.done)
+        else:
+            for change in changes:
+                error = errors.get(
+                    change.node.system_id, "No result from rack controller.")
+                if error is None:
+                    change.done.callback(None)
+                else:
+                    change.done.errback(PowerProblem(error))
+
+
+class PowerChangeBatching(threading.local):
+    """The `PowerChangeBatch` in use by this thread, if any."""
+
+    batch = None
+
+
+power_change_batching = PowerChangeBatching()
+
+
+def get_power_change_batch():
+    """Return the `PowerChangeBatch` in use by this thread, or `None`."""
+    return power_change_batching.batch
+
+
+@contextmanager
+def batched_power_changes():
+    """Batch the power changes that nodes make within this context.
+
+    Rather than each node calling its rack controller after commit, the
+    changes are collected and sent in one call for each rack controller
+    and kind of change. This must be used within a transaction.
+    """
+    if power_change_batching.batch is not None:
+        # Already batching; the outermost context sends the batch.
+        yield
+    else:
+        batch = PowerChangeBatch()
+        # Send the batch before the nodes' hooks, which wait for it.
+        hook = post_commit_do(batch.send)
+        power_change_batching.batch = batch
+        try:
+            yield
+        finally:
+            power_change_batching.batch = None
+        if len(batch.changes) == 0:
+            # Nothing to send, so don't leave the hook behind.
+            post_commit_hooks.hooks.remove(hook)
@@ -30,6 +30,7 @@ from maasserver.enum import BOOT_RESOURCE_TYPE
 from maasserver.models.config import Config
 from maasserver.models.signals import bootsources
 from maasserver.rpc import getAllClients
+from maasserver.rpc.capabilities import RackCapabilitiesRegistry
 from maasserver.rpc.testing.fixtures import (
     MockLiveRegionToClusterRPCFixture,
     RunningClusterRPCFixture,
@@ -188,6 +189,17 @@ class TestGetBootImages(MAASServerTestCase):
             call(ListBootImagesV2),
             call(ListBootImages)))
 
+    def test_uses_reported_capabilities_instead_of_asking(self):
+        rack_controller = factory.make_RackController()
+        registry = self.patch(
+            boot_images_module, "rack_capabilities",
+            RackCapabilitiesRegistry())
+        images = [make_rpc_boot_image() for _ in range(3)]
+        registry.update(rack_controller.system_id, [], images, [])
+        getClientFor = self.patch_autospec(boot_images_module, "getClientFor")
+        self.assertThat(get_boot_images(rack_controller), Equals(images))
+        self.assertThat(getClientFor, MockNotCalled())
+
 
 class TestGetBootImagesTxn(MAASTransactionServerTestCase):
     """Transactional tests for `get_boot_images`."""
@@ -321,6 +333,27 @@ class TestGetAvailableBootImages(MAASTransactionServerTestCase):
 
         self.assertItemsEqual(images, self.get())
 
+    def test_uses_reported_capabilities_instead_of_asking(self):
+        factory.make_RackController()
+        factory.make_RackController()
+        self.useFixture(RunningClusterRPCFixture())
+        registry = self.patch(
+            boot_images_module, "rack_capabilities",
+            RackCapabilitiesRegistry())
+
+        images = [make_rpc_boot_image() for _ in range(3)]
+        available_images = images[:2]
+
+        reported, asked = getAllClients()
+        registry.update(reported.ident, [], images, [])
+        callRemote_reported = self.patch(reported._conn, "callRemote")
+        callRemote_asked = self.patch(asked._conn, "callRemote")
+        callRemote_asked.return_value = succeed({'images': available_images})
+
+        expected_images = images if self.all else available_images
+        self.assertItemsEqual(expected_images, self.get())
+        self.assertThat(callRemote_reported, MockNotCalled())
+
     def test_returns_empty_list_when_all_clusters_fail(self):
         factory.make_RackController()
         factory.make_RackController()
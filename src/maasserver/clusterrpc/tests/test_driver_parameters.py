@@ -5,7 +5,10 @@
 
 __all__ = []
 
-from unittest.mock import sentinel
+from unittest.mock import (
+    Mock,
+    sentinel,
+)
 
 from django import forms
 import jsonschema
@@ -22,12 +25,18 @@ from maasserver.clusterrpc.driver_parameters import (
 )
 from maasserver.config_forms import DictCharField
 from maasserver.fields import MACAddressFormField
+from maasserver.rpc.capabilities import RackCapabilitiesRegistry
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
 from maasserver.utils.forms import compose_invalid_choice_text
-from maastesting.matchers import MockCalledOnceWith
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
 from maastesting.testcase import MAASTestCase
 from provisioningserver.drivers import make_setting_field
+from provisioningserver.rpc.cluster import DescribePowerTypes
+from testtools.matchers import Equals
 
 
 class TestGetPowerTypeParametersFromJSON(MAASServerTestCase):
@@ -400,3 +409,49 @@ class TestPowerTypes(MAASTestCase):
             mocked, MockCalledOnceWith(
                 controllers=sentinel.nodegroup,
                 ignore_errors=sentinel.ignore_errors))
+
+
+class TestGetAllPowerTypesFromRacks(MAASTestCase):
+    # This is deliberately not using a MAASServerTestCase; see TestPowerTypes.
+
+    def make_power_type(self):
+        return {
+            "driver_type": "power",
+            "name": factory.make_name("name"),
+            "description": factory.make_name("description"),
+            "fields": [],
+            "missing_packages": [],
+        }
+
+    def test_uses_reported_capabilities_instead_of_asking(self):
+        registry = self.patch(
+            driver_parameters, "rack_capabilities",
+            RackCapabilitiesRegistry())
+        reported = Mock(system_id=factory.make_name("system_id"))
+        asked = Mock(system_id=factory.make_name("system_id"))
+        reported_type = self.make_power_type()
+        asked_type = self.make_power_type()
+        registry.update(reported.system_id, [], [], [reported_type])
+        call_clusters = self.patch(driver_parameters, "call_clusters")
+        call_clusters.return_value = [{"power_types": [asked_type]}]
+
+        power_types = driver_parameters.get_all_power_types_from_racks(
+            controllers=[reported, asked])
+
+        self.expectThat(call_clusters, MockCalledOnceWith(
+            DescribePowerTypes, controllers=[asked], ignore_errors=True))
+        self.expectThat(
+            {power_type["name"] for power_type in power_types},
+            Equals({reported_type["name"], asked_type["name"]}))
+
+    def test_does_not_call_clusters_when_all_have_reported(self):
+        registry = self.patch(
+            driver_parameters, "rack_capabilities",
+            RackCapabilitiesRegistry())
+        reported = Mock(system_id=factory.make_name("system_id"))
+        registry.update(
+            reported.system_id, [], [], [self.make_power_type()])
+        call_clusters = self.patch(driver_parameters, "call_clusters")
+        driver_parameters.get_all_power_types_from_racks(
+            controllers=[reported])
+        self.assertThat(call_clusters, MockNotCalled())
@@ -10,6 +10,7 @@ from collections import (
     Iterator,
 )
 
+from maasserver.clusterrpc import osystems as osystems_module
 from maasserver.clusterrpc.osystems import (
     gen_all_known_operating_systems,
     get_os_release_title,
@@ -21,10 +22,12 @@ from maasserver.enum import (
     PRESEED_TYPE,
 )
 from maasserver.rpc import getAllClients
+from maasserver.rpc.capabilities import RackCapabilitiesRegistry
 from maasserver.rpc.testing.fixtures import RunningClusterRPCFixture
 from maasserver.testing.architecture import make_usable_architecture
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
+from maastesting.matchers import MockNotCalled
 from metadataserver.models import NodeKey
 from provisioningserver.rpc.exceptions import NoSuchOperatingSystem
 from testtools.matchers import (
@@ -154,6 +157,47 @@ class TestGenAllKnownOperatingSystems(MAASServerTestCase):
             [{"name": "custom", "releases": releases_with_titles}],
             gen_all_known_operating_systems())
 
+    def test_uses_reported_capabilities_instead_of_asking(self):
+        factory.make_RackController()
+        factory.make_RackController()
+        self.useFixture(RunningClusterRPCFixture())
+        registry = self.patch(
+            osystems_module, "rack_capabilities", RackCapabilitiesRegistry())
+
+        reported, asked = getAllClients()
+        registry.update(
+            reported.ident, [{"name": reported.ident}], [], [])
+        callRemote_reported = self.patch(reported._conn, "callRemote")
+        callRemote_asked = self.patch(asked._conn, "callRemote")
+        callRemote_asked.return_value = succeed(
+            {"osystems": [{"name": asked.ident}]})
+
+        self.assertItemsEqual(
+            [{"name": reported.ident}, {"name": asked.ident}],
+            gen_all_known_operating_systems())
+        self.assertThat(callRemote_reported, MockNotCalled())
+
+    def test_does_not_modify_reported_capabilities(self):
+        rack = factory.make_RackController()
+        self.useFixture(RunningClusterRPCFixture())
+        registry = self.patch(
+            osystems_module, "rack_capabilities", RackCapabilitiesRegistry())
+        release = factory.make_name("release")
+        factory.make_BootResource(
+            rtype=BOOT_RESOURCE_TYPE.UPLOADED, name=release,
+            architecture=make_usable_architecture(self),
+            extra={"title": release.upper()})
+        osystems = [{
+            "name": "custom",
+            "releases": [{"name": release, "title": release}],
+        }]
+        registry.update(rack.system_id, osystems, [], [])
+
+        list(gen_all_known_operating_systems())
+        self.assertThat(
+            registry.get(rack.system_id).osystems[0]["releases"][0]["title"],
+            Equals(release))
+
 
 class TestGetOSReleaseTitle(MAASServerTestCase):
     """Tests for `get_os_release_title`."""
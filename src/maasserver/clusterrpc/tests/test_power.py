@@ -11,7 +11,10 @@ from unittest.mock import Mock
 from crochet import wait_for
 from maasserver.clusterrpc import power as power_module
 from maasserver.clusterrpc.power import (
+    batched_power_changes,
+    get_power_change_batch,
     pick_best_power_state,
+    power_change_many,
     power_cycle,
     power_driver_check,
     power_off_node,
@@ -21,15 +24,24 @@ from maasserver.clusterrpc.power import (
 )
 from maasserver.enum import POWER_STATE
 from maasserver.exceptions import PowerProblem
+from maasserver.models.node import Node
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import (
     MAASServerTestCase,
     MAASTransactionServerTestCase,
 )
-from maasserver.utils.orm import transactional
+from maasserver.utils.orm import (
+    post_commit,
+    post_commit_hooks,
+    transactional,
+)
 from maasserver.utils.threads import deferToDatabase
-from maastesting.matchers import MockCalledOnceWith
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
 from provisioningserver.rpc.cluster import (
+    PowerChangeMany,
     PowerCycle,
     PowerDriverCheck,
     PowerOff,
@@ -38,6 +50,14 @@ from provisioningserver.rpc.cluster import (
 )
 from provisioningserver.rpc.exceptions import PowerActionAlreadyInProgress
 from testtools import ExpectedException
+from testtools.matchers import (
+    Equals,
+    GreaterThan,
+    HasLength,
+    Is,
+    IsInstance,
+    LessThan,
+)
 from twisted.internet import reactor
 from twisted.internet.defer import (
     fail,
@@ -45,6 +65,10 @@ from twisted.internet.defer import (
     succeed,
 )
 from twisted.internet.task import deferLater
+from twisted.protocols.amp import (
+    MAX_VALUE_LENGTH,
+    UnhandledCommand,
+)
 
 
 wait_for_reactor = wait_for(30)  # 30 seconds.
@@ -239,3 +263,215 @@ class TestPowerQueryAll(MAASTransactionServerTestCase):
         self.assertEqual(POWER_STATE.UNKNOWN, power_state)
         self.assertItemsEqual([], success_racks)
         self.assertItemsEqual([rack_id], failed_racks)
+
+
+class TestPowerChangeMany(MAASServerTestCase):
+    """Tests for `power_change_many`."""
+
+    def test__changes_power_of_many_nodes(self):
+        nodes = [factory.make_Node() for _ in range(3)]
+        client = Mock()
+        client.return_value = succeed({"results": [
+            {"system_id": nodes[0].system_id},
+            {"system_id": nodes[1].system_id, "error": "Busy."},
+            {"system_id": nodes[2].system_id},
+        ]})
+
+        errors = wait_for_reactor(power_change_many)(client, "on", (
+            (node.system_id, node.hostname, node.get_effective_power_info())
+            for node in nodes))
+
+        self.assertThat(errors, Equals({
+            nodes[0].system_id: None,
+            nodes[1].system_id: "Busy.",
+            nodes[2].system_id: None,
+        }))
+        self.assertThat(client, MockCalledOnceWith(
+            PowerChangeMany, power_change="on", nodes=[
+                {
+                    "system_id": node.system_id,
+                    "hostname": node.hostname,
+                    "power_type": node.get_effective_power_info().power_type,
+                    "context": (
+                        node.get_effective_power_info().power_parameters),
+                }
+                for node in nodes
+            ]))
+
+
+class TestBatchedPowerChanges(MAASServerTestCase):
+    """Tests for `batched_power_changes`."""
+
+    def test__batches_within_context_only(self):
+        self.assertIsNone(get_power_change_batch())
+        with batched_power_changes():
+            batch = get_power_change_batch()
+            self.assertIsNotNone(batch)
+            with batched_power_changes():
+                self.assertIs(batch, get_power_change_batch())
+            self.assertIs(batch, get_power_change_batch())
+        self.assertIsNone(get_power_change_batch())
+
+    def test__sends_batch_after_commit_ahead_of_later_hooks(self):
+        with batched_power_changes():
+            with batched_power_changes():
+                node = factory.make_Node()
+                get_power_change_batch().add(
+                    node, power_on_node, node.get_effective_power_info(),
+                    post_commit())
+        self.assertThat(post_commit_hooks.hooks, HasLength(2))
+        post_commit_hooks.reset()
+
+    def test__leaves_no_hook_when_nothing_was_batched(self):
+        with batched_power_changes():
+            pass
+        self.assertThat(post_commit_hooks.hooks, HasLength(0))
+
+    def test__batches_only_power_changes(self):
+        with batched_power_changes():
+            batch = get_power_change_batch()
+            self.expectThat(batch.can_add(power_on_node), Is(True))
+            self.expectThat(batch.can_add(power_off_node), Is(True))
+            self.expectThat(batch.can_add(power_cycle), Is(True))
+            self.expectThat(batch.can_add(power_query), Is(False))
+
+
+class TestPowerChangeBatch(MAASServerTestCase):
+    """Tests for `PowerChangeBatch`."""
+
+    def setUp(self):
+        super(TestPowerChangeBatch, self).setUp()
+        self.patch(Node, "confirm_power_driver_operable").return_value = (
+            succeed(None))
+
+    def make_changes(
+            self, batch, power_method, count=3, power_parameters=None):
+        changes = []
+        for _ in range(count):
+            node = factory.make_Node()
+            power_info = node.get_effective_power_info()
+            if power_parameters is not None:
+                power_info = power_info._replace(
+                    power_parameters=power_parameters)
+            done = batch.add(node, power_method, power_info, Mock())
+            changes.append((node, done))
+        return changes
+
+    def make_client(self):
+        client = Mock()
+        client.ident = factory.make_name("system_id")
+        return client
+
+    def test__send_group_reports_errors_per_node(self):
+        with batched_power_changes():
+            batch = get_power_change_batch()
+            changes = self.make_changes(batch, power_on_node)
+        post_commit_hooks.reset()
+        client = self.make_client()
+        client.return_value = succeed({"results": [
+            {"system_id": changes[0][0].system_id},
+            {"system_id": changes[1][0].system_id, "error": "Busy."},
+        ]})
+
+        wait_for_reactor(batch._send_group)(client, batch.changes)
+
+        results = [[] for _ in changes]
+        for (_, done), result in zip(changes, results):
+            done.addBoth(result.append)
+        self.expectThat(results[0], Equals([None]))
+        self.expectThat(results[1][0].value, IsInstance(PowerProblem))
+        self.expectThat(str(results[1][0].value), Equals("Busy."))
+        # No result was given for the last node.
+        self.expectThat(results[2][0].value, IsInstance(PowerProblem))
+
+    def test__send_group_falls_back_when_command_is_unhandled(self):
+        with batched_power_changes():
+            batch = get_power_change_batch()
+            changes = self.make_changes(batch, power_off_node)
+        post_commit_hooks.reset()
+        client = self.make_client()
+
+        def call(command, **kwargs):
+            if command is PowerChangeMany:
+                return fail(UnhandledCommand())
+            else:
+                return succeed({})
+        client.side_effect = call
+
+        wait_for_reactor(batch._send_group)(client, batch.changes)
+
+        self.assertThat(
+            [call[0][0] for call in client.call_args_list],
+            Equals([PowerChangeMany] + [PowerOff] * len(changes)))
+        for _, done in changes:
+            self.assertThat(done.called, Is(True))
+
+    def test__send_group_falls_back_when_batch_fails(self):
+        with batched_power_changes():
+            batch = get_power_change_batch()
+            changes = self.make_changes(batch, power_on_node)
+        post_commit_hooks.reset()
+        client = self.make_client()
+
+        def call(command, **kwargs):
+            if command is PowerChangeMany:
+                return fail(ZeroDivisionError())
+            else:
+                return succeed({})
+        client.side_effect = call
+
+        wait_for_reactor(batch._send_group)(client, batch.changes)
+
+        self.assertThat(
+            [call[0][0] for call in client.call_args_list],
+            Equals([PowerChangeMany] + [PowerOn] * len(changes)))
+        for _, done in changes:
+            self.assertThat(done.called, Is(True))
+
+    def test__send_group_splits_batches_too_big_for_amp(self):
+        # Each node's power parameters compress to more than 16KiB, so the
+        # nodes together are well over the 64KiB that AMP allows per value.
+        power_parameters = {"data": factory.make_string(30000)}
+        with batched_power_changes():
+            batch = get_power_change_batch()
+            changes = self.make_changes(
+                batch, power_on_node, count=6,
+                power_parameters=power_parameters)
+        post_commit_hooks.reset()
+        client = self.make_client()
+
+        def call(command, power_change, nodes):
+            return succeed({"results": [
+                {"system_id": node["system_id"]} for node in nodes]})
+        client.side_effect = call
+
+        wait_for_reactor(batch._send_group)(client, batch.changes)
+
+        argument = dict(PowerChangeMany.arguments)[b"nodes"]
+        calls = [call[1]["nodes"] for call in client.call_args_list]
+        self.expectThat(len(calls), GreaterThan(1))
+        for nodes in calls:
+            self.expectThat(
+                len(argument.toStringProto(nodes, None)),
+                LessThan(MAX_VALUE_LENGTH + 1))
+        self.expectThat(
+            [node["system_id"] for nodes in calls for node in nodes],
+            Equals([node.system_id for node, _ in changes]))
+        results = [[] for _ in changes]
+        for (_, done), result in zip(changes, results):
+            done.addBoth(result.append)
+        self.assertThat(results, Equals([[None]] * len(changes)))
+
+    def test__send_skips_cancelled_changes(self):
+        with batched_power_changes():
+            batch = get_power_change_batch()
+            [(node, done)] = self.make_changes(batch, power_cycle, count=1)
+        post_commit_hooks.reset()
+        batch.changes[0].hook.called = True
+        get_routes = self.patch(batch, "_get_routes")
+
+        wait_for_reactor(batch.send)()
+
+        self.assertThat(get_routes, MockNotCalled())
+        self.assertThat(batch.changes, Equals([]))
+        self.assertThat(done.called, Is(False))
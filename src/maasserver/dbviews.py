@@ -37,66 +37,6 @@ def _register_view(view_name, view_sql):
         cursor.execute(view_sql)
 
 
-# Note that the `Discovery` model object is backed by this view. Any
-# changes made to this view should be reflected there.
-maasserver_discovery = dedent("""\
-    SELECT
-        DISTINCT ON (neigh.mac_address, neigh.ip)
-        neigh.id AS id, -- Django needs a primary key for the object.
-        -- The following will create a string like "<ip>,<mac>", convert
-        -- it to base64, and strip out any embedded linefeeds.
-        REPLACE(ENCODE(BYTEA(TRIM(TRAILING '/32' FROM neigh.ip::TEXT)
-            || ',' || neigh.mac_address::text), 'base64'), CHR(10), '')
-            AS discovery_id, -- This can be used as a surrogate key.
-        neigh.id AS neighbour_id,
-        neigh.ip AS ip,
-        neigh.mac_address AS mac_address,
-        neigh.vid AS vid,
-        neigh.created AS first_seen,
-        GREATEST(neigh.updated, mdns.updated) AS last_seen,
-        mdns.id AS mdns_id,
-        -- Trust reverse-DNS more than multicast DNS.
-        COALESCE(rdns.hostname, mdns.hostname) AS hostname,
-        node.id AS observer_id,
-        node.system_id AS observer_system_id,
-        node.hostname AS observer_hostname, -- This will be the rack hostname.
-        iface.id AS observer_interface_id,
-        iface.name AS observer_interface_name,
-        fabric.id AS fabric_id,
-        fabric.name AS fabric_name,
-        -- Note: This VLAN is associated with the physical interface, so the
-        -- actual observed VLAN is actually the 'vid' value on the 'fabric'.
-        -- (this may or may not have an associated VLAN interface on the rack;
-        -- we can sometimes see traffic from unconfigured VLANs.)
-        vlan.id AS vlan_id,
-        CASE
-            WHEN neigh.ip = vlan.external_dhcp THEN TRUE
-            ELSE FALSE
-        END AS is_external_dhcp,
-        subnet.id AS subnet_id,
-        subnet.cidr AS subnet_cidr,
-        MASKLEN(subnet.cidr) AS subnet_prefixlen
-    FROM maasserver_neighbour neigh
-    JOIN maasserver_interface iface ON neigh.interface_id = iface.id
-    JOIN maasserver_node node ON node.id = iface.node_id
-    JOIN maasserver_vlan vlan ON iface.vlan_id = vlan.id
-    JOIN maasserver_fabric fabric ON vlan.fabric_id = fabric.id
-    LEFT OUTER JOIN maasserver_mdns mdns ON mdns.ip = neigh.ip
-    LEFT OUTER JOIN maasserver_rdns rdns ON rdns.ip = neigh.ip
-    LEFT OUTER JOIN maasserver_subnet subnet ON (
-        vlan.id = subnet.vlan_id
-        -- This checks if the IP address is within a known subnet.
-        AND neigh.ip << subnet.cidr
-    )
-    ORDER BY
-        neigh.mac_address,
-        neigh.ip,
-        neigh.updated DESC, -- We want the most recently seen neighbour.
-        rdns.updated DESC, -- We want the most recently seen reverse DNS entry.
-        mdns.updated DESC, -- We want the most recently seen mDNS hostname.
-        subnet_prefixlen DESC -- We want the best-match CIDR.
-    """)
-
 # Pairs of IP addresses that can route between nodes. In MAAS all addresses in
 # a "space" are mutually routable, so this essentially means finding pairs of
 # IP addresses that are in subnets with the same space ID. Typically this view
@@ -317,7 +257,6 @@ maas_support__ssh_keys__by_user = dedent("""\
 
 # Dictionary of view_name: view_sql tuples which describe the database views.
 _ALL_VIEWS = {
-    "maasserver_discovery": maasserver_discovery,
     "maasserver_routable_pairs": maasserver_routable_pairs,
     "maas_support__node_overview": maas_support__node_overview,
     "maas_support__device_overview": maas_support__device_overview,
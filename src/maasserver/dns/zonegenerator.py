@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """DNS zone generator."""
@@ -9,6 +9,7 @@ __all__ = [
 
 
 import collections
+from functools import partial
 from itertools import chain
 import socket
 
@@ -32,6 +33,7 @@ from netaddr import (
 from provisioningserver.dns.zoneconfig import (
     DNSForwardZoneConfig,
     DNSReverseZoneConfig,
+    StreamingMapping,
 )
 
 
@@ -75,6 +77,31 @@ def get_hostname_ip_mapping(domain_or_subnet):
     return StaticIPAddress.objects.get_hostname_ip_mapping(domain_or_subnet)
 
 
+def iter_hostname_ip_mapping(domain_or_subnet, network=None):
+    """Generate `(hostname, info)` pairs for the allocated nodes in `domain`
+    or `subnet`, streamed from the database.  Info contains: ttl, ips,
+    system_id.
+
+    :param network: Optional; only for subnets. See
+        `StaticIPAddressManager.iter_hostname_ip_mapping`.
+    """
+    return StaticIPAddress.objects.iter_hostname_ip_mapping(
+        domain_or_subnet, network=network)
+
+
+def iter_forward_mapping(domain, network=None):
+    """Generate `(hostname, info)` pairs for the allocated nodes in `domain`,
+    with host names relative to the domain, streamed from the database.
+
+    :param network: Ignored; forward zones are not limited to a network.
+    """
+    # Separate_fqdn handles top-of-domain names needing to have the name '@',
+    # and we already know the domain name, so we discard that part of the
+    # return.
+    for hostname, info in iter_hostname_ip_mapping(domain):
+        yield separate_fqdn(hostname, domainname=domain.name)[0], info
+
+
 def get_hostname_dnsdata_mapping(domain):
     """Return a mapping {hostnames -> info} for the allocated nodes in
     `domain`.  Info contains: system_id and rrsets (which contain (ttl, rrtype,
@@ -186,8 +213,15 @@ class ZoneGenerator:
 
     @staticmethod
     def _get_mappings():
-        """Return a lazily evaluated mapping dict."""
-        return lazydict(get_hostname_ip_mapping)
+        """Return a lazily evaluated dict of streamed mappings.
+
+        Each is a `StreamingMapping` that reads from the database every time
+        a zone is written, so that the addresses of every node need never be
+        held in memory at once.
+        """
+        return lazydict(
+            lambda domain_or_subnet: StreamingMapping(
+                partial(iter_hostname_ip_mapping, domain_or_subnet)))
 
     @staticmethod
     def _get_rrset_mappings():
@@ -196,8 +230,7 @@ class ZoneGenerator:
 
     @staticmethod
     def _gen_forward_zones(
-            domains, serial, ns_host_name, mappings,
-            rrset_mappings, default_ttl):
+            domains, serial, ns_host_name, rrset_mappings, default_ttl):
         """Generator of forward zones, collated by domain name."""
         dns_ip_list = get_dns_server_addresses()
         domains = set(domains)
@@ -210,13 +243,9 @@ class ZoneGenerator:
         for domain in domains:
             # 1. node: ip mapping(domain)
             # Map all of the nodes in this domain, including the user-reserved
-            # ip addresses.  Separate_fqdn handles top-of-domain names needing
-            # to have the name '@', and we already know the domain name, so we
-            # discard that part of the return.
-            mapping = {
-                separate_fqdn(hostname, domainname=domain.name)[0]: info
-                for hostname, info in mappings[domain].items()
-            }
+            # ip addresses.  This is streamed from the database as the zone is
+            # written.
+            mapping = StreamingMapping(partial(iter_forward_mapping, domain))
             # 2a. Create non-address records.  Specifically ignore any CNAME
             # records that collide with addresses in mapping.
             other_mapping = rrset_mappings[domain]
@@ -289,7 +318,8 @@ class ZoneGenerator:
                     rfc2317_glue.setdefault(basenet, set()).add(network)
 
         # Since get_hostname_ip_mapping(Subnet) ignores Subnet.id, so we can
-        # just do it once and be happy.  LP#1600259
+        # just do it once and be happy.  LP#1600259  Each reverse zone streams
+        # only the nodes with addresses in its own network from it.
         if len(subnets):
             mappings['reverse'] = mappings[Subnet.objects.first()]
 
@@ -380,8 +410,8 @@ class ZoneGenerator:
         default_ttl = self.default_ttl
         return chain(
             self._gen_forward_zones(
-                self.domains, serial, ns_host_name, mappings,
-                rrset_mappings, default_ttl),
+                self.domains, serial, ns_host_name, rrset_mappings,
+                default_ttl),
             self._gen_reverse_zones(
                 self.subnets, serial, ns_host_name, mappings, default_ttl),
             )
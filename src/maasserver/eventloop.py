@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Event-loop support for the MAAS Region Controller.
@@ -46,7 +46,10 @@ import os
 import socket
 from socket import gethostname
 
-from maasserver import is_master_process
+from maasserver import (
+    is_master_process,
+    is_worker_process,
+)
 from maasserver.utils.orm import disable_all_database_connections
 from provisioningserver.utils.twisted import asynchronous
 from twisted.application.service import MultiService
@@ -111,8 +114,18 @@ def make_ImportResourcesProgressService():
 
 
 def make_PostgresListenerService():
-    from maasserver.listener import PostgresListenerService
-    return PostgresListenerService()
+    from maasserver import listener
+    if is_worker_process() and not is_master_process():
+        # Notifications are relayed by the master on this host, so that
+        # there's only one listening database connection per host.
+        return listener.PostgresListenerClientService()
+    else:
+        return listener.PostgresListenerService()
+
+
+def make_PostgresListenerRelayService(postgresListener):
+    from maasserver.listener import PostgresListenerRelayService
+    return PostgresListenerRelayService(postgresListener)
 
 
 def make_RackControllerService(postgresListener, advertisingService):
@@ -151,6 +164,21 @@ def make_ReverseDNSService(postgresListener):
     return ReverseDNSService(postgresListener)
 
 
+def make_EventWatcherService(postgresListener):
+    from maasserver.regiondservices.event_watcher import EventWatcherService
+    return EventWatcherService(postgresListener)
+
+
+def make_ConfigCacheService(postgresListener):
+    from maasserver.regiondservices.config_cache import ConfigCacheService
+    return ConfigCacheService(postgresListener)
+
+
+def make_PreseedCacheService(postgresListener):
+    from maasserver.regiondservices.preseed_cache import PreseedCacheService
+    return PreseedCacheService(postgresListener)
+
+
 def make_NetworkTimeProtocolService():
     from maasserver.regiondservices import ntp
     return ntp.RegionNetworkTimeProtocolService(reactor)
@@ -248,6 +276,11 @@ class RegionEventLoop:
             "factory": make_PostgresListenerService,
             "requires": [],
         },
+        "postgres-listener-relay": {
+            "only_on_master": True,
+            "factory": make_PostgresListenerRelayService,
+            "requires": ["postgres-listener"],
+        },
         "web": {
             "only_on_master": False,
             "factory": make_WebApplicationService,
@@ -278,6 +311,21 @@ class RegionEventLoop:
             "factory": make_ReverseDNSService,
             "requires": ["postgres-listener"],
         },
+        "event-watcher": {
+            "only_on_master": False,
+            "factory": make_EventWatcherService,
+            "requires": ["postgres-listener"],
+        },
+        "config-cache": {
+            "only_on_master": False,
+            "factory": make_ConfigCacheService,
+            "requires": ["postgres-listener"],
+        },
+        "preseed-cache": {
+            "only_on_master": False,
+            "factory": make_PreseedCacheService,
+            "requires": ["postgres-listener"],
+        },
         "rack-controller": {
             "only_on_master": False,
             "factory": make_RackControllerService,
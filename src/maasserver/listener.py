@@ -1,25 +1,34 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Listens for NOTIFY events from the postgres database."""
 
 __all__ = [
+    "PostgresListenerClientService",
     "PostgresListenerNotifyError",
+    "PostgresListenerRelayService",
     "PostgresListenerService",
+    "get_relay_socket_path",
     ]
 
 from collections import defaultdict
 from contextlib import closing
 from errno import ENOENT
+import os
 
 from django.db import connections
 from django.db.utils import load_backend
+from provisioningserver.path import get_data_path
 from provisioningserver.utils.enum import map_enum
 from provisioningserver.utils.twisted import (
     callOut,
     suppress,
     synchronous,
 )
+from twisted.application.internet import (
+    ClientService,
+    StreamServerEndpointService,
+)
 from twisted.application.service import Service
 from twisted.internet import (
     defer,
@@ -33,9 +42,15 @@ from twisted.internet.defer import (
     Deferred,
     succeed,
 )
+from twisted.internet.endpoints import (
+    UNIXClientEndpoint,
+    UNIXServerEndpoint,
+)
+from twisted.internet.protocol import Factory
 from twisted.internet.task import deferLater
 from twisted.internet.threads import deferToThread
 from twisted.logger import Logger
+from twisted.protocols import amp
 from twisted.python.failure import Failure
 from zope.interface import implementer
 
@@ -88,6 +103,7 @@ class PostgresListenerService(Service, object):
     def __init__(self, alias="default"):
         self.alias = alias
         self.listeners = defaultdict(list)
+        self.relays = defaultdict(set)
         self.autoReconnect = False
         self.connection = None
         self.connectionFileno = None
@@ -160,21 +176,21 @@ class PostgresListenerService(Service, object):
                 for notify in notifies:
                     if self.isSystemChannel(notify.channel):
                         # System level message; pass it to the registered
-                        # handler immediately.
-                        if notify.channel in self.listeners:
+                        # handler, and to any relays, immediately.
+                        handlers = self.listeners.get(notify.channel, [])
+                        relays = self.relays.get(notify.channel, ())
+                        if len(handlers) == 0 and len(relays) == 0:
                             # Be defensive in that if a handler does not exist
                             # for this channel then the channel should be
                             # unregisted and removed from listeners.
-                            if len(self.listeners[notify.channel]) > 0:
-                                handler = self.listeners[notify.channel][0]
-                                handler(notify.channel, notify.payload)
-                            else:
-                                self.unregisterChannel(notify.channel)
-                                del self.listeners[notify.channel]
-                        else:
-                            # Unregister the channel since no listener is
-                            # registered for this channel.
                             self.unregisterChannel(notify.channel)
+                            self.listeners.pop(notify.channel, None)
+                        else:
+                            if len(handlers) > 0:
+                                handler = handlers[0]
+                                handler(notify.channel, notify.payload)
+                            for relay in list(relays):
+                                relay(notify.channel, None, notify.payload)
                     else:
                         # Place non-system messages into the queue to be
                         # processed.
@@ -243,8 +259,42 @@ class PostgresListenerService(Service, object):
             raise PostgresListenerUnregistrationError(
                 "Handler is not registered on that channel '%s'." % channel)
         if self.registeredChannels and self.connection and len(handlers) == 0:
-            # Channels have already been registered. Unregister the channel.
-            self.unregisterChannel(channel)
+            if len(self.relays.get(channel, ())) == 0:
+                # Channels have already been registered. Unregister the
+                # channel, unless notifications are still being relayed.
+                self.unregisterChannel(channel)
+
+    def relay(self, channel, relay):
+        """Relay notifications from a channel to another process.
+
+        Unlike a handler, `relay` is called with the channel, the action --
+        or `None` for a system channel -- and the payload. Any number of
+        relays can be added to a channel, including a system channel.
+        """
+        relays = self.relays[channel]
+        handlers = self.listeners.get(channel, ())
+        if (self.registeredChannels and self.connection and
+                len(relays) == 0 and len(handlers) == 0):
+            # Channels have already been registered. Register the new
+            # channel on the already existing connection.
+            self.registerChannel(channel)
+        relays.add(relay)
+
+    def unrelay(self, channel, relay):
+        """Stop relaying notifications from a channel.
+
+        `relay` needs to be same callable that was passed to `relay`.
+        """
+        relays = self.relays.get(channel, set())
+        if relay not in relays:
+            raise PostgresListenerUnregistrationError(
+                "Relay is not registered on that channel '%s'." % channel)
+        relays.remove(relay)
+        if len(relays) == 0:
+            del self.relays[channel]
+            if (self.registeredChannels and self.connection and
+                    len(self.listeners.get(channel, ())) == 0):
+                self.unregisterChannel(channel)
 
     @synchronous
     def createConnection(self):
@@ -375,7 +425,7 @@ class PostgresListenerService(Service, object):
 
     def registerChannels(self):
         """Register the all the channels."""
-        for channel in self.listeners.keys():
+        for channel in set(self.listeners).union(self.relays):
             self.registerChannel(channel)
         self.registeredChannels = True
 
@@ -386,7 +436,7 @@ class PostgresListenerService(Service, object):
             {action} is not in `ACTIONS`.
         """
         channel, action = channel.split('_', 1)
-        if channel not in self.listeners:
+        if channel not in self.listeners and channel not in self.relays:
             raise PostgresListenerNotifyError(
                 "%s is not a registered channel." % channel)
         if action not in map_enum(ACTIONS).values():
@@ -428,7 +478,7 @@ class PostgresListenerService(Service, object):
                 "Failed to convert channel {channel!r}.", channel=channel)
         else:
             defers = []
-            handlers = self.listeners[channel]
+            handlers = self.listeners.get(channel, [])
             # XXX: There could be an arbitrary number of listeners. Should we
             # limit concurrency here? Perhaps even do one at a time.
             for handler in handlers:
@@ -437,4 +487,250 @@ class PostgresListenerService(Service, object):
                     "Failure while handling notification to {channel!r}: "
                     "{payload!r}", failure, channel=channel, payload=payload))
                 defers.append(d)
+            for relay in list(self.relays.get(channel, ())):
+                d = defer.maybeDeferred(relay, channel, action, payload)
+                d.addErrback(lambda failure: self.log.failure(
+                    "Failure while relaying notification to {channel!r}: "
+                    "{payload!r}", failure, channel=channel, payload=payload))
+                defers.append(d)
             return defer.DeferredList(defers)
+
+
+def get_relay_socket_path():
+    """Return the path to the socket over which notifications are relayed."""
+    return os.path.join(
+        get_data_path("/var/lib/maas"), "regiond-listener.sock")
+
+
+class SubscribeToChannel(amp.Command):
+    """Ask the master regiond to relay notifications from a channel."""
+
+    arguments = [
+        (b"channel", amp.Unicode()),
+    ]
+    response = []
+    errors = []
+
+
+class UnsubscribeFromChannel(amp.Command):
+    """Ask the master regiond to stop relaying notifications."""
+
+    arguments = [
+        (b"channel", amp.Unicode()),
+    ]
+    response = []
+    errors = []
+
+
+class RelayNotification(amp.Command):
+    """A notification, relayed from the master regiond to a worker.
+
+    For a system channel `action` is omitted.
+    """
+
+    arguments = [
+        (b"channel", amp.Unicode()),
+        (b"action", amp.Unicode(optional=True)),
+        (b"payload", amp.Unicode()),
+    ]
+    requiresAnswer = False
+
+
+class PostgresListenerRelayProtocol(amp.AMP):
+    """The master's end of a connection from a worker regiond.
+
+    :ivar channels: The channels this worker has subscribed to.
+    """
+
+    def __init__(self, listener):
+        super(PostgresListenerRelayProtocol, self).__init__()
+        self.listener = listener
+        self.channels = set()
+
+    @SubscribeToChannel.responder
+    def subscribe(self, channel):
+        if channel not in self.channels:
+            self.listener.relay(channel, self.relayNotification)
+            self.channels.add(channel)
+        return {}
+
+    @UnsubscribeFromChannel.responder
+    def unsubscribe(self, channel):
+        if channel in self.channels:
+            self.channels.discard(channel)
+            self.listener.unrelay(channel, self.relayNotification)
+        return {}
+
+    def relayNotification(self, channel, action, payload):
+        """Relay a notification to the worker; called by the listener."""
+        self.callRemote(
+            RelayNotification, channel=channel, action=action,
+            payload=payload)
+
+    def connectionLost(self, reason):
+        for channel in self.channels:
+            self.listener.unrelay(channel, self.relayNotification)
+        self.channels.clear()
+        super(PostgresListenerRelayProtocol, self).connectionLost(reason)
+
+
+class PostgresListenerRelayFactory(Factory):
+    """Build `PostgresListenerRelayProtocol` instances."""
+
+    def __init__(self, listener):
+        super(PostgresListenerRelayFactory, self).__init__()
+        self.listener = listener
+
+    def buildProtocol(self, addr):
+        return PostgresListenerRelayProtocol(self.listener)
+
+
+class PostgresListenerRelayService(StreamServerEndpointService):
+    """Relay notifications to the other regiond processes on this host.
+
+    This runs in the master regiond process, alongside the one
+    `PostgresListenerService` that's connected to the database. Workers
+    connect to it with a `PostgresListenerClientService` and subscribe to
+    the channels they're interested in. Hence the number of listening
+    database connections does not grow with the number of workers.
+    """
+
+    def __init__(self, postgresListener, endpoint=None):
+        if endpoint is None:
+            endpoint = UNIXServerEndpoint(
+                reactor, get_relay_socket_path(), wantPID=True)
+        super(PostgresListenerRelayService, self).__init__(
+            endpoint, PostgresListenerRelayFactory(postgresListener))
+
+
+class PostgresListenerClientProtocol(amp.AMP):
+    """A worker's end of a connection to the master regiond."""
+
+    def __init__(self, service):
+        super(PostgresListenerClientProtocol, self).__init__()
+        self.service = service
+
+    def connectionMade(self):
+        super(PostgresListenerClientProtocol, self).connectionMade()
+        self.service.connected(self)
+
+    def connectionLost(self, reason):
+        self.service.disconnected(self)
+        super(PostgresListenerClientProtocol, self).connectionLost(reason)
+
+    @RelayNotification.responder
+    def relayNotification(self, channel, payload, action=None):
+        self.service.handleNotify(channel, action, payload)
+        return {}
+
+
+class PostgresListenerClientFactory(Factory):
+    """Build `PostgresListenerClientProtocol` instances."""
+
+    def __init__(self, service):
+        super(PostgresListenerClientFactory, self).__init__()
+        self.service = service
+
+    def buildProtocol(self, addr):
+        return PostgresListenerClientProtocol(self.service)
+
+
+class PostgresListenerClientService(ClientService):
+    """Receive notifications relayed by the master regiond on this host.
+
+    This offers the same `register` and `unregister` methods as
+    `PostgresListenerService`, and handlers are called in the same way, so
+    it can be used in its place in worker regiond processes. Subscriptions
+    are renewed each time the connection to the master is made.
+    """
+
+    def __init__(self, endpoint=None, clock=reactor):
+        if endpoint is None:
+            endpoint = UNIXClientEndpoint(clock, get_relay_socket_path())
+        super(PostgresListenerClientService, self).__init__(
+            endpoint, PostgresListenerClientFactory(self), clock=clock)
+        self.listeners = defaultdict(list)
+        self.protocol = None
+        self.log = Logger(__name__, self)
+
+    def isSystemChannel(self, channel):
+        """Return True if channel is a system channel."""
+        return channel.startswith("sys_")
+
+    def stopService(self):
+        """Disconnect from the master."""
+        self.protocol = None
+        return super(PostgresListenerClientService, self).stopService()
+
+    def connected(self, protocol):
+        """Subscribe to every channel with handlers on a new connection."""
+        self.protocol = protocol
+        for channel, handlers in self.listeners.items():
+            if len(handlers) > 0:
+                self.subscribe(channel)
+
+    def disconnected(self, protocol):
+        """Forget the connection; `ClientService` will make another."""
+        if self.protocol is protocol:
+            self.protocol = None
+
+    def subscribe(self, channel):
+        """Ask the master to relay `channel`, if connected."""
+        if self.protocol is not None:
+            d = self.protocol.callRemote(SubscribeToChannel, channel=channel)
+            d.addErrback(lambda failure: self.log.failure(
+                "Failed to subscribe to {channel!r}.", failure,
+                channel=channel))
+
+    def unsubscribe(self, channel):
+        """Ask the master to stop relaying `channel`, if connected."""
+        if self.protocol is not None:
+            d = self.protocol.callRemote(
+                UnsubscribeFromChannel, channel=channel)
+            d.addErrback(lambda failure: self.log.failure(
+                "Failed to unsubscribe from {channel!r}.", failure,
+                channel=channel))
+
+    def register(self, channel, handler):
+        """Register listening for notifications from a channel.
+
+        See `PostgresListenerService.register`.
+        """
+        handlers = self.listeners[channel]
+        if self.isSystemChannel(channel) and len(handlers) > 0:
+            raise PostgresListenerRegistrationError(
+                "System channel '%s' has already been registered." % channel)
+        handlers.append(handler)
+        if len(handlers) == 1:
+            self.subscribe(channel)
+
+    def unregister(self, channel, handler):
+        """Unregister listening for notifications from a channel.
+
+        See `PostgresListenerService.unregister`.
+        """
+        if channel not in self.listeners:
+            raise PostgresListenerUnregistrationError(
+                "Channel '%s' is not registered with the listener." % channel)
+        handlers = self.listeners[channel]
+        if handler in handlers:
+            handlers.remove(handler)
+        else:
+            raise PostgresListenerUnregistrationError(
+                "Handler is not registered on that channel '%s'." % channel)
+        if len(handlers) == 0:
+            self.unsubscribe(channel)
+
+    def handleNotify(self, channel, action, payload):
+        """Pass a relayed notification to the registered handlers."""
+        handlers = self.listeners.get(channel, [])
+        if self.isSystemChannel(channel):
+            if len(handlers) > 0:
+                handler = handlers[0]
+                handler(channel, payload)
+        else:
+            for handler in handlers:
+                d = defer.maybeDeferred(handler, action, payload)
+                d.addErrback(lambda failure: self.log.failure(
+                    "Failure while handling notification to {channel!r}: "
+                    "{payload!r}", failure, channel=channel, payload=payload))
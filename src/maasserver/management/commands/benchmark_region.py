@@ -0,0 +1,91 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Django command: benchmark the region's hot paths."""
+
+__all__ = [
+    "Command",
+]
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Measure wall time, SQL queries and peak memory of the region's "
+        "hot paths, writing the results as JSON. Optionally populate the "
+        "database with scaled sample data first.")
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            '--sample-data', action='store_true', default=False,
+            help=(
+                "Populate the database with sample data first. The "
+                "database must be empty."))
+        parser.add_argument(
+            '--machines', type=int, default=0,
+            help=(
+                "Add this many machines to the database before running the "
+                "benchmarks, e.g. 1000, 10000, or 50000."))
+        parser.add_argument(
+            '--benchmark', dest='benchmarks', action='append', default=None,
+            metavar='NAME', help=(
+                "Run only this benchmark. Can be given more than once. "
+                "Use --list to see the available benchmarks."))
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help="Run each benchmark this many times. Default: 3.")
+        parser.add_argument(
+            '--no-config-cache', dest='cache_config', action='store_false',
+            default=True, help=(
+                "Don't load the configuration cache before each run. "
+                "Compare with the default to see the queries it saves."))
+        parser.add_argument(
+            '--output', default=None, metavar='FILE',
+            help="Write the JSON results here instead of to stdout.")
+        parser.add_argument(
+            '--list', action='store_true', default=False,
+            help="List the available benchmarks and exit.")
+
+    def handle(self, *args, **options):
+        try:
+            from maasserver.testing import (
+                benchmark,
+                sampledata,
+            )
+        except ImportError:
+            print(
+                "Benchmarking is available only in development "
+                "and test environments.", file=self.stderr)
+            raise SystemExit(1)
+
+        if options['list']:
+            for name in benchmark.BENCHMARKS:
+                self.stdout.write(name)
+            return
+
+        names = options['benchmarks']
+        if names is not None:
+            unknown = set(names).difference(benchmark.BENCHMARKS)
+            if len(unknown) > 0:
+                raise CommandError(
+                    "Unknown benchmark(s): %s" % ", ".join(sorted(unknown)))
+
+        if options['sample_data']:
+            sampledata.populate()
+        if options['machines'] > 0:
+            sampledata.populate_machines(options['machines'])
+
+        results = benchmark.run_benchmarks(
+            names, repeat=options['repeat'],
+            cache_config=options['cache_config'])
+        if options['output'] is None:
+            benchmark.write_results(results, self.stdout)
+        else:
+            with open(options['output'], 'w') as stream:
+                benchmark.write_results(results, stream)
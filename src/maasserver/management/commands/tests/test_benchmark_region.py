@@ -0,0 +1,89 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Test the `benchmark_region` management command."""
+
+__all__ = []
+
+from io import StringIO
+import json
+import os
+
+from django.core.management import (
+    call_command,
+    CommandError,
+)
+from maasserver.testing import (
+    benchmark,
+    sampledata,
+)
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
+from maastesting.testcase import MAASTestCase
+from testtools.matchers import Equals
+
+
+class TestBenchmarkRegion(MAASTestCase):
+
+    def setUp(self):
+        super(TestBenchmarkRegion, self).setUp()
+        self.patch(sampledata, "populate")
+        self.patch(sampledata, "populate_machines")
+        self.run_benchmarks = self.patch(benchmark, "run_benchmarks")
+        self.run_benchmarks.return_value = {"benchmarks": {}}
+
+    def test__runs_benchmarks_and_writes_json(self):
+        stdout = StringIO()
+        call_command("benchmark_region", stdout=stdout)
+        self.assertThat(
+            self.run_benchmarks, MockCalledOnceWith(
+                None, repeat=3, cache_config=True))
+        self.assertThat(
+            json.loads(stdout.getvalue()), Equals({"benchmarks": {}}))
+        self.assertThat(sampledata.populate, MockNotCalled())
+        self.assertThat(sampledata.populate_machines, MockNotCalled())
+
+    def test__writes_json_to_file(self):
+        output = os.path.join(self.make_dir(), "results.json")
+        call_command("benchmark_region", output=output)
+        with open(output, "r") as stream:
+            self.assertThat(json.load(stream), Equals({"benchmarks": {}}))
+
+    def test__populates_sample_data_and_machines(self):
+        call_command(
+            "benchmark_region", sample_data=True, machines=1000,
+            stdout=StringIO())
+        self.assertThat(sampledata.populate, MockCalledOnceWith())
+        self.assertThat(
+            sampledata.populate_machines, MockCalledOnceWith(1000))
+
+    def test__runs_selected_benchmarks(self):
+        name = list(benchmark.BENCHMARKS)[0]
+        call_command(
+            "benchmark_region", benchmarks=[name], repeat=5,
+            stdout=StringIO())
+        self.assertThat(
+            self.run_benchmarks, MockCalledOnceWith(
+                [name], repeat=5, cache_config=True))
+
+    def test__runs_benchmarks_without_config_cache(self):
+        call_command(
+            "benchmark_region", cache_config=False, stdout=StringIO())
+        self.assertThat(
+            self.run_benchmarks, MockCalledOnceWith(
+                None, repeat=3, cache_config=False))
+
+    def test__rejects_unknown_benchmarks(self):
+        self.assertRaises(
+            CommandError, call_command, "benchmark_region",
+            benchmarks=["no-such-benchmark"], stdout=StringIO())
+
+    def test__lists_benchmarks(self):
+        stdout = StringIO()
+        call_command("benchmark_region", list=True, stdout=stdout)
+        self.assertThat(
+            stdout.getvalue().splitlines(),
+            Equals(list(benchmark.BENCHMARKS)))
+        self.assertThat(self.run_benchmarks, MockNotCalled())
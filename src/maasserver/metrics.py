@@ -0,0 +1,329 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Query accounting for the region.
+
+Each HTTP request, WebSocket request, and RPC call made to the region is
+accounted for: the number of SQL queries it issued, the time spent waiting
+for the database, the number of times its transaction was retried, and its
+wall time. These are recorded in histograms that can be scraped by
+Prometheus from ``/MAAS/metrics``.
+
+Accounting follows the work into database threads by way of Twisted's
+`context`, which `ThreadPool` propagates into each task it runs.
+
+The database thread-pool's scheduler also reports, per priority class, how
+many calls are queued or running and how long each call waited for a thread;
+see `maasserver.utils.threads`.
+"""
+
+__all__ = [
+    "DATABASE_POOL_METRICS",
+    "Gauge",
+    "get_query_accounting",
+    "install_query_accounting",
+    "METRICS",
+    "MetricsResource",
+    "QueryAccounting",
+    "record_retry",
+    "UNKNOWN_NAME",
+]
+
+from bisect import bisect_left
+from functools import wraps
+import threading
+from time import monotonic
+
+from twisted.python import context
+from twisted.web.resource import Resource
+
+
+class Histogram:
+    """A labelled histogram, rendered in Prometheus' text format.
+
+    :ivar name: The name of the metric.
+    :ivar documentation: A one-line description of the metric.
+    :ivar labelnames: The names of the labels for each observation.
+    :ivar buckets: The upper bounds of the buckets, in ascending order. An
+        implicit ``+Inf`` bucket is always added.
+    """
+
+    def __init__(self, name, documentation, labelnames, buckets):
+        super(Histogram, self).__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Discard all observations."""
+        with self.lock:
+            self.series = {}
+
+    def observe(self, value, *labels):
+        """Record `value` against the given label values."""
+        assert len(labels) == len(self.labelnames), (
+            "Expected labels %r, got %r" % (self.labelnames, labels))
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            try:
+                counts, total = self.series[labels]
+            except KeyError:
+                counts, total = [0] * (len(self.buckets) + 1), 0
+            counts[index] += 1
+            self.series[labels] = counts, total + value
+
+    def get(self, *labels):
+        """Return the bucket counts and sum recorded for `labels`.
+
+        :return: A ``(counts, sum)`` tuple, where `counts` is a list of
+            non-cumulative counts, one per bucket plus one for ``+Inf``, or
+            `None` if nothing has been observed for these labels.
+        """
+        with self.lock:
+            series = self.series.get(labels)
+        if series is None:
+            return None
+        else:
+            counts, total = series
+            return list(counts), total
+
+    def render(self):
+        """Generate lines in the Prometheus text exposition format."""
+        with self.lock:
+            series = sorted(
+                (labels, list(counts), total)
+                for labels, (counts, total) in self.series.items())
+        yield "# HELP %s %s" % (self.name, self.documentation)
+        yield "# TYPE %s histogram" % self.name
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, counts, total in series:
+            pairs = [
+                '%s="%s"' % (labelname, _escape_label_value(value))
+                for labelname, value in zip(self.labelnames, labels)
+            ]
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield "%s_bucket{%s} %d" % (
+                    self.name, ",".join(pairs + ['le="%s"' % bound]),
+                    cumulative)
+            yield "%s_sum{%s} %s" % (
+                self.name, ",".join(pairs), _format_value(total))
+            yield "%s_count{%s} %d" % (
+                self.name, ",".join(pairs), cumulative)
+
+
+class Gauge:
+    """A labelled gauge, rendered in Prometheus' text format.
+
+    :ivar name: The name of the metric.
+    :ivar documentation: A one-line description of the metric.
+    :ivar labelnames: The names of the labels for each value.
+    """
+
+    def __init__(self, name, documentation, labelnames):
+        super(Gauge, self).__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Discard all values."""
+        with self.lock:
+            self.series = {}
+
+    def set(self, value, *labels):
+        """Set the value for the given label values."""
+        assert len(labels) == len(self.labelnames), (
+            "Expected labels %r, got %r" % (self.labelnames, labels))
+        with self.lock:
+            self.series[labels] = value
+
+    def get(self, *labels):
+        """Return the value for `labels`, or `None` if it was never set."""
+        with self.lock:
+            return self.series.get(labels)
+
+    def render(self):
+        """Generate lines in the Prometheus text exposition format."""
+        with self.lock:
+            series = sorted(self.series.items())
+        yield "# HELP %s %s" % (self.name, self.documentation)
+        yield "# TYPE %s gauge" % self.name
+        for labels, value in series:
+            pairs = [
+                '%s="%s"' % (labelname, _escape_label_value(label))
+                for labelname, label in zip(self.labelnames, labels)
+            ]
+            yield "%s{%s} %s" % (
+                self.name, ",".join(pairs), _format_value(value))
+
+
+def _format_value(value):
+    return repr(float(value))
+
+
+def _escape_label_value(value):
+    return (
+        str(value).replace("\\", r"\\").replace(
+            "\n", r"\n").replace('"', r'\"'))
+
+
+_labelnames = ("kind", "name")
+
+_query_buckets = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+_seconds_buckets = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_retry_buckets = (0, 1, 2, 3, 5, 10)
+
+# The region's metrics, in the order they're rendered.
+METRICS = (
+    Histogram(
+        "maas_region_queries", "SQL queries issued per request.",
+        _labelnames, _query_buckets),
+    Histogram(
+        "maas_region_database_seconds",
+        "Time spent executing SQL queries per request.",
+        _labelnames, _seconds_buckets),
+    Histogram(
+        "maas_region_transaction_retries",
+        "Transaction retries per request.",
+        _labelnames, _retry_buckets),
+    Histogram(
+        "maas_region_request_seconds", "Wall time per request.",
+        _labelnames, _seconds_buckets),
+)
+
+# The database thread-pool's metrics, in the order they're rendered. These
+# are updated by `DatabaseScheduler` in `maasserver.utils.threads`.
+DATABASE_POOL_METRICS = (
+    Gauge(
+        "maas_region_database_pool_queued",
+        "Calls waiting for a database thread.", ("priority",)),
+    Gauge(
+        "maas_region_database_pool_running",
+        "Calls running in a database thread.", ("priority",)),
+    Histogram(
+        "maas_region_database_pool_wait_seconds",
+        "Time calls spent waiting for a database thread.", ("priority",),
+        _seconds_buckets),
+)
+
+
+# The name recorded for requests whose view, method, or command is not one
+# the region knows. Names come from clients, so recording them verbatim
+# would let any client create an unbounded number of series.
+UNKNOWN_NAME = "unknown"
+
+
+class QueryAccounting:
+    """Accounts for the database work done on behalf of a single request.
+
+    Use `call` to run a function with this accounting in effect. Database
+    queries issued from that function, and from database threads it defers
+    to, are counted towards it; see `install_query_accounting`.
+
+    :ivar queries: The number of SQL queries issued.
+    :ivar database_time: The time, in seconds, spent executing them.
+    :ivar retries: The number of times a transaction was retried.
+    :ivar started: When this accounting was created, from `monotonic`.
+    """
+
+    def __init__(self):
+        super(QueryAccounting, self).__init__()
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.database_time = 0.0
+        self.retries = 0
+        self.started = monotonic()
+
+    def call(self, func, *args, **kwargs):
+        """Call `func` with this accounting in effect."""
+        return context.call({QueryAccounting: self}, func, *args, **kwargs)
+
+    def addQuery(self, elapsed):
+        """Account for a query that took `elapsed` seconds."""
+        with self.lock:
+            self.queries += 1
+            self.database_time += elapsed
+
+    def addRetry(self):
+        """Account for a transaction retry."""
+        with self.lock:
+            self.retries += 1
+
+    def record(self, kind, name):
+        """Record this accounting into `METRICS`.
+
+        :param kind: The kind of request, e.g. "http", "websocket", "rpc".
+        :param name: The name of the request's endpoint, view, method, or
+            RPC command. This must be one the region defines, or
+            `UNKNOWN_NAME`, never an arbitrary name sent by a client.
+        """
+        elapsed = monotonic() - self.started
+        queries, retries, database_time = (
+            self.queries, self.retries, self.database_time)
+        for histogram, value in zip(
+                METRICS, (queries, database_time, retries, elapsed)):
+            histogram.observe(value, kind, name)
+
+
+def get_query_accounting():
+    """Return the `QueryAccounting` in effect, or `None`."""
+    return context.get(QueryAccounting)
+
+
+def record_retry():
+    """Account for a transaction retry, if accounting is in effect."""
+    accounting = context.get(QueryAccounting)
+    if accounting is not None:
+        accounting.addRetry()
+
+
+def _accounted(method):
+    """Decorate a cursor method so its queries are accounted for."""
+    @wraps(method)
+    def execute(*args, **kwargs):
+        accounting = context.get(QueryAccounting)
+        if accounting is None:
+            return method(*args, **kwargs)
+        started = monotonic()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            accounting.addQuery(monotonic() - started)
+    execute.accounted = True
+    return execute
+
+
+def install_query_accounting():
+    """Account for every query issued through Django's cursors.
+
+    Django's debug cursor up-calls to the plain `CursorWrapper` so queries
+    are counted once whether or not ``DEBUG`` is set. This is idempotent.
+    """
+    from django.db.backends.utils import CursorWrapper
+    for name in ("execute", "executemany"):
+        method = getattr(CursorWrapper, name)
+        if not getattr(method, "accounted", False):
+            setattr(CursorWrapper, name, _accounted(method))
+
+
+class MetricsResource(Resource):
+    """Render all metrics in Prometheus' text exposition format."""
+
+    isLeaf = True
+
+    def render_GET(self, request):
+        request.setHeader(
+            b"Content-Type", b"text/plain; version=0.0.4; charset=utf-8")
+        lines = [
+            line for metric in METRICS + DATABASE_POOL_METRICS
+            for line in metric.render()
+        ]
+        return ("\n".join(lines) + "\n").encode("utf-8")
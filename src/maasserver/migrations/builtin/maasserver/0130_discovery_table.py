@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Replace the `maasserver_discovery` view with a table of the same name and
+# shape. From now on it's kept up to date by triggers installed by
+# `maasserver.triggers.system`; here it's populated using the query the view
+# was defined with.
+create_discovery_table = """\
+    DROP VIEW IF EXISTS maasserver_discovery;
+    CREATE TABLE maasserver_discovery (
+        id integer PRIMARY KEY,
+        discovery_id varchar(256) UNIQUE,
+        neighbour_id integer NOT NULL,
+        ip inet,
+        mac_address macaddr,
+        vid integer,
+        first_seen timestamp with time zone NOT NULL,
+        last_seen timestamp with time zone NOT NULL,
+        mdns_id integer,
+        hostname varchar(256),
+        observer_id integer NOT NULL,
+        observer_system_id varchar(41) NOT NULL,
+        observer_hostname varchar(256),
+        observer_interface_id integer NOT NULL,
+        observer_interface_name varchar(255) NOT NULL,
+        fabric_id integer NOT NULL,
+        fabric_name varchar(256),
+        vlan_id integer NOT NULL,
+        is_external_dhcp boolean,
+        subnet_id integer,
+        subnet_cidr cidr
+    );
+    CREATE INDEX maasserver_discovery__mac_address_ip
+        ON maasserver_discovery(mac_address, ip);
+    CREATE INDEX maasserver_discovery__ip
+        ON maasserver_discovery(ip);
+    CREATE INDEX maasserver_discovery__last_seen
+        ON maasserver_discovery(last_seen);
+    CREATE INDEX maasserver_neighbour__ip
+        ON maasserver_neighbour(ip);
+    CREATE INDEX maasserver_mdns__ip
+        ON maasserver_mdns(ip);
+    INSERT INTO maasserver_discovery
+    SELECT
+        DISTINCT ON (neigh.mac_address, neigh.ip)
+        neigh.id,
+        REPLACE(ENCODE(BYTEA(TRIM(TRAILING '/32' FROM neigh.ip::TEXT)
+            || ',' || neigh.mac_address::text), 'base64'), CHR(10), ''),
+        neigh.id,
+        neigh.ip,
+        neigh.mac_address,
+        neigh.vid,
+        neigh.created,
+        GREATEST(neigh.updated, mdns.updated),
+        mdns.id,
+        COALESCE(rdns.hostname, mdns.hostname),
+        node.id,
+        node.system_id,
+        node.hostname,
+        iface.id,
+        iface.name,
+        fabric.id,
+        fabric.name,
+        vlan.id,
+        CASE WHEN neigh.ip = vlan.external_dhcp THEN TRUE ELSE FALSE END,
+        subnet.id,
+        subnet.cidr
+    FROM maasserver_neighbour neigh
+    JOIN maasserver_interface iface ON neigh.interface_id = iface.id
+    JOIN maasserver_node node ON node.id = iface.node_id
+    JOIN maasserver_vlan vlan ON iface.vlan_id = vlan.id
+    JOIN maasserver_fabric fabric ON vlan.fabric_id = fabric.id
+    LEFT OUTER JOIN maasserver_mdns mdns ON mdns.ip = neigh.ip
+    LEFT OUTER JOIN maasserver_rdns rdns ON rdns.ip = neigh.ip
+    LEFT OUTER JOIN maasserver_subnet subnet ON (
+        vlan.id = subnet.vlan_id AND neigh.ip << subnet.cidr)
+    ORDER BY
+        neigh.mac_address,
+        neigh.ip,
+        neigh.updated DESC,
+        rdns.updated DESC,
+        mdns.updated DESC,
+        MASKLEN(subnet.cidr) DESC;
+"""
+
+drop_discovery_table = """\
+    DROP TABLE maasserver_discovery;
+    DROP INDEX maasserver_neighbour__ip;
+    DROP INDEX maasserver_mdns__ip;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maasserver', '0129_add_install_rackd_flag'),
+    ]
+
+    operations = [
+        migrations.RunSQL(create_discovery_table, drop_discovery_table),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Indexes used by `maasserver.status_monitor` to find the nodes that have
+# missed a deadline. Few nodes have a `status_expires` at any one time, so
+# that index is partial.
+create_indexes = """\
+    CREATE INDEX maasserver_node__status_expires
+        ON maasserver_node(status_expires)
+        WHERE status_expires IS NOT NULL;
+    CREATE INDEX maasserver_node__status
+        ON maasserver_node(status);
+"""
+
+drop_indexes = """\
+    DROP INDEX maasserver_node__status_expires;
+    DROP INDEX maasserver_node__status;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maasserver', '0130_discovery_table'),
+    ]
+
+    operations = [
+        migrations.RunSQL(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import (
+    migrations,
+    models,
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maasserver', '0131_node_status_monitor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='controllerinfo',
+            name='interfaces_hash',
+            field=models.CharField(blank=True, null=True, max_length=64, editable=False),
+        ),
+    ]
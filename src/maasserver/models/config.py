@@ -5,16 +5,21 @@
 
 __all__ = [
     'Config',
+    'config_cache',
+    'ConfigCache',
     ]
 
 from collections import (
     defaultdict,
     namedtuple,
 )
+from contextlib import contextmanager
 import copy
 from datetime import timedelta
 from socket import gethostname
+import threading
 
+from django.db import transaction
 from django.db.models import (
     CharField,
     Manager,
@@ -23,6 +28,10 @@ from django.db.models import (
 from django.db.models.signals import post_save
 from maasserver import DefaultMeta
 from maasserver.fields import JSONObjectField
+from maasserver.utils.orm import (
+    in_transaction,
+    transactional,
+)
 from provisioningserver.drivers.osystem.ubuntu import UbuntuOS
 
 
@@ -114,6 +123,115 @@ NetworkDiscoveryConfig = namedtuple(
     'NetworkDiscoveryConfig', ('active', 'passive'))
 
 
+class ConfigCache:
+    """In-memory copy of the `Config` table for this process.
+
+    The cache is empty -- and `Config.objects.get_config` queries the
+    database -- until it's loaded, which `ConfigCacheService` does when the
+    region starts. That service also invalidates and reloads the cache when
+    the database notifies that configuration has changed.
+
+    Loaded values are never modified; each load or invalidation replaces them
+    wholesale. A thread can thus pin a single version of the configuration
+    with `pinned`, e.g. for the duration of a request.
+
+    :ivar generation: Incremented by every invalidation. Values that were
+        read from the database before an invalidation are discarded.
+    """
+
+    def __init__(self):
+        super(ConfigCache, self).__init__()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.values = None
+        self.generation = 0
+
+    @property
+    def loaded(self):
+        """Is the cache loaded?"""
+        return self.values is not None
+
+    def load(self):
+        """Load every configuration item from the database.
+
+        This must be called outside of a transaction: values read from an
+        older transaction's snapshot could otherwise be cached as current.
+
+        :return: True if the values were cached, or False if an invalidation
+            came along while they were being read.
+        """
+        if in_transaction():
+            raise transaction.TransactionManagementError(
+                "The configuration cache must be loaded outside of a "
+                "transaction.")
+        generation = self.generation
+        values = transactional(self._fetch)()
+        with self.lock:
+            if generation == self.generation:
+                self.values = values
+                return True
+            else:
+                return False
+
+    def _fetch(self):
+        return dict(Config.objects.values_list("name", "value"))
+
+    def invalidate(self):
+        """Forget the cached configuration until it's next loaded."""
+        with self.lock:
+            self.generation += 1
+            self.values = None
+
+    def get_values(self):
+        """Return the cached values for this thread, or `None`.
+
+        These must not be modified. `None` means that the database must be
+        queried instead.
+        """
+        local = self.local
+        if getattr(local, "bypass", False):
+            return None
+        elif getattr(local, "pinned", False):
+            return local.values
+        else:
+            return self.values
+
+    def bypass(self):
+        """Query the database instead of the cache in this thread.
+
+        This lasts until the current transaction commits or, if it does not,
+        until this thread next enters `pinned`. It ensures that a thread that
+        changes the configuration sees its own changes.
+        """
+        self.local.bypass = True
+        transaction.on_commit(self._end_bypass)
+
+    def _end_bypass(self):
+        self.local.bypass = False
+
+    @contextmanager
+    def pinned(self):
+        """Use the version of the cache current on entry throughout.
+
+        Nested use is allowed; the outermost context decides the version.
+        """
+        local = self.local
+        if getattr(local, "pinned", False):
+            yield
+        else:
+            local.pinned, local.values = True, self.values
+            local.bypass = False
+            try:
+                yield
+            finally:
+                local.pinned, local.values = False, None
+                local.bypass = False
+
+
+# The configuration cache for this process.
+config_cache = ConfigCache()
+
+
 class ConfigManager(Manager):
     """Manager for Config model class.
 
@@ -137,6 +255,12 @@ class ConfigManager(Manager):
         :return: A config value.
         :raises: Config.MultipleObjectsReturned
         """
+        values = config_cache.get_values()
+        if values is not None:
+            if name in values:
+                return copy.deepcopy(values[name])
+            else:
+                return copy.deepcopy(DEFAULT_CONFIG.get(name, default))
         try:
             return self.get(name=name).value
         except Config.DoesNotExist:
@@ -187,6 +311,8 @@ class ConfigManager(Manager):
         self._config_changed_connections[config_name].discard(method)
 
     def _config_changed(self, sender, instance, created, **kwargs):
+        # The cache doesn't know about this change until it's committed.
+        config_cache.bypass()
         for connection in self._config_changed_connections[instance.name]:
             connection(sender, instance, created, **kwargs)
 
@@ -8,6 +8,8 @@ __all__ = [
     ]
 
 from collections import namedtuple
+from hashlib import sha256
+import json
 
 from django.db.models import (
     CASCADE,
@@ -84,9 +86,18 @@ class ControllerInfoManager(Manager):
 
     def set_interface_update_info(self, controller, interfaces, hints):
         self.update_or_create(
-            defaults=dict(interfaces=interfaces, interface_update_hints=hints),
+            defaults=dict(
+                interfaces=interfaces, interface_update_hints=hints,
+                interfaces_hash=get_interfaces_hash(interfaces, hints)),
             node=controller)
 
+    def clear_interfaces_hash(self, controller):
+        """Forget that `controller`'s interfaces were last applied.
+
+        The next update will process every interface again.
+        """
+        self.filter(node=controller).update(interfaces_hash=None)
+
     def get_controller_version_info(self):
         versions = list(self.select_related('node').filter(
             node__node_type__in=(
@@ -102,6 +113,16 @@ class ControllerInfoManager(Manager):
         return sorted(versions, key=lambda version: version[-1], reverse=True)
 
 
+def get_interfaces_hash(interfaces, hints):
+    """Return a hash of an interfaces definition and its topology hints.
+
+    Keys are sorted before hashing, so equal definitions hash the same no
+    matter the order in which the controller sent them.
+    """
+    definition = json.dumps([interfaces, hints], sort_keys=True)
+    return sha256(definition.encode("utf-8")).hexdigest()
+
+
 VERSION_NOTIFICATION_IDENT = "controller_out_of_date_"
 
 
@@ -206,6 +227,9 @@ class ControllerInfo(CleanSave, TimestampedModel):
     :ivar interfaces: Interfaces JSON last sent by the controller.
     :ivar interface_udpate_hints: Topology hints last sent by the controller
         during a call to update_interfaces().
+    :ivar interfaces_hash: Hash of `interfaces` and `interface_update_hints`
+        when they were last applied to the controller's interfaces, or None
+        if they must all be processed again on the next update.
     """
 
     class Meta(DefaultMeta):
@@ -223,5 +247,8 @@ class ControllerInfo(CleanSave, TimestampedModel):
     interface_update_hints = JSONObjectField(
         max_length=(2 ** 15), blank=True, default='')
 
+    interfaces_hash = CharField(
+        max_length=64, null=True, blank=True, editable=False)
+
     def __str__(self):
         return "%s (%s)" % (self.__class__.__name__, self.node.hostname)
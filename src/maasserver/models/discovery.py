@@ -1,4 +1,4 @@
-# Copyright 2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2016-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Model definition for a `Discovery` (a discovered network device)."""
@@ -144,14 +144,16 @@ class Discovery(CleanSave, ViewModel):
     """A `Discovery` object represents the combined data for a network entity
     that MAAS believes has been discovered.
 
-    Note that this class is backed by the `maasserver_discovery` view. Any
-    updates to this model must be reflected in `maasserver/dbviews.py` under
-    the `maasserver_discovery` view.
+    Note that this class is backed by the `maasserver_discovery` table, which
+    is maintained by the `sys_discovery_*` triggers rather than by Django.
+    Any updates to this model must be reflected in `maasserver/triggers/
+    system.py` under `DISCOVERY_REFRESH`.
     """
 
     class Meta(DefaultViewMeta):
         # When managed is False, Django will not create a migration for this
-        # model class. This is required for model classes based on views.
+        # model class. The table is created by a hand-written migration and
+        # its rows are written only by triggers, so it is treated as a view.
         verbose_name = "Discovery"
         verbose_name_plural = "Discoveries"
 
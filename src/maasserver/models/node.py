@@ -24,6 +24,7 @@ import random
 import re
 import socket
 from socket import gethostname
+import threading
 from urllib.parse import urlparse
 
 from crochet import TimeoutError
@@ -40,6 +41,7 @@ from django.db.models import (
     CASCADE,
     CharField,
     DateTimeField,
+    F,
     ForeignKey,
     IntegerField,
     Manager,
@@ -61,6 +63,7 @@ from maasserver import (
 )
 from maasserver.clusterrpc.pods import decompose_machine
 from maasserver.clusterrpc.power import (
+    get_power_change_batch,
     power_cycle,
     power_driver_check,
     power_off_node,
@@ -3848,6 +3851,13 @@ class Node(CleanSave, TimestampedModel):
         return d
 
     def _power_control_node(self, defer, power_method, power_info):
+        # When batching power changes, leave it to the batch to send this
+        # change along with others to the same rack controller.
+        batch = get_power_change_batch()
+        if batch is not None and batch.can_add(power_method):
+            done = batch.add(self, power_method, power_info, defer)
+            return defer.addCallback(lambda _: done)
+
         # Check if the BMC is accessible. If not we need to do some work to
         # make sure we can determine which rack controller can power
         # control this node.
@@ -4165,6 +4175,19 @@ class Machine(Node):
             node_type=NODE_TYPE.MACHINE, *args, **kwargs)
 
 
+class ControllerInterfacesUpdate(threading.local):
+    """Whether this thread is applying a controller's reported interfaces.
+
+    Interfaces changed meanwhile are changed as the controller reported, so
+    they don't make that definition stale. See `Controller.update_interfaces`.
+    """
+
+    active = False
+
+
+controller_interfaces_update = ControllerInterfacesUpdate()
+
+
 class Controller(Node):
     """A node which is either a rack or region controller."""
 
@@ -4758,14 +4781,39 @@ class Controller(Node):
             entries. mDNS data is gathered from an `avahi-browse` process
             running on each rack interface.
         """
+        # Circular imports.
+        from maasserver.models.mdns import MDNS
         # Determine which interfaces' entries need updating.
         interface_set = {entry['interface'] for entry in entries}
         interfaces = Interface.objects.get_interface_dict_for_node(
             self, names=interface_set)
+        # The same bindings are reported over and over. Those that are
+        # already known just have their count bumped, all in one query; only
+        # new or changed bindings are updated one at a time.
+        known_bindings = {
+            (interface_id, hostname, str(ip)): binding_id
+            for binding_id, interface_id, hostname, ip in (
+                MDNS.objects.filter(interface__in=interfaces.values())
+                .values_list("id", "interface_id", "hostname", "ip"))
+        }
+        seen = set()
+        unchanged_bindings = []
         for entry in entries:
             interface = interfaces.get(entry['interface'], None)
-            if interface is not None:
+            if interface is None:
+                continue
+            key = (interface.id, entry.get('hostname'), entry.get('address'))
+            if key in seen:
+                # Repeated within this report.
+                continue
+            seen.add(key)
+            if key not in known_bindings:
                 interface.update_mdns_entry(entry)
+            elif interface.mdns_discovery_state is not False:
+                unchanged_bindings.append(known_bindings[key])
+        if len(unchanged_bindings) > 0:
+            MDNS.objects.filter(id__in=unchanged_bindings).update(
+                count=F('count') + 1, updated=now())
 
     def get_discovery_state(self):
         """Returns the interface monitoring state for this Controller.
@@ -4795,6 +4843,41 @@ class Controller(Node):
             VLAN. Otherwise, creates the interfaces but does not create any
             links or VLANs.
         """
+        active = controller_interfaces_update.active
+        controller_interfaces_update.active = True
+        try:
+            self._update_interfaces(
+                interfaces, topology_hints, create_fabrics)
+        finally:
+            controller_interfaces_update.active = active
+
+    def _update_interfaces(self, interfaces, topology_hints, create_fabrics):
+        """Update the interfaces attached to the controller.
+
+        See `update_interfaces`.
+        """
+        # Circular imports.
+        from maasserver.models.controllerinfo import (
+            ControllerInfo,
+            get_interfaces_hash,
+        )
+
+        # Controllers send their interfaces regularly, but they rarely
+        # change. Skip the whole update when this definition, with these
+        # hints, is the one that was last applied. Otherwise, when that last
+        # definition is known, update only the interfaces whose settings
+        # differ from it, and their children.
+        hints = [] if topology_hints is None else topology_hints
+        interfaces_hash = get_interfaces_hash(interfaces, hints)
+        info = ControllerInfo.objects.filter(node=self).first()
+        if info is not None and info.interfaces_hash == interfaces_hash:
+            return
+        previous_interfaces = {}
+        if create_fabrics and info is not None:
+            if info.interfaces_hash == get_interfaces_hash(
+                    info.interfaces, hints):
+                previous_interfaces = info.interfaces
+
         # Get all of the current interfaces on this controller.
         current_interfaces = {
             interface.id: interface
@@ -4817,10 +4900,23 @@ class Controller(Node):
             sorted(list(items))
             for items in process_order
         ]
+        changed = {
+            name for name, settings in interfaces.items()
+            if previous_interfaces.get(name) != settings
+        }
+        for name in flatten(process_order):
+            if not changed.isdisjoint(interfaces[name]["parents"]):
+                changed.add(name)
+        # Interfaces that have not changed are left as they are.
+        for nic_id, nic in list(current_interfaces.items()):
+            if nic.name in interfaces and nic.name not in changed:
+                del current_interfaces[nic_id]
         # Cache the neighbour discovery settings, since they will be used for
         # every interface on this Controller.
         discovery_mode = Config.objects.get_network_discovery_config()
         for name in flatten(process_order):
+            if name not in changed:
+                continue
             settings = interfaces[name]
             # Note: the interface that comes back from this call may be None,
             # if we decided not to model an interface based on what the rack
@@ -4835,7 +4931,10 @@ class Controller(Node):
 
         if not create_fabrics:
             # This could be an existing rack controller re-registering,
-            # so don't delete interfaces during this phase.
+            # so don't delete interfaces during this phase. Nor is the
+            # definition fully applied, so the next update must process
+            # every interface.
+            ControllerInfo.objects.clear_interfaces_hash(self)
             return
 
         # Remove all the interfaces that no longer exist. We do this in reverse
@@ -4858,6 +4957,8 @@ class Controller(Node):
                 self.boot_interface = None
             current_interfaces[delete_id].delete()
         self.save()
+        ControllerInfo.objects.set_interface_update_info(
+            self, interfaces, hints)
 
     @transactional
     def _get_token_for_controller(self):
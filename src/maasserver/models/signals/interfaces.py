@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Respond to interface changes."""
@@ -23,6 +23,7 @@ from maasserver.models import (
     BondInterface,
     BridgeInterface,
     Config,
+    ControllerInfo,
     Interface,
     PhysicalInterface,
     UnknownInterface,
@@ -31,6 +32,7 @@ from maasserver.models import (
 )
 from maasserver.models.node import (
     Controller,
+    controller_interfaces_update,
     Node,
 )
 from maasserver.models.staticipaddress import StaticIPAddress
@@ -310,6 +312,70 @@ for klass in INTERFACE_CLASSES:
     signals.watch(post_save, resave_children_interface_handler, klass)
 
 
+def _clear_controller_interfaces_hash(interface):
+    """Forget the applied definition of `interface`'s controller, if any."""
+    try:
+        node = interface.node
+    except Node.DoesNotExist:
+        return
+    if node is not None and node.is_controller:
+        ControllerInfo.objects.clear_interfaces_hash(node)
+
+
+def clear_controller_interfaces_hash(sender, instance, **kwargs):
+    """Process every interface when the controller next reports them.
+
+    The controller's last applied definition no longer describes its
+    interfaces once one is changed by something other than the controller's
+    own report, so that definition mustn't be used to skip the next report.
+    """
+    if controller_interfaces_update.active:
+        return
+    _clear_controller_interfaces_hash(instance)
+
+
+def clear_controller_interfaces_hash_for_ip(sender, instance, **kwargs):
+    """Process every interface when the controllers next report them, once
+    an IP address linked to any of their interfaces is changed or deleted.
+
+    This includes IP addresses deleted along with their subnet.
+    """
+    if controller_interfaces_update.active or kwargs.get("created"):
+        return
+    for interface in instance.interface_set.all():
+        _clear_controller_interfaces_hash(interface)
+
+
+def clear_controller_interfaces_hash_for_link(
+        sender, instance, action, model, pk_set, **kwargs):
+    """Process every interface when the controllers next report them, once
+    an IP address is linked to or unlinked from any of their interfaces."""
+    if controller_interfaces_update.active:
+        return
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if model == StaticIPAddress:
+        # The interface's IP addresses were changed.
+        interfaces = [instance]
+    elif pk_set is None:
+        # The IP address is being unlinked from all its interfaces.
+        interfaces = instance.interface_set.all()
+    else:
+        interfaces = Interface.objects.filter(id__in=pk_set)
+    for interface in interfaces:
+        _clear_controller_interfaces_hash(interface)
+
+
+for klass in INTERFACE_CLASSES:
+    signals.watch(post_save, clear_controller_interfaces_hash, klass)
+    signals.watch(pre_delete, clear_controller_interfaces_hash, klass)
+
+signals.watch(
+    post_save, clear_controller_interfaces_hash_for_ip, StaticIPAddress)
+signals.watch(
+    pre_delete, clear_controller_interfaces_hash_for_ip, StaticIPAddress)
+
+
 def remove_gateway_link_when_ip_address_removed_from_interface(
         sender, instance, action, model, pk_set, **kwargs):
     """When an IP address is removed from an interface it is possible that
@@ -349,6 +415,9 @@ def update_interface_monitoring(sender, instance, *args, **kwargs):
 signals.watch(
     m2m_changed, remove_gateway_link_when_ip_address_removed_from_interface,
     Interface.ip_addresses.through)
+signals.watch(
+    m2m_changed, clear_controller_interfaces_hash_for_link,
+    Interface.ip_addresses.through)
 
 signals.watch_config(update_interface_monitoring, "network_discovery")
 
@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Test the behaviour of interface signals."""
@@ -10,15 +10,20 @@ import threading
 from unittest.mock import call
 
 from maasserver.enum import (
+    INTERFACE_LINK_TYPE,
     INTERFACE_TYPE,
     IPADDRESS_TYPE,
     NODE_TYPE,
 )
-from maasserver.models import Controller
+from maasserver.models import (
+    Controller,
+    ControllerInfo,
+)
 from maasserver.models.config import (
     Config,
     NetworkDiscoveryConfig,
 )
+from maasserver.models.node import controller_interfaces_update
 from maasserver.models.signals.interfaces import update_parents_thread_local
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
@@ -26,6 +31,7 @@ from maasserver.utils.orm import reload_object
 from maastesting.matchers import MockCallsMatch
 from testtools.matchers import (
     Contains,
+    Is,
     Not,
 )
 
@@ -290,6 +296,98 @@ class TestInterfaceVLANUpdateController(MAASServerTestCase):
             (vlan_subnet.vlan.fabric.id, vlan_subnet.vlan.vid))
 
 
+class TestClearControllerInterfacesHash(MAASServerTestCase):
+    """Changes to a controller's interfaces forget its applied definition."""
+
+    def make_controller_interface(self):
+        controller = factory.make_RackController()
+        interface = factory.make_Interface(
+            INTERFACE_TYPE.PHYSICAL, node=controller)
+        ControllerInfo.objects.set_interface_update_info(controller, {}, [])
+        return controller, interface
+
+    def get_interfaces_hash(self, controller):
+        return ControllerInfo.objects.get(node=controller).interfaces_hash
+
+    def test__saving_interface_clears_hash(self):
+        controller, interface = self.make_controller_interface()
+        interface.enabled = False
+        interface.save()
+        self.assertThat(self.get_interfaces_hash(controller), Is(None))
+
+    def test__deleting_interface_clears_hash(self):
+        controller, interface = self.make_controller_interface()
+        interface.delete()
+        self.assertThat(self.get_interfaces_hash(controller), Is(None))
+
+    def test__keeps_hash_while_controller_updates_interfaces(self):
+        controller, interface = self.make_controller_interface()
+        self.patch(controller_interfaces_update, "active", True)
+        interface.enabled = False
+        interface.save()
+        self.assertThat(self.get_interfaces_hash(controller), Not(Is(None)))
+
+    def make_controller_ip(self):
+        controller, interface = self.make_controller_interface()
+        subnet = factory.make_Subnet(vlan=interface.vlan)
+        ip = factory.make_StaticIPAddress(
+            alloc_type=IPADDRESS_TYPE.STICKY, subnet=subnet,
+            interface=interface)
+        ControllerInfo.objects.set_interface_update_info(controller, {}, [])
+        return controller, interface, ip
+
+    def test__linking_subnet_clears_hash(self):
+        controller, interface = self.make_controller_interface()
+        subnet = factory.make_Subnet(vlan=interface.vlan)
+        interface.link_subnet(INTERFACE_LINK_TYPE.STATIC, subnet)
+        self.assertThat(self.get_interfaces_hash(controller), Is(None))
+
+    def test__unlinking_subnet_clears_hash(self):
+        controller, interface, ip = self.make_controller_ip()
+        interface.unlink_subnet_by_id(ip.id)
+        self.assertThat(self.get_interfaces_hash(controller), Is(None))
+
+    def test__linking_ip_from_ip_side_clears_hash(self):
+        controller, interface = self.make_controller_interface()
+        subnet = factory.make_Subnet(vlan=interface.vlan)
+        ip = factory.make_StaticIPAddress(
+            alloc_type=IPADDRESS_TYPE.STICKY, subnet=subnet)
+        ControllerInfo.objects.set_interface_update_info(controller, {}, [])
+        ip.interface_set.add(interface)
+        self.assertThat(self.get_interfaces_hash(controller), Is(None))
+
+    def test__saving_ip_clears_hash(self):
+        controller, interface, ip = self.make_controller_ip()
+        ip.ip = factory.pick_ip_in_Subnet(ip.subnet, but_not=[ip.ip])
+        ip.save()
+        self.assertThat(self.get_interfaces_hash(controller), Is(None))
+
+    def test__deleting_ip_clears_hash(self):
+        controller, interface, ip = self.make_controller_ip()
+        ip.delete()
+        self.assertThat(self.get_interfaces_hash(controller), Is(None))
+
+    def test__deleting_subnet_clears_hash(self):
+        controller, interface, ip = self.make_controller_ip()
+        ip.subnet.delete()
+        self.assertThat(self.get_interfaces_hash(controller), Is(None))
+
+    def test__keeps_hash_when_machine_ip_is_deleted(self):
+        controller, interface = self.make_controller_interface()
+        machine_interface = factory.make_Interface(
+            INTERFACE_TYPE.PHYSICAL, vlan=interface.vlan)
+        ip = factory.make_StaticIPAddress(
+            alloc_type=IPADDRESS_TYPE.STICKY, interface=machine_interface)
+        ip.delete()
+        self.assertThat(self.get_interfaces_hash(controller), Not(Is(None)))
+
+    def test__keeps_hash_while_controller_updates_ip_addresses(self):
+        controller, interface, ip = self.make_controller_ip()
+        self.patch(controller_interfaces_update, "active", True)
+        interface.unlink_subnet_by_id(ip.id)
+        self.assertThat(self.get_interfaces_hash(controller), Not(Is(None)))
+
+
 class TestDiscoveryConfigChanges(MAASServerTestCase):
     """Test that changes to the network discovery cause interface changes."""
 
@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Model definition for StaticIPAddress.
@@ -14,7 +14,12 @@ __all__ = [
     'StaticIPAddress',
 ]
 
-from collections import defaultdict
+from collections import (
+    defaultdict,
+    OrderedDict,
+)
+from itertools import groupby
+from operator import itemgetter
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
@@ -88,6 +93,88 @@ def convert_leases_to_dict(leases):
     return ip_leases
 
 
+def _group_rows_by_node(rows, iface_rows):
+    """Generate ``(rows, iface_rows)`` for each node in either.
+
+    Both `rows` and `iface_rows` must be ordered by node ID, their first
+    column. Each node's rows are returned as lists, which are empty when
+    there are none for that node.
+    """
+    get_node_id = itemgetter(0)
+    groups = groupby(rows, get_node_id)
+    iface_groups = groupby(iface_rows, get_node_id)
+    group = next(groups, None)
+    iface_group = next(iface_groups, None)
+    while group is not None or iface_group is not None:
+        if iface_group is None or (
+                group is not None and group[0] < iface_group[0]):
+            yield list(group[1]), []
+            group = next(groups, None)
+        elif group is None or iface_group[0] < group[0]:
+            yield [], list(iface_group[1])
+            iface_group = next(iface_groups, None)
+        else:
+            yield list(group[1]), list(iface_group[1])
+            group = next(groups, None)
+            iface_group = next(iface_groups, None)
+
+
+def _gen_node_mappings(rows, iface_rows, special_mappings):
+    """Generate ``(hostname, HostnameIPMapping)`` pairs for a single node.
+
+    :param rows: The node's rows from the DISTINCT ON query in
+        `iter_hostname_ip_mapping`.
+    :param iface_rows: The node's rows from the query for all the addresses
+        on all of its interfaces.
+    :param special_mappings: The special mappings. Any with the same name as
+        one generated here is removed and combined with it.
+    """
+    fqdn = (rows or iface_rows)[0][1]
+    # If there's a special mapping for this node's name then we will only
+    # want to add addresses for the boot interface (is_boot == True).
+    iface_is_boot = fqdn in special_mappings
+    mapping = special_mappings.pop(fqdn, None)
+    if mapping is None:
+        mapping = HostnameIPMapping()
+    # The records from the query provide, for the node, the boot and non-boot
+    # interface ip address in ipv4 and ipv6.  Our task: if there are boot
+    # interace IPs, they win.  If there are none, then whatever we got wins.
+    # The ORDER BY means that we will see all of the boot interfaces before
+    # we see any non-boot interface IPs.  See Bug#1584850
+    for _, _, system_id, node_type, ttl, ip, is_boot in rows:
+        mapping.node_type = node_type
+        mapping.system_id = system_id
+        mapping.ttl = ttl
+        if is_boot:
+            iface_is_boot = True
+        # If we have an IP on the right interface type, save it.
+        if is_boot == iface_is_boot:
+            mapping.ips.add(ip)
+    yield fqdn, mapping
+    # Next, get all the addresses, on all the interfaces, and add the ones
+    # that are not already present on the FQDN as $IFACE.$FQDN.  Exclude
+    # any discovered addresses once there are any non-discovered addresses.
+    assigned_ips = False
+    iface_mappings = OrderedDict()
+    for (_, _, system_id, node_type, ttl,
+            ip, iface_name, assigned) in iface_rows:
+        if assigned:
+            assigned_ips = True
+        # If this is an assigned IP, or there are NO assigned IPs on the
+        # node, then consider adding the IP.
+        if assigned or not assigned_ips:
+            if ip not in mapping.ips:
+                name = "%s.%s" % (iface_name, fqdn)
+                if name not in iface_mappings:
+                    iface_mappings[name] = special_mappings.pop(
+                        name, None) or HostnameIPMapping()
+                iface_mappings[name].node_type = node_type
+                iface_mappings[name].system_id = system_id
+                iface_mappings[name].ttl = ttl
+                iface_mappings[name].ips.add(ip)
+    yield from iface_mappings.items()
+
+
 class StaticIPAddressManager(Manager):
     """A utility to manage collections of IPAddresses."""
 
@@ -440,10 +527,65 @@ class StaticIPAddressManager(Manager):
 
         The returned name is an FQDN (no trailing dot.)
         """
-        cursor = connection.cursor()
+        mapping = defaultdict(HostnameIPMapping)
+        for hostname, info in self.iter_hostname_ip_mapping(
+                domain_or_subnet, raw_ttl):
+            if hostname in mapping:
+                # An interface's name can clash with another node's FQDN.
+                entry = mapping[hostname]
+                if info.system_id is not None:
+                    entry.node_type = info.node_type
+                    entry.system_id = info.system_id
+                if info.ttl is not None:
+                    entry.ttl = info.ttl
+                entry.ips.update(info.ips)
+            else:
+                mapping[hostname] = info
+        return mapping
+
+    def iter_hostname_ip_mapping(
+            self, domain_or_subnet, raw_ttl=False, network=None):
+        """Generate hostname mappings for `StaticIPAddress` entries.
+
+        This generates the same ``(hostname, HostnameIPMapping)`` pairs as
+        `get_hostname_ip_mapping` returns, but node by node, as it reads
+        server-side cursors in chunks, so that memory use does not grow with
+        the number of nodes. The same name may be generated more than once.
 
+        :param network: Optional, and only for subnets; include only the
+            nodes that have an address in this `IPNetwork`, and addresses
+            not belonging to a node. Mappings for these nodes are the same
+            as without `network`: they may include addresses outside it.
+        """
+        # We get user reserved et al mappings first, so that we can overwrite
+        # TTL as we process the return from the SQL horror below.
+        special_mappings = self._get_special_mappings(
+            domain_or_subnet, raw_ttl)
+        sql_query, iface_sql_query, query_parms = (
+            self._get_hostname_ip_mapping_queries(
+                domain_or_subnet, raw_ttl, network, special_mappings))
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(sql_query, query_parms)
+            with connection.chunked_cursor() as iface_cursor:
+                iface_cursor.execute(iface_sql_query, query_parms)
+                for rows, iface_rows in _group_rows_by_node(
+                        cursor, iface_cursor):
+                    yield from _gen_node_mappings(
+                        rows, iface_rows, special_mappings)
+        # Anything left is not also the name of a node.
+        yield from special_mappings.items()
+
+    def _get_hostname_ip_mapping_queries(
+            self, domain_or_subnet, raw_ttl, network, special_mappings):
+        """Return the queries for `iter_hostname_ip_mapping`.
+
+        Both queries return rows ordered by node ID, so that they can be
+        read together, a node at a time.
+
+        :return: A ``(sql_query, iface_sql_query, query_parms)`` tuple.
+        """
         # DISTINCT ON returns the first matching row for any given
-        # hostname, using the query's ordering.  Here, we're trying to
+        # node, using the query's ordering.  Here, we're trying to
         # return the IPs for the oldest Interface address.
         default_ttl = "%d" % Config.objects.get_config('default_dns_ttl')
         if raw_ttl:
@@ -455,7 +597,8 @@ class StaticIPAddressManager(Manager):
                     domain.ttl,
                     %s)""" % default_ttl
         sql_query = """
-            SELECT DISTINCT ON (node.hostname, is_boot, family(staticip.ip))
+            SELECT DISTINCT ON (node.id, is_boot, family(staticip.ip))
+                node.id,
                 CONCAT(node.hostname, '.', domain.name) AS fqdn,
                 node.system_id,
                 node.node_type,
@@ -484,7 +627,29 @@ class StaticIPAddressManager(Manager):
             JOIN maasserver_staticipaddress AS staticip ON
                 staticip.id = link.staticipaddress_id
             """
+        iface_sql_query = """
+            SELECT
+                node.id,
+                CONCAT(node.hostname, '.', domain.name) AS fqdn,
+                node.system_id,
+                node.node_type,
+                """ + ttl_clause + """ AS ttl,
+                staticip.ip,
+                interface.name,
+                alloc_type != 6 /* DISCOVERED */ AS assigned
+            FROM
+                maasserver_interface AS interface
+            JOIN maasserver_node AS node ON
+                node.id = interface.node_id
+            JOIN maasserver_domain AS domain ON
+                domain.id = node.domain_id
+            JOIN maasserver_interface_ip_addresses AS link ON
+                link.interface_id = interface.id
+            JOIN maasserver_staticipaddress AS staticip ON
+                staticip.id = link.staticipaddress_id
+            """
         if isinstance(domain_or_subnet, Domain):
+            assert network is None, "Only subnets can be limited to a network."
             # The model has nodes in the parent domain, but they actually live
             # in the child domain.  And the parent needs the glue.  So we
             # return such nodes addresses in _BOTH_ the parent and the child
@@ -498,8 +663,19 @@ class StaticIPAddressManager(Manager):
             WHERE
                 (domain2.id = %s OR node.domain_id = %s) AND
             """
+            # This logic is similar to the logic in sql_query above.
+            iface_sql_query += """
+            LEFT JOIN maasserver_domain AS domain2 ON
+                /* Pick up another copy of domain looking for instances of
+                 * the name as the top of a domain.
+                 */
+                domain2.name = CONCAT(
+                    interface.name, '.', node.hostname, '.', domain.name)
+            WHERE
+                (domain2.id = %s OR node.domain_id = %s) AND
+            """
             query_parms = [domain_or_subnet.id, domain_or_subnet.id, ]
-        else:
+        elif network is None:
             # For subnets, we need ALL the names, so that we can correctly
             # identify which ones should have the FQDN.  dns/zonegenerator.py
             # optimizes based on this, and only calls once with a subnet,
@@ -507,12 +683,42 @@ class StaticIPAddressManager(Manager):
             sql_query += """
             WHERE
             """
+            iface_sql_query += """
+            WHERE
+            """
             query_parms = []
+        else:
+            # Which of a node's addresses get its FQDN depends on all of its
+            # addresses, so limit the nodes, not the addresses.  Nodes whose
+            # FQDN is also a special mapping's name in the network must be
+            # included too, since they are combined.
+            node_filter = """
+            WHERE
+                (
+                    node.id IN (
+                        SELECT iface.node_id
+                        FROM maasserver_interface AS iface
+                        JOIN maasserver_interface_ip_addresses AS iia ON
+                            iia.interface_id = iface.id
+                        JOIN maasserver_staticipaddress AS sip ON
+                            sip.id = iia.staticipaddress_id
+                        WHERE sip.ip <<= %s
+                    ) OR
+                    CONCAT(node.hostname, '.', domain.name) = ANY(%s)
+                ) AND
+            """
+            sql_query += node_filter
+            iface_sql_query += node_filter
+            query_parms = [str(network), [
+                hostname
+                for hostname, info in special_mappings.items()
+                if any(IPAddress(ip) in network for ip in info.ips)
+            ]]
         sql_query += """
                 staticip.ip IS NOT NULL AND
                 host(staticip.ip) != ''
             ORDER BY
-                node.hostname,
+                node.id,
                 is_boot DESC,
                 family(staticip.ip),
                 CASE
@@ -547,98 +753,15 @@ class StaticIPAddressManager(Manager):
                 interface.id,
                 inet 'fc00::/7' >> ip /* ULA after non-ULA */
             """
-        iface_sql_query = """
-            SELECT
-                CONCAT(node.hostname, '.', domain.name) AS fqdn,
-                node.system_id,
-                node.node_type,
-                """ + ttl_clause + """ AS ttl,
-                staticip.ip,
-                interface.name,
-                alloc_type != 6 /* DISCOVERED */ AS assigned
-            FROM
-                maasserver_interface AS interface
-            JOIN maasserver_node AS node ON
-                node.id = interface.node_id
-            JOIN maasserver_domain AS domain ON
-                domain.id = node.domain_id
-            JOIN maasserver_interface_ip_addresses AS link ON
-                link.interface_id = interface.id
-            JOIN maasserver_staticipaddress AS staticip ON
-                staticip.id = link.staticipaddress_id
-            """
-        if isinstance(domain_or_subnet, Domain):
-            # This logic is similar to the logic in sql_query above.
-            iface_sql_query += """
-            LEFT JOIN maasserver_domain AS domain2 ON
-                /* Pick up another copy of domain looking for instances of
-                 * the name as the top of a domain.
-                 */
-                domain2.name = CONCAT(
-                    interface.name, '.', node.hostname, '.', domain.name)
-            WHERE
-                (domain2.id = %s OR node.domain_id = %s) AND
-            """
-        else:
-            # For subnets, we need ALL the names, so that we can correctly
-            # identify which ones should have the FQDN.  dns/zonegenerator.py
-            # optimizes based on this, and only calls once with a subnet,
-            # expecting to get all the subnets back in one table.
-            iface_sql_query += """
-            WHERE
-            """
         iface_sql_query += """
                 staticip.ip IS NOT NULL AND
                 host(staticip.ip) != ''
             ORDER BY
-                node.hostname,
+                node.id,
                 assigned DESC, /* Return all assigned IPs for a node first. */
                 interface.id
             """
-        # We get user reserved et al mappings first, so that we can overwrite
-        # TTL as we process the return from the SQL horror above.
-        mapping = self._get_special_mappings(domain_or_subnet, raw_ttl)
-        # All of the mappings that we got mean that we will only want to add
-        # addresses for the boot interface (is_boot == True).
-        iface_is_boot = defaultdict(bool, {
-            hostname: True for hostname in mapping.keys()
-        })
-        assigned_ips = defaultdict(bool)
-        cursor.execute(sql_query, query_parms)
-        # The records from the query provide, for each hostname (after
-        # stripping domain), the boot and non-boot interface ip address in ipv4
-        # and ipv6.  Our task: if there are boot interace IPs, they win.  If
-        # there are none, then whatever we got wins.  The ORDER BY means that
-        # we will see all of the boot interfaces before we see any non-boot
-        # interface IPs.  See Bug#1584850
-        for (fqdn, system_id, node_type, ttl,
-                ip, is_boot) in cursor.fetchall():
-            mapping[fqdn].node_type = node_type
-            mapping[fqdn].system_id = system_id
-            mapping[fqdn].ttl = ttl
-            if is_boot:
-                iface_is_boot[fqdn] = True
-            # If we have an IP on the right interface type, save it.
-            if is_boot == iface_is_boot[fqdn]:
-                mapping[fqdn].ips.add(ip)
-        # Next, get all the addresses, on all the interfaces, and add the ones
-        # that are not already present on the FQDN as $IFACE.$FQDN.  Exclude
-        # any discovered addresses once there are any non-discovered addresses.
-        cursor.execute(iface_sql_query, query_parms)
-        for (fqdn, system_id, node_type, ttl,
-                ip, iface_name, assigned) in cursor.fetchall():
-            if assigned:
-                assigned_ips[fqdn] = True
-            # If this is an assigned IP, or there are NO assigned IPs on the
-            # node, then consider adding the IP.
-            if assigned or not assigned_ips[fqdn]:
-                if ip not in mapping[fqdn].ips:
-                    name = "%s.%s" % (iface_name, fqdn)
-                    mapping[name].node_type = node_type
-                    mapping[name].system_id = system_id
-                    mapping[name].ttl = ttl
-                    mapping[name].ips.add(ip)
-        return mapping
+        return sql_query, iface_sql_query, query_parms
 
     def filter_by_ip_family(self, family):
         possible_families = map_enum_reverse(IPADDRESS_FAMILY)
@@ -1,4 +1,4 @@
-# Copyright 2012-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2012-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for the `Config` class and friends."""
@@ -8,16 +8,28 @@ __all__ = []
 from socket import gethostname
 
 from django.db import IntegrityError
+from django.db.transaction import TransactionManagementError
 from fixtures import TestWithFixtures
 from maasserver.models import (
     Config,
     signals,
 )
 import maasserver.models.config
-from maasserver.models.config import get_default_config
+from maasserver.models.config import (
+    ConfigCache,
+    DEFAULT_CONFIG,
+    get_default_config,
+)
 from maasserver.testing.factory import factory
-from maasserver.testing.testcase import MAASServerTestCase
-from testtools.matchers import Is
+from maasserver.testing.testcase import (
+    MAASServerTestCase,
+    MAASTransactionServerTestCase,
+)
+from maastesting.djangotestcase import count_queries
+from testtools.matchers import (
+    Equals,
+    Is,
+)
 
 
 class ConfigDefaultTest(MAASServerTestCase, TestWithFixtures):
@@ -193,3 +205,126 @@ class SettingConfigTest(MAASServerTestCase):
         something = [factory.make_name("value")]
         Config.objects.set_config(self.name, something)
         self.assertEqual(something, Config.objects.get_config(self.name))
+
+
+class ConfigCacheTest(MAASServerTestCase):
+    """Testing of the :class:`ConfigCache` and its use by the manager."""
+
+    def make_cache(self, values=None):
+        cache = self.patch(
+            maasserver.models.config, "config_cache", ConfigCache())
+        cache.values = values
+        return cache
+
+    def test_get_config_queries_database_when_not_loaded(self):
+        self.make_cache()
+        name = factory.make_string()
+        Config.objects.set_config(name, "value")
+        count, value = count_queries(Config.objects.get_config, name)
+        self.expectThat(count, Equals(1))
+        self.expectThat(value, Equals("value"))
+
+    def test_get_config_uses_cache_when_loaded(self):
+        name = factory.make_string()
+        self.make_cache({name: "value"})
+        count, value = count_queries(Config.objects.get_config, name)
+        self.expectThat(count, Equals(0))
+        self.expectThat(value, Equals("value"))
+
+    def test_get_config_returns_default_when_not_in_cache(self):
+        self.make_cache({})
+        self.assertThat(
+            Config.objects.get_config("maas_name"),
+            Equals(DEFAULT_CONFIG["maas_name"]))
+
+    def test_get_config_returns_copies_from_cache(self):
+        name = factory.make_string()
+        self.make_cache({name: {"key": "value"}})
+        Config.objects.get_config(name).clear()
+        self.assertThat(
+            Config.objects.get_config(name), Equals({"key": "value"}))
+
+    def test_saving_config_bypasses_cache_in_thread(self):
+        name = factory.make_string()
+        self.make_cache({name: "old"})
+        Config.objects.set_config(name, "new")
+        self.assertThat(Config.objects.get_config(name), Equals("new"))
+
+    def test_invalidate_forgets_values(self):
+        cache = self.make_cache({})
+        generation = cache.generation
+        cache.invalidate()
+        self.expectThat(cache.loaded, Is(False))
+        self.expectThat(cache.generation, Equals(generation + 1))
+
+    def test_load_refuses_to_run_in_transaction(self):
+        cache = ConfigCache()
+        self.assertRaises(TransactionManagementError, cache.load)
+
+    def test_pinned_uses_values_current_on_entry(self):
+        name = factory.make_string()
+        cache = self.make_cache({name: "old"})
+        with cache.pinned():
+            cache.values = {name: "new"}
+            self.expectThat(Config.objects.get_config(name), Equals("old"))
+        self.expectThat(Config.objects.get_config(name), Equals("new"))
+
+    def test_pinned_nested_keeps_outer_version(self):
+        name = factory.make_string()
+        cache = self.make_cache({name: "old"})
+        with cache.pinned():
+            cache.values = {name: "new"}
+            with cache.pinned():
+                self.expectThat(
+                    Config.objects.get_config(name), Equals("old"))
+            self.expectThat(Config.objects.get_config(name), Equals("old"))
+
+    def test_pinned_ends_bypass_on_exit(self):
+        cache = self.make_cache({})
+        with cache.pinned():
+            cache.bypass()
+            self.expectThat(cache.get_values(), Is(None))
+        self.expectThat(cache.get_values(), Equals({}))
+
+
+class ConfigCacheLoadTest(MAASTransactionServerTestCase):
+    """Testing of `ConfigCache.load`."""
+
+    def test_load_reads_every_config_item(self):
+        name = factory.make_string()
+        Config.objects.set_config(name, "value")
+        cache = ConfigCache()
+        self.expectThat(cache.load(), Is(True))
+        self.expectThat(cache.values[name], Equals("value"))
+
+    def test_load_discards_values_overtaken_by_invalidation(self):
+        cache = ConfigCache()
+        fetch = cache._fetch
+
+        def fetch_then_invalidate():
+            try:
+                return fetch()
+            finally:
+                cache.invalidate()
+
+        self.patch(cache, "_fetch", fetch_then_invalidate)
+        self.expectThat(cache.load(), Is(False))
+        self.expectThat(cache.loaded, Is(False))
+
+    def test_warm_lookups_issue_no_queries(self):
+        cache = self.patch(
+            maasserver.models.config, "config_cache", ConfigCache())
+        names = sorted(DEFAULT_CONFIG)
+
+        def get_configs():
+            return [Config.objects.get_config(name) for name in names]
+
+        # Without the cache each lookup is a query. Loading the cache is a
+        # single query, after which lookups issue none.
+        cold_count, cold_values = count_queries(get_configs)
+        load_count, _ = count_queries(cache.load)
+        warm_count, warm_values = count_queries(get_configs)
+        self.expectThat(cold_count, Equals(len(names)))
+        self.expectThat(load_count, Equals(1))
+        self.expectThat(warm_count, Equals(0))
+        self.expectThat(warm_values, Equals(cold_values))
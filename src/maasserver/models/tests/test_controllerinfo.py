@@ -13,6 +13,7 @@ from maasserver.models import (
 from maasserver.models.controllerinfo import (
     ControllerVersionInfo,
     create_or_update_version_notification,
+    get_interfaces_hash,
     KNOWN_VERSION_MISMATCH_NOTIFICATION,
     UNKNOWN_VERSION_MISMATCH_NOTIFICATION,
     VERSION_NOTIFICATION_IDENT,
@@ -22,6 +23,7 @@ from maasserver.testing.testcase import MAASServerTestCase
 from testtools.matchers import (
     Equals,
     Is,
+    Not,
 )
 
 
@@ -50,6 +52,30 @@ class TestControllerInfo(MAASServerTestCase):
             controller, interfaces, hints)
         self.assertThat(controller.interfaces, Equals(interfaces))
         self.assertThat(controller.interface_update_hints, Equals(hints))
+        self.assertThat(
+            controller.controllerinfo.interfaces_hash,
+            Equals(get_interfaces_hash(interfaces, hints)))
+
+    def test_controllerinfo_clear_interfaces_hash(self):
+        controller = factory.make_RackController()
+        ControllerInfo.objects.set_interface_update_info(controller, {}, [])
+        ControllerInfo.objects.clear_interfaces_hash(controller)
+        info = ControllerInfo.objects.get(node=controller)
+        self.assertThat(info.interfaces_hash, Is(None))
+
+
+class TestGetInterfacesHash(MAASServerTestCase):
+
+    def test__ignores_order_of_keys(self):
+        self.assertThat(
+            get_interfaces_hash({"eth0": {"a": 1, "b": 2}, "eth1": {}}, []),
+            Equals(get_interfaces_hash(
+                {"eth1": {}, "eth0": {"b": 2, "a": 1}}, [])))
+
+    def test__depends_on_hints(self):
+        self.assertThat(
+            get_interfaces_hash({}, []),
+            Not(Equals(get_interfaces_hash({}, [{"hint": "x"}]))))
 
 
 class TestGetControllerVersionInfo(MAASServerTestCase):
@@ -1,4 +1,4 @@
-# Copyright 2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2016-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for the Discovery model."""
@@ -144,6 +144,66 @@ class TestDiscoveryModel(MAASServerTestCase):
         self.assertThat(discovery.hostname, Equals(rdns_hostname))
 
 
+class TestDiscoveryTable(MAASServerTestCase):
+    """Tests that the `maasserver_discovery` table is kept up to date."""
+
+    def make_rack_interface(self):
+        rack = factory.make_RackController()
+        return factory.make_Interface(node=rack)
+
+    def test__follows_mdns_hostname_changes(self):
+        iface = self.make_rack_interface()
+        discovery = factory.make_Discovery(hostname="", interface=iface)
+        mdns = factory.make_MDNS(
+            hostname=factory.make_hostname(), ip=discovery.ip,
+            interface=iface)
+        mdns.hostname = factory.make_hostname()
+        mdns.save()
+        self.expectThat(
+            Discovery.objects.get(id=discovery.id).hostname,
+            Equals(mdns.hostname))
+        mdns.delete()
+        self.expectThat(
+            Discovery.objects.get(id=discovery.id).hostname, Is(None))
+
+    def test__falls_back_to_other_observation_when_neighbour_deleted(self):
+        iface1 = self.make_rack_interface()
+        iface2 = self.make_rack_interface()
+        discovery = factory.make_Discovery(interface=iface1)
+        neighbour = factory.make_Neighbour(
+            interface=iface2, mac_address=discovery.mac_address,
+            ip=discovery.ip)
+        Neighbour.objects.filter(id=neighbour.id).delete()
+        self.expectThat(
+            Discovery.objects.get().observer_interface, Equals(iface1))
+        Neighbour.objects.filter(id=discovery.neighbour_id).delete()
+        self.expectThat(Discovery.objects.count(), Equals(0))
+
+    def test__follows_observer_renames(self):
+        iface = self.make_rack_interface()
+        factory.make_Discovery(interface=iface)
+        iface.name = factory.make_name("eth")
+        iface.save()
+        iface.node.hostname = factory.make_name("rack")
+        iface.node.save()
+        fabric = iface.vlan.fabric
+        fabric.name = factory.make_name("fabric")
+        fabric.save()
+        discovery = Discovery.objects.get()
+        self.expectThat(discovery.observer_interface_name, Equals(iface.name))
+        self.expectThat(
+            discovery.observer_hostname, Equals(iface.node.hostname))
+        self.expectThat(discovery.fabric_name, Equals(fabric.name))
+
+    def test__follows_subnet_changes(self):
+        iface = self.make_rack_interface()
+        factory.make_Discovery(interface=iface, ip="10.0.0.1")
+        subnet = factory.make_Subnet(cidr="10.0.0.0/8", vlan=iface.vlan)
+        self.expectThat(Discovery.objects.get().subnet, Equals(subnet))
+        subnet.delete()
+        self.expectThat(Discovery.objects.get().subnet, Is(None))
+
+
 class TestDiscoveryManagerClear(MAASServerTestCase):
     """Tests for `DiscoveryManager.clear` """
 
@@ -6,8 +6,10 @@
 __all__ = []
 
 import base64
+import copy
 from datetime import datetime
 import email
+from functools import partial
 import os
 import random
 import re
@@ -71,6 +73,7 @@ from maasserver.models import (
     BridgeInterface,
     Config,
     Controller,
+    ControllerInfo,
     Device,
     Domain,
     EventType,
@@ -97,6 +100,7 @@ from maasserver.models.bmc import (
     BMCRoutableRackControllerRelationship,
 )
 from maasserver.models.config import NetworkDiscoveryConfig
+from maasserver.models.controllerinfo import get_interfaces_hash
 from maasserver.models.event import Event
 import maasserver.models.interface as interface_module
 from maasserver.models.node import (
@@ -6836,6 +6840,35 @@ class TestReportMDNSEntries(MAASServerTestCase):
             *[call(entry) for entry in entries]
         ))
 
+    def test__updates_each_new_binding_once(self):
+        rack = factory.make_RackController()
+        factory.make_Interface(name='eth0', node=rack)
+        update_mdns_entry = self.patch(
+            interface_module.Interface, 'update_mdns_entry')
+        entry = {
+            'interface': 'eth0', 'hostname': factory.make_name('eth0'),
+            'address': factory.make_ipv4_address(),
+        }
+        rack.report_mdns_entries([entry, dict(entry)])
+        self.assertThat(update_mdns_entry, MockCalledOnceWith(entry))
+
+    def test__counts_known_bindings_without_updating_them(self):
+        rack = factory.make_RackController()
+        interface = factory.make_Interface(name='eth0', node=rack)
+        interface.mdns_discovery_state = True
+        interface.save()
+        binding = factory.make_MDNS(
+            ip=factory.make_ipv4_address(), interface=interface)
+        update_mdns_entry = self.patch(
+            interface_module.Interface, 'update_mdns_entry')
+        entry = {
+            'interface': 'eth0', 'hostname': binding.hostname,
+            'address': binding.ip,
+        }
+        rack.report_mdns_entries([entry, dict(entry)])
+        self.expectThat(update_mdns_entry, MockNotCalled())
+        self.expectThat(reload_object(binding).count, Equals(2))
+
 
 class UpdateInterfacesMixin:
 
@@ -6935,7 +6968,7 @@ class TestUpdateInterfaces(MAASServerTestCase, UpdateInterfacesMixin):
                 call(
                     "bond0.10", interfaces["bond0.10"], create_fabrics=True,
                     hints=None),
-            ] * self.passes
+            ]
         else:
             expected_call_order = [
                 call(
@@ -6968,10 +7001,12 @@ class TestUpdateInterfaces(MAASServerTestCase, UpdateInterfacesMixin):
                 call(
                     "bond0.10", interfaces["bond0.10"], create_fabrics=True,
                     hints=None),
-            ] * self.passes
+            ]
         # Perform multiple times to make sure the call order is always
-        # the same.
+        # the same. Later passes with the same definition are skipped, so
+        # forget it was applied each time.
         for _ in range(5):
+            ControllerInfo.objects.clear_interfaces_hash(controller)
             mock_update_interface = self.patch(controller, "_update_interface")
             self.update_interfaces(controller, interfaces)
             self.assertThat(
@@ -9498,6 +9533,145 @@ class TestUpdateInterfaces(MAASServerTestCase, UpdateInterfacesMixin):
         self.assertThat(alice_eth0.vlan, Equals(bob_eth0.vlan))
 
 
+class TestUpdateInterfacesChanges(MAASServerTestCase):
+    """Tests for `Controller.update_interfaces` with a known definition."""
+
+    def make_interfaces(self):
+        return {
+            "eth0": {
+                "type": "physical",
+                "mac_address": factory.make_mac_address(),
+                "parents": [],
+                "links": [],
+                "enabled": True,
+            },
+            "eth1": {
+                "type": "physical",
+                "mac_address": factory.make_mac_address(),
+                "parents": [],
+                "links": [],
+                "enabled": True,
+            },
+            "eth1.10": {
+                "type": "vlan",
+                "vid": 10,
+                "parents": ["eth1"],
+                "links": [],
+                "enabled": True,
+            },
+        }
+
+    def patch_update_interface(self, controller):
+        update_interface = self.patch(controller, "_update_interface")
+        update_interface.side_effect = partial(
+            type(controller)._update_interface, controller)
+        return update_interface
+
+    def get_updated_names(self, update_interface):
+        return [args[0] for args, _ in update_interface.call_args_list]
+
+    def test__records_applied_definition(self):
+        controller = factory.make_RackController()
+        interfaces = self.make_interfaces()
+        controller.update_interfaces(interfaces)
+        info = ControllerInfo.objects.get(node=controller)
+        self.expectThat(info.interfaces, Equals(interfaces))
+        self.expectThat(info.interfaces_hash, Not(Is(None)))
+
+    def test__skips_definition_already_applied(self):
+        controller = factory.make_RackController()
+        interfaces = self.make_interfaces()
+        controller.update_interfaces(interfaces)
+        update_interface = self.patch(controller, "_update_interface")
+        controller.update_interfaces(copy.deepcopy(interfaces))
+        self.assertThat(update_interface, MockNotCalled())
+
+    def test__updates_only_changed_interfaces_and_their_children(self):
+        controller = factory.make_RackController()
+        interfaces = self.make_interfaces()
+        controller.update_interfaces(interfaces)
+        eth0 = controller.interface_set.get(name="eth0")
+        interfaces["eth1"]["enabled"] = False
+        update_interface = self.patch_update_interface(controller)
+        controller.update_interfaces(interfaces)
+        self.expectThat(
+            self.get_updated_names(update_interface),
+            Equals(["eth1", "eth1.10"]))
+        self.expectThat(reload_object(eth0), Equals(eth0))
+        self.expectThat(
+            controller.interface_set.get(name="eth1").enabled, Is(False))
+
+    def test__removes_interfaces_missing_from_changed_definition(self):
+        controller = factory.make_RackController()
+        interfaces = self.make_interfaces()
+        controller.update_interfaces(interfaces)
+        eth0 = controller.interface_set.get(name="eth0")
+        eth1 = controller.interface_set.get(name="eth1")
+        del interfaces["eth0"]
+        update_interface = self.patch_update_interface(controller)
+        controller.update_interfaces(interfaces)
+        self.expectThat(self.get_updated_names(update_interface), Equals([]))
+        self.expectThat(reload_object(eth0), Is(None))
+        self.expectThat(reload_object(eth1), Equals(eth1))
+
+    def test__updates_all_interfaces_when_hints_change(self):
+        controller = factory.make_RackController()
+        interfaces = self.make_interfaces()
+        controller.update_interfaces(interfaces)
+        update_interface = self.patch_update_interface(controller)
+        controller.update_interfaces(interfaces, topology_hints=[{
+            "hint": "same_local_fabric_as",
+            "ifname": "eth0",
+            "related_ifname": "eth1",
+        }])
+        self.assertThat(
+            self.get_updated_names(update_interface),
+            Equals(["eth0", "eth1", "eth1.10"]))
+
+    def test__updates_interfaces_edited_since_definition_applied(self):
+        controller = factory.make_RackController()
+        interfaces = self.make_interfaces()
+        controller.update_interfaces(interfaces)
+        eth0 = controller.interface_set.get(name="eth0")
+        eth0.enabled = False
+        eth0.save()
+        info = ControllerInfo.objects.get(node=controller)
+        self.expectThat(info.interfaces_hash, Is(None))
+        # The controller reports the same definition again, which puts the
+        # edited interface back as the controller has it.
+        update_interface = self.patch_update_interface(controller)
+        controller.update_interfaces(copy.deepcopy(interfaces))
+        self.expectThat(
+            self.get_updated_names(update_interface),
+            Equals(["eth0", "eth1", "eth1.10"]))
+        self.expectThat(reload_object(eth0).enabled, Is(True))
+
+    def test__keeps_definition_when_interfaces_are_updated(self):
+        controller = factory.make_RackController()
+        interfaces = self.make_interfaces()
+        controller.update_interfaces(interfaces)
+        interfaces["eth0"]["enabled"] = False
+        controller.update_interfaces(interfaces)
+        info = ControllerInfo.objects.get(node=controller)
+        self.assertThat(
+            info.interfaces_hash,
+            Equals(get_interfaces_hash(interfaces, [])))
+
+    def test__updates_all_interfaces_after_registration_pass(self):
+        controller = factory.make_RackController()
+        interfaces = self.make_interfaces()
+        controller.update_interfaces(interfaces)
+        interfaces["eth0"]["enabled"] = False
+        controller.update_interfaces(interfaces, create_fabrics=False)
+        info = ControllerInfo.objects.get(node=controller)
+        self.expectThat(info.interfaces_hash, Is(None))
+        update_interface = self.patch_update_interface(controller)
+        controller.update_interfaces(interfaces)
+        self.expectThat(
+            self.get_updated_names(update_interface),
+            Equals(["eth0", "eth1", "eth1.10"]))
+
+
 class TestUpdateInterfacesWithHints(
         MAASTransactionServerTestCase, UpdateInterfacesMixin):
 
@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """:class:`StaticIPAddress` tests."""
@@ -432,6 +432,57 @@ class TestStaticIPAddressManagerMapping(MAASServerTestCase):
         }
         self.assertEqual(expected, mapping)
 
+    def test_iter_hostname_ip_mapping_generates_mapping_per_node(self):
+        subnet = factory.make_Subnet()
+        node = factory.make_Node_with_Interface_on_Subnet(
+            interface_count=2, subnet=subnet)
+        boot_interface = node.get_boot_interface()
+        staticip = factory.make_StaticIPAddress(
+            alloc_type=IPADDRESS_TYPE.STICKY,
+            ip=factory.pick_ip_in_Subnet(subnet),
+            subnet=subnet, interface=boot_interface)
+        iface2 = node.interface_set.exclude(id=boot_interface.id).first()
+        sip2 = factory.make_StaticIPAddress(
+            alloc_type=IPADDRESS_TYPE.STICKY,
+            ip=factory.pick_ip_in_Subnet(subnet),
+            subnet=subnet, interface=iface2)
+        reserved = factory.make_StaticIPAddress(
+            alloc_type=IPADDRESS_TYPE.USER_RESERVED,
+            ip=factory.pick_ip_in_Subnet(subnet), subnet=subnet)
+        items = list(StaticIPAddress.objects.iter_hostname_ip_mapping(subnet))
+        self.assertItemsEqual(
+            StaticIPAddress.objects.get_hostname_ip_mapping(subnet).items(),
+            items)
+        self.assertEqual(
+            [{staticip.ip}, {sip2.ip}, {reserved.ip}],
+            [info.ips for _, info in items])
+
+    def test_iter_hostname_ip_mapping_limits_nodes_to_network(self):
+        subnets = [factory.make_Subnet(cidr=cidr) for cidr in (
+            "10.1.0.0/24", "10.2.0.0/24")]
+        nodes = []
+        for subnet in subnets:
+            node = factory.make_Node_with_Interface_on_Subnet(subnet=subnet)
+            factory.make_StaticIPAddress(
+                alloc_type=IPADDRESS_TYPE.STICKY,
+                ip=factory.pick_ip_in_Subnet(subnet), subnet=subnet,
+                interface=node.get_boot_interface())
+            nodes.append(node)
+        reserved = factory.make_StaticIPAddress(
+            alloc_type=IPADDRESS_TYPE.USER_RESERVED,
+            ip=factory.pick_ip_in_Subnet(subnets[1]), subnet=subnets[1])
+        mapping = StaticIPAddress.objects.get_hostname_ip_mapping(subnets[0])
+        items = StaticIPAddress.objects.iter_hostname_ip_mapping(
+            subnets[0], network=subnets[0].get_ipnetwork())
+        # Addresses not belonging to nodes are all included; they're few.
+        reserved_name = "%s.%s" % (
+            get_ip_based_hostname(reserved.ip),
+            Domain.objects.get_default_domain().name)
+        self.assertItemsEqual([
+            (nodes[0].fqdn, mapping[nodes[0].fqdn]),
+            (reserved_name, mapping[reserved_name]),
+        ], items)
+
     def make_mapping(self, node, raw_ttl=False):
         if raw_ttl or node.address_ttl is not None:
             ttl = node.address_ttl
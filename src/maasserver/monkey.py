@@ -62,7 +62,14 @@ def fix_piston_emitter_related():
             emitters.Emitter.construct = local_vars['emitter_new_construct']
 
 
+def add_query_accounting():
+    """Account for each query issued by Django; see `maasserver.metrics`."""
+    from maasserver.metrics import install_query_accounting
+    install_query_accounting()
+
+
 def add_patches():
     add_patches_to_twisted()
+    add_query_accounting()
     fix_django_http_request()
     fix_piston_emitter_related()
@@ -7,6 +7,7 @@ __all__ = [
 
 
 from collections import defaultdict
+from functools import lru_cache
 import itertools
 from itertools import chain
 import re
@@ -279,6 +280,18 @@ def describe_multi_constraint_value(values):
 
 def get_storage_constraints_from_string(storage):
     """Return sorted list of storage constraints from the given string."""
+    constraints = parse_storage_constraints(storage)
+    return None if constraints is None else list(constraints)
+
+
+# Juju asks for the same few storage and interfaces constraints again and
+# again, so each distinct constraint string is parsed only once.
+@lru_cache(maxsize=256)
+def parse_storage_constraints(storage):
+    """Return sorted tuple of storage constraints from the given string.
+
+    Results are cached, and shared between callers: don't modify them.
+    """
     groups = STORAGE_REGEX.findall(storage)
     if not groups:
         return None
@@ -300,7 +313,16 @@ def get_storage_constraints_from_string(storage):
 
     head, tail = constraints[:1], constraints[1:]
     tail.sort(key=count_tags, reverse=True)
-    return head + tail
+    return tuple(head + tail)
+
+
+@lru_cache(maxsize=256)
+def get_labeled_constraint_map(value):
+    """Return a `LabeledConstraintMap` for the given string.
+
+    Results are cached, and shared between callers: don't modify them.
+    """
+    return LabeledConstraintMap(value)
 
 
 def nodes_by_storage(storage, node_ids=None):
@@ -414,7 +436,7 @@ def nodes_by_storage(storage, node_ids=None):
     return nodes
 
 
-def nodes_by_interface(interfaces_label_map):
+def nodes_by_interface(interfaces_label_map, node_ids=None):
     """Determines the set of nodes that match the specified
     LabeledConstraintMap (which must be a map of interface constraints.)
 
@@ -429,31 +451,35 @@ def nodes_by_interface(interfaces_label_map):
     }
 
     :param interfaces_label_map: LabeledConstraintMap
+    :param node_ids: If given, only consider the interfaces of these nodes.
+        This can be a list of IDs or a query that selects them.
     :return: dict
     """
-    node_ids = None
+    interfaces = Interface.objects.all()
+    if node_ids is not None:
+        interfaces = interfaces.filter(node_id__in=node_ids)
+    matched_node_ids = None
     label_map = {}
     for label in interfaces_label_map:
         constraints = interfaces_label_map[label]
-        if node_ids is None:
+        if matched_node_ids is None:
             # The first time through the filter, build the list
             # of candidate nodes.
-            node_ids, node_map = Interface.objects.get_matching_node_map(
+            matched_node_ids, node_map = interfaces.get_matching_node_map(
                 constraints)
             label_map[label] = node_map
         else:
             # For subsequent labels, only match nodes that already matched a
             # preceding label. Use the set intersection operator to do this,
-            # because that will yield more complete data in the label_map.
-            # (which is less efficient, but may be needed for troubleshooting.)
-            # If a more efficient approach is desired, this could be changed
-            # to filter the nodes starting from an 'id__in' filter using the
-            # current 'node_ids' set.
-            new_node_ids, node_map = Interface.objects.get_matching_node_map(
+            # rather than narrowing the query to 'matched_node_ids', because
+            # that will yield more complete data in the label_map (which is
+            # less efficient, but may be needed for troubleshooting). Every
+            # label's query is already limited to the given 'node_ids'.
+            new_node_ids, node_map = interfaces.get_matching_node_map(
                 constraints)
             label_map[label] = node_map
-            node_ids &= new_node_ids
-    return node_ids, label_map
+            matched_node_ids &= new_node_ids
+    return matched_node_ids, label_map
 
 
 class LabeledConstraintMapField(Field):
@@ -467,7 +493,7 @@ class LabeledConstraintMapField(Field):
     def to_python(self, value):
         """Returns a LabeledConstraintMap object."""
         if value is not None and len(value.strip()) != 0:
-            return LabeledConstraintMap(value)
+            return get_labeled_constraint_map(value)
 
 
 class AcquireNodeForm(RenamableFieldsForm):
@@ -787,8 +813,11 @@ class AcquireNodeForm(RenamableFieldsForm):
         interfaces_label_map = self.cleaned_data.get(
             self.get_field_name('interfaces'))
         if interfaces_label_map is not None:
+            # Only match the interfaces of nodes that meet the other
+            # constraints; the database does this in the same query.
             node_ids, compatible_interfaces = nodes_by_interface(
-                interfaces_label_map)
+                interfaces_label_map,
+                node_ids=filtered_nodes.values('id'))
             if node_ids is not None:
                 filtered_nodes = filtered_nodes.filter(id__in=node_ids)
 
@@ -799,7 +828,10 @@ class AcquireNodeForm(RenamableFieldsForm):
         storage = self.cleaned_data.get(
             self.get_field_name('storage'))
         if storage:
-            compatible_nodes = nodes_by_storage(storage)
+            # Only match the storage of nodes that meet the other
+            # constraints; the database does this in the same queries.
+            compatible_nodes = nodes_by_storage(
+                storage, node_ids=filtered_nodes.values('id'))
             node_ids = list(compatible_nodes)
             if node_ids is not None:
                 filtered_nodes = filtered_nodes.filter(id__in=node_ids)
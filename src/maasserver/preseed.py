@@ -55,6 +55,7 @@ from maasserver.models import (
 )
 from maasserver.models.filesystem import Filesystem
 from maasserver.node_status import COMMISSIONING_LIKE_STATUSES
+from maasserver.preseed_cache import preseed_cache
 from maasserver.preseed_network import compose_curtin_network_config
 from maasserver.preseed_storage import compose_curtin_storage_config
 from maasserver.server_address import get_maas_facing_server_host
@@ -410,9 +411,9 @@ def get_curtin_userdata(node):
     """
     # Pack the curtin and the configuration into a script to execute on the
     # deploying node.
-    return pack_install(
+    return preseed_cache.get(node, "curtin-userdata", lambda: pack_install(
         configs=get_curtin_yaml_config(node),
-        args=[get_curtin_installer_url(node)])
+        args=[get_curtin_installer_url(node)]))
 
 
 def get_curtin_image(node):
@@ -578,6 +579,12 @@ def get_preseed(node) -> bytes:
     :return: The rendered preseed string.
     :rtype: unicode.
     """
+    return preseed_cache.get(
+        node, "preseed", lambda: render_node_preseed(node))
+
+
+def render_node_preseed(node):
+    """Render the preseed for a given node; see `get_preseed`."""
     if node.status in COMMISSIONING_LIKE_STATUSES:
         return render_preseed(
             node, PRESEED_TYPE.COMMISSIONING,
@@ -0,0 +1,121 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Cache of rendered preseeds and user-data, per node."""
+
+__all__ = [
+    "preseed_cache",
+    "PreseedCache",
+]
+
+from collections import OrderedDict
+from datetime import timedelta
+import threading
+from time import monotonic
+
+# Entries older than this are rendered again, even if nothing they depend on
+# is known to have changed. This bounds the effect of a missed notification.
+# It is also the only invalidation for changes to a rack controller's boot
+# images and connections, which send no notification, so an entry may refer
+# to a rack's old images, or to a rack that went away, for this long.
+MAX_AGE = timedelta(minutes=5).total_seconds()
+
+# The most entries to keep. Each is a rendered preseed or user-data for a
+# single node, typically a few tens of kilobytes.
+MAX_ENTRIES = 1000
+
+
+class PreseedCache:
+    """Rendered preseeds and user-data, cached per node, in this process.
+
+    Entries are tagged with generation counters when they're rendered: one
+    for the configuration shared by all nodes -- networks, package
+    repositories, settings -- and one per node for the node itself and its
+    storage and interfaces. `PreseedCacheService` increments these when the
+    database notifies that something they cover has changed, after which the
+    affected entries are rendered again on their next use.
+
+    The cache is disabled -- `get` always renders -- until that service
+    enables it, because without notifications entries could go stale.
+
+    :ivar generation: The generation of the shared configuration.
+    :ivar node_generations: The generation of each node, by system_id.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_age=MAX_AGE,
+                 clock=monotonic):
+        super(PreseedCache, self).__init__()
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.generation = 0
+        self.node_generations = {}
+        self.entries = OrderedDict()
+
+    def enable(self):
+        """Start caching."""
+        self.enabled = True
+
+    def disable(self):
+        """Stop caching, and forget all entries."""
+        with self.lock:
+            self.enabled = False
+            self.generation += 1
+            self.node_generations.clear()
+            self.entries.clear()
+
+    def invalidate(self, system_id=None):
+        """Increment the generation of the node with `system_id`.
+
+        If `system_id` is `None`, increment the generation of the shared
+        configuration instead, invalidating every entry.
+        """
+        with self.lock:
+            if system_id is None:
+                self.generation += 1
+                self.entries.clear()
+            else:
+                self.node_generations[system_id] = (
+                    self.node_generations.get(system_id, 0) + 1)
+
+    def _get_generations(self, system_id):
+        return self.generation, self.node_generations.get(system_id, 0)
+
+    def get(self, node, kind, render):
+        """Return the `kind` of preseed or user-data for `node`.
+
+        :param kind: A name for what's being rendered, e.g. "curtin".
+        :param render: A callable that renders it; called only when there's
+            no current entry for `node` and `kind`.
+        """
+        if not self.enabled:
+            return render()
+        key = node.system_id, kind
+        now = self.clock()
+        with self.lock:
+            generations = self._get_generations(node.system_id)
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry_generations, rendered_at, value = entry
+                if (entry_generations == generations and
+                        now - rendered_at < self.max_age):
+                    self.entries.move_to_end(key)
+                    return value
+                else:
+                    del self.entries[key]
+        value = render()
+        with self.lock:
+            # Don't cache a value that something may have changed beneath
+            # while it was being rendered.
+            if self.enabled and (
+                    generations == self._get_generations(node.system_id)):
+                self.entries[key] = generations, now, value
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return value
+
+
+# The preseed cache for this process.
+preseed_cache = PreseedCache()
@@ -1,4 +1,4 @@
-# Copyright 2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2016-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Region controller service.
@@ -17,6 +17,13 @@ Proxy:
     'sys_proxy'. Any time a message is recieved on that channel the maas-proxy
     is marked as requiring an update. Once marked for update the proxy
     configuration is updated and maas-proxy is told to reload.
+
+Boot configuration:
+    The regiond process listens for messages from Postgres on channel
+    'sys_boot_config'. Each message carries a comma-separated list of MAC
+    addresses, or '*' for all. These are collected and every connected rack
+    controller is told to forget the boot configurations it has cached for
+    them.
 """
 
 __all__ = [
@@ -26,9 +33,11 @@ __all__ = [
 from maasserver.dns.config import dns_update_all_zones
 from maasserver.models.dnspublication import DNSPublication
 from maasserver.proxyconfig import proxy_update_config
+from maasserver.rpc import getAllClients
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
 from provisioningserver.logger import LegacyLogger
+from provisioningserver.rpc.cluster import InvalidateBootConfigs
 from provisioningserver.utils.twisted import (
     asynchronous,
     FOREVER,
@@ -73,6 +82,8 @@ class RegionControllerService(Service):
         self.processingDefer = None
         self.needsDNSUpdate = False
         self.needsProxyUpdate = False
+        self.needsBootConfigsInvalidated = False
+        self.bootConfigMACs = set()
         self.postgresListener = postgresListener
         self.dnsResolver = Resolver(
             resolv=None, servers=[('127.0.0.1', 53)],
@@ -85,6 +96,8 @@ class RegionControllerService(Service):
         super(RegionControllerService, self).startService()
         self.postgresListener.register("sys_dns", self.markDNSForUpdate)
         self.postgresListener.register("sys_proxy", self.markProxyForUpdate)
+        self.postgresListener.register(
+            "sys_boot_config", self.markBootConfigsForInvalidation)
 
         # Update DNS and proxy on first start.
         self.markDNSForUpdate(None, None)
@@ -96,6 +109,8 @@ class RegionControllerService(Service):
         super(RegionControllerService, self).stopService()
         self.postgresListener.unregister("sys_dns", self.markDNSForUpdate)
         self.postgresListener.unregister("sys_proxy", self.markProxyForUpdate)
+        self.postgresListener.unregister(
+            "sys_boot_config", self.markBootConfigsForInvalidation)
         if self.processingDefer is not None:
             self.processingDefer, d = None, self.processingDefer
             self.processing.stop()
@@ -111,13 +126,21 @@ class RegionControllerService(Service):
         self.needsProxyUpdate = True
         self.startProcessing()
 
+    def markBootConfigsForInvalidation(self, channel, message):
+        """Called when the `sys_boot_config` message is received."""
+        if message == "*":
+            self.needsBootConfigsInvalidated = True
+        elif message:
+            self.bootConfigMACs.update(message.split(","))
+        self.startProcessing()
+
     def startProcessing(self):
         """Start the process looping call."""
         if not self.processing.running:
             self.processingDefer = self.processing.start(0.1, now=False)
 
     def process(self):
-        """Process the DNS and/or proxy update."""
+        """Process the DNS, proxy, and/or boot configuration updates."""
         defers = []
         if self.needsDNSUpdate:
             self.needsDNSUpdate = False
@@ -138,6 +161,14 @@ class RegionControllerService(Service):
                 log.err,
                 "Failed configuring proxy.")
             defers.append(d)
+        if self.needsBootConfigsInvalidated or len(self.bootConfigMACs) > 0:
+            if self.needsBootConfigsInvalidated:
+                macs = None
+            else:
+                macs = sorted(self.bootConfigMACs)
+            self.needsBootConfigsInvalidated = False
+            self.bootConfigMACs = set()
+            defers.append(self._invalidateBootConfigs(macs))
         if len(defers) == 0:
             # Nothing more to do.
             self.processing.stop()
@@ -145,6 +176,19 @@ class RegionControllerService(Service):
         else:
             return DeferredList(defers)
 
+    def _invalidateBootConfigs(self, macs):
+        """Tell every connected rack controller to forget the boot
+        configurations cached for `macs`, or all of them if `macs` is `None`.
+        """
+        def invalidate(client):
+            d = client(InvalidateBootConfigs, macs=macs)
+            d.addErrback(
+                log.err, "Failed invalidating boot configurations on "
+                "rack controller '%s'." % client.ident)
+            return d
+
+        return DeferredList(map(invalidate, getAllClients()))
+
     @inlineCallbacks
     def _checkSerial(self, result):
         """Check that the serial of the domain is updated."""
@@ -0,0 +1,84 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Service that keeps this process's configuration cache up to date."""
+
+__all__ = [
+    "ConfigCacheService",
+]
+
+from datetime import timedelta
+
+from maasserver.models.config import config_cache
+from maasserver.utils.threads import deferToDatabase
+from provisioningserver.logger import LegacyLogger
+from twisted.application.internet import TimerService
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+
+
+log = LegacyLogger()
+
+
+# The cache is reloaded periodically in case a notification is missed, e.g.
+# while the listener is reconnecting to the database.
+RELOAD_INTERVAL = timedelta(minutes=1).total_seconds()
+
+
+class ConfigCacheService(TimerService):
+    """Load the `Config` table into memory, and reload it when it changes.
+
+    The `sys_config` channel of the `PostgresListenerService` is notified
+    each time a configuration item is inserted, updated, or deleted. The
+    cache is invalidated straight away, then reloaded in a new transaction.
+    Until it's reloaded `Config.objects.get_config` queries the database.
+    """
+
+    def __init__(self, postgresListener=None, cache=config_cache,
+                 clock=reactor):
+        super().__init__(RELOAD_INTERVAL, self.reload)
+        self.clock = clock
+        self.listener = postgresListener
+        self.cache = cache
+        self.reloading = None
+
+    def startService(self):
+        if self.listener is not None:
+            self.listener.register("sys_config", self.configChanged)
+        super().startService()
+
+    def stopService(self):
+        if self.listener is not None:
+            self.listener.unregister("sys_config", self.configChanged)
+        # Without notifications the cache would soon be stale.
+        self.cache.invalidate()
+        return super().stopService()
+
+    def configChanged(self, channel, name):
+        """Called when the `sys_config` channel is notified."""
+        self.cache.invalidate()
+        self.reload()
+
+    def reload(self):
+        """Reload the cache, unless a reload is already in progress.
+
+        A reload in progress notices if it was overtaken by an invalidation,
+        and tries again.
+        """
+        if self.reloading is None:
+            d = self.reloading = self._reload()
+            d.addErrback(log.err, "Failed to load the configuration cache.")
+            d.addBoth(self._reloaded)
+            return d
+        else:
+            return self.reloading
+
+    def _reloaded(self, _):
+        self.reloading = None
+
+    @inlineCallbacks
+    def _reload(self):
+        while self.running:
+            loaded = yield deferToDatabase(self.cache.load)
+            if loaded:
+                break
@@ -0,0 +1,122 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Event watcher service.
+
+Tracks the newest event announced by the database so that API clients can
+long-poll for new events without repeatedly querying the events table.
+"""
+
+__all__ = [
+    "EventWatcherService",
+    "get_event_watcher",
+    "TooManyWaiters",
+]
+
+import threading
+
+from maasserver import concurrency
+from maasserver.listener import PostgresListenerService
+from twisted.application.service import Service
+
+
+class TooManyWaiters(Exception):
+    """Raised when as many threads as allowed are already waiting."""
+
+
+class EventWatcherService(Service):
+    """Service that wakes up threads waiting for new events.
+
+    The `event` channel of the `PostgresListenerService` is notified each
+    time a row is inserted into `maasserver_event`. This records the newest
+    event ID seen so far; threads blocked in `wait_for_event_after` are
+    woken as soon as an event newer than the one they know about arrives.
+
+    Waiting threads are web application threads, each holding one of the
+    slots limited by `maasserver.concurrency.webapp` and a database
+    connection, so at most `max_waiters` may wait at once.
+
+    :ivar latest: The ID of the newest event announced since this service
+        started, or `None` if none has been announced yet.
+    :ivar waiters: The number of threads waiting right now.
+    """
+
+    # Leave at least half of the web application's slots for other requests.
+    max_waiters = max(1, concurrency.webapp.limit // 2)
+
+    def __init__(self, postgresListener: PostgresListenerService=None):
+        super().__init__()
+        self.listener = postgresListener
+        self.condition = threading.Condition()
+        self.latest = None
+        self.waiters = 0
+
+    def startService(self):
+        super().startService()
+        if self.listener is not None:
+            self.listener.register("event", self.consumeEventNotification)
+
+    def stopService(self):
+        if self.listener is not None:
+            self.listener.unregister("event", self.consumeEventNotification)
+        d = super().stopService()
+        # Release all waiters; they will find nothing new and return.
+        with self.condition:
+            self.condition.notify_all()
+        return d
+
+    def consumeEventNotification(self, action: str, event_id: str):
+        """Record the event announced by the postgres listener.
+
+        Called in the reactor; this never touches the database.
+        """
+        if action != "create":
+            return
+        event_id = int(event_id)
+        with self.condition:
+            if self.latest is None or event_id > self.latest:
+                self.latest = event_id
+            self.condition.notify_all()
+
+    def wait_for_event_after(self, event_id: int, timeout: float) -> bool:
+        """Block until an event newer than `event_id` has been announced.
+
+        Must NOT be called from the reactor thread.
+
+        :param event_id: The ID of the newest event known to the caller.
+        :param timeout: The maximum number of seconds to wait.
+        :return: True if a newer event has been announced, False if the
+            timeout expired or the service was stopped.
+        :raise TooManyWaiters: If `max_waiters` threads are already waiting.
+        """
+        def has_newer_event():
+            if not self.running:
+                return True
+            return self.latest is not None and self.latest > event_id
+
+        with self.condition:
+            if self.waiters >= self.max_waiters:
+                raise TooManyWaiters(
+                    "%d threads are already waiting for events." % (
+                        self.waiters))
+            self.waiters += 1
+            try:
+                self.condition.wait_for(has_newer_event, timeout)
+            finally:
+                self.waiters -= 1
+            return self.latest is not None and self.latest > event_id
+
+
+def get_event_watcher():
+    """Return the running `EventWatcherService` for this process.
+
+    :return: The service, or `None` when it's not running, e.g. when called
+        from a management command or from a test.
+    """
+    from maasserver.eventloop import services
+    try:
+        service = services.getServiceNamed("event-watcher")
+    except KeyError:
+        return None
+    else:
+        return service if service.running else None
@@ -0,0 +1,71 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Service that keeps this process's preseed cache up to date."""
+
+__all__ = [
+    "PreseedCacheService",
+]
+
+from maasserver.preseed_cache import preseed_cache
+from twisted.application.service import Service
+
+# Channels notified when a node, or its storage or interfaces, change. The
+# notification's payload is the node's system_id.
+NODE_CHANNELS = (
+    "controller",
+    "machine",
+)
+
+# Channels notified when configuration shared by all nodes changes.
+SHARED_CHANNELS = (
+    "config",
+    "domain",
+    "fabric",
+    "packagerepository",
+    "space",
+    "staticroute",
+    "subnet",
+    "vlan",
+)
+
+
+class PreseedCacheService(Service):
+    """Enable the `PreseedCache`, and invalidate it when models change.
+
+    Every region process renders preseeds and user-data, but models can be
+    changed in any of them, so generations are incremented on notifications
+    from the database's triggers rather than by Django's in-process signals.
+    """
+
+    def __init__(self, postgresListener=None, cache=preseed_cache):
+        super().__init__()
+        self.listener = postgresListener
+        self.cache = cache
+
+    def startService(self):
+        super().startService()
+        if self.listener is not None:
+            for channel in NODE_CHANNELS:
+                self.listener.register(channel, self.nodeChanged)
+            for channel in SHARED_CHANNELS:
+                self.listener.register(channel, self.sharedChanged)
+            self.cache.enable()
+
+    def stopService(self):
+        if self.listener is not None:
+            for channel in NODE_CHANNELS:
+                self.listener.unregister(channel, self.nodeChanged)
+            for channel in SHARED_CHANNELS:
+                self.listener.unregister(channel, self.sharedChanged)
+        # Without notifications the cache would soon be stale.
+        self.cache.disable()
+        return super().stopService()
+
+    def nodeChanged(self, action, system_id):
+        """Called when a node, or its storage or interfaces, change."""
+        self.cache.invalidate(system_id)
+
+    def sharedChanged(self, action, obj_id):
+        """Called when configuration shared by all nodes changes."""
+        self.cache.invalidate()
@@ -1,4 +1,4 @@
-# Copyright 2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2016-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Reverse DNS service."""
@@ -7,33 +7,73 @@ __all__ = [
     "ReverseDNSService"
 ]
 
-from typing import List
+from collections import OrderedDict
+from datetime import timedelta
+from typing import (
+    Dict,
+    List,
+)
 
 from maasserver.listener import PostgresListenerService
 from maasserver.models import (
     RDNS,
     RegionController,
 )
+from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.utils.network import reverseResolve
 from provisioningserver.utils.twisted import suppress
 from twisted.application.service import Service
-from twisted.internet import defer
+from twisted.internet import (
+    defer,
+    reactor,
+)
+from twisted.internet.interfaces import IResolver
+from twisted.python.failure import Failure
 
 
 log = LegacyLogger()
 
 
 class ReverseDNSService(Service):
-    """Service to resolve and cache reverse DNS names for neighbour entries."""
+    """Service to resolve and cache reverse DNS names for neighbour entries.
+
+    Neighbours are observed over and over, so lookups are deduplicated: an
+    IP address that is already being resolved is not resolved again, and
+    results are cached for `cache_ttl` seconds (`negative_cache_ttl` when
+    the address has no names). At most `concurrency` lookups are made at
+    once. Changed results are saved in batches, one transaction at a time;
+    results that are the same as those last saved are not saved again.
+
+    :ivar cache: Results by IP address, each with the time they expire.
+    """
+
+    cache_ttl = timedelta(minutes=5).total_seconds()
+    negative_cache_ttl = timedelta(minutes=1).total_seconds()
 
-    def __init__(self, postgresListener: PostgresListenerService=None):
+    # The most IP addresses to remember results for.
+    cache_size = 10000
+
+    # The most reverse lookups to make at once.
+    concurrency = 10
+
+    def __init__(
+            self, postgresListener: PostgresListenerService=None,
+            resolver: IResolver=None, clock=reactor):
         super().__init__()
         self.listener = postgresListener
+        self.resolver = resolver
+        self.clock = clock
         # We will cache a reference to the region model object so we don't
         # need to look it up every time a DNS entry changes.
         self.region = None
+        self.cache = OrderedDict()
+        self._lookups = defer.DeferredSemaphore(self.concurrency)
+        self._resolving = {}
+        self._writes = OrderedDict()
+        self._waiting = []
+        self._writing = False
 
     @defer.inlineCallbacks
     def startService(self):
@@ -68,7 +108,116 @@ class ReverseDNSService(Service):
         """
         RDNS.objects.delete_current_entry(ip, self.region)
 
+    @transactional
+    def save_rdns_entries(self, entries: Dict[str, List[str]]):
+        """Set or delete the reverse-DNS entries for several IP addresses.
+
+        Must run in a thread where database access is permitted.
+
+        :param entries: a dict mapping IP addresses to lists of hostnames,
+            in "preferred" order. The entry for an IP address with an empty
+            list of hostnames is deleted.
+        """
+        for ip, results in entries.items():
+            if len(results) > 0:
+                self.set_rdns_entry(ip, results)
+            else:
+                self.delete_rdns_entry(ip)
+
+    def _getCachedResults(self, ip: str):
+        """Return the unexpired cached results for `ip`, or `None`."""
+        cached = self.cache.get(ip)
+        if cached is not None:
+            expires, results = cached
+            if expires > self.clock.seconds():
+                return results
+        return None
+
+    def _cacheResults(self, ip: str, results: List[str]):
+        """Cache `results` for `ip`, forgetting the oldest results if full."""
+        ttl = self.cache_ttl if len(results) > 0 else self.negative_cache_ttl
+        self.cache.pop(ip, None)
+        self.cache[ip] = self.clock.seconds() + ttl, results
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _save(self, ip: str, results: List[str]):
+        """Save `results` for `ip` with the next batch of changes.
+
+        :return: A `Deferred` that fires once the batch has been saved.
+        """
+        self._writes[ip] = results
+        waiting = defer.Deferred()
+        self._waiting.append(waiting)
+        if not self._writing:
+            self._writing = True
+            self._saveBatches()
+        return waiting
+
     @defer.inlineCallbacks
+    def _saveBatches(self):
+        """Save queued changes, in batches, until there are none left.
+
+        Changes that are queued while a batch is being saved are saved
+        together in the next batch.
+        """
+        try:
+            while len(self._writes) > 0:
+                entries, self._writes = self._writes, OrderedDict()
+                waiting, self._waiting = self._waiting, []
+                try:
+                    yield deferToDatabase(self.save_rdns_entries, entries)
+                except:
+                    log.err(None, "Failed to save reverse-DNS entries.")
+                    # Look these up and try again next time.
+                    for ip in entries:
+                        self.cache.pop(ip, None)
+                for d in waiting:
+                    d.callback(None)
+        finally:
+            self._writing = False
+
+    def _resolve(self, ip: str):
+        """Resolve `ip` and save its results if they have changed.
+
+        Only one lookup for each IP address is made at a time: requests made
+        while one is in progress share its result.
+        """
+        resolving = self._resolving.get(ip)
+        if resolving is None:
+            resolving = self._resolving[ip] = self._lookups.run(
+                reverseResolve, ip, resolver=self.resolver)
+            resolving.addErrback(suppress, defer.TimeoutError, instead=None)
+            resolving.addCallback(self._resolved, ip, resolving)
+        # Each caller gets its own Deferred, firing when the results have
+        # been saved, without disturbing the shared one.
+        done = defer.Deferred()
+
+        def notify(result):
+            if isinstance(result, Failure):
+                done.errback(result)
+            else:
+                done.callback(None)
+
+        resolving.addBoth(notify)
+        return done
+
+    def _resolved(self, results, ip: str, resolving):
+        if self._resolving.get(ip) is not resolving:
+            # The neighbour was deleted while this lookup was in progress.
+            return None
+        del self._resolving[ip]
+        if results is None:
+            # A return of 'None' indicates a timeout or other possibly-
+            # temporary failure, so take no action.
+            return None
+        cached = self.cache.get(ip)
+        self._cacheResults(ip, results)
+        if cached is not None and cached[1] == results:
+            return None  # Unchanged since they were last saved.
+        else:
+            return self._save(ip, results)
+
     def consumeNeighbourEvent(self, action: str=None, cidr: str=None):
         """Given an event from the postgresListener, resolve RDNS for an IP.
 
@@ -78,27 +227,22 @@ class ReverseDNSService(Service):
         :param cidr: the 'ip' field in the neighbour table, after PostgreSQL
             casts it to a string. It will end up looking like "x.x.x.x/32"
             or "yyyy:yyyy::yyyy/128".
+        :return: A `Deferred` that fires once any change has been saved.
         """
         ip = cidr.split('/')[0]  # Strip off the "/<prefixlen>".
         if action in ('create', 'update'):
-            # XXX mpontillo 2016-10-19: We might consider throttling this on
-            # a per-IP-address basis, both because multiple racks can observe
-            # the same IP address, and because an IP address might repeatedly
-            # go back-and-forth between two MACs in the case of a duplicate IP
-            # address.
-            results = yield reverseResolve(ip).addErrback(
-                suppress, defer.TimeoutError, instead=None)
-            if results is not None:
-                if len(results) > 0:
-                    yield deferToDatabase(self.set_rdns_entry, ip, results)
-                else:
-                    yield deferToDatabase(self.delete_rdns_entry, ip)
+            if self._getCachedResults(ip) is not None:
+                # Multiple racks can observe the same IP address, and an IP
+                # address might go back-and-forth between two MACs in the
+                # case of a duplicate IP address. Don't look it up again.
+                return defer.succeed(None)
             else:
-                # A return of 'None' indicates a timeout or other possibly-
-                # temporary failure, so take no action.
-                pass
+                return self._resolve(ip)
         elif action == 'delete':
-            yield deferToDatabase(self.delete_rdns_entry, ip)
+            self._resolving.pop(ip, None)
+            self.cache.pop(ip, None)
+            return self._save(ip, [])
         else:
             log.msg("Unsupported event from listener: action=%r, cidr=%r" % (
                 action, cidr), system="reverse-dns")
+            return defer.succeed(None)
@@ -0,0 +1,119 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the configuration cache service."""
+
+__all__ = []
+
+from unittest.mock import Mock
+
+from maasserver.regiondservices import config_cache
+from maasserver.regiondservices.config_cache import ConfigCacheService
+from maasserver.testing.listener import FakePostgresListenerService
+from maastesting.factory import factory
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
+from maastesting.testcase import MAASTestCase
+from maastesting.twisted import TwistedLoggerFixture
+from testtools.matchers import (
+    Contains,
+    Equals,
+    Is,
+    Not,
+)
+from twisted.internet.defer import (
+    Deferred,
+    maybeDeferred,
+)
+from twisted.internet.task import Clock
+
+
+class TestConfigCacheService(MAASTestCase):
+    """Tests for `ConfigCacheService`."""
+
+    def setUp(self):
+        super(TestConfigCacheService, self).setUp()
+        self.patch(config_cache, "deferToDatabase", maybeDeferred)
+
+    def make_service(self, loads=(True,)):
+        cache = Mock()
+        cache.load.side_effect = loads
+        listener = FakePostgresListenerService()
+        service = ConfigCacheService(listener, cache, Clock())
+        return service, listener, cache
+
+    def test__registers_and_unregisters_sys_config_channel(self):
+        service, listener, _ = self.make_service()
+        service.startService()
+        self.assertThat(
+            listener.listeners["sys_config"],
+            Contains(service.configChanged))
+        service.stopService()
+        self.assertThat(
+            listener.listeners["sys_config"],
+            Not(Contains(service.configChanged)))
+
+    def test__loads_cache_on_start(self):
+        service, _, cache = self.make_service()
+        service.startService()
+        self.addCleanup(service.stopService)
+        self.assertThat(cache.load, MockCalledOnceWith())
+
+    def test__reloads_cache_periodically(self):
+        service, _, cache = self.make_service(loads=(True, True))
+        service.startService()
+        self.addCleanup(service.stopService)
+        service.clock.advance(config_cache.RELOAD_INTERVAL)
+        self.assertThat(cache.load.call_count, Equals(2))
+
+    def test__invalidates_cache_on_stop(self):
+        service, _, cache = self.make_service()
+        service.startService()
+        service.stopService()
+        self.assertThat(cache.invalidate, MockCalledOnceWith())
+
+    def test__invalidates_and_reloads_when_config_changes(self):
+        service, _, cache = self.make_service(loads=(True, True))
+        service.startService()
+        self.addCleanup(service.stopService)
+        service.configChanged("sys_config", factory.make_name("name"))
+        self.expectThat(cache.invalidate, MockCalledOnceWith())
+        self.expectThat(cache.load.call_count, Equals(2))
+
+    def test__reload_retries_when_overtaken_by_invalidation(self):
+        service, _, cache = self.make_service(loads=(False, True))
+        service.startService()
+        self.addCleanup(service.stopService)
+        self.assertThat(cache.load.call_count, Equals(2))
+
+    def test__reload_does_not_overlap(self):
+        service, _, cache = self.make_service()
+        loading = Deferred()
+        self.patch(config_cache, "deferToDatabase").return_value = loading
+        service.startService()
+        self.addCleanup(service.stopService)
+        self.expectThat(service.reload(), Is(service.reloading))
+        self.expectThat(config_cache.deferToDatabase.call_count, Equals(1))
+        loading.callback(True)
+        self.expectThat(service.reloading, Is(None))
+
+    def test__logs_failures_to_load(self):
+        service, _, cache = self.make_service(
+            loads=factory.make_exception())
+        with TwistedLoggerFixture() as logger:
+            service.startService()
+            self.addCleanup(service.stopService)
+        self.expectThat(service.reloading, Is(None))
+        self.assertDocTestMatches(
+            """\
+            Failed to load the configuration cache.
+            Traceback (most recent call last):
+            ...
+            """, logger.output)
+
+    def test__does_not_reload_when_stopped(self):
+        service, _, cache = self.make_service()
+        service.reload()
+        self.assertThat(cache.load, MockNotCalled())
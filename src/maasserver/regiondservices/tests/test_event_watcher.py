@@ -0,0 +1,148 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the event watcher service."""
+
+__all__ = []
+
+import threading
+from time import sleep
+
+from maasserver import eventloop
+from maasserver.regiondservices.event_watcher import (
+    EventWatcherService,
+    get_event_watcher,
+    TooManyWaiters,
+)
+from maasserver.testing.listener import FakePostgresListenerService
+from maastesting.testcase import MAASTestCase
+from provisioningserver.utils.twisted import retries
+from testtools.matchers import (
+    Contains,
+    Equals,
+    Is,
+    Not,
+)
+from twisted.application.service import MultiService
+
+
+def wait_for_waiters(service, count, timeout=30):
+    """Wait until `count` threads are waiting in `service`."""
+    for elapsed, remaining, wait in retries(timeout, 0.01):
+        if service.waiters == count:
+            return
+        sleep(wait)
+    raise AssertionError(
+        "Expected %d waiters, but there are %d." % (count, service.waiters))
+
+
+class TestEventWatcherService(MAASTestCase):
+    """Tests for `EventWatcherService`."""
+
+    def test__registers_and_unregisters_event_channel(self):
+        listener = FakePostgresListenerService()
+        service = EventWatcherService(listener)
+        service.startService()
+        self.assertThat(
+            listener.listeners["event"],
+            Contains(service.consumeEventNotification))
+        service.stopService()
+        self.assertThat(
+            listener.listeners["event"],
+            Not(Contains(service.consumeEventNotification)))
+
+    def test__records_latest_created_event(self):
+        service = EventWatcherService()
+        service.consumeEventNotification("create", "12")
+        service.consumeEventNotification("create", "10")
+        self.assertThat(service.latest, Equals(12))
+
+    def test__ignores_updates_and_deletes(self):
+        service = EventWatcherService()
+        service.consumeEventNotification("update", "12")
+        service.consumeEventNotification("delete", "13")
+        self.assertThat(service.latest, Is(None))
+
+    def test__wait_returns_immediately_when_newer_event_known(self):
+        service = EventWatcherService()
+        service.startService()
+        self.addCleanup(service.stopService)
+        service.consumeEventNotification("create", "12")
+        self.assertTrue(service.wait_for_event_after(11, 0))
+
+    def test__wait_times_out_when_no_newer_event(self):
+        service = EventWatcherService()
+        service.startService()
+        self.addCleanup(service.stopService)
+        service.consumeEventNotification("create", "12")
+        self.assertFalse(service.wait_for_event_after(12, 0.01))
+
+    def test__wait_is_woken_by_new_event(self):
+        service = EventWatcherService()
+        service.startService()
+        self.addCleanup(service.stopService)
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(
+            service.wait_for_event_after(5, 30)))
+        waiter.start()
+        service.consumeEventNotification("create", "6")
+        waiter.join(30)
+        self.assertThat(results, Equals([True]))
+
+    def test__wait_is_released_when_stopped(self):
+        service = EventWatcherService()
+        service.startService()
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(
+            service.wait_for_event_after(5, 30)))
+        waiter.start()
+        service.stopService()
+        waiter.join(30)
+        self.assertThat(results, Equals([False]))
+
+    def test__wait_refuses_more_than_max_waiters(self):
+        service = EventWatcherService()
+        service.max_waiters = 1
+        service.startService()
+        waiter = threading.Thread(
+            target=service.wait_for_event_after, args=(5, 30))
+        waiter.start()
+        wait_for_waiters(service, 1)
+        self.assertRaises(
+            TooManyWaiters, service.wait_for_event_after, 5, 0.01)
+        service.stopService()
+        waiter.join(30)
+        self.assertThat(service.waiters, Equals(0))
+
+    def test__wait_counts_waiters(self):
+        service = EventWatcherService()
+        service.startService()
+        self.addCleanup(service.stopService)
+        service.wait_for_event_after(5, 0.01)
+        self.assertThat(service.waiters, Equals(0))
+
+
+class TestGetEventWatcher(MAASTestCase):
+    """Tests for `get_event_watcher`."""
+
+    def setUp(self):
+        super(TestGetEventWatcher, self).setUp()
+        self.services = MultiService()
+        self.patch(eventloop, "services", self.services)
+
+    def test__returns_running_service(self):
+        service = EventWatcherService()
+        service.setName("event-watcher")
+        service.setServiceParent(self.services)
+        service.startService()
+        self.addCleanup(service.stopService)
+        self.assertThat(get_event_watcher(), Is(service))
+
+    def test__returns_None_when_not_running(self):
+        service = EventWatcherService()
+        service.setName("event-watcher")
+        service.setServiceParent(self.services)
+        self.assertThat(get_event_watcher(), Is(None))
+
+    def test__returns_None_when_not_registered(self):
+        self.assertThat(get_event_watcher(), Is(None))
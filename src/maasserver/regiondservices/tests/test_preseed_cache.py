@@ -0,0 +1,80 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the preseed cache service."""
+
+__all__ = []
+
+from unittest.mock import Mock
+
+from maasserver.regiondservices.preseed_cache import (
+    NODE_CHANNELS,
+    PreseedCacheService,
+    SHARED_CHANNELS,
+)
+from maasserver.testing.listener import FakePostgresListenerService
+from maastesting.factory import factory
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
+from maastesting.testcase import MAASTestCase
+from testtools.matchers import (
+    Contains,
+    Not,
+)
+
+
+class TestPreseedCacheService(MAASTestCase):
+    """Tests for `PreseedCacheService`."""
+
+    def make_service(self):
+        cache = Mock()
+        listener = FakePostgresListenerService()
+        service = PreseedCacheService(listener, cache)
+        return service, listener, cache
+
+    def test__registers_and_unregisters_channels(self):
+        service, listener, _ = self.make_service()
+        service.startService()
+        for channel in NODE_CHANNELS:
+            self.expectThat(
+                listener.listeners[channel], Contains(service.nodeChanged))
+        for channel in SHARED_CHANNELS:
+            self.expectThat(
+                listener.listeners[channel], Contains(service.sharedChanged))
+        service.stopService()
+        for channel in NODE_CHANNELS:
+            self.expectThat(
+                listener.listeners[channel],
+                Not(Contains(service.nodeChanged)))
+        for channel in SHARED_CHANNELS:
+            self.expectThat(
+                listener.listeners[channel],
+                Not(Contains(service.sharedChanged)))
+
+    def test__enables_cache_on_start_and_disables_on_stop(self):
+        service, _, cache = self.make_service()
+        service.startService()
+        self.expectThat(cache.enable, MockCalledOnceWith())
+        self.expectThat(cache.disable, MockNotCalled())
+        service.stopService()
+        self.expectThat(cache.disable, MockCalledOnceWith())
+
+    def test__does_not_enable_cache_without_listener(self):
+        cache = Mock()
+        service = PreseedCacheService(None, cache)
+        service.startService()
+        self.addCleanup(service.stopService)
+        self.assertThat(cache.enable, MockNotCalled())
+
+    def test__invalidates_node_when_node_changes(self):
+        service, _, cache = self.make_service()
+        system_id = factory.make_name("system_id")
+        service.nodeChanged("update", system_id)
+        self.assertThat(cache.invalidate, MockCalledOnceWith(system_id))
+
+    def test__invalidates_everything_when_shared_config_changes(self):
+        service, _, cache = self.make_service()
+        service.sharedChanged("update", str(factory.pick_int()))
+        self.assertThat(cache.invalidate, MockCalledOnceWith())
@@ -1,4 +1,4 @@
-# Copyright 2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2016-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for reverse-DNS service."""
@@ -14,7 +14,10 @@ from maasserver.regiondservices.reverse_dns import ReverseDNSService
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASTransactionServerTestCase
 from maasserver.utils.threads import deferToDatabase
-from maastesting.matchers import MockCalledOnceWith
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
 from provisioningserver.utils.testing import callWithServiceRunning
 from provisioningserver.utils.tests.test_network import (
     TestReverseResolveMixIn,
@@ -24,7 +27,11 @@ from testtools.matchers import (
     Is,
 )
 from twisted.internet import defer
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import (
+    Deferred,
+    inlineCallbacks,
+)
+from twisted.internet.task import Clock
 
 
 class TestReverseDNSService(
@@ -71,11 +78,13 @@ class TestReverseDNSService(
         hostname = factory.make_hostname()
         hostname2 = factory.make_hostname()
         self.set_fake_twisted_dns_reply([hostname])
-        service = ReverseDNSService()
+        clock = Clock()
+        service = ReverseDNSService(clock=clock)
         yield service.startService()
         ip = factory.make_ip_address(ipv6=False)
         yield service.consumeNeighbourEvent("create", "%s/32" % ip)
         self.set_fake_twisted_dns_reply([hostname2])
+        clock.advance(service.cache_ttl)
         yield service.consumeNeighbourEvent("update", "%s/32" % ip)
         service.stopService()
         result = yield deferToDatabase(RDNS.objects.first)
@@ -122,6 +131,78 @@ class TestReverseDNSService(
         yield callWithServiceRunning(
             service, service.consumeNeighbourEvent,
             "create", "%s/32" % ip)
-        self.assertThat(reverseResolve, MockCalledOnceWith(ip))
+        self.assertThat(reverseResolve, MockCalledOnceWith(ip, resolver=None))
+        result = yield deferToDatabase(RDNS.objects.first)
+        self.assertThat(result, Is(None))
+
+    @wait_for(30)
+    @inlineCallbacks
+    def test__uses_cached_results_until_they_expire(self):
+        self.set_fake_twisted_dns_reply([factory.make_hostname()])
+        resolver = self.get_mock_iresolver()
+        clock = Clock()
+        service = ReverseDNSService(resolver=resolver, clock=clock)
+        yield service.startService()
+        ip = factory.make_ip_address(ipv6=False)
+        yield service.consumeNeighbourEvent("create", "%s/32" % ip)
+        yield service.consumeNeighbourEvent("update", "%s/32" % ip)
+        self.expectThat(resolver.lookupPointer.call_count, Equals(1))
+        clock.advance(service.cache_ttl)
+        yield service.consumeNeighbourEvent("update", "%s/32" % ip)
+        service.stopService()
+        self.expectThat(resolver.lookupPointer.call_count, Equals(2))
+
+    @wait_for(30)
+    @inlineCallbacks
+    def test__shares_lookups_in_progress(self):
+        hostname = factory.make_hostname()
+        self.set_fake_twisted_dns_reply([hostname])
+        reply = Deferred()
+        resolver = self.get_mock_iresolver()
+        resolver.lookupPointer.side_effect = lambda ip, timeout: reply
+        service = ReverseDNSService(resolver=resolver, clock=Clock())
+        yield service.startService()
+        ip = factory.make_ip_address(ipv6=False)
+        d1 = service.consumeNeighbourEvent("create", "%s/32" % ip)
+        d2 = service.consumeNeighbourEvent("update", "%s/32" % ip)
+        reply.callback(self.reply)
+        yield d1
+        yield d2
+        service.stopService()
+        self.expectThat(resolver.lookupPointer.call_count, Equals(1))
+        result = yield deferToDatabase(RDNS.objects.first)
+        self.expectThat(result.hostname, Equals(hostname))
+
+    @wait_for(30)
+    @inlineCallbacks
+    def test__does_not_save_unchanged_results(self):
+        self.set_fake_twisted_dns_reply([factory.make_hostname()])
+        clock = Clock()
+        service = ReverseDNSService(
+            resolver=self.get_mock_iresolver(), clock=clock)
+        yield service.startService()
+        ip = factory.make_ip_address(ipv6=False)
+        yield service.consumeNeighbourEvent("create", "%s/32" % ip)
+        save_rdns_entries = self.patch(service, "save_rdns_entries")
+        clock.advance(service.cache_ttl)
+        yield service.consumeNeighbourEvent("update", "%s/32" % ip)
+        service.stopService()
+        self.assertThat(save_rdns_entries, MockNotCalled())
+
+    @wait_for(30)
+    @inlineCallbacks
+    def test__ignores_lookup_completed_after_delete(self):
+        self.set_fake_twisted_dns_reply([factory.make_hostname()])
+        reply = Deferred()
+        resolver = self.get_mock_iresolver()
+        resolver.lookupPointer.side_effect = lambda ip, timeout: reply
+        service = ReverseDNSService(resolver=resolver, clock=Clock())
+        yield service.startService()
+        ip = factory.make_ip_address(ipv6=False)
+        d = service.consumeNeighbourEvent("create", "%s/32" % ip)
+        yield service.consumeNeighbourEvent("delete", "%s/32" % ip)
+        reply.callback(self.reply)
+        yield d
+        service.stopService()
         result = yield deferToDatabase(RDNS.objects.first)
         self.assertThat(result, Is(None))
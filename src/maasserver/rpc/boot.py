@@ -7,8 +7,12 @@ __all__ = [
     "get_config",
 ]
 
+from collections import OrderedDict
+from functools import lru_cache
 import re
 import shlex
+import threading
+import time
 
 from django.core.exceptions import (
     ObjectDoesNotExist,
@@ -20,15 +24,12 @@ from maasserver.enum import (
 )
 from maasserver.models import (
     BootResource,
+    BootResourceFile,
     Config,
     Event,
     RackController,
-    VLAN,
-)
-from maasserver.models.interface import (
-    Interface,
-    PhysicalInterface,
 )
+from maasserver.models.interface import Interface
 from maasserver.node_status import NODE_STATUS
 from maasserver.preseed import (
     compose_enlistment_preseed_url,
@@ -48,22 +49,60 @@ from provisioningserver.utils.twisted import synchronous
 
 DEFAULT_ARCH = 'i386'
 
+# Firmware and boot loaders often ask for their configuration several times
+# while booting. The same PXE request from a machine is logged only once in
+# this many seconds.
+PXE_REQUEST_EVENT_INTERVAL = 60
+
+# When each machine's PXE requests were last logged, by (machine ID, boot
+# purpose), oldest first. At most this many are remembered.
+PXE_REQUEST_EVENT_MAX_REQUESTS = 10000
+_pxe_requests_logged = OrderedDict()
+_pxe_requests_logged_lock = threading.Lock()
+
 
-def get_node_from_mac_string(mac_string):
-    """Get a Node object from a MAC address string.
+def get_interface_from_mac_string(mac_string):
+    """Get the physical interface with a MAC address string.
 
-    Returns a Node object or None if no node with the given MAC address exists.
+    Its node, and the node's domain and boot interface, are fetched in the
+    same query, along with the VLANs of both interfaces.
+
+    Returns an Interface object or None if no interface with the given MAC
+    address exists.
     """
     if mac_string is None:
         return None
-    interface = get_one(
+    return get_one(
         Interface.objects.filter(
-            type=INTERFACE_TYPE.PHYSICAL, mac_address=mac_string))
-    return interface.node if interface else None
+            type=INTERFACE_TYPE.PHYSICAL, mac_address=mac_string)
+        .select_related(
+            "vlan", "node__domain", "node__boot_interface__vlan"))
+
+
+def _should_log_pxe_request(machine, purpose):
+    """Return whether to log this PXE request, noting when it was logged.
+
+    This is tracked in memory, by each region process, so it costs no query.
+    """
+    key = machine.id, purpose
+    now = time.monotonic()
+    with _pxe_requests_logged_lock:
+        logged = _pxe_requests_logged.get(key)
+        if logged is not None and now - logged < PXE_REQUEST_EVENT_INTERVAL:
+            return False
+        _pxe_requests_logged[key] = now
+        _pxe_requests_logged.move_to_end(key)
+        while len(_pxe_requests_logged) > PXE_REQUEST_EVENT_MAX_REQUESTS:
+            _pxe_requests_logged.popitem(last=False)
+        return True
 
 
 def event_log_pxe_request(machine, purpose):
-    """Log PXE request to machines's event log."""
+    """Log PXE request to machines's event log.
+
+    Nothing is logged if this region process has logged the same request
+    for the machine in the last `PXE_REQUEST_EVENT_INTERVAL` seconds.
+    """
     options = {
         'commissioning': "commissioning",
         'rescue': "rescue mode",
@@ -72,9 +111,40 @@ def event_log_pxe_request(machine, purpose):
         'local': "local boot",
         'poweroff': "power off",
     }
-    Event.objects.create_node_event(
-        system_id=machine.system_id, event_type=EVENT_TYPES.NODE_PXE_REQUEST,
-        event_description=options[purpose])
+    description = options[purpose]
+    if _should_log_pxe_request(machine, purpose):
+        Event.objects.create_node_event(
+            system_id=machine.system_id,
+            event_type=EVENT_TYPES.NODE_PXE_REQUEST,
+            event_description=description)
+
+
+@lru_cache(maxsize=256)
+def get_boot_resource_set_filenames(resource_set_id, files_count):
+    """Return the filenames of the kernel, initrd, and boot_dtb in a set.
+
+    The files of a complete `BootResourceSet` don't change, so this is
+    cached by the set's ID and its number of files.
+    """
+    filenames = dict(
+        BootResourceFile.objects.filter(
+            resource_set_id=resource_set_id, filetype__in=(
+                BOOT_RESOURCE_FILE_TYPE.BOOT_KERNEL,
+                BOOT_RESOURCE_FILE_TYPE.BOOT_INITRD,
+                BOOT_RESOURCE_FILE_TYPE.BOOT_DTB,
+            )).values_list("filetype", "filename"))
+    kernel = filenames.get(BOOT_RESOURCE_FILE_TYPE.BOOT_KERNEL)
+    if kernel is None:
+        # If a filename can not be found return None to allow the rack to
+        # figure out what todo.
+        return None, None, None
+    # An initrd is not needed to boot if the kernel contains all driver
+    # support, and not all archs use boot_dtb.
+    return (
+        kernel,
+        filenames.get(BOOT_RESOURCE_FILE_TYPE.BOOT_INITRD),
+        filenames.get(BOOT_RESOURCE_FILE_TYPE.BOOT_DTB),
+    )
 
 
 def get_boot_filenames(arch, subarch, osystem, series):
@@ -102,27 +172,14 @@ def get_boot_filenames(arch, subarch, osystem, series):
             name="%s/%s" % (osystem, series)
         )
         boot_resource_set = boot_resource.get_latest_complete_set()
-        kernel = boot_resource_set.files.get(
-            filetype=BOOT_RESOURCE_FILE_TYPE.BOOT_KERNEL).filename
     except ObjectDoesNotExist:
+        boot_resource_set = None
+    if boot_resource_set is None:
         # If a filename can not be found return None to allow the rack to
         # figure out what todo.
         return None, None, None
-    try:
-        initrd = boot_resource_set.files.get(
-            filetype=BOOT_RESOURCE_FILE_TYPE.BOOT_INITRD).filename
-    except ObjectDoesNotExist:
-        # An initrd is not needed to boot if the kernel contains all driver
-        # support.
-        initrd = None
-    try:
-        boot_dtb = boot_resource_set.files.get(
-            filetype=BOOT_RESOURCE_FILE_TYPE.BOOT_DTB).filename
-    except ObjectDoesNotExist:
-        # Not all archs use boot_dtb so allow just this to fail
-        boot_dtb = None
-
-    return kernel, initrd, boot_dtb
+    return get_boot_resource_set_filenames(
+        boot_resource_set.id, boot_resource_set.files_count)
 
 
 def merge_kparams_with_extra(kparams, extra_kernel_opts):
@@ -184,7 +241,8 @@ def get_config(
     Raises BootConfigNoResponse when booting machine should fail to next file.
     """
     rack_controller = RackController.objects.get(system_id=system_id)
-    machine = get_node_from_mac_string(mac)
+    interface = get_interface_from_mac_string(mac)
+    machine = None if interface is None else interface.node
 
     # Fail with no response early so no extra work is performed.
     if machine is None and arch is None and mac is not None:
@@ -200,8 +258,7 @@ def get_config(
         update_fields = []
         if (machine.boot_interface is None or
                 machine.boot_interface.mac_address != mac):
-            machine.boot_interface = PhysicalInterface.objects.get(
-                mac_address=mac)
+            machine.boot_interface = interface
             update_fields.append("boot_interface")
         if (machine.boot_cluster_ip is None or
                 machine.boot_cluster_ip != local_ip):
@@ -217,19 +274,20 @@ def get_config(
         # interface on the rack controller that the machine communicated with,
         # unless the VLAN is being relayed.
         rack_interface = rack_controller.interface_set.filter(
-            ip_addresses__ip=local_ip).first()
+            ip_addresses__ip=local_ip).select_related("vlan").first()
+        boot_interface = machine.boot_interface
         if (rack_interface is not None and
-                machine.boot_interface.vlan != rack_interface.vlan):
+                boot_interface.vlan_id != rack_interface.vlan_id):
             # Rack controller and machine is not on the same VLAN, with DHCP
             # relay this is possible. Lets ensure that the VLAN on the
             # interface is setup to relay through the identified VLAN.
-            if not VLAN.objects.filter(
-                    id=machine.boot_interface.vlan_id,
-                    relay_vlan=rack_interface.vlan).exists():
+            if (boot_interface.vlan is None or
+                    boot_interface.vlan.relay_vlan_id !=
+                    rack_interface.vlan_id):
                 # DHCP relay is not being performed for that VLAN. Set the VLAN
                 # to the VLAN of the rack controller.
-                machine.boot_interface.vlan = rack_interface.vlan
-                machine.boot_interface.save()
+                boot_interface.vlan = rack_interface.vlan
+                boot_interface.save()
 
         arch, subarch = machine.split_arch()
         preseed_url = compose_preseed_url(machine, rack_controller)
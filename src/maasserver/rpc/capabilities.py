@@ -0,0 +1,69 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Registry of the capabilities of connected rack controllers.
+
+Rack controllers report the operating systems, boot images, and power drivers
+they support with `UpdateRackCapabilities` when they connect and whenever
+these change. Each regiond process keeps what it has been told in memory, so
+it needn't ask every rack controller each time it needs to know.
+
+Rack controllers that have not reported, e.g. because they run an older
+version of MAAS, must still be asked.
+"""
+
+__all__ = [
+    "rack_capabilities",
+    "RackCapabilities",
+    "RackCapabilitiesRegistry",
+]
+
+from collections import namedtuple
+import threading
+
+# The capabilities of a single rack controller. These are shared and must not
+# be modified. The version is taken from the registry when they're recorded.
+RackCapabilities = namedtuple(
+    "RackCapabilities", ("version", "osystems", "images", "power_types"))
+
+
+class RackCapabilitiesRegistry:
+    """The capabilities of rack controllers connected to this process.
+
+    Entries are recorded from the reactor and read from database threads.
+
+    :ivar version: Incremented whenever any entry is recorded or discarded.
+        Anything derived from the registry can be compared against this to
+        tell if it's stale.
+    """
+
+    def __init__(self):
+        super(RackCapabilitiesRegistry, self).__init__()
+        self.lock = threading.Lock()
+        self.racks = {}
+        self.version = 0
+
+    def update(self, system_id, osystems, images, power_types):
+        """Record the capabilities reported by rack controller `system_id`."""
+        with self.lock:
+            self.version += 1
+            self.racks[system_id] = RackCapabilities(
+                self.version, osystems, images, power_types)
+
+    def get(self, system_id):
+        """Return the `RackCapabilities` for `system_id`, or `None`."""
+        return self.racks.get(system_id)
+
+    def discard(self, system_id):
+        """Forget the capabilities of rack controller `system_id`.
+
+        Call this when this process loses its last connection to the rack
+        controller; what it reported can no longer be relied upon.
+        """
+        with self.lock:
+            if self.racks.pop(system_id, None) is not None:
+                self.version += 1
+
+
+# The registry for this process.
+rack_capabilities = RackCapabilitiesRegistry()
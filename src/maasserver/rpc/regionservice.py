@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """RPC implementation for regions."""
@@ -29,6 +29,10 @@ from maasserver import (
 )
 from maasserver.bootresources import get_simplestream_endpoint
 from maasserver.enum import SERVICE_STATUS
+from maasserver.metrics import (
+    QueryAccounting,
+    UNKNOWN_NAME,
+)
 from maasserver.models.node import (
     Node,
     RackController,
@@ -50,6 +54,7 @@ from maasserver.rpc import (
     packagerepository,
     rackcontrollers,
 )
+from maasserver.rpc.capabilities import rack_capabilities
 from maasserver.rpc.nodes import (
     commission_node,
     create_node,
@@ -62,7 +67,11 @@ from maasserver.utils.orm import (
     transactional,
     with_connection,
 )
-from maasserver.utils.threads import deferToDatabase
+from maasserver.utils.threads import (
+    DatabasePriority,
+    deferToDatabase,
+    deferToDatabaseWithPriority,
+)
 from netaddr import (
     AddrConversionError,
     IPAddress,
@@ -139,6 +148,20 @@ class Region(RPCProtocol):
     connection is established, AMP is symmetric.
     """
 
+    def dispatchCommand(self, box):
+        """Call up, accounting for the queries made by the command.
+
+        See `maasserver.metrics`.
+        """
+        command = box[amp.COMMAND]
+        if self.locateResponder(command) is None:
+            command = UNKNOWN_NAME  # Don't let the peer choose the name.
+        else:
+            command = command.decode("ascii")
+        accounting = QueryAccounting()
+        d = accounting.call(super(Region, self).dispatchCommand, box)
+        return d.addBoth(callOut, accounting.record, "rpc", command)
+
     @region.Identify.responder
     def identify(self):
         """identify()
@@ -180,9 +203,9 @@ class Region(RPCProtocol):
         :py:class`~provisioningserver.rpc.region.UpdateLease`.
         """
         dbtasks = eventloop.services.getServiceNamed("database-tasks")
-        d = dbtasks.deferTask(
-            leases.update_lease, action, mac, ip_family, ip,
-            timestamp, lease_time, hostname)
+        d = dbtasks.deferTaskWithPriority(
+            DatabasePriority.HIGH, leases.update_lease, action, mac,
+            ip_family, ip, timestamp, lease_time, hostname)
 
         # Catch all errors except the NoSuchCluster failure. We want that to
         # be sent back to the cluster.
@@ -224,8 +247,9 @@ class Region(RPCProtocol):
         Implementation of
         :py:class:`~provisioningserver.rpc.region.GetBootConfig`.
         """
-        return deferToDatabase(
-            boot.get_config, system_id, local_ip, remote_ip,
+        return deferToDatabaseWithPriority(
+            DatabasePriority.HIGH, boot.get_config, system_id, local_ip,
+            remote_ip,
             arch=arch, subarch=subarch, mac=mac,
             bios_boot_method=bios_boot_method)
 
@@ -292,8 +316,9 @@ class Region(RPCProtocol):
         Implementation of
         :py:class:`~provisioningserver.rpc.region.ListNodePowerParameters`.
         """
-        d = deferToDatabase(
-            nodes.list_cluster_nodes_power_parameters, uuid)
+        d = deferToDatabaseWithPriority(
+            DatabasePriority.HIGH, nodes.list_cluster_nodes_power_parameters,
+            uuid)
         d.addCallback(lambda nodes: {"nodes": nodes})
         return d
 
@@ -316,8 +341,9 @@ class Region(RPCProtocol):
         Implementation of
         :py:class:`~provisioningserver.rpc.region.UpdateNodePowerState`.
         """
-        d = deferToDatabase(
-            nodes.update_node_power_state, system_id, power_state)
+        d = deferToDatabaseWithPriority(
+            DatabasePriority.HIGH, nodes.update_node_power_state, system_id,
+            power_state)
         d.addCallback(lambda args: {})
         return d
 
@@ -489,6 +515,17 @@ class Region(RPCProtocol):
         return deferToDatabase(
             update_services, system_id, services)
 
+    @region.UpdateRackCapabilities.responder
+    def update_rack_capabilities(
+            self, system_id, osystems, images, power_types):
+        """update_rack_capabilities(system_id, osystems, images, power_types)
+
+        Implementation of
+        :py:class:`~provisioningserver.rpc.region.UpdateRackCapabilities`.
+        """
+        rack_capabilities.update(system_id, osystems, images, power_types)
+        return {}
+
     @region.RequestRackRefresh.responder
     def request_rack_refresh(self, system_id):
         """Request a refresh of the rack
@@ -841,6 +878,8 @@ class RegionService(service.Service, object):
     def _removeConnectionFor(self, ident, connection):
         """Removes `connection` from the set of connections for `ident`."""
         self.connections[ident].discard(connection)
+        if len(self.connections[ident]) == 0:
+            rack_capabilities.discard(ident)
         self.events.disconnected.fire(ident)
 
     def _savePorts(self, results):
@@ -1,4 +1,4 @@
-# Copyright 2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2016-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """RPC helpers relating to services."""
@@ -35,18 +35,32 @@ def update_services(system_id, services):
     except RackController.DoesNotExist:
         raise NoSuchCluster.from_uuid(system_id)
 
-    # Update each service. For now, when a service is not recognised, log it
-    # and move on, but what we really need is as UpdateServicesV2 RPC call in
-    # order to report this error back to the rack properly.
+    # Update each service that has changed. The rack may report only those
+    # services whose status has changed since its last report. For now, when
+    # a service is not recognised, log it and move on, but what we really
+    # need is as UpdateServicesV2 RPC call in order to report this error
+    # back to the rack properly.
+    existing = {
+        service.name: service
+        for service in Service.objects.filter(node=rack)
+    }
     for service in services:
         try:
-            Service.objects.update_service_for(
-                rack, service['name'], service['status'],
-                service['status_info'])
-        except Service.DoesNotExist:
+            existing_service = existing[service['name']]
+        except KeyError:
             log.error(
                 "Rack %s reported status for %r but this is not a recognised "
                 "service (status=%r, info=%r).", rack.system_id,
                 service['name'], service['status'], service['status_info'])
+        else:
+            update_fields = []
+            if existing_service.status != service['status']:
+                existing_service.status = service['status']
+                update_fields.append("status")
+            if existing_service.status_info != service['status_info']:
+                existing_service.status_info = service['status_info']
+                update_fields.append("status_info")
+            if len(update_fields) > 0:
+                existing_service.save(update_fields=update_fields)
 
     return {}
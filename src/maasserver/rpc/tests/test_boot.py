@@ -5,6 +5,7 @@
 
 __all__ = []
 
+from collections import OrderedDict
 import random
 
 from maasserver import server_address
@@ -28,6 +29,7 @@ from maasserver.rpc import boot as boot_module
 from maasserver.rpc.boot import (
     event_log_pxe_request,
     get_boot_filenames,
+    get_boot_resource_set_filenames,
     get_config,
     merge_kparams_with_extra,
 )
@@ -37,6 +39,7 @@ from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
 from maasserver.utils.orm import reload_object
 from maasserver.utils.osystems import get_release_from_distro_info
+from maastesting.djangotestcase import count_queries
 from maastesting.matchers import (
     MockCalledOnceWith,
     MockNotCalled,
@@ -453,6 +456,43 @@ class TestGetConfig(MAASServerTestCase):
                 description,
                 Event.objects.get(node=node).description)
 
+    def test_event_log_pxe_request_coalesces_repeated_requests(self):
+        node = self.make_node()
+        event_log_pxe_request(node, "commissioning")
+        event_log_pxe_request(node, "commissioning")
+        event_log_pxe_request(node, "local")
+        self.assertItemsEqual(
+            ["commissioning", "local boot"],
+            Event.objects.filter(node=node).values_list(
+                "description", flat=True))
+
+    def test_event_log_pxe_request_logs_again_after_interval(self):
+        self.patch(boot_module, "_pxe_requests_logged", OrderedDict())
+        monotonic = self.patch(boot_module.time, "monotonic")
+        monotonic.return_value = 1000.0
+        node = self.make_node()
+        event_log_pxe_request(node, "commissioning")
+        monotonic.return_value += boot_module.PXE_REQUEST_EVENT_INTERVAL - 1
+        event_log_pxe_request(node, "commissioning")
+        monotonic.return_value += 1
+        event_log_pxe_request(node, "commissioning")
+        self.assertEqual(
+            2, Event.objects.filter(node=node).count())
+
+    def test_event_log_pxe_request_remembers_a_bounded_number(self):
+        self.patch(boot_module, "_pxe_requests_logged", OrderedDict())
+        self.patch(boot_module, "PXE_REQUEST_EVENT_MAX_REQUESTS", 2)
+        nodes = [self.make_node() for _ in range(3)]
+        for node in nodes:
+            event_log_pxe_request(node, "commissioning")
+        self.assertEqual(
+            [(nodes[1].id, "commissioning"), (nodes[2].id, "commissioning")],
+            list(boot_module._pxe_requests_logged))
+        # The oldest request was forgotten, so it's logged again.
+        event_log_pxe_request(nodes[0], "commissioning")
+        self.assertEqual(
+            2, Event.objects.filter(node=nodes[0]).count())
+
     def test__sets_boot_interface_when_empty(self):
         rack_controller = factory.make_RackController()
         local_ip = factory.make_ip_address()
@@ -765,6 +805,18 @@ class TestGetBootFilenames(MAASServerTestCase):
                 filetype=BOOT_RESOURCE_FILE_TYPE.BOOT_DTB).filename,
             boot_dbt)
 
+    def test_caches_filenames_of_resource_set(self):
+        release = factory.make_default_ubuntu_release_bootable()
+        arch, subarch = release.architecture.split('/')
+        osystem, series = release.name.split('/')
+        boot_resource_set = release.get_latest_complete_set()
+        filenames = get_boot_filenames(arch, subarch, osystem, series)
+        count, cached_filenames = count_queries(
+            get_boot_resource_set_filenames, boot_resource_set.id,
+            boot_resource_set.files.count())
+        self.assertEquals(0, count)
+        self.assertEquals(filenames, cached_filenames)
+
     def test_returns_all_none_when_not_found(self):
         self.assertItemsEqual(
             (None, None, None),
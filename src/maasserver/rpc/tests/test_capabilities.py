@@ -0,0 +1,55 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.rpc.capabilities`."""
+
+__all__ = []
+
+from maasserver.rpc.capabilities import (
+    RackCapabilities,
+    RackCapabilitiesRegistry,
+)
+from maastesting.factory import factory
+from maastesting.testcase import MAASTestCase
+from testtools.matchers import (
+    Equals,
+    Is,
+)
+
+
+class TestRackCapabilitiesRegistry(MAASTestCase):
+    """Tests for `RackCapabilitiesRegistry`."""
+
+    def test_update_records_capabilities(self):
+        registry = RackCapabilitiesRegistry()
+        system_id = factory.make_name("system_id")
+        osystems, images, power_types = [{}], [{}], [{}]
+        registry.update(system_id, osystems, images, power_types)
+        self.assertThat(registry.get(system_id), Equals(
+            RackCapabilities(1, osystems, images, power_types)))
+
+    def test_update_increments_version(self):
+        registry = RackCapabilitiesRegistry()
+        system_id = factory.make_name("system_id")
+        registry.update(system_id, [], [], [])
+        registry.update(system_id, [], [], [])
+        self.expectThat(registry.version, Equals(2))
+        self.expectThat(registry.get(system_id).version, Equals(2))
+
+    def test_get_returns_None_for_unknown_rack(self):
+        registry = RackCapabilitiesRegistry()
+        self.assertThat(
+            registry.get(factory.make_name("system_id")), Is(None))
+
+    def test_discard_forgets_capabilities(self):
+        registry = RackCapabilitiesRegistry()
+        system_id = factory.make_name("system_id")
+        registry.update(system_id, [], [], [])
+        registry.discard(system_id)
+        self.expectThat(registry.get(system_id), Is(None))
+        self.expectThat(registry.version, Equals(2))
+
+    def test_discard_does_not_increment_version_for_unknown_rack(self):
+        registry = RackCapabilitiesRegistry()
+        registry.discard(factory.make_name("system_id"))
+        self.assertThat(registry.version, Equals(0))
@@ -1009,6 +1009,21 @@ class TestRegionService(MAASTestCase):
 
         self.assertEqual({uuid: {c2}}, service.connections)
 
+    def test_removeConnectionFor_discards_capabilities_of_last_connection(
+            self):
+        registry = self.patch(regionservice, "rack_capabilities")
+        service = RegionService(sentinel.advertiser)
+        uuid = factory.make_UUID()
+        c1 = DummyConnection()
+        c2 = DummyConnection()
+
+        service._addConnectionFor(uuid, c1)
+        service._addConnectionFor(uuid, c2)
+        service._removeConnectionFor(uuid, c1)
+        self.assertThat(registry.discard, MockNotCalled())
+        service._removeConnectionFor(uuid, c2)
+        self.assertThat(registry.discard, MockCalledOnceWith(uuid))
+
     def test_removeConnectionFor_is_okay_if_connection_is_not_there(self):
         service = RegionService(sentinel.advertiser)
         uuid = factory.make_UUID()
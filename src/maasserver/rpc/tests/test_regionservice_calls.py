@@ -18,6 +18,7 @@ import random
 from random import randint
 import time
 from unittest import skip
+from unittest.mock import ANY
 from urllib.parse import urlparse
 
 from crochet import wait_for
@@ -28,6 +29,10 @@ from maasserver.enum import (
     NODE_STATUS,
     POWER_STATE,
 )
+from maasserver.metrics import (
+    QueryAccounting,
+    UNKNOWN_NAME,
+)
 from maasserver.models import (
     Config,
     Event,
@@ -43,6 +48,10 @@ from maasserver.rpc import (
     leases as leases_module,
     regionservice,
 )
+from maasserver.rpc.capabilities import (
+    RackCapabilities,
+    RackCapabilitiesRegistry,
+)
 from maasserver.rpc.nodes import (
     get_controller_type,
     get_time_configuration,
@@ -96,6 +105,7 @@ from provisioningserver.rpc.region import (
     UpdateInterfaces,
     UpdateLease,
     UpdateNodePowerState,
+    UpdateRackCapabilities,
     UpdateServices,
 )
 from provisioningserver.rpc.testing import (
@@ -143,6 +153,35 @@ class TestRegionProtocol_Identify(MAASTestCase):
         return d.addCallback(check)
 
 
+class TestRegionProtocol_DispatchCommand(MAASTestCase):
+
+    @wait_for_reactor
+    def test_dispatchCommand_accounts_for_command(self):
+        record = self.patch_autospec(QueryAccounting, "record")
+        box = amp.Box({amp.COMMAND: Identify.commandName})
+        d = Region().dispatchCommand(box)
+
+        def check(_):
+            self.assertThat(
+                record, MockCalledOnceWith(ANY, "rpc", "Identify"))
+
+        return d.addCallback(check)
+
+    @wait_for_reactor
+    def test_dispatchCommand_accounts_for_unknown_command_as_unknown(self):
+        record = self.patch_autospec(QueryAccounting, "record")
+        command = factory.make_name("Command").encode("ascii")
+        box = amp.Box({amp.COMMAND: command})
+        d = Region().dispatchCommand(box)
+
+        def check(failure):
+            failure.trap(amp.RemoteAmpError)
+            self.assertThat(
+                record, MockCalledOnceWith(ANY, "rpc", UNKNOWN_NAME))
+
+        return d.addErrback(check)
+
+
 class TestRegionProtocol_Authenticate(MAASTransactionServerTestCase):
 
     def test_authenticate_is_registered(self):
@@ -1038,6 +1077,52 @@ class TestRegionProtocol_UpdateServices(MAASTransactionServerTestCase):
             MockCalledWith(update_services, system_id, services))
 
 
+class TestRegionProtocol_UpdateRackCapabilities(MAASTestCase):
+
+    def test_update_rack_capabilities_is_registered(self):
+        protocol = Region()
+        responder = protocol.locateResponder(
+            UpdateRackCapabilities.commandName)
+        self.assertIsNotNone(responder)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__records_capabilities(self):
+        registry = RackCapabilitiesRegistry()
+        self.patch(regionservice, "rack_capabilities", registry)
+        system_id = factory.make_name("system_id")
+        osystems = [{
+            "name": factory.make_name("name"),
+            "title": factory.make_name("title"),
+            "releases": [{
+                "name": factory.make_name("release"),
+                "title": factory.make_name("title"),
+                "requires_license_key": False,
+                "can_commission": True,
+            }],
+            "default_release": factory.make_name("release"),
+            "default_commissioning_release": factory.make_name("release"),
+        }]
+        images = [{
+            name: factory.make_name(name) for name in (
+                "osystem", "architecture", "subarchitecture", "release",
+                "label", "purpose", "xinstall_type", "xinstall_path")
+        }]
+        power_types = [{"name": factory.make_name("power_type")}]
+
+        response = yield call_responder(
+            Region(), UpdateRackCapabilities, {
+                "system_id": system_id,
+                "osystems": osystems,
+                "images": images,
+                "power_types": power_types,
+            })
+
+        self.expectThat(response, Equals({}))
+        self.expectThat(registry.get(system_id), Equals(
+            RackCapabilities(1, osystems, images, power_types)))
+
+
 class TestRegionProtocol_ReportForeignDHCPServer(
         MAASTransactionServerTestCase):
 
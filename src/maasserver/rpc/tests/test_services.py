@@ -1,4 +1,4 @@
-# Copyright 2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2016-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for `rpc.services`."""
@@ -15,9 +15,13 @@ from maasserver.rpc import services
 from maasserver.rpc.services import update_services
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASTransactionServerTestCase
+from maastesting.djangotestcase import count_queries
 from maastesting.matchers import DocTestMatches
 from provisioningserver.rpc.exceptions import NoSuchCluster
-from testtools.matchers import MatchesStructure
+from testtools.matchers import (
+    Equals,
+    MatchesStructure,
+)
 
 
 class TestUpdateServices(MAASTransactionServerTestCase):
@@ -62,3 +66,32 @@ class TestUpdateServices(MAASTransactionServerTestCase):
                 MatchesStructure.byEquality(
                     status=services[service]["status"],
                     status_info=services[service]["status_info"]))
+
+    def test_update_services_updates_only_reported_services(self):
+        rack_controller = factory.make_RackController()
+        [name, *unreported] = sorted(RACK_SERVICES)
+        before = {
+            service.name: (service.status, service.status_info)
+            for service in Service.objects.filter(node=rack_controller)
+        }
+        service = self.make_service(name)
+        update_services(rack_controller.system_id, [service])
+        self.expectThat(
+            Service.objects.get(node=rack_controller, name=name),
+            MatchesStructure.byEquality(
+                status=service["status"], status_info=service["status_info"]))
+        for other_name in unreported:
+            status, status_info = before[other_name]
+            self.expectThat(
+                Service.objects.get(node=rack_controller, name=other_name),
+                MatchesStructure.byEquality(
+                    status=status, status_info=status_info))
+
+    def test_update_services_queries_services_once(self):
+        services = [self.make_service(service) for service in RACK_SERVICES]
+        rack_controller = factory.make_RackController()
+        update_services(rack_controller.system_id, services)
+        queries, _ = count_queries(
+            update_services, rack_controller.system_id, services)
+        # One query for the rack, one for its services, and no updates.
+        self.assertThat(queries, Equals(2))
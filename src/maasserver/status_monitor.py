@@ -4,6 +4,7 @@
 """Status monitoring service."""
 
 __all__ = [
+    'get_next_deadline',
     'mark_nodes_failed_after_expiring',
     'StatusMonitorService',
     ]
@@ -12,7 +13,11 @@ from datetime import (
     datetime,
     timedelta,
 )
+from itertools import groupby
+from operator import itemgetter
 
+from django.db import connection
+from django.db.models import Min
 from maasserver.enum import (
     NODE_STATUS,
     NODE_STATUS_CHOICES_DICT,
@@ -26,9 +31,16 @@ from maasserver.node_status import (
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
 from metadataserver.enum import SCRIPT_STATUS
+from metadataserver.models import ScriptResult
+from provisioningserver.logger import LegacyLogger
 from provisioningserver.refresh.node_info_scripts import NODE_INFO_SCRIPTS
 from provisioningserver.utils.twisted import synchronous
-from twisted.application.internet import TimerService
+from twisted.application.service import Service
+from twisted.internet import reactor
+from twisted.internet.defer import maybeDeferred
+
+
+log = LegacyLogger()
 
 
 def mark_nodes_failed_after_expiring():
@@ -50,31 +62,113 @@ def mark_nodes_failed_after_expiring():
             comment=comment, script_result_status=SCRIPT_STATUS.ABORTED)
 
 
+# maas-run-remote-scripts sends a heartbeat every two minutes. We allow for
+# a node to miss up to five heartbeats to account for network blips.
+HEARTBEAT_TIMEOUT = timedelta(minutes=(2 * 5))
+
+# The node running the scripts checks if a script has run past its time
+# limit. The node will try to kill the script and move on by signaling the
+# region. If after this long past the timeout the region hasn't received the
+# signal the node is marked failed and stopped.
+SCRIPT_TIMEOUT_GRACE = timedelta(minutes=5)
+
+# The heartbeat and script deadlines of every commissioning or testing node.
+# status_expires is used while the node is booting. Once MAAS receives the
+# signal that scripts have begun it resets status_expires and checks for the
+# heartbeat instead. A running script's timeout is its "runtime" parameter,
+# its built-in timeout, or its Script's timeout, in that order.
+SCRIPT_DEADLINES_SQL = """\
+    SELECT
+        node.id AS node_id,
+        script_set.last_ping + %(heartbeat_timeout)s AS heartbeat_deadline,
+        result.id AS result_id,
+        result.name AS result_name,
+        result.timeout AS result_timeout,
+        result.started + result.timeout + %(script_timeout_grace)s
+            AS result_deadline
+    FROM maasserver_node AS node
+    JOIN metadataserver_scriptset AS script_set ON script_set.id = (
+        CASE node.status
+        WHEN %(commissioning)s THEN node.current_commissioning_script_set_id
+        ELSE node.current_testing_script_set_id
+        END)
+    LEFT JOIN LATERAL (
+        SELECT
+            result.id,
+            result.started,
+            COALESCE(script.name, result.script_name) AS name,
+            COALESCE(
+                (SELECT (param.value ->> 'value')::float * interval '1 second'
+                 FROM json_each(result.parameters::json) AS param
+                 WHERE param.value ->> 'type' = 'runtime'
+                 LIMIT 1),
+                builtin.timeout,
+                NULLIF(script.timeout, interval '0')) AS timeout
+        FROM metadataserver_scriptresult AS result
+        LEFT JOIN metadataserver_script AS script
+            ON script.id = result.script_id
+        LEFT JOIN unnest(
+            %(builtin_names)s::text[], %(builtin_timeouts)s::interval[])
+            AS builtin (name, timeout)
+            ON builtin.name = COALESCE(script.name, result.script_name)
+        WHERE result.script_set_id = script_set.id
+            AND result.status = %(running)s
+    ) AS result ON true
+    WHERE node.status IN (%(commissioning)s, %(testing)s)
+        AND node.status_expires IS NULL
+"""
+
+
+def _execute_script_deadlines_query(cursor, query, **params):
+    """Execute `query` over the script deadlines as `deadlines`."""
+    builtin_timeouts = [
+        (name, script['timeout'])
+        for name, script in NODE_INFO_SCRIPTS.items()
+        if 'timeout' in script
+    ]
+    params.update(
+        heartbeat_timeout=HEARTBEAT_TIMEOUT,
+        script_timeout_grace=SCRIPT_TIMEOUT_GRACE,
+        commissioning=NODE_STATUS.COMMISSIONING,
+        testing=NODE_STATUS.TESTING,
+        running=SCRIPT_STATUS.RUNNING,
+        builtin_names=[name for name, _ in builtin_timeouts],
+        builtin_timeouts=[timeout for _, timeout in builtin_timeouts])
+    cursor.execute(
+        "WITH deadlines AS (%s) %s" % (SCRIPT_DEADLINES_SQL, query), params)
+
+
 def mark_nodes_failed_after_missing_script_timeout():
     """Check on the status of commissioning or testing nodes.
 
     For any node currently commissioning or testing check that a region is
     still receiving its heartbeat and no running script has gone past its
     run limit. If the node fails either condition its put into a failed status.
+
+    The deadlines are compared in the database, so only the nodes that need
+    to be failed are loaded.
     """
     now = datetime.now()
-    # maas-run-remote-scripts sends a heartbeat every two minutes. We allow
-    # for a node to miss up to five heartbeats to account for network blips.
-    heartbeat_expired = now - timedelta(minutes=(2 * 5))
-    # Get the list of nodes currently running testing. status_expires is used
-    # while the node is booting. Once MAAS receives the signal that testing
-    # has begun it resets status_expires and checks for the heartbeat instead.
-    qs = Node.objects.filter(
-        status__in=[NODE_STATUS.COMMISSIONING, NODE_STATUS.TESTING],
-        status_expires=None).prefetch_related(
-            'current_commissioning_script_set', 'current_testing_script_set')
-    for node in qs:
-        if node.status == NODE_STATUS.COMMISSIONING:
-            script_set = node.current_commissioning_script_set
-        elif node.status == NODE_STATUS.TESTING:
-            script_set = node.current_testing_script_set
-        if (script_set.last_ping is not None and
-                script_set.last_ping < heartbeat_expired):
+    with connection.cursor() as cursor:
+        _execute_script_deadlines_query(cursor, """\
+            SELECT node_id, heartbeat_deadline < %(now)s,
+                result_id, result_name, result_timeout
+            FROM deadlines
+            WHERE heartbeat_deadline < %(now)s OR result_deadline < %(now)s
+            ORDER BY node_id, result_deadline
+        """, now=now)
+        rows = cursor.fetchall()
+    # The first row for each node says why it's failing: a missed heartbeat,
+    # or else the script that was first to run past its timeout.
+    failures = [
+        next(node_rows) for _, node_rows in groupby(rows, itemgetter(0))]
+    nodes = Node.objects.in_bulk([failure[0] for failure in failures])
+    ScriptResult.objects.filter(id__in=[
+        result_id for _, heartbeat_expired, result_id, _, _ in failures
+        if not heartbeat_expired]).update(status=SCRIPT_STATUS.TIMEDOUT)
+    for node_id, heartbeat_expired, _, name, timeout in failures:
+        node = nodes[node_id]
+        if heartbeat_expired:
             node.mark_failed(
                 comment='Node has missed the last 5 heartbeats',
                 script_result_status=SCRIPT_STATUS.TIMEDOUT,
@@ -84,62 +178,114 @@ def mark_nodes_failed_after_missing_script_timeout():
                     comment=(
                         'Node stopped due to missing the last 5 heartbeats'),
                 )
-            continue
-
-        # Check for scripts which have gone past their timeout.
-        script_qs = script_set.scriptresult_set.filter(
-            status=SCRIPT_STATUS.RUNNING).prefetch_related('script')
-        for script_result in script_qs:
-            timeout = None
-            for param in script_result.parameters.values():
-                if param.get('type') == 'runtime':
-                    timeout = param.get('value')
-                    break
-            if (timeout is None and script_result.name in NODE_INFO_SCRIPTS and
-                    'timeout' in NODE_INFO_SCRIPTS[script_result.name]):
-                timeout = NODE_INFO_SCRIPTS[script_result.name]['timeout']
-            elif (timeout is None and script_result.script is not None and
-                    script_result.script.timeout.seconds > 0):
-                timeout = script_result.script.timeout
-            else:
-                continue
-            # The node running the scripts checks if the script has run past
-            # its time limit. The node will try to kill the script and move on
-            # by signaling the region. If after 5 minutes past the timeout the
-            # region hasn't recieved the signal mark_failed and stop the node.
-            script_expires = (
-                script_result.started + timeout + timedelta(minutes=5))
-            if script_expires < now:
-                script_result.status = SCRIPT_STATUS.TIMEDOUT
-                script_result.save(update_fields=['status'])
-                node.mark_failed(
-                    comment="%s has run past it's timeout(%s)" % (
-                        script_result.name, str(timeout)),
-                    script_result_status=SCRIPT_STATUS.ABORTED)
-                if not node.enable_ssh:
-                    node.stop(
-                        comment=(
-                            "Node stopped due to %s running past it's "
-                            "timeout(%s)" % (script_result.name, str(timeout)))
-                    )
-                break
+        else:
+            node.mark_failed(
+                comment="%s has run past it's timeout(%s)" % (
+                    name, str(timeout)),
+                script_result_status=SCRIPT_STATUS.ABORTED)
+            if not node.enable_ssh:
+                node.stop(
+                    comment=(
+                        "Node stopped due to %s running past it's "
+                        "timeout(%s)" % (name, str(timeout)))
+                )
+
+
+def get_next_deadline():
+    """Return the number of seconds until the next known deadline.
+
+    This is the earliest of the nodes' `status_expires` and their heartbeat
+    and script deadlines that are still in the future, or `None` if there
+    are no deadlines.
+    """
+    delays = []
+    current_db_time = now()
+    status_expires = Node.objects.filter(
+        status__in=NODE_FAILURE_MONITORED_STATUS_TRANSITIONS.keys(),
+        status_expires__gt=current_db_time).aggregate(
+            Min('status_expires'))['status_expires__min']
+    if status_expires is not None:
+        delays.append(status_expires - current_db_time)
+    current_time = datetime.now()
+    with connection.cursor() as cursor:
+        _execute_script_deadlines_query(cursor, """\
+            SELECT MIN(deadline) FROM (
+                SELECT heartbeat_deadline FROM deadlines
+                UNION ALL
+                SELECT result_deadline FROM deadlines
+            ) AS all_deadlines (deadline)
+            WHERE deadline >= %(now)s
+        """, now=current_time)
+        [script_deadline] = cursor.fetchone()
+    if script_deadline is not None:
+        delays.append(script_deadline - current_time)
+    if len(delays) == 0:
+        return None
+    else:
+        return min(delays).total_seconds()
 
 
 @synchronous
 @transactional
 def check_status():
-    """Check the status_expires and script timeout on all nodes."""
+    """Check the status_expires and script timeout on all nodes.
+
+    :return: The number of seconds until the next known deadline, or `None`.
+    """
     mark_nodes_failed_after_expiring()
     mark_nodes_failed_after_missing_script_timeout()
+    return get_next_deadline()
 
 
-class StatusMonitorService(TimerService, object):
-    """Service to periodically monitor node statues and mark them failed.
+class StatusMonitorService(Service, object):
+    """Service to monitor node statuses and mark them failed.
 
-    This will run immediately when it's started, then once every 60 seconds,
-    though the interval can be overridden by passing it to the constructor.
+    This will run immediately when it's started, then again just after the
+    next deadline that `check_status` found, or after 60 seconds if that's
+    sooner. The interval, which can be overridden by passing it to the
+    constructor, bounds how long it takes to notice deadlines that were set
+    since the last check.
     """
 
-    def __init__(self, interval=60):
-        super(StatusMonitorService, self).__init__(
-            interval, deferToDatabase, check_status)
+    # Wait at least this long between checks, and this long after a
+    # deadline before checking it, so that it has certainly passed.
+    min_interval = 1
+
+    def __init__(self, interval=60, clock=reactor):
+        super(StatusMonitorService, self).__init__()
+        self.interval = interval
+        self.clock = clock
+        self._call = None
+        self._checking = None
+
+    def startService(self):
+        super(StatusMonitorService, self).startService()
+        self._check()
+
+    def stopService(self):
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+        checking = self._checking
+        # Stop running first, so that a check in progress does not schedule
+        # another when it finishes.
+        d = maybeDeferred(super(StatusMonitorService, self).stopService)
+        if checking is not None:
+            d.addCallback(lambda _: checking)
+        return d
+
+    def _check(self):
+        self._call = None
+        d = self._checking = deferToDatabase(check_status)
+        d.addErrback(log.err, "Failed to check the status of nodes.")
+        d.addCallback(self._schedule)
+        return d
+
+    def _schedule(self, delay):
+        self._checking = None
+        if self.running:
+            if delay is None or delay > self.interval:
+                delay = self.interval
+            else:
+                delay = max(delay + self.min_interval, self.min_interval)
+            self._call = self.clock.callLater(delay, self._check)
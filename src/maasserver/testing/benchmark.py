@@ -0,0 +1,284 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Benchmarks of the region's hot paths.
+
+Each benchmark measures wall time, the number of SQL queries, and the peak
+memory allocated by Python while running one of the region's most-used code
+paths against whatever is in the database, typically sample data created by
+`maasserver.testing.sampledata`.
+
+Results are plain data so they can be written out as JSON and compared
+between versions of MAAS.
+"""
+
+__all__ = [
+    "BENCHMARKS",
+    "measure",
+    "run_benchmarks",
+    "write_results",
+]
+
+from collections import OrderedDict
+from datetime import datetime
+from functools import partial
+import json
+from statistics import median
+from time import monotonic
+import tracemalloc
+
+from django.db import transaction
+from fixtures import (
+    EnvironmentVariable,
+    TempDir,
+)
+from maasserver.dhcp import get_dhcp_configuration
+from maasserver.dns.zonegenerator import ZoneGenerator
+from maasserver.enum import (
+    INTERFACE_TYPE,
+    NODE_STATUS,
+    NODE_TYPE,
+    RDNS_MODE,
+)
+from maasserver.models import (
+    Domain,
+    Interface,
+    Machine,
+    RackController,
+    StaticIPAddress,
+    Subnet,
+)
+from maasserver.models.config import config_cache
+from maasserver.preseed import get_curtin_config
+from maasserver.rpc.boot import get_config
+from maasserver.rpc.nodes import list_cluster_nodes_power_parameters
+from maasserver.testing.factory import factory
+from maasserver.testing.testclient import MAASSensibleOAuthClient
+from maasserver.utils.django_urls import reverse
+from maasserver.utils.orm import get_one
+from maasserver.websockets.handlers.machine import MachineHandler
+from maastesting.djangotestcase import CountQueries
+from provisioningserver.utils.version import get_maas_version
+
+# Registry of benchmarks, in the order they're defined. Each value is a
+# function that prepares the benchmark and returns a zero-argument callable
+# that runs it. Only the returned callable is measured.
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """Register the decorated preparation function as benchmark `name`."""
+    def decorator(prepare):
+        BENCHMARKS[name] = prepare
+        return prepare
+    return decorator
+
+
+@benchmark("websocket.machine.list")
+def prepare_machine_handler_list():
+    handler = MachineHandler(factory.make_admin(), {})
+    return partial(handler.list, {})
+
+
+@benchmark("api.machines.read")
+def prepare_api_machines_read():
+    user, _ = factory.make_user_with_keys()
+    client = MAASSensibleOAuthClient(user)
+    return partial(client.get, reverse('machines_handler'))
+
+
+@benchmark("api.machines.allocate")
+def prepare_api_machines_allocate():
+    user, _ = factory.make_user_with_keys()
+    client = MAASSensibleOAuthClient(user)
+    return partial(
+        client.post, reverse('machines_handler'), {'op': 'allocate'})
+
+
+@benchmark("api.machines.allocate.storage_and_interfaces")
+def prepare_api_machines_allocate_storage_and_interfaces():
+    # As Juju asks: the same storage and interfaces constraints every time.
+    user, _ = factory.make_user_with_keys()
+    client = MAASSensibleOAuthClient(user)
+    return partial(
+        client.post, reverse('machines_handler'), {
+            'op': 'allocate',
+            'storage': 'root:8,data:16',
+            'interfaces': 'eth0:type=physical',
+        })
+
+
+@benchmark("dns.zonegenerator.as_list")
+def prepare_zone_generator_as_list():
+    domains = Domain.objects.filter(authoritative=True)
+    subnets = Subnet.objects.exclude(rdns_mode=RDNS_MODE.DISABLED)
+    return ZoneGenerator(domains, subnets, serial=1).as_list
+
+
+@benchmark("dns.write_zones")
+def prepare_write_zones():
+    domains = Domain.objects.filter(authoritative=True)
+    subnets = Subnet.objects.exclude(rdns_mode=RDNS_MODE.DISABLED)
+
+    # Records are streamed from the database as each zone file is written,
+    # so peak memory here should stay flat as the number of nodes grows.
+    def write_zones():
+        with TempDir() as tempdir, EnvironmentVariable(
+                "MAAS_DNS_CONFIG_DIR", tempdir.path):
+            for zone in ZoneGenerator(domains, subnets, serial=1):
+                zone.write_config()
+
+    return write_zones
+
+
+@benchmark("dhcp.get_dhcp_configuration")
+def prepare_get_dhcp_configuration():
+    rack = RackController.objects.first()
+    return partial(get_dhcp_configuration, rack)
+
+
+@benchmark("rpc.list_cluster_nodes_power_parameters")
+def prepare_list_cluster_nodes_power_parameters():
+    rack = RackController.objects.first()
+    return partial(list_cluster_nodes_power_parameters, rack.system_id)
+
+
+@benchmark("preseed.get_curtin_config")
+def prepare_get_curtin_config():
+    machine = get_one(
+        Machine.objects.filter(status=NODE_STATUS.DEPLOYING)[:1])
+    if machine is None:
+        machine = factory.make_Machine(status=NODE_STATUS.DEPLOYING)
+    return partial(get_curtin_config, machine)
+
+
+@benchmark("rpc.boot.get_config")
+def prepare_get_boot_config():
+    rack = RackController.objects.first()
+    local_ip = StaticIPAddress.objects.filter(
+        interface__node=rack, ip__isnull=False).values_list(
+        "ip", flat=True).first()
+    if local_ip is None:
+        local_ip = factory.make_ipv4_address()
+    macs = [
+        str(mac) for mac in Interface.objects.filter(
+            type=INTERFACE_TYPE.PHYSICAL,
+            node__node_type=NODE_TYPE.MACHINE).order_by(
+            "node_id", "id").distinct("node_id").values_list(
+            "mac_address", flat=True)[:200]
+    ]
+
+    # As when up to 200 machines are power cycled together and all ask the
+    # rack for their boot configuration. The requests run one after another
+    # here, but it's the queries they make that saturate the database when
+    # they run concurrently.
+    def get_configs():
+        for mac in macs:
+            get_config(
+                rack.system_id, local_ip, factory.make_ipv4_address(),
+                mac=mac, bios_boot_method="pxe")
+
+    return get_configs
+
+
+def measure(func, trace_memory=False):
+    """Run `func` once, measuring its cost.
+
+    :param trace_memory: Measure peak memory allocated by Python too. This
+        slows `func` down considerably, so its wall time is not useful.
+    :return: A dict with `wall_time` in seconds, `queries`, and, when
+        tracing memory, `peak_memory` in bytes.
+    """
+    counter = CountQueries()
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        started = monotonic()
+        with counter:
+            func()
+        result = {
+            "wall_time": monotonic() - started,
+            "queries": counter.num_queries,
+        }
+        if trace_memory:
+            _, result["peak_memory"] = tracemalloc.get_traced_memory()
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return result
+
+
+def _measure_once(prepare, trace_memory, cache_config=False):
+    """Prepare and measure a benchmark, rolling back any changes it makes.
+
+    This makes sure every run sees the same database.
+
+    :param cache_config: Load the configuration cache first, as a running
+        region does. This must not be called from within a transaction.
+    """
+    if cache_config:
+        config_cache.load()
+    try:
+        # Pinned, as a request is, so that the transaction's own changes to
+        # the configuration aren't hidden by the cache.
+        with config_cache.pinned(), transaction.atomic():
+            try:
+                return measure(prepare(), trace_memory)
+            finally:
+                transaction.set_rollback(True)
+    finally:
+        if cache_config:
+            config_cache.invalidate()
+
+
+def run_benchmarks(names=None, repeat=3, cache_config=False):
+    """Run benchmarks, returning their results.
+
+    Each benchmark is run `repeat` times for wall time and query count, then
+    once more to measure peak memory.
+
+    :param names: The names of the benchmarks to run; all by default.
+    :param cache_config: Load the configuration cache before each run, as a
+        running region does. Comparing results with and without shows how
+        many queries the cache saves. This must not be called from within a
+        transaction.
+    :return: A dict of results that can be serialised as JSON.
+    """
+    if names is None:
+        names = list(BENCHMARKS)
+    results = OrderedDict()
+    for name in names:
+        prepare = BENCHMARKS[name]
+        try:
+            runs = [
+                _measure_once(prepare, False, cache_config)
+                for _ in range(repeat)
+            ]
+            memory = _measure_once(prepare, True, cache_config)
+        except Exception as error:
+            results[name] = {"error": "%s: %s" % (
+                type(error).__name__, error)}
+        else:
+            wall_times = [run["wall_time"] for run in runs]
+            results[name] = {
+                "wall_time": {
+                    "min": min(wall_times),
+                    "median": median(wall_times),
+                    "max": max(wall_times),
+                },
+                "queries": max(run["queries"] for run in runs),
+                "peak_memory": memory["peak_memory"],
+            }
+    return {
+        "maas_version": get_maas_version(),
+        "created": datetime.utcnow().isoformat(),
+        "machines": Machine.objects.count(),
+        "repeat": repeat,
+        "cache_config": cache_config,
+        "benchmarks": results,
+    }
+
+
+def write_results(results, stream):
+    """Write `results` from `run_benchmarks` to `stream` as JSON."""
+    stream.write(json.dumps(results, indent=2, sort_keys=True) + "\n")
@@ -5,6 +5,7 @@
 
 __all__ = [
     "populate",
+    "populate_machines",
 ]
 
 from collections import defaultdict
@@ -26,6 +27,7 @@ from maasserver.models import (
     RackController,
     User,
     VersionedTextFile,
+    Zone,
 )
 from maasserver.storage_layouts import STORAGE_LAYOUTS
 from maasserver.testing.factory import factory
@@ -170,6 +172,48 @@ def populate(seed="sampledata"):
         make_discovery()
 
 
+def populate_machines(count, seed="sampledata", chunk_size=100):
+    """Populate the database with `count` additional machines.
+
+    This is for scaling up the data created by `populate` so that the cost of
+    the region's hot paths can be measured on realistically sized
+    installations. The machines are simpler than those made by `populate` --
+    each has a random network configuration and a few disks -- and they are
+    created `chunk_size` at a time, each chunk in its own transaction.
+    """
+    random.seed(seed)
+    for start in range(0, count, chunk_size):
+        make_machines(min(chunk_size, count - start))
+
+
+@transactional
+def make_machines(count):
+    """Make `count` machines, all in one transaction."""
+    zones = list(Zone.objects.all())
+    domains = list(Domain.objects.all())
+    owners = list(User.objects.filter(is_superuser=False))
+    statuses = [
+        NODE_STATUS.NEW,
+        NODE_STATUS.READY,
+        NODE_STATUS.ALLOCATED,
+        NODE_STATUS.DEPLOYED,
+    ]
+    for _ in range(count):
+        status = random.choice(statuses)
+        owner = None
+        if status in ALLOCATED_NODE_STATUSES and len(owners) > 0:
+            owner = random.choice(owners)
+        machine = factory.make_Node(
+            status=status, owner=owner, zone=random.choice(zones),
+            interface=False, with_boot_disk=False, power_type='manual',
+            domain=random.choice(domains),
+            memory=random.choice([1024, 4096, 8192]),
+            cpu_count=random.randint(2, 8))
+        RandomInterfaceFactory.create_random(machine)
+        for _ in range(random.randint(1, 3)):
+            factory.make_PhysicalBlockDevice(node=machine)
+
+
 @transactional
 def make_discovery():
     """Make a discovery in its own transaction so each last_seen time
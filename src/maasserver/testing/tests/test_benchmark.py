@@ -0,0 +1,103 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the `benchmark` module."""
+
+__all__ = []
+
+from io import StringIO
+import json
+
+from maasserver.models import Zone
+from maasserver.testing import (
+    benchmark,
+    sampledata,
+)
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import MAASServerTestCase
+from testtools.matchers import (
+    ContainsDict,
+    Equals,
+    GreaterThan,
+    HasLength,
+    Is,
+    IsInstance,
+    MatchesDict,
+    Not,
+)
+
+
+class TestMeasure(MAASServerTestCase):
+    """Tests for `benchmark.measure`."""
+
+    def test__counts_queries(self):
+        def func():
+            list(Zone.objects.all())
+            list(Zone.objects.all())
+
+        result = benchmark.measure(func)
+        self.assertThat(result, MatchesDict({
+            "wall_time": IsInstance(float),
+            "queries": Equals(2),
+        }))
+
+    def test__traces_memory(self):
+        result = benchmark.measure(lambda: [0] * 10000, trace_memory=True)
+        self.assertThat(result["peak_memory"], GreaterThan(10000))
+
+
+class TestRunBenchmarks(MAASServerTestCase):
+    """Tests for `benchmark.run_benchmarks`."""
+
+    def test__runs_all_benchmarks_on_sample_data(self):
+        sampledata.populate()
+        results = benchmark.run_benchmarks(repeat=1)
+        self.assertThat(
+            results["benchmarks"], HasLength(len(benchmark.BENCHMARKS)))
+        for name, result in results["benchmarks"].items():
+            self.assertThat(result.get("error"), Is(None), name)
+            self.assertThat(result, ContainsDict({
+                "queries": Not(Is(None)),
+                "peak_memory": Not(Is(None)),
+            }))
+
+    def test__rolls_back_changes(self):
+        name = factory.make_name("benchmark")
+        self.patch(benchmark, "BENCHMARKS", {
+            name: lambda: lambda: factory.make_Zone(),
+        })
+        zones_before = Zone.objects.count()
+        benchmark.run_benchmarks(repeat=2)
+        self.assertThat(Zone.objects.count(), Equals(zones_before))
+
+    def test__records_errors(self):
+        name = factory.make_name("benchmark")
+
+        def prepare():
+            raise ValueError("broken")
+
+        self.patch(benchmark, "BENCHMARKS", {name: prepare})
+        results = benchmark.run_benchmarks(repeat=1)
+        self.assertThat(
+            results["benchmarks"][name],
+            Equals({"error": "ValueError: broken"}))
+
+    def test__loads_and_invalidates_config_cache_around_each_run(self):
+        name = factory.make_name("benchmark")
+        self.patch(benchmark, "BENCHMARKS", {name: lambda: lambda: None})
+        config_cache = self.patch(benchmark, "config_cache")
+        results = benchmark.run_benchmarks(repeat=2, cache_config=True)
+        self.expectThat(results["cache_config"], Is(True))
+        # Two runs for time and queries, one for memory.
+        self.expectThat(config_cache.load.call_count, Equals(3))
+        self.expectThat(config_cache.invalidate.call_count, Equals(3))
+
+    def test__results_can_be_written_as_json(self):
+        name = factory.make_name("benchmark")
+        self.patch(benchmark, "BENCHMARKS", {name: lambda: lambda: None})
+        results = benchmark.run_benchmarks(repeat=1)
+        stream = StringIO()
+        benchmark.write_results(results, stream)
+        self.assertThat(
+            json.loads(stream.getvalue())["benchmarks"], Equals(
+                json.loads(json.dumps(results["benchmarks"]))))
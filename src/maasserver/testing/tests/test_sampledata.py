@@ -5,8 +5,10 @@
 
 __all__ = []
 
+from maasserver.models import Machine
 from maasserver.testing import sampledata
 from maasserver.testing.testcase import MAASServerTestCase
+from testtools.matchers import Equals
 
 
 class TestPopulates(MAASServerTestCase):
@@ -14,3 +16,9 @@ class TestPopulates(MAASServerTestCase):
 
     def test__runs(self):
         sampledata.populate()
+
+    def test__populate_machines_adds_machines(self):
+        sampledata.populate()
+        before = Machine.objects.count()
+        sampledata.populate_machines(3, chunk_size=2)
+        self.assertThat(Machine.objects.count(), Equals(before + 3))
@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for `maasserver.eventloop`."""
@@ -13,6 +13,7 @@ from django.db import connections
 from maasserver import (
     bootresources,
     eventloop,
+    listener,
     nonces_cleanup,
     rack_controller,
     region_controller,
@@ -20,7 +21,12 @@ from maasserver import (
     webapp,
 )
 from maasserver.eventloop import DEFAULT_PORT
-from maasserver.regiondservices import service_monitor_service
+from maasserver.regiondservices import (
+    config_cache,
+    event_watcher,
+    preseed_cache,
+    service_monitor_service,
+)
 from maasserver.rpc import regionservice
 from maasserver.testing.eventloop import RegionEventLoopFixture
 from maasserver.testing.listener import FakePostgresListenerService
@@ -280,6 +286,49 @@ class TestFactories(MAASTestCase):
         self.assertFalse(
             eventloop.loop.factories["web"]["only_on_master"])
 
+    def test_make_PostgresListenerService(self):
+        self.patch(eventloop, "is_worker_process").return_value = False
+        service = eventloop.make_PostgresListenerService()
+        self.assertThat(service, IsInstance(
+            listener.PostgresListenerService))
+        # It is registered as a factory in RegionEventLoop.
+        self.assertIs(
+            eventloop.make_PostgresListenerService,
+            eventloop.loop.factories["postgres-listener"]["factory"])
+        self.assertFalse(
+            eventloop.loop.factories["postgres-listener"]["only_on_master"])
+
+    def test_make_PostgresListenerService_on_master(self):
+        self.patch(eventloop, "is_worker_process").return_value = True
+        self.patch(eventloop, "is_master_process").return_value = True
+        service = eventloop.make_PostgresListenerService()
+        self.assertThat(service, IsInstance(
+            listener.PostgresListenerService))
+
+    def test_make_PostgresListenerService_on_worker(self):
+        self.patch(eventloop, "is_worker_process").return_value = True
+        self.patch(eventloop, "is_master_process").return_value = False
+        service = eventloop.make_PostgresListenerService()
+        self.assertThat(service, IsInstance(
+            listener.PostgresListenerClientService))
+
+    def test_make_PostgresListenerRelayService(self):
+        service = eventloop.make_PostgresListenerRelayService(
+            FakePostgresListenerService())
+        self.assertThat(service, IsInstance(
+            listener.PostgresListenerRelayService))
+        # It is registered as a factory in RegionEventLoop.
+        self.assertIs(
+            eventloop.make_PostgresListenerRelayService,
+            eventloop.loop.factories["postgres-listener-relay"]["factory"])
+        # Has a dependency of postgres-listener.
+        self.assertEquals(
+            ["postgres-listener"],
+            eventloop.loop.factories["postgres-listener-relay"]["requires"])
+        self.assertTrue(
+            eventloop.loop.factories[
+                "postgres-listener-relay"]["only_on_master"])
+
     def test_make_RackControllerService(self):
         service = eventloop.make_RackControllerService(
             FakePostgresListenerService(), sentinel.rpc_advertise)
@@ -328,6 +377,54 @@ class TestFactories(MAASTestCase):
         self.assertFalse(
             eventloop.loop.factories["status-worker"]["only_on_master"])
 
+    def test_make_EventWatcherService(self):
+        service = eventloop.make_EventWatcherService(
+            FakePostgresListenerService())
+        self.assertThat(service, IsInstance(
+            event_watcher.EventWatcherService))
+        # It is registered as a factory in RegionEventLoop.
+        self.assertIs(
+            eventloop.make_EventWatcherService,
+            eventloop.loop.factories["event-watcher"]["factory"])
+        # Has a dependency of postgres-listener.
+        self.assertEquals(
+            ["postgres-listener"],
+            eventloop.loop.factories["event-watcher"]["requires"])
+        self.assertFalse(
+            eventloop.loop.factories["event-watcher"]["only_on_master"])
+
+    def test_make_ConfigCacheService(self):
+        service = eventloop.make_ConfigCacheService(
+            FakePostgresListenerService())
+        self.assertThat(service, IsInstance(
+            config_cache.ConfigCacheService))
+        # It is registered as a factory in RegionEventLoop.
+        self.assertIs(
+            eventloop.make_ConfigCacheService,
+            eventloop.loop.factories["config-cache"]["factory"])
+        # Has a dependency of postgres-listener.
+        self.assertEquals(
+            ["postgres-listener"],
+            eventloop.loop.factories["config-cache"]["requires"])
+        self.assertFalse(
+            eventloop.loop.factories["config-cache"]["only_on_master"])
+
+    def test_make_PreseedCacheService(self):
+        service = eventloop.make_PreseedCacheService(
+            FakePostgresListenerService())
+        self.assertThat(service, IsInstance(
+            preseed_cache.PreseedCacheService))
+        # It is registered as a factory in RegionEventLoop.
+        self.assertIs(
+            eventloop.make_PreseedCacheService,
+            eventloop.loop.factories["preseed-cache"]["factory"])
+        # Has a dependency of postgres-listener.
+        self.assertEquals(
+            ["postgres-listener"],
+            eventloop.loop.factories["preseed-cache"]["requires"])
+        self.assertFalse(
+            eventloop.loop.factories["preseed-cache"]["only_on_master"])
+
 
 class TestDisablingDatabaseConnections(MAASServerTestCase):
 
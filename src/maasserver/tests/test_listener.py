@@ -1,4 +1,4 @@
-# Copyright 2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2016-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for `maasserver.websockets.listener`"""
@@ -11,6 +11,7 @@ from unittest.mock import (
     ANY,
     call,
     MagicMock,
+    Mock,
     sentinel,
 )
 
@@ -18,10 +19,15 @@ from crochet import wait_for
 from django.db import connection
 from maasserver import listener as listener_module
 from maasserver.listener import (
+    PostgresListenerClientService,
     PostgresListenerNotifyError,
     PostgresListenerRegistrationError,
+    PostgresListenerRelayProtocol,
     PostgresListenerService,
     PostgresListenerUnregistrationError,
+    RelayNotification,
+    SubscribeToChannel,
+    UnsubscribeFromChannel,
 )
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
@@ -34,11 +40,13 @@ from maastesting.matchers import (
     MockCallsMatch,
     MockNotCalled,
 )
+from maastesting.testcase import MAASTestCase
 from maastesting.twisted import TwistedLoggerFixture
 from provisioningserver.utils.twisted import DeferredValue
 from psycopg2 import OperationalError
 from testtools import ExpectedException
 from testtools.matchers import (
+    Contains,
     ContainsDict,
     Equals,
     HasLength,
@@ -55,6 +63,7 @@ from twisted.internet.defer import (
     Deferred,
     DeferredQueue,
     inlineCallbacks,
+    succeed,
 )
 from twisted.logger import LogLevel
 from twisted.python.failure import Failure
@@ -597,3 +606,243 @@ class TestPostgresListenerService(MAASServerTestCase):
                 call("UNLISTEN %s_create;" % channel),
                 call("UNLISTEN %s_delete;" % channel),
                 call("UNLISTEN %s_update;" % channel)))
+
+
+class TestPostgresListenerServiceRelays(MAASTestCase):
+    """Tests for relaying notifications from `PostgresListenerService`."""
+
+    def make_connected_listener(self):
+        listener = PostgresListenerService()
+        listener.connection = sentinel.connection
+        listener.registeredChannels = True
+        self.patch(listener, "registerChannel")
+        self.patch(listener, "unregisterChannel")
+        return listener
+
+    def test_relay_registers_channel_once(self):
+        listener = self.make_connected_listener()
+        channel = factory.make_name("channel")
+        listener.relay(channel, sentinel.relay1)
+        listener.relay(channel, sentinel.relay2)
+        self.expectThat(
+            listener.relays[channel],
+            Equals({sentinel.relay1, sentinel.relay2}))
+        self.expectThat(
+            listener.registerChannel, MockCalledOnceWith(channel))
+
+    def test_relay_does_not_register_channel_with_handlers(self):
+        listener = self.make_connected_listener()
+        channel = factory.make_name("channel")
+        listener.listeners[channel].append(sentinel.handler)
+        listener.relay(channel, sentinel.relay)
+        self.assertThat(listener.registerChannel, MockNotCalled())
+
+    def test_relay_allows_many_relays_on_system_channel(self):
+        listener = PostgresListenerService()
+        listener.register("sys_test", sentinel.handler)
+        listener.relay("sys_test", sentinel.relay1)
+        listener.relay("sys_test", sentinel.relay2)
+        self.assertThat(listener.relays["sys_test"], HasLength(2))
+
+    def test_unrelay_unregisters_channel_after_last_relay(self):
+        listener = self.make_connected_listener()
+        channel = factory.make_name("channel")
+        listener.relay(channel, sentinel.relay1)
+        listener.relay(channel, sentinel.relay2)
+        listener.unrelay(channel, sentinel.relay1)
+        self.expectThat(listener.unregisterChannel, MockNotCalled())
+        listener.unrelay(channel, sentinel.relay2)
+        self.expectThat(
+            listener.unregisterChannel, MockCalledOnceWith(channel))
+        self.expectThat(listener.relays, Not(Contains(channel)))
+
+    def test_unrelay_keeps_channel_with_handlers(self):
+        listener = self.make_connected_listener()
+        channel = factory.make_name("channel")
+        listener.listeners[channel].append(sentinel.handler)
+        listener.relay(channel, sentinel.relay)
+        listener.unrelay(channel, sentinel.relay)
+        self.assertThat(listener.unregisterChannel, MockNotCalled())
+
+    def test_unregister_keeps_channel_with_relays(self):
+        listener = self.make_connected_listener()
+        channel = factory.make_name("channel")
+        listener.register(channel, sentinel.handler)
+        listener.relay(channel, sentinel.relay)
+        listener.unregister(channel, sentinel.handler)
+        self.assertThat(listener.unregisterChannel, MockNotCalled())
+
+    def test_unrelay_raises_error_if_relay_does_not_match(self):
+        listener = PostgresListenerService()
+        self.assertRaises(
+            PostgresListenerUnregistrationError,
+            listener.unrelay, "channel", sentinel.relay)
+
+    def test_registerChannels_includes_relayed_channels(self):
+        listener = PostgresListenerService()
+        self.patch(listener, "registerChannel")
+        listener.register("node", sentinel.handler)
+        listener.relay("machine", sentinel.relay)
+        listener.registerChannels()
+        self.assertItemsEqual(
+            ["machine", "node"],
+            [args[0] for args, _ in listener.registerChannel.call_args_list])
+
+    def test_doRead_relays_system_notifications(self):
+        listener = PostgresListenerService()
+        relay = Mock()
+        listener.relay("sys_test", relay)
+        connection = self.patch(listener, "connection")
+        connection.connection.poll.return_value = None
+        connection.connection.notifies = [FakeNotify("sys_test", "payload")]
+        listener.doRead()
+        self.assertThat(relay, MockCalledOnceWith("sys_test", None, "payload"))
+
+    def test_handleNotify_relays_notifications(self):
+        listener = PostgresListenerService()
+        handler, relay = Mock(), Mock()
+        listener.register("node", handler)
+        listener.relay("node", relay)
+        listener.handleNotify(("node_create", "payload"))
+        self.expectThat(handler, MockCalledOnceWith("create", "payload"))
+        self.expectThat(
+            relay, MockCalledOnceWith("node", "create", "payload"))
+
+    def test_handleNotify_relays_notifications_without_handlers(self):
+        listener = PostgresListenerService()
+        relay = Mock()
+        listener.relay("node", relay)
+        listener.handleNotify(("node_update", "payload"))
+        self.expectThat(
+            relay, MockCalledOnceWith("node", "update", "payload"))
+        self.expectThat(listener.listeners, Not(Contains("node")))
+
+
+class TestPostgresListenerRelayProtocol(MAASTestCase):
+    """Tests for `PostgresListenerRelayProtocol`."""
+
+    def make_protocol(self):
+        listener = PostgresListenerService()
+        protocol = PostgresListenerRelayProtocol(listener)
+        self.patch(protocol, "callRemote")
+        return protocol, listener
+
+    def test_subscribe_relays_channel(self):
+        protocol, listener = self.make_protocol()
+        responder = protocol.locateResponder(SubscribeToChannel.commandName)
+        self.assertThat(responder, Not(Is(None)))
+        protocol.subscribe("node")
+        protocol.subscribe("node")
+        self.expectThat(protocol.channels, Equals({"node"}))
+        self.expectThat(
+            listener.relays["node"], Equals({protocol.relayNotification}))
+
+    def test_unsubscribe_stops_relaying_channel(self):
+        protocol, listener = self.make_protocol()
+        responder = protocol.locateResponder(
+            UnsubscribeFromChannel.commandName)
+        self.assertThat(responder, Not(Is(None)))
+        protocol.subscribe("node")
+        protocol.unsubscribe("node")
+        protocol.unsubscribe("node")
+        self.expectThat(protocol.channels, Equals(set()))
+        self.expectThat(listener.relays, Not(Contains("node")))
+
+    def test_relayNotification_calls_worker(self):
+        protocol, _ = self.make_protocol()
+        protocol.relayNotification("node", "create", "payload")
+        self.assertThat(protocol.callRemote, MockCalledOnceWith(
+            RelayNotification, channel="node", action="create",
+            payload="payload"))
+
+    def test_connectionLost_stops_relaying_all_channels(self):
+        protocol, listener = self.make_protocol()
+        protocol.subscribe("node")
+        protocol.subscribe("sys_test")
+        protocol.connectionLost(Failure(error.ConnectionDone()))
+        self.expectThat(protocol.channels, Equals(set()))
+        self.expectThat(listener.relays, Equals({}))
+
+
+class TestPostgresListenerClientService(MAASTestCase):
+    """Tests for `PostgresListenerClientService`."""
+
+    def make_connected_service(self):
+        service = PostgresListenerClientService(sentinel.endpoint)
+        protocol = Mock()
+        protocol.callRemote.return_value = succeed({})
+        service.connected(protocol)
+        return service, protocol
+
+    def test_register_subscribes_once_per_channel(self):
+        service, protocol = self.make_connected_service()
+        service.register("node", sentinel.handler1)
+        service.register("node", sentinel.handler2)
+        self.assertThat(protocol.callRemote, MockCalledOnceWith(
+            SubscribeToChannel, channel="node"))
+
+    def test_register_raises_error_if_system_handler_registered_twice(self):
+        service = PostgresListenerClientService(sentinel.endpoint)
+        service.register("sys_test", sentinel.handler)
+        self.assertRaises(
+            PostgresListenerRegistrationError,
+            service.register, "sys_test", sentinel.handler)
+
+    def test_unregister_unsubscribes_after_last_handler(self):
+        service, protocol = self.make_connected_service()
+        service.register("node", sentinel.handler1)
+        service.register("node", sentinel.handler2)
+        service.unregister("node", sentinel.handler1)
+        self.expectThat(protocol.callRemote.call_count, Equals(1))
+        service.unregister("node", sentinel.handler2)
+        self.expectThat(protocol.callRemote, MockCalledWith(
+            UnsubscribeFromChannel, channel="node"))
+
+    def test_unregister_raises_error_if_channel_not_registered(self):
+        service = PostgresListenerClientService(sentinel.endpoint)
+        self.assertRaises(
+            PostgresListenerUnregistrationError,
+            service.unregister, "node", sentinel.handler)
+
+    def test_connected_subscribes_to_registered_channels(self):
+        service = PostgresListenerClientService(sentinel.endpoint)
+        service.register("node", sentinel.handler)
+        service.register("sys_test", sentinel.handler)
+        protocol = Mock()
+        protocol.callRemote.return_value = succeed({})
+        service.connected(protocol)
+        self.assertThat(protocol.callRemote, MockCallsMatch(
+            call(SubscribeToChannel, channel="node"),
+            call(SubscribeToChannel, channel="sys_test")))
+
+    def test_disconnected_forgets_protocol(self):
+        service, protocol = self.make_connected_service()
+        service.disconnected(protocol)
+        self.assertThat(service.protocol, Is(None))
+        # Registering while disconnected waits for the next connection.
+        service.register("node", sentinel.handler)
+        self.assertThat(protocol.callRemote, MockNotCalled())
+
+    def test_handleNotify_calls_handlers(self):
+        service = PostgresListenerClientService(sentinel.endpoint)
+        handler1, handler2 = Mock(), Mock()
+        service.register("node", handler1)
+        service.register("node", handler2)
+        service.handleNotify("node", "update", "payload")
+        self.expectThat(handler1, MockCalledOnceWith("update", "payload"))
+        self.expectThat(handler2, MockCalledOnceWith("update", "payload"))
+
+    def test_handleNotify_calls_system_handler_with_channel(self):
+        service = PostgresListenerClientService(sentinel.endpoint)
+        handler = Mock()
+        service.register("sys_test", handler)
+        service.handleNotify("sys_test", None, "payload")
+        self.assertThat(handler, MockCalledOnceWith("sys_test", "payload"))
+
+    def test_handleNotify_logs_handler_failures(self):
+        service = PostgresListenerClientService(sentinel.endpoint)
+        service.register("node", Mock(side_effect=factory.make_exception()))
+        with TwistedLoggerFixture() as logger:
+            service.handleNotify("node", "update", "payload")
+        self.assertThat(logger.output, DocTestMatches(
+            "Failure while handling notification to 'node': 'payload'..."))
@@ -0,0 +1,219 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.metrics`."""
+
+__all__ = []
+
+import threading
+
+from django.db import connection
+from django.db.backends.utils import CursorWrapper
+from maasserver import metrics
+from maasserver.metrics import (
+    Gauge,
+    get_query_accounting,
+    Histogram,
+    install_query_accounting,
+    METRICS,
+    MetricsResource,
+    QueryAccounting,
+    record_retry,
+)
+from maasserver.testing.testcase import MAASServerTestCase
+from maastesting.factory import factory
+from maastesting.testcase import MAASTestCase
+from testtools.matchers import (
+    Contains,
+    Equals,
+    GreaterThan,
+    Is,
+)
+from twisted.web.test.requesthelper import DummyRequest
+
+
+class TestHistogram(MAASTestCase):
+    """Tests for `Histogram`."""
+
+    def make_histogram(self, buckets=(1, 5, 10)):
+        return Histogram(
+            "maas_test", "A test histogram.", ("kind", "name"), buckets)
+
+    def test_observe_counts_into_buckets(self):
+        histogram = self.make_histogram()
+        for value in (0, 1, 3, 10, 11, 50):
+            histogram.observe(value, "http", "view")
+        self.assertThat(
+            histogram.get("http", "view"), Equals(([2, 1, 1, 2], 75)))
+
+    def test_observe_keeps_labels_separate(self):
+        histogram = self.make_histogram()
+        histogram.observe(1, "http", "a")
+        histogram.observe(7, "http", "b")
+        self.expectThat(histogram.get("http", "a"), Equals(([1, 0, 0, 0], 1)))
+        self.expectThat(histogram.get("http", "b"), Equals(([0, 0, 1, 0], 7)))
+
+    def test_get_returns_None_when_nothing_observed(self):
+        histogram = self.make_histogram()
+        self.assertThat(histogram.get("http", "view"), Is(None))
+
+    def test_reset_discards_observations(self):
+        histogram = self.make_histogram()
+        histogram.observe(1, "http", "view")
+        histogram.reset()
+        self.assertThat(histogram.get("http", "view"), Is(None))
+
+    def test_observe_is_thread_safe(self):
+        histogram = self.make_histogram()
+
+        def observe():
+            for _ in range(1000):
+                histogram.observe(1, "http", "view")
+
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertThat(
+            histogram.get("http", "view"), Equals(([4000, 0, 0, 0], 4000)))
+
+    def test_render_produces_prometheus_text_format(self):
+        histogram = self.make_histogram()
+        histogram.observe(3, "rpc", "GetBootConfig")
+        histogram.observe(20, "rpc", "GetBootConfig")
+        self.assertThat(list(histogram.render()), Equals([
+            '# HELP maas_test A test histogram.',
+            '# TYPE maas_test histogram',
+            'maas_test_bucket{kind="rpc",name="GetBootConfig",le="1.0"} 0',
+            'maas_test_bucket{kind="rpc",name="GetBootConfig",le="5.0"} 1',
+            'maas_test_bucket{kind="rpc",name="GetBootConfig",le="10.0"} 1',
+            'maas_test_bucket{kind="rpc",name="GetBootConfig",le="+Inf"} 2',
+            'maas_test_sum{kind="rpc",name="GetBootConfig"} 23.0',
+            'maas_test_count{kind="rpc",name="GetBootConfig"} 2',
+        ]))
+
+    def test_render_escapes_label_values(self):
+        histogram = self.make_histogram()
+        histogram.observe(1, "http", 'a"b\\c')
+        self.assertThat(
+            list(histogram.render()),
+            Contains('maas_test_count{kind="http",name="a\\"b\\\\c"} 1'))
+
+
+class TestGauge(MAASTestCase):
+    """Tests for `Gauge`."""
+
+    def make_gauge(self):
+        return Gauge("maas_test", "A test gauge.", ("priority",))
+
+    def test_set_replaces_value(self):
+        gauge = self.make_gauge()
+        gauge.set(3, "high")
+        gauge.set(1, "high")
+        gauge.set(2, "low")
+        self.expectThat(gauge.get("high"), Equals(1))
+        self.expectThat(gauge.get("low"), Equals(2))
+
+    def test_get_returns_None_when_never_set(self):
+        gauge = self.make_gauge()
+        self.assertThat(gauge.get("high"), Is(None))
+
+    def test_render_produces_prometheus_text_format(self):
+        gauge = self.make_gauge()
+        gauge.set(2, "normal")
+        gauge.set(1, "high")
+        self.assertThat(list(gauge.render()), Equals([
+            '# HELP maas_test A test gauge.',
+            '# TYPE maas_test gauge',
+            'maas_test{priority="high"} 1.0',
+            'maas_test{priority="normal"} 2.0',
+        ]))
+
+
+class TestQueryAccounting(MAASServerTestCase):
+    """Tests for `QueryAccounting`."""
+
+    def test_accounts_for_queries_made_within_call(self):
+        accounting = QueryAccounting()
+
+        def query():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.execute("SELECT 2")
+
+        accounting.call(query)
+        self.expectThat(accounting.queries, Equals(2))
+        self.expectThat(accounting.database_time, GreaterThan(0))
+
+    def test_does_not_account_for_queries_made_outside_call(self):
+        accounting = QueryAccounting()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        self.assertThat(accounting.queries, Equals(0))
+
+    def test_get_query_accounting_returns_accounting_within_call(self):
+        accounting = QueryAccounting()
+        self.expectThat(
+            accounting.call(get_query_accounting), Is(accounting))
+        self.expectThat(get_query_accounting(), Is(None))
+
+    def test_record_retry_accounts_for_retry_within_call(self):
+        accounting = QueryAccounting()
+        accounting.call(record_retry)
+        record_retry()  # Outside of the call; this does nothing.
+        self.assertThat(accounting.retries, Equals(1))
+
+    def test_record_observes_into_metrics(self):
+        self.patch(metrics, "METRICS", tuple(
+            Histogram(
+                histogram.name, histogram.documentation,
+                histogram.labelnames, histogram.buckets)
+            for histogram in METRICS))
+        name = factory.make_name("view")
+        accounting = QueryAccounting()
+        accounting.queries = 3
+        accounting.retries = 1
+        accounting.database_time = 0.25
+        accounting.record("http", name)
+        queries, database_time, retries, wall_time = metrics.METRICS
+        self.expectThat(queries.get("http", name)[1], Equals(3))
+        self.expectThat(database_time.get("http", name)[1], Equals(0.25))
+        self.expectThat(retries.get("http", name)[1], Equals(1))
+        self.expectThat(wall_time.get("http", name)[1], GreaterThan(0))
+
+
+class TestInstallQueryAccounting(MAASTestCase):
+    """Tests for `install_query_accounting`."""
+
+    def test_is_installed_and_idempotent(self):
+        # Installed when the application starts; see `maasserver.monkey`.
+        execute = CursorWrapper.execute
+        executemany = CursorWrapper.executemany
+        self.expectThat(execute.accounted, Is(True))
+        self.expectThat(executemany.accounted, Is(True))
+        install_query_accounting()
+        self.expectThat(CursorWrapper.execute, Is(execute))
+        self.expectThat(CursorWrapper.executemany, Is(executemany))
+
+
+class TestMetricsResource(MAASTestCase):
+    """Tests for `MetricsResource`."""
+
+    def test_renders_all_metrics(self):
+        self.patch(metrics, "METRICS", (
+            Histogram("maas_a", "A.", ("kind", "name"), (1,)),
+            Histogram("maas_b", "B.", ("kind", "name"), (1,)),
+        ))
+        self.patch(metrics, "DATABASE_POOL_METRICS", (
+            Gauge("maas_c", "C.", ("priority",)),
+        ))
+        request = DummyRequest([])
+        content = MetricsResource().render_GET(request).decode("utf-8")
+        self.expectThat(content, Equals(
+            "# HELP maas_a A.\n# TYPE maas_a histogram\n"
+            "# HELP maas_b B.\n# TYPE maas_b histogram\n"
+            "# HELP maas_c C.\n# TYPE maas_c gauge\n"))
+        self.expectThat(
+            request.responseHeaders.getRawHeaders(b"Content-Type"),
+            Equals([b"text/plain; version=0.0.4; charset=utf-8"]))
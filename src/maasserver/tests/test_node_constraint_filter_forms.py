@@ -25,10 +25,13 @@ from maasserver.node_constraint_filter_forms import (
     detect_nonexistent_zone_names,
     generate_architecture_wildcards,
     get_architecture_wildcards,
+    get_labeled_constraint_map,
     get_storage_constraints_from_string,
     JUJU_ACQUIRE_FORM_FIELDS_MAPPING,
+    nodes_by_interface,
     nodes_by_storage,
     parse_legacy_tags,
+    parse_storage_constraints,
     RenamableFieldsForm,
 )
 from maasserver.testing.architecture import patch_usable_architectures
@@ -168,9 +171,45 @@ class TestUtils(MAASServerTestCase):
                     "0(ssd),0(ssd,sata),0(ssd),0(ssd,sata,removable)")
             ])
 
+    def test_get_storage_constraints_from_string_parses_once(self):
+        storage = "%d(%s)" % (randint(1, 100), factory.make_name("tag"))
+        constraints = get_storage_constraints_from_string(storage)
+        hits = parse_storage_constraints.cache_info().hits
+        self.assertEqual(
+            constraints, get_storage_constraints_from_string(storage))
+        self.assertEqual(
+            hits + 1, parse_storage_constraints.cache_info().hits)
+
+    def test_get_labeled_constraint_map_parses_once(self):
+        value = "%s:space=%s" % (
+            factory.make_name("label"), factory.make_name("space"))
+        self.assertIs(
+            get_labeled_constraint_map(value),
+            get_labeled_constraint_map(value))
+
     def test_nodes_by_storage_returns_None_when_storage_string_is_empty(self):
         self.assertEqual(None, nodes_by_storage(""))
 
+    def test_nodes_by_storage_only_matches_given_nodes(self):
+        node1 = factory.make_Node(with_boot_disk=False)
+        factory.make_PhysicalBlockDevice(node=node1, formatted_root=True)
+        node2 = factory.make_Node(with_boot_disk=False)
+        factory.make_PhysicalBlockDevice(node=node2, formatted_root=True)
+        self.assertItemsEqual(
+            [node2.id], nodes_by_storage(
+                "0", node_ids=Machine.objects.filter(
+                    id=node2.id).values('id')))
+
+    def test_nodes_by_interface_only_matches_given_nodes(self):
+        node1 = factory.make_Node_with_Interface_on_Subnet()
+        node2 = factory.make_Node_with_Interface_on_Subnet()
+        node_ids, label_map = nodes_by_interface(
+            get_labeled_constraint_map("eth:type=physical"),
+            node_ids=[node2.id])
+        self.assertItemsEqual([node2.id], node_ids)
+        self.assertItemsEqual([node2.id], label_map["eth"])
+        self.assertNotIn(node1.id, label_map["eth"])
+
 
 class TestRenamableForm(RenamableFieldsForm):
     field1 = forms.CharField(label="A field which is forced to contain 'foo'.")
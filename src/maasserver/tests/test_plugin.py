@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for the ``maasregiond`` TAP."""
@@ -93,14 +93,18 @@ class TestRegionServiceMaker(MAASTestCase):
         self.assertIsInstance(service, MultiService)
         expected_services = [
             "active-discovery",
+            "config-cache",
             "database-tasks",
             "dns-publication-cleanup",
+            "event-watcher",
             "import-resources",
             "import-resources-progress",
             "networks-monitor",
             "nonce-cleanup",
             "ntp",
             "postgres-listener",
+            "postgres-listener-relay",
+            "preseed-cache",
             "rack-controller",
             "region-controller",
             "reverse-dns",
@@ -1,4 +1,4 @@
-# Copyright 2012-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2012-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Test `maasserver.preseed` and related bits and bobs."""
@@ -10,7 +10,10 @@ import json
 import os
 from pipes import quote
 from textwrap import dedent
-from unittest.mock import sentinel
+from unittest.mock import (
+    Mock,
+    sentinel,
+)
 from urllib.parse import urlparse
 
 from django.conf import settings
@@ -70,6 +73,7 @@ from maasserver.preseed import (
     split_subarch,
     TemplateNotFoundError,
 )
+from maasserver.preseed_cache import PreseedCache
 from maasserver.rpc.testing.mixins import PreseedRPCMixin
 from maasserver.testing.architecture import make_usable_architecture
 from maasserver.testing.config import RegionConfigurationFixture
@@ -1829,6 +1833,64 @@ class TestPreseedMethods(
         self.assertIn(b'#cloud-config', preseed)
 
 
+class TestPreseedCaching(MAASTestCase):
+    """Tests for the caching of `get_preseed` and `get_curtin_userdata`."""
+
+    def setUp(self):
+        super(TestPreseedCaching, self).setUp()
+        self.cache = PreseedCache()
+        self.cache.enable()
+        self.patch(preseed_module, "preseed_cache", self.cache)
+        self.node = Mock(system_id=factory.make_name("system_id"))
+
+    def patch_curtin(self):
+        self.patch(preseed_module, "get_curtin_yaml_config")
+        self.patch(preseed_module, "get_curtin_installer_url")
+        return self.patch(preseed_module, "pack_install")
+
+    def test_get_preseed_renders_once(self):
+        render = self.patch(preseed_module, "render_node_preseed")
+        render.return_value = b"preseed"
+        self.expectThat(get_preseed(self.node), Equals(b"preseed"))
+        self.expectThat(get_preseed(self.node), Equals(b"preseed"))
+        self.expectThat(render, MockCalledOnceWith(self.node))
+
+    def test_get_preseed_renders_again_when_node_invalidated(self):
+        render = self.patch(preseed_module, "render_node_preseed")
+        render.side_effect = [b"old", b"new"]
+        get_preseed(self.node)
+        self.cache.invalidate(self.node.system_id)
+        self.assertThat(get_preseed(self.node), Equals(b"new"))
+
+    def test_get_preseed_renders_again_when_all_invalidated(self):
+        render = self.patch(preseed_module, "render_node_preseed")
+        render.side_effect = [b"old", b"new"]
+        get_preseed(self.node)
+        self.cache.invalidate()
+        self.assertThat(get_preseed(self.node), Equals(b"new"))
+
+    def test_get_curtin_userdata_renders_once(self):
+        pack_install = self.patch_curtin()
+        pack_install.return_value = "userdata"
+        self.expectThat(get_curtin_userdata(self.node), Equals("userdata"))
+        self.expectThat(get_curtin_userdata(self.node), Equals("userdata"))
+        self.expectThat(pack_install.call_count, Equals(1))
+
+    def test_get_curtin_userdata_renders_again_when_node_invalidated(self):
+        pack_install = self.patch_curtin()
+        pack_install.side_effect = ["old", "new"]
+        get_curtin_userdata(self.node)
+        self.cache.invalidate(self.node.system_id)
+        self.assertThat(get_curtin_userdata(self.node), Equals("new"))
+
+    def test_get_preseed_and_curtin_userdata_are_cached_apart(self):
+        self.patch(
+            preseed_module, "render_node_preseed").return_value = b"preseed"
+        self.patch_curtin().return_value = "userdata"
+        self.expectThat(get_preseed(self.node), Equals(b"preseed"))
+        self.expectThat(get_curtin_userdata(self.node), Equals("userdata"))
+
+
 class TestPreseedURLs(
         PreseedRPCMixin, BootImageHelperMixin, MAASServerTestCase):
     """Tests for functions that return preseed URLs."""
@@ -0,0 +1,132 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.preseed_cache`."""
+
+__all__ = []
+
+from unittest.mock import Mock
+
+from maasserver.preseed_cache import PreseedCache
+from maastesting.factory import factory
+from maastesting.testcase import MAASTestCase
+from testtools.matchers import (
+    Equals,
+    HasLength,
+)
+
+
+def make_node(system_id=None):
+    node = Mock()
+    node.system_id = (
+        factory.make_name("system_id") if system_id is None else system_id)
+    return node
+
+
+class TestPreseedCache(MAASTestCase):
+    """Tests for `PreseedCache`."""
+
+    def make_cache(self, **kwargs):
+        self.now = 0.0
+        cache = PreseedCache(clock=lambda: self.now, **kwargs)
+        cache.enable()
+        return cache
+
+    def test_get_renders_every_time_when_disabled(self):
+        cache = PreseedCache()
+        node = make_node()
+        render = Mock(side_effect=[b"one", b"two"])
+        self.expectThat(cache.get(node, "preseed", render), Equals(b"one"))
+        self.expectThat(cache.get(node, "preseed", render), Equals(b"two"))
+        self.expectThat(cache.entries, Equals({}))
+
+    def test_get_caches_per_node_and_kind(self):
+        cache = self.make_cache()
+        node = make_node()
+        render = Mock(side_effect=[b"preseed", b"curtin"])
+        self.expectThat(cache.get(node, "preseed", render), Equals(b"preseed"))
+        self.expectThat(cache.get(node, "curtin", render), Equals(b"curtin"))
+        self.expectThat(cache.get(node, "preseed", render), Equals(b"preseed"))
+        self.expectThat(render.call_count, Equals(2))
+
+    def test_invalidate_node_renders_only_that_node_again(self):
+        cache = self.make_cache()
+        node, other_node = make_node(), make_node()
+        cache.get(node, "preseed", lambda: b"old")
+        cache.get(other_node, "preseed", lambda: b"other")
+        cache.invalidate(node.system_id)
+        self.expectThat(
+            cache.get(node, "preseed", lambda: b"new"), Equals(b"new"))
+        self.expectThat(
+            cache.get(other_node, "preseed", lambda: b"changed"),
+            Equals(b"other"))
+
+    def test_invalidate_without_node_renders_every_node_again(self):
+        cache = self.make_cache()
+        node = make_node()
+        cache.get(node, "preseed", lambda: b"old")
+        cache.invalidate()
+        self.expectThat(cache.entries, Equals({}))
+        self.expectThat(
+            cache.get(node, "preseed", lambda: b"new"), Equals(b"new"))
+
+    def test_get_does_not_cache_when_invalidated_while_rendering(self):
+        cache = self.make_cache()
+        node = make_node()
+
+        def render():
+            cache.invalidate(node.system_id)
+            return b"stale"
+
+        self.expectThat(cache.get(node, "preseed", render), Equals(b"stale"))
+        self.expectThat(cache.entries, Equals({}))
+
+    def test_get_does_not_cache_when_all_invalidated_while_rendering(self):
+        cache = self.make_cache()
+        node = make_node()
+
+        def render():
+            cache.invalidate()
+            return b"stale"
+
+        self.expectThat(cache.get(node, "preseed", render), Equals(b"stale"))
+        self.expectThat(cache.entries, Equals({}))
+
+    def test_get_returns_entry_until_max_age(self):
+        cache = self.make_cache(max_age=10)
+        node = make_node()
+        cache.get(node, "preseed", lambda: b"old")
+        self.now += 9
+        self.expectThat(
+            cache.get(node, "preseed", lambda: b"new"), Equals(b"old"))
+
+    def test_get_renders_again_after_max_age(self):
+        cache = self.make_cache(max_age=10)
+        node = make_node()
+        cache.get(node, "preseed", lambda: b"old")
+        self.now += 10
+        self.expectThat(
+            cache.get(node, "preseed", lambda: b"new"), Equals(b"new"))
+
+    def test_get_evicts_least_recently_used(self):
+        cache = self.make_cache(max_entries=2)
+        nodes = [make_node(system_id) for system_id in "abc"]
+        render = Mock(return_value=b"preseed")
+        cache.get(nodes[0], "preseed", render)
+        cache.get(nodes[1], "preseed", render)
+        cache.get(nodes[0], "preseed", render)
+        cache.get(nodes[2], "preseed", render)
+        self.expectThat(cache.entries, HasLength(2))
+        self.expectThat(
+            list(cache.entries), Equals([("a", "preseed"), ("c", "preseed")]))
+
+    def test_disable_forgets_entries(self):
+        cache = self.make_cache()
+        node = make_node()
+        cache.get(node, "preseed", lambda: b"old")
+        cache.disable()
+        render = Mock(return_value=b"new")
+        cache.get(node, "preseed", render)
+        cache.get(node, "preseed", render)
+        self.expectThat(cache.entries, Equals({}))
+        self.expectThat(render.call_count, Equals(2))
@@ -1,4 +1,4 @@
-# Copyright 2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2016-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for the region controller service."""
@@ -31,8 +31,13 @@ from maastesting.matchers import (
     MockCallsMatch,
     MockNotCalled,
 )
+from provisioningserver.rpc.cluster import InvalidateBootConfigs
 from testtools import ExpectedException
-from testtools.matchers import MatchesStructure
+from testtools.matchers import (
+    Equals,
+    Is,
+    MatchesStructure,
+)
 from twisted.internet import reactor
 from twisted.internet.defer import (
     fail,
@@ -73,7 +78,10 @@ class TestRegionControllerService(MAASServerTestCase):
             listener.register,
             MockCallsMatch(
                 call("sys_dns", service.markDNSForUpdate),
-                call("sys_proxy", service.markProxyForUpdate)))
+                call("sys_proxy", service.markProxyForUpdate),
+                call(
+                    "sys_boot_config",
+                    service.markBootConfigsForInvalidation)))
 
     @wait_for_reactor
     @inlineCallbacks
@@ -104,7 +112,10 @@ class TestRegionControllerService(MAASServerTestCase):
             listener.unregister,
             MockCallsMatch(
                 call("sys_dns", service.markDNSForUpdate),
-                call("sys_proxy", service.markProxyForUpdate)))
+                call("sys_proxy", service.markProxyForUpdate),
+                call(
+                    "sys_boot_config",
+                    service.markBootConfigsForInvalidation)))
 
     @wait_for_reactor
     @inlineCallbacks
@@ -131,6 +142,24 @@ class TestRegionControllerService(MAASServerTestCase):
         self.assertTrue(service.needsProxyUpdate)
         self.assertThat(mock_startProcessing, MockCalledOnceWith())
 
+    def test_markBootConfigsForInvalidation_collects_macs(self):
+        listener = MagicMock()
+        service = RegionControllerService(listener)
+        mock_startProcessing = self.patch(service, "startProcessing")
+        macs = [factory.make_mac_address() for _ in range(3)]
+        service.markBootConfigsForInvalidation(None, ",".join(macs[:2]))
+        service.markBootConfigsForInvalidation(None, macs[2])
+        self.expectThat(service.bootConfigMACs, Equals(set(macs)))
+        self.expectThat(service.needsBootConfigsInvalidated, Is(False))
+        self.expectThat(mock_startProcessing, MockCallsMatch(call(), call()))
+
+    def test_markBootConfigsForInvalidation_marks_all(self):
+        listener = MagicMock()
+        service = RegionControllerService(listener)
+        self.patch(service, "startProcessing")
+        service.markBootConfigsForInvalidation(None, "*")
+        self.assertTrue(service.needsBootConfigsInvalidated)
+
     def test_startProcessing_doesnt_call_start_when_looping_call_running(self):
         service = RegionControllerService(sentinel.listener)
         mock_start = self.patch(service.processing, "start")
@@ -221,6 +250,51 @@ class TestRegionControllerService(MAASServerTestCase):
             mock_msg,
             MockCalledOnceWith("Successfully configured proxy."))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_invalidates_boot_configs_for_macs(self):
+        service = RegionControllerService(sentinel.listener)
+        macs = [factory.make_mac_address() for _ in range(2)]
+        service.bootConfigMACs = set(macs)
+        clients = [MagicMock(return_value=succeed({})) for _ in range(2)]
+        self.patch(region_controller, "getAllClients").return_value = clients
+        service.startProcessing()
+        yield service.processingDefer
+        for client in clients:
+            self.expectThat(client, MockCalledOnceWith(
+                InvalidateBootConfigs, macs=sorted(macs)))
+        self.expectThat(service.bootConfigMACs, Equals(set()))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_invalidates_all_boot_configs(self):
+        service = RegionControllerService(sentinel.listener)
+        service.needsBootConfigsInvalidated = True
+        service.bootConfigMACs = {factory.make_mac_address()}
+        client = MagicMock(return_value=succeed({}))
+        self.patch(region_controller, "getAllClients").return_value = [client]
+        service.startProcessing()
+        yield service.processingDefer
+        self.expectThat(
+            client, MockCalledOnceWith(InvalidateBootConfigs, macs=None))
+        self.expectThat(service.needsBootConfigsInvalidated, Is(False))
+        self.expectThat(service.bootConfigMACs, Equals(set()))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_invalidates_boot_configs_logs_failure(self):
+        service = RegionControllerService(sentinel.listener)
+        service.needsBootConfigsInvalidated = True
+        client = MagicMock(return_value=fail(factory.make_exception()))
+        client.ident = factory.make_name("rack")
+        self.patch(region_controller, "getAllClients").return_value = [client]
+        mock_err = self.patch(region_controller.log, "err")
+        service.startProcessing()
+        yield service.processingDefer
+        self.assertThat(mock_err, MockCalledOnceWith(
+            ANY, "Failed invalidating boot configurations on rack "
+            "controller '%s'." % client.ident))
+
     @wait_for_reactor
     @inlineCallbacks
     def test_process_updates_zones_logs_failure(self):
@@ -18,6 +18,7 @@ from maasserver.models import Node
 from maasserver.models.signals.testing import SignalsDisabled
 from maasserver.node_status import NODE_FAILURE_MONITORED_STATUS_TRANSITIONS
 from maasserver.status_monitor import (
+    get_next_deadline,
     mark_nodes_failed_after_expiring,
     mark_nodes_failed_after_missing_script_timeout,
     StatusMonitorService,
@@ -27,15 +28,27 @@ from maasserver.testing.testcase import MAASServerTestCase
 from maasserver.utils.orm import reload_object
 from maastesting.djangotestcase import CountQueries
 from maastesting.matchers import (
+    DocTestMatches,
     MockCalledOnce,
     MockCalledOnceWith,
     MockCallsMatch,
     MockNotCalled,
 )
+from maastesting.twisted import TwistedLoggerFixture
 from metadataserver.enum import SCRIPT_STATUS
 from metadataserver.models import ScriptSet
 from provisioningserver.refresh.node_info_scripts import NODE_INFO_SCRIPTS
-from twisted.internet.defer import maybeDeferred
+from testtools.matchers import (
+    Equals,
+    GreaterThan,
+    Is,
+    LessThan,
+    MatchesAll,
+)
+from twisted.internet.defer import (
+    Deferred,
+    maybeDeferred,
+)
 from twisted.internet.task import Clock
 
 
@@ -280,38 +293,123 @@ class TestMarkNodesFailedAfterMissingScriptTimeout(MAASServerTestCase):
         counter = CountQueries()
         with counter:
             mark_nodes_failed_after_missing_script_timeout()
-        # Initial lookup and prefetch take three queries. This is done once to
-        # find the nodes which nodes are being tests and on each node which
-        # scripts are currently running.
-        self.assertEquals(3 + len(nodes) * 2, counter.num_queries)
+        # One query finds the nodes and scripts that have missed their
+        # deadlines, one loads those nodes, and one marks the scripts as
+        # timed-out, however many nodes there are.
+        self.assertEquals(3, counter.num_queries)
+
+    def test_mark_nodes_failed_after_param_runtime_overrun(self):
+        node, script_set = self.make_node()
+        now = datetime.now()
+        script_set.last_ping = now
+        script_set.save()
+        script = factory.make_Script(timeout=timedelta(hours=2))
+        running_script_result = factory.make_ScriptResult(
+            script_set=script_set, status=SCRIPT_STATUS.RUNNING, script=script,
+            started=now - timedelta(minutes=70), parameters={'runtime': {
+                'type': 'runtime',
+                'value': 60 * 60,
+                }})
+
+        mark_nodes_failed_after_missing_script_timeout()
+        node = reload_object(node)
+
+        self.assertEquals(self.failed_status, node.status)
+        self.assertEquals(
+            "%s has run past it's timeout(%s)" % (
+                running_script_result.name, str(timedelta(hours=1))),
+            node.error_description)
+        self.assertEquals(
+            SCRIPT_STATUS.TIMEDOUT,
+            reload_object(running_script_result).status)
+
+    def test_skips_nodes_with_status_expires(self):
+        node, script_set = self.make_node()
+        node.status_expires = datetime.now() + timedelta(minutes=5)
+        node.save()
+        script_set.last_ping = datetime.now() - timedelta(minutes=11)
+        script_set.save()
+
+        mark_nodes_failed_after_missing_script_timeout()
+
+        self.assertEquals(self.status, reload_object(node).status)
+
+
+class TestGetNextDeadline(MAASServerTestCase):
+
+    def test__returns_None_when_there_are_no_deadlines(self):
+        factory.make_Node(status=NODE_STATUS.DEPLOYED)
+        self.assertIsNone(get_next_deadline())
+
+    def test__returns_seconds_until_status_expires(self):
+        self.useFixture(SignalsDisabled("power"))
+        current_time = datetime.now()
+        self.patch(status_monitor, "now").return_value = current_time
+        factory.make_Node(
+            status=NODE_STATUS.DEPLOYING,
+            status_expires=current_time + timedelta(minutes=3))
+        factory.make_Node(
+            status=NODE_STATUS.DEPLOYING,
+            status_expires=current_time + timedelta(minutes=7))
+        self.assertEquals(180, get_next_deadline())
+
+    def test__returns_seconds_until_heartbeat_deadline(self):
+        node = factory.make_Node(
+            status=NODE_STATUS.TESTING, with_empty_script_sets=True)
+        script_set = node.current_testing_script_set
+        script_set.last_ping = datetime.now() - timedelta(minutes=8)
+        script_set.save()
+        self.assertThat(
+            get_next_deadline(), MatchesAll(GreaterThan(110), LessThan(121)))
+
+    def test__returns_seconds_until_script_deadline(self):
+        node = factory.make_Node(
+            status=NODE_STATUS.COMMISSIONING, with_empty_script_sets=True)
+        script_set = node.current_commissioning_script_set
+        script_set.last_ping = datetime.now()
+        script_set.save()
+        script = factory.make_Script(timeout=timedelta(minutes=1))
+        factory.make_ScriptResult(
+            script_set=script_set, status=SCRIPT_STATUS.RUNNING,
+            script=script, started=datetime.now() - timedelta(minutes=5))
+        self.assertThat(
+            get_next_deadline(), MatchesAll(GreaterThan(50), LessThan(61)))
 
 
 class TestStatusMonitorService(MAASServerTestCase):
 
-    def test_init_with_default_interval(self):
+    def make_service(self, next_deadline=None, interval=60):
         # The service itself calls `check_status` in a thread, via a couple of
         # decorators. This indirection makes it clearer to mock
-        # `cleanup_old_nonces` here and track calls to it.
+        # `check_status` here and track calls to it.
         mock_check_status = self.patch(status_monitor, "check_status")
+        mock_check_status.return_value = next_deadline
         # Making `deferToDatabase` use the current thread helps testing.
         self.patch(status_monitor, "deferToDatabase", maybeDeferred)
+        # Use a deterministic clock instead of the reactor for testing.
+        service = StatusMonitorService(interval, clock=Clock())
+        self.addCleanup(service.stopService)
+        return service, mock_check_status
 
+    def test_init_with_default_interval(self):
         service = StatusMonitorService()
-        # Use a deterministic clock instead of the reactor for testing.
-        service.clock = Clock()
+        self.assertEqual(60, service.interval)
 
-        # The interval is stored as `step` by TimerService,
-        # StatusMonitorService's parent class.
-        interval = 60  # seconds.
-        self.assertEqual(service.step, interval)
+    def test_interval_can_be_set(self):
+        interval = self.getUniqueInteger()
+        service = StatusMonitorService(interval)
+        self.assertEqual(interval, service.interval)
 
+    def test_checks_at_interval_without_deadlines(self):
+        interval = 60  # seconds.
+        service, mock_check_status = self.make_service(None, interval)
         # `check_status` is not called before the service is started.
         self.assertThat(mock_check_status, MockNotCalled())
         # `check_status` is called the moment the service is started.
         service.startService()
         self.assertThat(mock_check_status, MockCalledOnceWith())
-        # Advancing the clock by `interval - 1` means that
-        # `mark_nodes_failed_after_expiring` has still only been called once.
+        # Advancing the clock by `interval - 1` means that `check_status`
+        # has still only been called once.
         service.clock.advance(interval - 1)
         self.assertThat(mock_check_status, MockCalledOnceWith())
         # Advancing the clock one more second causes another call to
@@ -319,7 +417,44 @@ class TestStatusMonitorService(MAASServerTestCase):
         service.clock.advance(1)
         self.assertThat(mock_check_status, MockCallsMatch(call(), call()))
 
-    def test_interval_can_be_set(self):
-        interval = self.getUniqueInteger()
-        service = StatusMonitorService(interval)
-        self.assertEqual(interval, service.step)
+    def test_checks_just_after_next_deadline(self):
+        service, mock_check_status = self.make_service(10.5)
+        service.startService()
+        service.clock.advance(10.5)
+        self.assertThat(mock_check_status, MockCalledOnceWith())
+        service.clock.advance(service.min_interval)
+        self.assertThat(mock_check_status, MockCallsMatch(call(), call()))
+
+    def test_checks_at_interval_when_next_deadline_is_later(self):
+        service, mock_check_status = self.make_service(600)
+        service.startService()
+        service.clock.advance(60)
+        self.assertThat(mock_check_status, MockCallsMatch(call(), call()))
+
+    def test_checks_at_interval_after_failure(self):
+        service, mock_check_status = self.make_service()
+        mock_check_status.side_effect = factory.make_exception()
+        with TwistedLoggerFixture() as logger:
+            service.startService()
+        self.assertThat(
+            logger.output, DocTestMatches(
+                "Failed to check the status of nodes.\n..."))
+        service.clock.advance(60)
+        self.assertThat(mock_check_status, MockCallsMatch(call(), call()))
+
+    def test_stopService_cancels_next_check(self):
+        service, mock_check_status = self.make_service(10)
+        service.startService()
+        service.stopService()
+        self.assertThat(service.clock.getDelayedCalls(), Equals([]))
+
+    def test_stopService_during_check_does_not_schedule_another(self):
+        service, mock_check_status = self.make_service()
+        checking = Deferred()
+        mock_check_status.return_value = checking
+        service.startService()
+        stopped = service.stopService()
+        self.assertThat(stopped.called, Is(False))
+        checking.callback(10)
+        self.assertThat(stopped.called, Is(True))
+        self.assertThat(service.clock.getDelayedCalls(), Equals([]))
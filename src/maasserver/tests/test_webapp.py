@@ -16,6 +16,7 @@ from maasserver import (
     eventloop,
     webapp,
 )
+from maasserver.metrics import MetricsResource
 from maasserver.testing.listener import FakePostgresListenerService
 from maasserver.webapp import OverlaySite
 from maasserver.websockets.protocol import WebSocketFactory
@@ -316,6 +317,18 @@ class TestWebApplicationService(MAASTestCase):
             _reactor=Is(reactor), _threadpool=Is(service.threadpool),
             _application=IsInstance(WSGIHandler)))
 
+    def test__successful_start_installs_metrics_resource(self):
+        service = self.make_webapp()
+        self.addCleanup(service.stopService)
+
+        service.startService()
+
+        maas_resource = service.site.resource.getChildWithDefault(
+            b"MAAS", request=None)
+        self.assertThat(
+            maas_resource.getChildWithDefault(b"metrics", request=None),
+            IsInstance(MetricsResource))
+
     def test__stopService_stops_the_service(self):
         service = self.make_webapp()
         service.startService()
@@ -1,4 +1,4 @@
-# Copyright 2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2016-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """
@@ -1616,6 +1616,482 @@ PEER_PROXY_CONFIG_UPDATE = dedent("""\
     """)
 
 
+# Helper that notifies the MAC addresses of every interface on a node. Rack
+# controllers cache boot configurations by MAC address, so these are the
+# entries that need forgetting when something about the node changes.
+BOOT_CONFIG_NODE_ALERT = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_node_alert(nodeid integer)
+    RETURNS void AS $$
+    DECLARE
+      macs text;
+    BEGIN
+      SELECT string_agg(mac_address::text, ',') INTO macs
+      FROM maasserver_interface
+      WHERE maasserver_interface.node_id = nodeid
+      AND maasserver_interface.mac_address IS NOT NULL;
+      IF macs IS NOT NULL THEN
+        PERFORM pg_notify('sys_boot_config', macs);
+      END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a node is updated. Alerts when anything that the boot
+# configuration for the node depends on changes, e.g. its status.
+BOOT_CONFIG_NODE_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_node_update()
+    RETURNS trigger AS $$
+    BEGIN
+      IF (OLD.status != NEW.status OR
+          OLD.netboot != NEW.netboot OR
+          OLD.osystem != NEW.osystem OR
+          OLD.distro_series != NEW.distro_series OR
+          OLD.architecture IS DISTINCT FROM NEW.architecture OR
+          OLD.hwe_kernel IS DISTINCT FROM NEW.hwe_kernel OR
+          OLD.min_hwe_kernel IS DISTINCT FROM NEW.min_hwe_kernel OR
+          OLD.hostname != NEW.hostname OR
+          OLD.domain_id IS DISTINCT FROM NEW.domain_id) THEN
+        PERFORM sys_boot_config_node_alert(NEW.id);
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when an interface is added. A machine booting from an unknown MAC
+# address is given an enlistment configuration, which must not outlive the
+# machine becoming known.
+BOOT_CONFIG_INTERFACE_INSERT = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_interface_insert()
+    RETURNS trigger AS $$
+    BEGIN
+      IF NEW.mac_address IS NOT NULL THEN
+        PERFORM pg_notify('sys_boot_config', NEW.mac_address::text);
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when an interface moves to another node or changes MAC address.
+BOOT_CONFIG_INTERFACE_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_interface_update()
+    RETURNS trigger AS $$
+    BEGIN
+      IF (OLD.mac_address IS DISTINCT FROM NEW.mac_address OR
+          OLD.node_id IS DISTINCT FROM NEW.node_id) THEN
+        IF OLD.mac_address IS NOT NULL THEN
+          PERFORM pg_notify('sys_boot_config', OLD.mac_address::text);
+        END IF;
+        IF (NEW.mac_address IS NOT NULL AND
+            OLD.mac_address IS DISTINCT FROM NEW.mac_address) THEN
+          PERFORM pg_notify('sys_boot_config', NEW.mac_address::text);
+        END IF;
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when an interface is deleted.
+BOOT_CONFIG_INTERFACE_DELETE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_interface_delete()
+    RETURNS trigger AS $$
+    BEGIN
+      IF OLD.mac_address IS NOT NULL THEN
+        PERFORM pg_notify('sys_boot_config', OLD.mac_address::text);
+      END IF;
+      RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a tag is added to a node. Tags contribute kernel options.
+BOOT_CONFIG_NODE_TAG_LINK = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_node_tag_link()
+    RETURNS trigger AS $$
+    BEGIN
+      PERFORM sys_boot_config_node_alert(NEW.node_id);
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a tag is removed from a node.
+BOOT_CONFIG_NODE_TAG_UNLINK = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_node_tag_unlink()
+    RETURNS trigger AS $$
+    BEGIN
+      PERFORM sys_boot_config_node_alert(OLD.node_id);
+      RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when the kernel options of a tag change. Tags can apply to a great
+# many nodes so this alerts that all boot configurations are stale.
+BOOT_CONFIG_TAG_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_tag_update()
+    RETURNS trigger AS $$
+    BEGIN
+      IF OLD.kernel_opts IS DISTINCT FROM NEW.kernel_opts THEN
+        PERFORM pg_notify('sys_boot_config', '*');
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Refreshes the discovery of `mac` at `addr`, the row in the
+# `maasserver_discovery` table that summarises every observation of that pair:
+# the most recently seen neighbour, its best hostname, and its best-matching
+# subnet. The table is read far more often than neighbours are observed, so
+# it's maintained by these procedures rather than being a view.
+#
+# Note that `Discovery` is backed by this table. Any changes made to the
+# columns here should be reflected there.
+DISCOVERY_REFRESH = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_refresh(mac macaddr, addr inet)
+    RETURNS void AS $$
+    BEGIN
+      -- Serialise refreshes of the same discovery by concurrent
+      -- transactions, so that each sees the others' rows and removes them.
+      PERFORM pg_advisory_xact_lock(
+        hashtext('sys_discovery_refresh'),
+        hashtext(COALESCE(mac::text, '') || ',' || COALESCE(addr::text, '')));
+      DELETE FROM maasserver_discovery
+      WHERE
+        (mac_address = mac OR (mac IS NULL AND mac_address IS NULL)) AND
+        (ip = addr OR (addr IS NULL AND ip IS NULL));
+      INSERT INTO maasserver_discovery (
+        id, discovery_id, neighbour_id, ip, mac_address, vid, first_seen,
+        last_seen, mdns_id, hostname, observer_id, observer_system_id,
+        observer_hostname, observer_interface_id, observer_interface_name,
+        fabric_id, fabric_name, vlan_id, is_external_dhcp, subnet_id,
+        subnet_cidr)
+      SELECT
+        neigh.id, -- Django needs a primary key for the object.
+        -- The following will create a string like "<ip>,<mac>", convert
+        -- it to base64, and strip out any embedded linefeeds.
+        REPLACE(ENCODE(BYTEA(TRIM(TRAILING '/32' FROM neigh.ip::TEXT)
+            || ',' || neigh.mac_address::text), 'base64'), CHR(10), ''),
+        neigh.id,
+        neigh.ip,
+        neigh.mac_address,
+        neigh.vid,
+        neigh.created,
+        GREATEST(neigh.updated, mdns.updated),
+        mdns.id,
+        -- Trust reverse-DNS more than multicast DNS.
+        COALESCE(rdns.hostname, mdns.hostname),
+        node.id,
+        node.system_id,
+        node.hostname, -- This will be the rack hostname.
+        iface.id,
+        iface.name,
+        fabric.id,
+        fabric.name,
+        -- Note: This VLAN is associated with the physical interface, so the
+        -- actual observed VLAN is actually the 'vid' value on the 'fabric'.
+        vlan.id,
+        CASE WHEN neigh.ip = vlan.external_dhcp THEN TRUE ELSE FALSE END,
+        subnet.id,
+        subnet.cidr
+      FROM maasserver_neighbour neigh
+      JOIN maasserver_interface iface ON neigh.interface_id = iface.id
+      JOIN maasserver_node node ON node.id = iface.node_id
+      JOIN maasserver_vlan vlan ON iface.vlan_id = vlan.id
+      JOIN maasserver_fabric fabric ON vlan.fabric_id = fabric.id
+      LEFT OUTER JOIN maasserver_mdns mdns ON mdns.ip = neigh.ip
+      LEFT OUTER JOIN maasserver_rdns rdns ON rdns.ip = neigh.ip
+      LEFT OUTER JOIN maasserver_subnet subnet ON (
+        vlan.id = subnet.vlan_id
+        -- This checks if the IP address is within a known subnet.
+        AND neigh.ip << subnet.cidr
+      )
+      WHERE
+        (neigh.mac_address = mac OR
+         (mac IS NULL AND neigh.mac_address IS NULL)) AND
+        (neigh.ip = addr OR (addr IS NULL AND neigh.ip IS NULL))
+      ORDER BY
+        neigh.updated DESC, -- We want the most recently seen neighbour.
+        rdns.updated DESC, -- We want the most recently seen reverse DNS.
+        mdns.updated DESC, -- We want the most recently seen mDNS hostname.
+        MASKLEN(subnet.cidr) DESC -- We want the best-match CIDR.
+      LIMIT 1;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Refreshes the discoveries of every neighbour seen at `addr`.
+DISCOVERY_REFRESH_IP = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_refresh_ip(addr inet)
+    RETURNS void AS $$
+    DECLARE
+      pair RECORD;
+    BEGIN
+      FOR pair IN (
+        SELECT DISTINCT mac_address
+        FROM maasserver_neighbour
+        WHERE ip = addr)
+      LOOP
+        PERFORM sys_discovery_refresh(pair.mac_address, addr);
+      END LOOP;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Refreshes the discoveries of every neighbour seen from an interface.
+DISCOVERY_REFRESH_INTERFACE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_refresh_interface(iface integer)
+    RETURNS void AS $$
+    DECLARE
+      pair RECORD;
+    BEGIN
+      FOR pair IN (
+        SELECT DISTINCT mac_address, ip
+        FROM maasserver_neighbour
+        WHERE interface_id = iface)
+      LOOP
+        PERFORM sys_discovery_refresh(pair.mac_address, pair.ip);
+      END LOOP;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Refreshes the discoveries of every neighbour within `net` that was seen
+# from an interface on `vlan`.
+DISCOVERY_REFRESH_SUBNET = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_refresh_subnet(
+      vlan integer, net cidr)
+    RETURNS void AS $$
+    DECLARE
+      pair RECORD;
+    BEGIN
+      FOR pair IN (
+        SELECT DISTINCT neigh.mac_address, neigh.ip
+        FROM maasserver_neighbour neigh
+        JOIN maasserver_interface iface ON neigh.interface_id = iface.id
+        WHERE iface.vlan_id = vlan AND neigh.ip << net)
+      LOOP
+        PERFORM sys_discovery_refresh(pair.mac_address, pair.ip);
+      END LOOP;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a neighbour is observed.
+DISCOVERY_NEIGHBOUR_INSERT = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_neighbour_insert()
+    RETURNS trigger AS $$
+    BEGIN
+      PERFORM sys_discovery_refresh(NEW.mac_address, NEW.ip);
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a neighbour is observed again.
+DISCOVERY_NEIGHBOUR_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_neighbour_update()
+    RETURNS trigger AS $$
+    BEGIN
+      IF OLD.mac_address IS DISTINCT FROM NEW.mac_address OR
+         OLD.ip IS DISTINCT FROM NEW.ip THEN
+        PERFORM sys_discovery_refresh(OLD.mac_address, OLD.ip);
+      END IF;
+      PERFORM sys_discovery_refresh(NEW.mac_address, NEW.ip);
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a neighbour is forgotten.
+DISCOVERY_NEIGHBOUR_DELETE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_neighbour_delete()
+    RETURNS trigger AS $$
+    BEGIN
+      PERFORM sys_discovery_refresh(OLD.mac_address, OLD.ip);
+      RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when an mDNS or reverse-DNS hostname is observed for an IP
+# address. Both tables have an `ip` column, so these procedures serve both.
+DISCOVERY_HOSTNAME_INSERT = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_hostname_insert()
+    RETURNS trigger AS $$
+    BEGIN
+      PERFORM sys_discovery_refresh_ip(NEW.ip);
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when an mDNS or reverse-DNS hostname is observed again.
+DISCOVERY_HOSTNAME_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_hostname_update()
+    RETURNS trigger AS $$
+    BEGIN
+      IF OLD.ip IS DISTINCT FROM NEW.ip THEN
+        PERFORM sys_discovery_refresh_ip(OLD.ip);
+      END IF;
+      PERFORM sys_discovery_refresh_ip(NEW.ip);
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when an mDNS or reverse-DNS hostname is forgotten.
+DISCOVERY_HOSTNAME_DELETE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_hostname_delete()
+    RETURNS trigger AS $$
+    BEGIN
+      PERFORM sys_discovery_refresh_ip(OLD.ip);
+      RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when an interface is renamed or moved. Interfaces that have
+# observed neighbours belong to rack controllers.
+DISCOVERY_INTERFACE_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_interface_update()
+    RETURNS trigger AS $$
+    BEGIN
+      PERFORM sys_discovery_refresh_interface(NEW.id);
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a node is renamed.
+DISCOVERY_NODE_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_node_update()
+    RETURNS trigger AS $$
+    BEGIN
+      PERFORM sys_discovery_refresh_interface(id)
+      FROM maasserver_interface
+      WHERE node_id = NEW.id;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a VLAN's external DHCP server or fabric changes.
+DISCOVERY_VLAN_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_vlan_update()
+    RETURNS trigger AS $$
+    BEGIN
+      PERFORM sys_discovery_refresh_interface(id)
+      FROM maasserver_interface
+      WHERE vlan_id = NEW.id;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a fabric is renamed.
+DISCOVERY_FABRIC_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_fabric_update()
+    RETURNS trigger AS $$
+    BEGIN
+      PERFORM sys_discovery_refresh_interface(iface.id)
+      FROM maasserver_interface iface
+      JOIN maasserver_vlan vlan ON iface.vlan_id = vlan.id
+      WHERE vlan.fabric_id = NEW.id;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a subnet is created. Neighbours within it on its VLAN may
+# now be associated with it.
+DISCOVERY_SUBNET_INSERT = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_subnet_insert()
+    RETURNS trigger AS $$
+    BEGIN
+      PERFORM sys_discovery_refresh_subnet(NEW.vlan_id, NEW.cidr);
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a subnet's CIDR or VLAN changes.
+DISCOVERY_SUBNET_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_subnet_update()
+    RETURNS trigger AS $$
+    BEGIN
+      PERFORM sys_discovery_refresh_subnet(OLD.vlan_id, OLD.cidr);
+      PERFORM sys_discovery_refresh_subnet(NEW.vlan_id, NEW.cidr);
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a subnet is deleted.
+DISCOVERY_SUBNET_DELETE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_discovery_subnet_delete()
+    RETURNS trigger AS $$
+    BEGIN
+      PERFORM sys_discovery_refresh_subnet(OLD.vlan_id, OLD.cidr);
+      RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Configuration that affects the boot configuration of every machine.
+BOOT_CONFIG_CONFIG_NAMES = (
+    "commissioning_distro_series",
+    "commissioning_osystem",
+    "default_distro_series",
+    "default_min_hwe_kernel",
+    "default_osystem",
+    "enable_third_party_drivers",
+    "http_boot",
+    "kernel_opts",
+)
+
+
+def render_sys_boot_config_config_procedure(proc_name):
+    """Render a database procedure with name `proc_name` that notifies that
+    all boot configurations are stale when a setting in
+    `BOOT_CONFIG_CONFIG_NAMES` is inserted or updated.
+
+    :param proc_name: Name of the procedure.
+    """
+    names = ", ".join("'%s'" % name for name in BOOT_CONFIG_CONFIG_NAMES)
+    return dedent("""\
+        CREATE OR REPLACE FUNCTION %s() RETURNS trigger AS $$
+        BEGIN
+          IF NEW.name IN (%s) THEN
+            PERFORM pg_notify('sys_boot_config', '*');
+          END IF;
+          RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        """ % (proc_name, names))
+
+
+def render_sys_config_procedure(proc_name, on_delete=False):
+    """Render a database procedure with name `proc_name` that notifies that
+    a configuration item has changed. The name of the item is the payload.
+
+    :param proc_name: Name of the procedure.
+    :param on_delete: True when procedure will be used as a delete trigger.
+    """
+    row = 'NEW' if not on_delete else 'OLD'
+    return dedent("""\
+        CREATE OR REPLACE FUNCTION %s() RETURNS trigger AS $$
+        BEGIN
+          PERFORM pg_notify('sys_config', %s.name);
+          RETURN %s;
+        END;
+        $$ LANGUAGE plpgsql;
+        """ % (proc_name, row, row))
+
+
 def render_sys_proxy_procedure(proc_name, on_delete=False):
     """Render a database procedure with name `proc_name` that notifies that a
     proxy update is needed.
@@ -1876,3 +2352,120 @@ def register_system_triggers():
     register_trigger(
         "maasserver_config", "sys_proxy_config_use_peer_proxy_update",
         "update")
+
+    # Boot configuration
+    register_procedure(BOOT_CONFIG_NODE_ALERT)
+
+    # - Node
+    register_procedure(BOOT_CONFIG_NODE_UPDATE)
+    register_trigger(
+        "maasserver_node", "sys_boot_config_node_update", "update")
+
+    # - Interface
+    register_procedure(BOOT_CONFIG_INTERFACE_INSERT)
+    register_trigger(
+        "maasserver_interface", "sys_boot_config_interface_insert", "insert")
+    register_procedure(BOOT_CONFIG_INTERFACE_UPDATE)
+    register_trigger(
+        "maasserver_interface", "sys_boot_config_interface_update", "update")
+    register_procedure(BOOT_CONFIG_INTERFACE_DELETE)
+    register_trigger(
+        "maasserver_interface", "sys_boot_config_interface_delete", "delete")
+
+    # - Node -> Tag
+    register_procedure(BOOT_CONFIG_NODE_TAG_LINK)
+    register_trigger(
+        "maasserver_node_tags", "sys_boot_config_node_tag_link", "insert")
+    register_procedure(BOOT_CONFIG_NODE_TAG_UNLINK)
+    register_trigger(
+        "maasserver_node_tags", "sys_boot_config_node_tag_unlink", "delete")
+
+    # - Tag
+    register_procedure(BOOT_CONFIG_TAG_UPDATE)
+    register_trigger(
+        "maasserver_tag", "sys_boot_config_tag_update", "update")
+
+    # - Config
+    register_procedure(
+        render_sys_boot_config_config_procedure(
+            "sys_boot_config_config_insert"))
+    register_trigger(
+        "maasserver_config", "sys_boot_config_config_insert", "insert")
+    register_procedure(
+        render_sys_boot_config_config_procedure(
+            "sys_boot_config_config_update"))
+    register_trigger(
+        "maasserver_config", "sys_boot_config_config_update", "update")
+
+    # Configuration cache
+    register_procedure(render_sys_config_procedure("sys_config_insert"))
+    register_trigger("maasserver_config", "sys_config_insert", "insert")
+    register_procedure(render_sys_config_procedure("sys_config_update"))
+    register_trigger("maasserver_config", "sys_config_update", "update")
+    register_procedure(
+        render_sys_config_procedure("sys_config_delete", on_delete=True))
+    register_trigger("maasserver_config", "sys_config_delete", "delete")
+
+    # Discovery
+    register_procedure(DISCOVERY_REFRESH)
+    register_procedure(DISCOVERY_REFRESH_IP)
+    register_procedure(DISCOVERY_REFRESH_INTERFACE)
+    register_procedure(DISCOVERY_REFRESH_SUBNET)
+
+    # - Neighbour
+    register_procedure(DISCOVERY_NEIGHBOUR_INSERT)
+    register_trigger(
+        "maasserver_neighbour", "sys_discovery_neighbour_insert", "insert")
+    register_procedure(DISCOVERY_NEIGHBOUR_UPDATE)
+    register_trigger(
+        "maasserver_neighbour", "sys_discovery_neighbour_update", "update")
+    register_procedure(DISCOVERY_NEIGHBOUR_DELETE)
+    register_trigger(
+        "maasserver_neighbour", "sys_discovery_neighbour_delete", "delete")
+
+    # - MDNS and RDNS
+    register_procedure(DISCOVERY_HOSTNAME_INSERT)
+    register_procedure(DISCOVERY_HOSTNAME_UPDATE)
+    register_procedure(DISCOVERY_HOSTNAME_DELETE)
+    for table in ("maasserver_mdns", "maasserver_rdns"):
+        register_trigger(table, "sys_discovery_hostname_insert", "insert")
+        register_trigger(
+            table, "sys_discovery_hostname_update", "update",
+            fields=["ip", "hostname", "updated"])
+        register_trigger(table, "sys_discovery_hostname_delete", "delete")
+
+    # - Interface
+    register_procedure(DISCOVERY_INTERFACE_UPDATE)
+    register_trigger(
+        "maasserver_interface", "sys_discovery_interface_update", "update",
+        fields=["name", "node_id", "vlan_id"])
+
+    # - Node
+    register_procedure(DISCOVERY_NODE_UPDATE)
+    register_trigger(
+        "maasserver_node", "sys_discovery_node_update", "update",
+        fields=["hostname"])
+
+    # - VLAN
+    register_procedure(DISCOVERY_VLAN_UPDATE)
+    register_trigger(
+        "maasserver_vlan", "sys_discovery_vlan_update", "update",
+        fields=["external_dhcp", "fabric_id"])
+
+    # - Fabric
+    register_procedure(DISCOVERY_FABRIC_UPDATE)
+    register_trigger(
+        "maasserver_fabric", "sys_discovery_fabric_update", "update",
+        fields=["name"])
+
+    # - Subnet
+    register_procedure(DISCOVERY_SUBNET_INSERT)
+    register_trigger(
+        "maasserver_subnet", "sys_discovery_subnet_insert", "insert")
+    register_procedure(DISCOVERY_SUBNET_UPDATE)
+    register_trigger(
+        "maasserver_subnet", "sys_discovery_subnet_update", "update",
+        fields=["cidr", "vlan_id"])
+    register_procedure(DISCOVERY_SUBNET_DELETE)
+    register_trigger(
+        "maasserver_subnet", "sys_discovery_subnet_delete", "delete")
@@ -1,4 +1,4 @@
-# Copyright 2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2016-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for `maasserver.triggers.system`."""
@@ -61,6 +61,34 @@ class TestTriggers(MAASServerTestCase):
             "subnet_sys_proxy_subnet_insert",
             "subnet_sys_proxy_subnet_update",
             "subnet_sys_proxy_subnet_delete",
+            "node_sys_boot_config_node_update",
+            "interface_sys_boot_config_interface_insert",
+            "interface_sys_boot_config_interface_update",
+            "interface_sys_boot_config_interface_delete",
+            "node_tags_sys_boot_config_node_tag_link",
+            "node_tags_sys_boot_config_node_tag_unlink",
+            "tag_sys_boot_config_tag_update",
+            "config_sys_boot_config_config_insert",
+            "config_sys_boot_config_config_update",
+            "config_sys_config_insert",
+            "config_sys_config_update",
+            "config_sys_config_delete",
+            "neighbour_sys_discovery_neighbour_insert",
+            "neighbour_sys_discovery_neighbour_update",
+            "neighbour_sys_discovery_neighbour_delete",
+            "mdns_sys_discovery_hostname_insert",
+            "mdns_sys_discovery_hostname_update",
+            "mdns_sys_discovery_hostname_delete",
+            "rdns_sys_discovery_hostname_insert",
+            "rdns_sys_discovery_hostname_update",
+            "rdns_sys_discovery_hostname_delete",
+            "interface_sys_discovery_interface_update",
+            "node_sys_discovery_node_update",
+            "vlan_sys_discovery_vlan_update",
+            "fabric_sys_discovery_fabric_update",
+            "subnet_sys_discovery_subnet_insert",
+            "subnet_sys_discovery_subnet_update",
+            "subnet_sys_discovery_subnet_delete",
             ]
         sql, args = psql_array(triggers, sql_type="text")
         with closing(connection.cursor()) as cursor:
@@ -19,6 +19,7 @@ from maasserver.enum import (
     INTERFACE_TYPE,
     IPADDRESS_TYPE,
     IPRANGE_TYPE,
+    NODE_STATUS,
     RDNS_MODE,
 )
 from maasserver.models.config import Config
@@ -4321,3 +4322,162 @@ class TestProxyListener(
             yield dv.get(timeout=2)
         finally:
             yield listener.stopService()
+
+
+class TestBootConfigListener(
+        MAASTransactionServerTestCase, TransactionalHelpersMixin):
+    """End-to-end test for the boot configuration triggers code."""
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_node_status_update(self):
+        yield deferToDatabase(register_system_triggers)
+        node = yield deferToDatabase(self.create_node_with_interface)
+        interface = yield deferToDatabase(
+            self.get_node_boot_interface, node.system_id)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_boot_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.update_node, node.system_id, {
+                "status": NODE_STATUS.DEPLOYED,
+            })
+            channel, message = yield dv.get(timeout=2)
+            self.assertIn(str(interface.mac_address), message.split(","))
+        finally:
+            yield listener.stopService()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_interface_insert(self):
+        yield deferToDatabase(register_system_triggers)
+        mac_address = factory.make_mac_address()
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_boot_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(
+                self.create_interface, {"mac_address": mac_address})
+            yield dv.get(timeout=2)
+            self.assertThat(dv.value, Equals(
+                ("sys_boot_config", mac_address)))
+        finally:
+            yield listener.stopService()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_interface_delete(self):
+        yield deferToDatabase(register_system_triggers)
+        interface = yield deferToDatabase(self.create_interface)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_boot_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.delete_interface, interface.id)
+            yield dv.get(timeout=2)
+            self.assertThat(dv.value, Equals(
+                ("sys_boot_config", str(interface.mac_address))))
+        finally:
+            yield listener.stopService()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_tag_kernel_opts_update(self):
+        yield deferToDatabase(register_system_triggers)
+        tag = yield deferToDatabase(self.create_tag)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_boot_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.update_tag, tag.id, {
+                "kernel_opts": factory.make_name("opts"),
+            })
+            yield dv.get(timeout=2)
+            self.assertThat(dv.value, Equals(("sys_boot_config", "*")))
+        finally:
+            yield listener.stopService()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_config_kernel_opts_insert(self):
+        yield deferToDatabase(register_system_triggers)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_boot_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(
+                self.create_config, "kernel_opts", factory.make_name("opts"))
+            yield dv.get(timeout=2)
+            self.assertThat(dv.value, Equals(("sys_boot_config", "*")))
+        finally:
+            yield listener.stopService()
+
+
+class TestConfigListener(
+        MAASTransactionServerTestCase, TransactionalHelpersMixin):
+    """End-to-end test for the configuration cache triggers code."""
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_config_insert(self):
+        yield deferToDatabase(register_system_triggers)
+        name = factory.make_name("name")
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register("sys_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(
+                self.create_config, name, factory.make_name("value"))
+            yield dv.get(timeout=2)
+            self.assertThat(dv.value, Equals(("sys_config", name)))
+        finally:
+            yield listener.stopService()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_config_update(self):
+        yield deferToDatabase(register_system_triggers)
+        name = factory.make_name("name")
+        yield deferToDatabase(
+            self.create_config, name, factory.make_name("value"))
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register("sys_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(
+                self.set_config, name, factory.make_name("value"))
+            yield dv.get(timeout=2)
+            self.assertThat(dv.value, Equals(("sys_config", name)))
+        finally:
+            yield listener.stopService()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_config_delete(self):
+        yield deferToDatabase(register_system_triggers)
+        name = factory.make_name("name")
+        yield deferToDatabase(
+            self.create_config, name, factory.make_name("value"))
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register("sys_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(
+                lambda: Config.objects.filter(name=name).delete())
+            yield dv.get(timeout=2)
+            self.assertThat(dv.value, Equals(("sys_config", name)))
+        finally:
+            yield listener.stopService()
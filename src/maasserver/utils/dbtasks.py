@@ -1,5 +1,5 @@
 # encoding: utf-8
-# Copyright 2015 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Database Tasks Service.
@@ -13,7 +13,10 @@ __all__ = [
     "DatabaseTasksService",
 ]
 
-from maasserver.utils.threads import deferToDatabase
+from maasserver.utils.threads import (
+    DatabasePriority,
+    deferToDatabaseWithPriority,
+)
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.utils.twisted import (
     asynchronous,
@@ -69,6 +72,18 @@ class DatabaseTasksService(Service, object):
     def deferTask(self, func, *args, **kwargs):
         """Schedules `func` to run later.
 
+        See `deferTaskWithPriority`; this uses `DatabasePriority.NORMAL`.
+        """
+        return self.deferTaskWithPriority(
+            DatabasePriority.NORMAL, func, *args, **kwargs)
+
+    @asynchronous
+    def deferTaskWithPriority(self, priority, func, *args, **kwargs):
+        """Schedules `func` to run later, in a thread of `priority`.
+
+        Tasks are still run one at a time, in order; `priority` applies once
+        the task reaches the front of the queue and needs a database thread.
+
         :raise QueueOverflow: If the queue of tasks is full.
         :return: :class:`Deferred`, which fires with the result of the running
             the task in a database thread. This can be cancelled while the
@@ -84,7 +99,7 @@ class DatabaseTasksService(Service, object):
         done = Deferred(cancel)
 
         def task():
-            d = deferToDatabase(func, *args, **kwargs)
+            d = deferToDatabaseWithPriority(priority, func, *args, **kwargs)
             d.chainDeferred(done)
             return d
 
@@ -72,6 +72,7 @@ from maasserver.exceptions import (
     MAASAPIBadRequest,
     MAASAPIForbidden,
 )
+from maasserver.metrics import record_retry
 from maasserver.utils.async import DeferredHooks
 from provisioningserver.utils import flatten
 from provisioningserver.utils.backoff import (
@@ -503,10 +504,12 @@ def retry_on_retryable_failure(func, reset=noop):
                 try:
                     return func(*args, **kwargs)
                 except RetryTransaction:
+                    record_retry()
                     reset()  # Which may do nothing.
                     sleep(next(intervals))
                 except DatabaseError as error:
                     if is_retryable_failure(error):
+                        record_retry()
                         reset()  # Which may do nothing.
                         sleep(next(intervals))
                     else:
@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for `maasserver.utils.dbtasks`."""
@@ -7,16 +7,25 @@ __all__ = []
 
 import random
 import threading
-from unittest.mock import sentinel
+from unittest.mock import (
+    call,
+    sentinel,
+)
 
 from crochet import wait_for
 from maasserver.testing.testcase import MAASTransactionServerTestCase
+from maasserver.utils import dbtasks
 from maasserver.utils.dbtasks import (
     DatabaseTaskAlreadyRunning,
     DatabaseTasksService,
 )
 from maasserver.utils.orm import transactional
+from maasserver.utils.threads import (
+    DatabasePriority,
+    deferToDatabaseWithPriority,
+)
 from maastesting.factory import factory
+from maastesting.matchers import MockCallsMatch
 from maastesting.testcase import MAASTestCase
 from maastesting.twisted import TwistedLoggerFixture
 from testtools.matchers import (
@@ -161,6 +170,21 @@ class TestDatabaseTaskService(MAASTestCase):
         finally:
             service.stopService()
 
+    def test__task_is_deferred_with_priority(self):
+        deferToDatabase = self.patch(dbtasks, "deferToDatabaseWithPriority")
+        deferToDatabase.side_effect = deferToDatabaseWithPriority
+        service = DatabaseTasksService()
+        service.startService()
+        try:
+            service.deferTaskWithPriority(
+                DatabasePriority.HIGH, noop).wait(30)
+            service.deferTask(noop).wait(30)
+        finally:
+            service.stopService()
+        self.assertThat(deferToDatabase, MockCallsMatch(
+            call(DatabasePriority.HIGH, noop),
+            call(DatabasePriority.NORMAL, noop)))
+
     def test__tasks_are_all_run_before_shutdown_completes(self):
         service = DatabaseTasksService()
         service.startService()
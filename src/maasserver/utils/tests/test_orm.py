@@ -31,6 +31,7 @@ from django.db.utils import (
     IntegrityError,
     OperationalError,
 )
+from maasserver.metrics import QueryAccounting
 from maasserver.models import Node
 from maasserver.testing.testcase import (
     MAASServerTestCase,
@@ -522,6 +523,16 @@ class TestRetryOnRetryableFailure(SerializationFailureTestCase, NoSleepMixin):
         self.assertEqual(sentinel.result, function_wrapped())
         self.assertThat(function, MockCallsMatch(call(), call()))
 
+    def test_accounts_for_retries(self):
+        function = self.make_mock_function()
+        function.side_effect = [
+            orm.make_deadlock_failure(), orm.RetryTransaction(),
+            sentinel.result]
+        function_wrapped = retry_on_retryable_failure(function)
+        accounting = QueryAccounting()
+        self.assertEqual(sentinel.result, accounting.call(function_wrapped))
+        self.assertThat(accounting.retries, Equals(2))
+
     def test_retries_on_retry_transaction(self):
         function = self.make_mock_function()
         function.side_effect = orm.RetryTransaction()
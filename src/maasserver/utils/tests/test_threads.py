@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for `maasserver.utils.threads`."""
@@ -6,15 +6,29 @@
 __all__ = []
 
 import random
-from unittest.mock import sentinel
+from unittest.mock import (
+    Mock,
+    sentinel,
+)
 
 from crochet import wait_for
 from django.db import connection
+from maasserver.metrics import (
+    Gauge,
+    Histogram,
+)
 from maasserver.testing.testcase import MAASServerTestCase
 from maasserver.utils import (
     orm,
     threads,
 )
+from maasserver.utils.threads import (
+    DatabasePriority,
+    DatabasePriorityPool,
+    DatabaseScheduler,
+    PRIORITIES,
+)
+from maastesting.matchers import MockCalledOnceWith
 from maastesting.testcase import MAASTestCase
 from provisioningserver.utils.twisted import (
     ThreadPool,
@@ -22,6 +36,7 @@ from provisioningserver.utils.twisted import (
 )
 from testtools.matchers import (
     Equals,
+    HasLength,
     Is,
     IsInstance,
 )
@@ -30,6 +45,7 @@ from twisted.internet.defer import (
     DeferredSemaphore,
     inlineCallbacks,
 )
+from twisted.python import context
 
 
 wait_for_reactor = wait_for(30)  # 30 seconds.
@@ -108,6 +124,153 @@ class TestInstallFunctions(MAASTestCase):
         self.assertThat(pool, IsInstance(ThreadUnpool))
         self.assertThat(pool.contextFactory, Is(orm.ExclusivelyConnected))
 
+    def test__database_scheduler_has_capacity_of_database_pool(self):
+        self.assertThat(
+            threads.database_scheduler.capacity,
+            Equals(threads.max_threads_for_database_pool))
+
+
+class FakeDatabasePool:
+    """Records calls, which are run with `finish`."""
+
+    def __init__(self):
+        super(FakeDatabasePool, self).__init__()
+        self.calls = []
+
+    def callInThreadWithCallback(self, onResult, func, *args, **kwargs):
+        ctx = context.get("name")
+        self.calls.append((onResult, func, args, kwargs, ctx))
+
+    def finish(self, index=0):
+        onResult, func, args, kwargs, _ = self.calls.pop(index)
+        onResult(True, func(*args, **kwargs))
+
+
+class TestDatabaseScheduler(MAASTestCase):
+    """Tests for `DatabaseScheduler`."""
+
+    def setUp(self):
+        super(TestDatabaseScheduler, self).setUp()
+        self.pool = FakeDatabasePool()
+        fake_reactor = self.patch(threads, "reactor")
+        fake_reactor.threadpoolForDatabase = self.pool
+        fake_reactor.callFromThread.side_effect = (
+            lambda func, *args: func(*args))
+
+    def make_scheduler(self, capacity=4, reservations=None):
+        if reservations is None:
+            reservations = {DatabasePriority.HIGH: 2}
+        metrics = (
+            Gauge("maas_queued", "Queued.", ("priority",)),
+            Gauge("maas_running", "Running.", ("priority",)),
+            Histogram("maas_wait", "Wait.", ("priority",), (1,)),
+        )
+        return DatabaseScheduler(capacity, reservations, metrics)
+
+    def submit(self, scheduler, priority, count=1):
+        for _ in range(count):
+            scheduler.callInThreadWithCallback(
+                priority, Mock(), lambda: priority)
+
+    def test_dispatches_calls_straight_away_when_idle(self):
+        scheduler = self.make_scheduler()
+        onResult = Mock()
+        scheduler.callInThreadWithCallback(
+            DatabasePriority.NORMAL, onResult, sentinel.func,
+            sentinel.arg, kw=sentinel.kw)
+        self.assertThat(self.pool.calls, HasLength(1))
+        _, func, args, kwargs, _ = self.pool.calls[0]
+        self.expectThat(func, Is(sentinel.func))
+        self.expectThat(args, Equals((sentinel.arg,)))
+        self.expectThat(kwargs, Equals({"kw": sentinel.kw}))
+
+    def test_passes_result_to_onResult(self):
+        scheduler = self.make_scheduler()
+        onResult = Mock()
+        scheduler.callInThreadWithCallback(
+            DatabasePriority.NORMAL, onResult, lambda: sentinel.result)
+        self.pool.finish()
+        self.assertThat(onResult, MockCalledOnceWith(True, sentinel.result))
+
+    def test_dispatches_in_the_callers_context(self):
+        scheduler = self.make_scheduler(capacity=1, reservations={})
+        self.submit(scheduler, DatabasePriority.NORMAL)
+        context.call(
+            {"name": sentinel.context}, self.submit,
+            scheduler, DatabasePriority.NORMAL)
+        self.pool.finish()
+        self.assertThat(self.pool.calls[0][4], Is(sentinel.context))
+
+    def test_other_classes_cannot_use_reserved_threads(self):
+        scheduler = self.make_scheduler(capacity=4)
+        self.submit(scheduler, DatabasePriority.NORMAL, 4)
+        self.expectThat(self.pool.calls, HasLength(2))
+        self.submit(scheduler, DatabasePriority.HIGH, 3)
+        self.expectThat(self.pool.calls, HasLength(4))
+        self.expectThat(scheduler.running, Equals({
+            DatabasePriority.HIGH: 2,
+            DatabasePriority.NORMAL: 2,
+            DatabasePriority.LOW: 0,
+        }))
+
+    def test_dispatches_highest_priority_first_when_freed(self):
+        scheduler = self.make_scheduler(capacity=1, reservations={})
+        self.submit(scheduler, DatabasePriority.LOW)
+        self.submit(scheduler, DatabasePriority.LOW)
+        self.submit(scheduler, DatabasePriority.NORMAL)
+        self.submit(scheduler, DatabasePriority.HIGH)
+        order = []
+        while len(self.pool.calls) > 0:
+            order.append(self.pool.calls[0][1]())
+            self.pool.finish()
+        self.assertThat(order, Equals([
+            DatabasePriority.LOW, DatabasePriority.HIGH,
+            DatabasePriority.NORMAL, DatabasePriority.LOW,
+        ]))
+
+    def test_dispatches_each_class_in_order(self):
+        scheduler = self.make_scheduler(capacity=1, reservations={})
+        funcs = [Mock(return_value=None) for _ in range(3)]
+        for func in funcs:
+            scheduler.callInThreadWithCallback(
+                DatabasePriority.NORMAL, None, func)
+        for func in funcs:
+            self.expectThat(self.pool.calls[0][1], Is(func))
+            self.pool.finish()
+
+    def test_configure_leaves_one_thread_unreserved(self):
+        scheduler = self.make_scheduler(capacity=2, reservations={
+            DatabasePriority.HIGH: 1, DatabasePriority.NORMAL: 1})
+        self.assertThat(scheduler.reserved, Equals({
+            DatabasePriority.HIGH: 1,
+            DatabasePriority.NORMAL: 0,
+            DatabasePriority.LOW: 0,
+        }))
+
+    def test_records_metrics(self):
+        scheduler = self.make_scheduler(capacity=1, reservations={})
+        self.submit(scheduler, DatabasePriority.HIGH)
+        self.submit(scheduler, DatabasePriority.LOW)
+        queued, running, waits = (
+            scheduler.queued_gauge, scheduler.running_gauge, scheduler.waits)
+        self.expectThat(queued.get(DatabasePriority.LOW), Equals(1))
+        self.expectThat(running.get(DatabasePriority.HIGH), Equals(1))
+        self.expectThat(waits.get(DatabasePriority.LOW), Is(None))
+        self.pool.finish()
+        self.expectThat(queued.get(DatabasePriority.LOW), Equals(0))
+        self.expectThat(running.get(DatabasePriority.HIGH), Equals(0))
+        self.expectThat(running.get(DatabasePriority.LOW), Equals(1))
+        self.expectThat(waits.get(DatabasePriority.LOW)[0], Equals([1, 0]))
+
+    def test_priority_pool_calls_scheduler_with_its_priority(self):
+        scheduler = Mock()
+        priority = random.choice(PRIORITIES)
+        pool = DatabasePriorityPool(priority, scheduler)
+        pool.callInThreadWithCallback(sentinel.onResult, sentinel.func, 1)
+        self.assertThat(
+            scheduler.callInThreadWithCallback, MockCalledOnceWith(
+                priority, sentinel.onResult, sentinel.func, 1))
+
 
 class TestDeferToDatabase(MAASServerTestCase):
 
@@ -126,6 +289,24 @@ class TestDeferToDatabase(MAASServerTestCase):
             (sentinel.called, sentinel.a, sentinel.b)))
 
 
+class TestDeferToDatabaseWithPriority(MAASServerTestCase):
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__defers_to_database_threadpool_with_priority(self):
+
+        @orm.transactional
+        def call_in_database_thread(a, b):
+            orm.validate_in_transaction(connection)
+            return sentinel.called, a, b
+
+        result = yield threads.deferToDatabaseWithPriority(
+            DatabasePriority.HIGH, call_in_database_thread,
+            sentinel.a, b=sentinel.b)
+        self.assertThat(result, Equals(
+            (sentinel.called, sentinel.a, sentinel.b)))
+
+
 class TestCallOutToDatabase(MAASServerTestCase):
 
     @wait_for_reactor
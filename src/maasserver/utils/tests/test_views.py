@@ -17,6 +17,7 @@ import sys
 from unittest.mock import (
     ANY,
     call,
+    Mock,
     sentinel,
 )
 from weakref import WeakSet
@@ -30,7 +31,15 @@ from django.core.handlers.wsgi import (
 from django.db import connection
 from django.http import HttpResponse
 from fixtures import FakeLogger
+from maasserver import metrics
+from maasserver.api.machines import MachinesHandler
 from maasserver.exceptions import MAASAPIException
+from maasserver.metrics import (
+    Histogram,
+    QueryAccounting,
+    UNKNOWN_NAME,
+)
+from maasserver.models.config import config_cache
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import (
     MAASServerTestCase,
@@ -58,6 +67,7 @@ from piston3.models import Nonce
 from testtools.matchers import (
     Contains,
     Equals,
+    GreaterThan,
     HasLength,
     Is,
     IsInstance,
@@ -512,6 +522,22 @@ class TestWebApplicationHandler(SerializationFailureTestCase):
         self.assertThat(retry_context.active, Is(False))
         self.assertThat(get_response, MockCalledOnceWith(request))
 
+    def test__get_response_pins_config_cache(self):
+        handler = views.WebApplicationHandler(2)
+
+        def check_config_cache_pinned(request):
+            self.assertThat(config_cache.local.pinned, Is(True))
+
+        get_response = self.patch(WSGIHandler, "get_response")
+        get_response.side_effect = check_config_cache_pinned
+
+        request = make_request()
+        request.path = factory.make_name("path")
+        handler.get_response(request)
+
+        self.assertThat(config_cache.local.pinned, Is(False))
+        self.assertThat(get_response, MockCalledOnceWith(request))
+
     def test__get_response_restores_files_across_requests(self):
         handler = views.WebApplicationHandler(3)
         file_content = sample_binary_data
@@ -584,6 +610,134 @@ class TestWebApplicationHandler(SerializationFailureTestCase):
         handler.get_response(request)
         self.assertEqual(recorder, [True] * 3, "Nonce hasn't been cleaned up!")
 
+    def test__get_response_accounts_for_all_attempts(self):
+        handler = views.WebApplicationHandler(2)
+
+        def query_and_retry(request):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            response = HttpResponse()
+            handler._WebApplicationHandler__retry.add(response)
+            return response
+
+        get_response = self.patch(WSGIHandler, "get_response")
+        get_response.side_effect = query_and_retry
+        record = self.patch_autospec(QueryAccounting, "record")
+
+        request = make_request()
+        request.path = factory.make_name("path")
+        handler.get_response(request)
+
+        self.assertThat(record, MockCalledOnceWith(ANY, "http", "unresolved"))
+        [accounting, _, _] = record.call_args[0]
+        self.expectThat(accounting.queries, GreaterThan(1))
+        self.expectThat(accounting.retries, Equals(1))
+
+    def test__get_response_records_unknown_ops_as_one_series(self):
+        self.patch(metrics, "METRICS", tuple(
+            Histogram(
+                histogram.name, histogram.documentation,
+                histogram.labelnames, histogram.buckets)
+            for histogram in metrics.METRICS))
+
+        def resolve(request):
+            request.resolver_match = make_resolver_match(
+                "machines_handler", MachinesHandler())
+            return HttpResponse()
+
+        get_response = self.patch(WSGIHandler, "get_response")
+        get_response.side_effect = resolve
+
+        handler = views.WebApplicationHandler()
+        for _ in range(3):
+            handler.get_response(make_request({
+                "QUERY_STRING": "op=%s" % factory.make_name("op")}))
+
+        for histogram in metrics.METRICS:
+            self.expectThat(
+                list(histogram.series), Equals([("http", UNKNOWN_NAME)]))
+
+
+def make_resolver_match(view_name, handler=None):
+    """Make a resolver match for `view_name`, handled by `handler`."""
+    if handler is None:
+        func = Mock(spec=[])  # A plain view.
+    else:
+        func = Mock(handler=handler)  # An API resource.
+    return Mock(view_name=view_name, func=func)
+
+
+def make_POST_request(body):
+    return make_request({
+        "REQUEST_METHOD": "POST",
+        "wsgi.input": wsgi._InputStream(io.BytesIO(body)),
+        "CONTENT_TYPE": "application/x-www-form-urlencoded",
+        "CONTENT_LENGTH": str(len(body)),
+    })
+
+
+class TestGetViewName(MAASTestCase):
+
+    def test__returns_unresolved_when_not_resolved(self):
+        request = make_request()
+        self.assertThat(views.get_view_name(request), Equals("unresolved"))
+
+    def test__returns_view_name(self):
+        request = make_request()
+        request.resolver_match = make_resolver_match("index")
+        self.assertThat(views.get_view_name(request), Equals("index"))
+
+    def test__returns_view_name_without_op_for_plain_views(self):
+        request = make_request({"QUERY_STRING": "op=anything"})
+        request.resolver_match = make_resolver_match("index")
+        self.assertThat(views.get_view_name(request), Equals("index"))
+
+    def test__returns_handler_view_name(self):
+        request = make_request()
+        request.resolver_match = make_resolver_match(
+            "machines_handler", MachinesHandler())
+        self.assertThat(
+            views.get_view_name(request), Equals("machines_handler"))
+
+    def test__returns_view_name_with_GET_op(self):
+        request = make_request({"QUERY_STRING": "op=list_allocated"})
+        request.resolver_match = make_resolver_match(
+            "machines_handler", MachinesHandler())
+        self.assertThat(
+            views.get_view_name(request),
+            Equals("machines_handler.list_allocated"))
+
+    def test__returns_view_name_with_POST_op(self):
+        request = make_POST_request(b"op=allocate")
+        request.resolver_match = make_resolver_match(
+            "machines_handler", MachinesHandler())
+        self.assertThat(
+            views.get_view_name(request),
+            Equals("machines_handler.allocate"))
+
+    def test__returns_view_name_with_anonymous_op(self):
+        request = make_request({"QUERY_STRING": "op=get_boot_source"})
+        request.resolver_match = make_resolver_match(
+            "version_handler", Mock(
+                exports={}, anonymous=Mock(exports={
+                    ("GET", "get_boot_source"): sentinel.function})))
+        self.assertThat(
+            views.get_view_name(request),
+            Equals("version_handler.get_boot_source"))
+
+    def test__returns_unknown_for_unknown_op(self):
+        request = make_request({
+            "QUERY_STRING": "op=%s" % factory.make_name("op")})
+        request.resolver_match = make_resolver_match(
+            "machines_handler", MachinesHandler())
+        self.assertThat(views.get_view_name(request), Equals(UNKNOWN_NAME))
+
+    def test__returns_unknown_for_op_with_wrong_method(self):
+        request = make_POST_request(b"op=list_allocated")
+        request.resolver_match = make_resolver_match(
+            "machines_handler", MachinesHandler())
+        self.assertThat(views.get_view_name(request), Equals(UNKNOWN_NAME))
+
 
 class TestWebApplicationHandlerAtomicViews(MAASServerTestCase):
 
@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Stuff relating to threads in the MAAS Region Controller.
@@ -7,11 +7,19 @@ Threads in Python aren't great, but they're okay for what we need. However,
 Django's ORM closely weds database connections to threads, so we use specific
 pools to limit the number of connections each `regiond` process will consume.
 
+Calls into the database pool are scheduled by priority class; see
+`DatabasePriority` and `DatabaseScheduler`.
+
 """
 
 __all__ = [
     "callOutToDatabase",
+    "database_scheduler",
+    "DatabasePriority",
+    "DatabasePriorityPool",
+    "DatabaseScheduler",
     "deferToDatabase",
+    "deferToDatabaseWithPriority",
     "install_database_pool",
     "install_database_unpool",
     "install_default_pool",
@@ -19,6 +27,10 @@ __all__ = [
     "make_default_pool",
 ]
 
+from collections import deque
+from time import monotonic
+
+from maasserver.metrics import DATABASE_POOL_METRICS
 from maasserver.utils.orm import (
     ExclusivelyConnected,
     FullyConnected,
@@ -35,6 +47,7 @@ from twisted.internet import (
     threads,
 )
 from twisted.internet.defer import DeferredSemaphore
+from twisted.python import context
 
 
 max_threads_for_default_pool = 50
@@ -48,6 +61,180 @@ max_threads_for_default_pool = 50
 max_threads_for_database_pool = 9
 
 
+class DatabasePriority:
+    """Priority classes for calls into the database thread-pool."""
+
+    # Latency-critical work, e.g. RPC calls made on behalf of booting
+    # machines, which will time out if kept waiting.
+    HIGH = "high"
+    # Interactive work, e.g. web, API, and WebSocket requests. This is the
+    # default for `deferToDatabase`.
+    NORMAL = "normal"
+    # Background work that can wait.
+    LOW = "low"
+
+
+# Priority classes, highest first.
+PRIORITIES = (
+    DatabasePriority.HIGH,
+    DatabasePriority.NORMAL,
+    DatabasePriority.LOW,
+)
+
+# Database threads reserved for each priority class. Other classes cannot use
+# these even when they're idle, so a burst of, say, web requests can never
+# occupy every thread in the pool.
+reserved_threads_for_database_pool = {
+    DatabasePriority.HIGH: 2,
+    DatabasePriority.NORMAL: 1,
+    DatabasePriority.LOW: 0,
+}
+
+
+class DatabaseScheduler:
+    """Share the database thread-pool between priority classes.
+
+    Calls are queued per priority class, first-in first-out, then dispatched
+    to ``reactor.threadpoolForDatabase``. When a thread is freed the queued
+    call of the highest priority goes next. A call can only be dispatched if
+    it would leave enough threads free to honour the reservations of other
+    classes.
+
+    Queue depths, running calls, and the time each call waited for a thread
+    are recorded, per class, in `DATABASE_POOL_METRICS`.
+
+    This must only be used from the reactor thread.
+
+    :ivar capacity: The number of calls that can run at once, i.e. the size
+        of the database thread-pool.
+    :ivar reserved: The number of threads reserved for each priority class.
+    """
+
+    def __init__(self, capacity, reservations, metrics=DATABASE_POOL_METRICS):
+        super(DatabaseScheduler, self).__init__()
+        self.reservations = dict(reservations)
+        self.queues = {priority: deque() for priority in PRIORITIES}
+        self.running = dict.fromkeys(PRIORITIES, 0)
+        self.queued_gauge, self.running_gauge, self.waits = metrics
+        self.configure(capacity)
+
+    def configure(self, capacity):
+        """Set the capacity, and the reservations within it.
+
+        Reservations are honoured highest priority first, but always leave at
+        least one thread unreserved so that every class can make progress.
+        """
+        self.capacity = capacity
+        self.reserved = {}
+        unreserved = capacity - 1
+        for priority in PRIORITIES:
+            reserve = self.reservations.get(priority, 0)
+            reserve = max(0, min(reserve, unreserved))
+            self.reserved[priority] = reserve
+            unreserved -= reserve
+
+    def canRun(self, priority):
+        """Can a call of `priority` be dispatched now?"""
+        running = sum(self.running.values())
+        held = sum(
+            max(0, self.reserved[other] - self.running[other])
+            for other in PRIORITIES if other != priority)
+        return running + held < self.capacity
+
+    def callInThread(self, priority, func, *args, **kwargs):
+        """Schedule `func` to be called in a database thread.
+
+        See `callInThreadWithCallback`.
+        """
+        self.callInThreadWithCallback(priority, None, func, *args, **kwargs)
+
+    def callInThreadWithCallback(
+            self, priority, onResult, func, *args, **kwargs):
+        """Schedule `func` to be called in a database thread.
+
+        This has the same semantics as Twisted's `ThreadPool` method of the
+        same name, except for the leading `priority` argument.
+
+        :param priority: One of `PRIORITIES`.
+        """
+        # Capture the context now; the call may be dispatched from another.
+        ctx = context.theContextTracker.currentContext().contexts[-1]
+        call = ctx, onResult, func, args, kwargs, monotonic()
+        self.queues[priority].append(call)
+        self._dispatch()
+
+    def _dispatch(self):
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            while len(queue) > 0 and self.canRun(priority):
+                self._run(priority, queue.popleft())
+        for priority in PRIORITIES:
+            self.queued_gauge.set(len(self.queues[priority]), priority)
+            self.running_gauge.set(self.running[priority], priority)
+
+    def _run(self, priority, call):
+        ctx, onResult, func, args, kwargs, queued = call
+        self.waits.observe(monotonic() - queued, priority)
+
+        def callback(success, result):
+            try:
+                if onResult is not None:
+                    onResult(success, result)
+            finally:
+                reactor.callFromThread(self._finished, priority)
+
+        self.running[priority] += 1
+        try:
+            context.call(
+                ctx, reactor.threadpoolForDatabase.callInThreadWithCallback,
+                callback, func, *args, **kwargs)
+        except:
+            self.running[priority] -= 1
+            raise
+
+    def _finished(self, priority):
+        self.running[priority] -= 1
+        self._dispatch()
+
+
+# The scheduler for this process's database thread-pool. Its capacity is set
+# when the pool is installed.
+database_scheduler = DatabaseScheduler(
+    max_threads_for_database_pool, reserved_threads_for_database_pool)
+
+
+class DatabasePriorityPool:
+    """The database thread-pool as seen by one priority class.
+
+    This can be used in place of a Twisted `ThreadPool`, e.g. by a WSGI
+    resource or a `ThreadPoolLimiter`. Calls go via `database_scheduler`.
+    """
+
+    def __init__(self, priority, scheduler=database_scheduler):
+        super(DatabasePriorityPool, self).__init__()
+        self.priority = priority
+        self.scheduler = scheduler
+
+    def start(self):
+        reactor.threadpoolForDatabase.start()
+
+    def stop(self):
+        reactor.threadpoolForDatabase.stop()
+
+    @property
+    def started(self):
+        return reactor.threadpoolForDatabase.started
+
+    def callInThread(self, func, *args, **kwargs):
+        """See :class:`twisted.python.threadpool.ThreadPool`."""
+        self.scheduler.callInThread(self.priority, func, *args, **kwargs)
+
+    def callInThreadWithCallback(self, onResult, func, *args, **kwargs):
+        """See :class:`twisted.python.threadpool.ThreadPool`."""
+        self.scheduler.callInThreadWithCallback(
+            self.priority, onResult, func, *args, **kwargs)
+
+
 def make_default_pool(maxthreads=max_threads_for_default_pool):
     """Create a general thread-pool for non-database activity.
 
@@ -113,6 +300,7 @@ def install_database_pool(maxthreads=max_threads_for_database_pool):
         # configuration straight away; it may not be ready yet.
         reactor.threadpoolForDatabase = make_database_pool(maxthreads)
         reactor.callInDatabase = reactor.threadpoolForDatabase.callInThread
+        database_scheduler.configure(maxthreads)
         reactor.callWhenRunning(reactor.threadpoolForDatabase.start)
         reactor.addSystemEventTrigger(
             "during", "shutdown", reactor.threadpoolForDatabase.stop)
@@ -133,6 +321,7 @@ def install_database_unpool(maxthreads=max_threads_for_database_pool):
     except AttributeError:
         reactor.threadpoolForDatabase = make_database_unpool(maxthreads)
         reactor.callInDatabase = reactor.threadpoolForDatabase.callInThread
+        database_scheduler.configure(maxthreads)
         reactor.callWhenRunning(reactor.threadpoolForDatabase.start)
         reactor.addSystemEventTrigger(
             "during", "shutdown", reactor.threadpoolForDatabase.stop)
@@ -143,10 +332,21 @@ def install_database_unpool(maxthreads=max_threads_for_database_pool):
 
 
 def deferToDatabase(func, *args, **kwargs):
-    """Call `func` in a thread where database activity is permitted."""
+    """Call `func` in a thread where database activity is permitted.
+
+    This is scheduled at `DatabasePriority.NORMAL`.
+    """
+    return deferToDatabaseWithPriority(
+        DatabasePriority.NORMAL, func, *args, **kwargs)
+
+
+def deferToDatabaseWithPriority(priority, func, *args, **kwargs):
+    """Call `func` in a database thread, scheduled at `priority`.
+
+    :param priority: One of the `DatabasePriority` classes.
+    """
     return threads.deferToThreadPool(
-        reactor, reactor.threadpoolForDatabase,
-        func, *args, **kwargs)
+        reactor, DatabasePriorityPool(priority), func, *args, **kwargs)
 
 
 def callOutToDatabase(thing, func, *args, **kwargs):
@@ -19,6 +19,12 @@ from django.core.handlers.wsgi import WSGIHandler
 from django.db import transaction
 from django.template.response import SimpleTemplateResponse
 from maasserver.exceptions import MAASAPIException
+from maasserver.metrics import (
+    QueryAccounting,
+    record_retry,
+    UNKNOWN_NAME,
+)
+from maasserver.models.config import config_cache
 from maasserver.utils.django_urls import get_resolver
 from maasserver.utils.orm import (
     gen_retry_intervals,
@@ -201,7 +207,9 @@ class WebApplicationHandler(WSGIHandler):
             # transaction may fail because of a retryable conflict, so
             # pass errors to handle_uncaught_exception().
             try:
-                with post_commit_hooks:
+                # Every configuration item read while handling the request
+                # comes from the same version of the configuration cache.
+                with post_commit_hooks, config_cache.pinned():
                     with transaction.atomic():
                         return django_get_response(request)
             except SystemExit:
@@ -228,24 +236,75 @@ class WebApplicationHandler(WSGIHandler):
         retry_attempts = self.__retry_attempts
         retry_set = self.__retry
 
-        with retry_context:
-            for attempt in count(1):
-                retry_context.prepare()
-                response = get_response(request)
-                if response in retry_set:
-                    elapsed, remaining, wait = next(retry_details)
-                    if attempt == retry_attempts or wait == 0:
-                        # Time's up: this was the final attempt.
-                        log_final_failed_attempt(request, attempt, elapsed)
-                        conflict_response = HttpResponseConflict(response)
-                        conflict_response.render()
-                        return conflict_response
+        def get_response_with_retries(request):
+            with retry_context:
+                for attempt in count(1):
+                    retry_context.prepare()
+                    response = get_response(request)
+                    if response in retry_set:
+                        elapsed, remaining, wait = next(retry_details)
+                        if attempt == retry_attempts or wait == 0:
+                            # Time's up: this was the final attempt.
+                            log_final_failed_attempt(
+                                request, attempt, elapsed)
+                            conflict_response = HttpResponseConflict(
+                                response)
+                            conflict_response.render()
+                            return request, conflict_response
+                        else:
+                            # We'll retry after a brief interlude.
+                            log_failed_attempt(
+                                request, attempt, elapsed, remaining, wait)
+                            record_retry()
+                            delete_oauth_nonce(request)
+                            request = reset_request(request)
+                            sleep(wait)
                     else:
-                        # We'll retry after a brief interlude.
-                        log_failed_attempt(
-                            request, attempt, elapsed, remaining, wait)
-                        delete_oauth_nonce(request)
-                        request = reset_request(request)
-                        sleep(wait)
-                else:
-                    return response
+                        return request, response
+
+        # Account for the queries, database time, and retries of all
+        # attempts together. The final request is used to name the view
+        # because it's the one that has been resolved.
+        accounting = QueryAccounting()
+        request, response = accounting.call(get_response_with_retries, request)
+        accounting.record("http", get_view_name(request))
+        return response
+
+
+def get_view_name(request):
+    """Return a name for the view that handled `request`.
+
+    This is the view's name, qualified with the API operation if there is
+    one, e.g. "machines_handler.allocate". Requests that were not resolved
+    to a view are named "unresolved". API requests for an operation that
+    the handler does not export are named `UNKNOWN_NAME`, so that clients
+    cannot choose names.
+    """
+    resolver_match = getattr(request, "resolver_match", None)
+    if resolver_match is None:
+        return "unresolved"
+    handler = getattr(resolver_match.func, "handler", None)
+    exports = getattr(handler, "exports", None)
+    if exports is None:
+        # Not an API handler, so there are no operations.
+        return resolver_match.view_name
+    if request.method == "GET":
+        op = request.GET.get("op")
+    else:
+        op = request.POST.get("op")
+    if not is_exported(handler, request.method, op):
+        return UNKNOWN_NAME
+    elif op:
+        return "%s.%s" % (resolver_match.view_name, op)
+    else:
+        return resolver_match.view_name
+
+
+def is_exported(handler, method, op):
+    """Is `op` exported for `method` by `handler` or its anonymous handler?"""
+    signature = method.upper(), op
+    if signature in handler.exports:
+        return True
+    anonymous = getattr(handler, "anonymous", None)
+    exports = getattr(anonymous, "exports", None)
+    return exports is not None and signature in exports
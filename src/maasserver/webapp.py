@@ -15,6 +15,11 @@ import re
 from django.conf import settings
 from lxml import html
 from maasserver import concurrency
+from maasserver.metrics import MetricsResource
+from maasserver.utils.threads import (
+    DatabasePriority,
+    DatabasePriorityPool,
+)
 from maasserver.utils.views import WebApplicationHandler
 from maasserver.websockets.protocol import WebSocketFactory
 from maasserver.websockets.websockets import (
@@ -191,7 +196,8 @@ class WebApplicationService(StreamServerEndpointService):
         super(WebApplicationService, self).__init__(endpoint, self.site)
         self.websocket = WebSocketFactory(listener)
         self.threadpool = ThreadPoolLimiter(
-            reactor.threadpoolForDatabase, concurrency.webapp)
+            DatabasePriorityPool(DatabasePriority.NORMAL),
+            concurrency.webapp)
         self.status_worker = status_worker
 
     def prepareApplication(self):
@@ -221,6 +227,7 @@ class WebApplicationService(StreamServerEndpointService):
         maas = Resource()
         maas.putChild(b'metadata', metadata)
         maas.putChild(b'static', File(settings.STATIC_ROOT))
+        maas.putChild(b'metrics', MetricsResource())
         maas.putChild(
             b'ws',
             WebSocketsResource(lookupProtocolForFactory(self.websocket)))
@@ -10,6 +10,7 @@ __all__ = [
     "Handler",
     ]
 
+from functools import partial
 from operator import attrgetter
 
 from django.contrib.postgres.fields import ArrayField
@@ -18,6 +19,7 @@ from django.db.models import Model
 from django.http import HttpRequest
 from django.utils.encoding import is_protected_type
 from maasserver import concurrency
+from maasserver.metrics import get_query_accounting
 from maasserver.utils.forms import get_QueryDict
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
@@ -329,9 +331,14 @@ class Handler(metaclass=HandlerMetaclass):
                     return method(params)
                 else:
                     # This is going to block and hold a database connection so
-                    # we limit its concurrency.
+                    # we limit its concurrency. The semaphore may defer this
+                    # call, so carry the query accounting across explicitly.
+                    method = transactional(method)
+                    accounting = get_query_accounting()
+                    if accounting is not None:
+                        method = partial(accounting.call, method)
                     return concurrency.webapp.run(
-                        deferToDatabase, transactional(method), params)
+                        deferToDatabase, method, params)
         else:
             raise HandlerNoSuchMethodError(method_name)
 
@@ -11,6 +11,7 @@ from functools import partial
 from operator import itemgetter
 
 from django.core.exceptions import ValidationError
+from maasserver.clusterrpc.power import batched_power_changes
 from maasserver.enum import (
     BMC_TYPE,
     INTERFACE_LINK_TYPE,
@@ -68,6 +69,7 @@ from maasserver.models.tag import Tag
 from maasserver.node_action import compile_node_actions
 from maasserver.utils.orm import (
     reload_object,
+    savepoint,
     transactional,
 )
 from maasserver.utils.threads import deferToDatabase
@@ -108,6 +110,7 @@ class MachineHandler(NodeHandler):
             'create',
             'update',
             'action',
+            'action_many',
             'set_active',
             'check_power',
             'create_physical',
@@ -860,6 +863,32 @@ class MachineHandler(NodeHandler):
         extra_params = params.get("extra", {})
         return action.execute(**extra_params)
 
+    def action_many(self, params):
+        """Perform the action on each of the objects in `system_ids`.
+
+        Each action is performed in its own savepoint, so one that fails
+        does not prevent the others, and power changes are batched so that
+        each rack controller is asked to make them all at once.
+
+        :return: A dict with the `system_ids` of the objects on which the
+            action was performed, and a dict of `errors` keyed by the
+            `system_id` of each object on which it failed.
+        """
+        system_ids = params.get("system_ids", [])
+        succeeded, errors = [], {}
+        with batched_power_changes():
+            for system_id in system_ids:
+                action_params = dict(params, system_id=system_id)
+                try:
+                    with savepoint():
+                        self.action(action_params)
+                except (HandlerError, NodeActionError, NodeStateViolation,
+                        ValidationError) as error:
+                    errors[system_id] = str(error)
+                else:
+                    succeeded.append(system_id)
+        return {"system_ids": succeeded, "errors": errors}
+
     def _create_link_on_interface(self, interface, params):
         """Create a link on a new interface."""
         mode = params.get("mode", None)
@@ -114,6 +114,7 @@ from testtools.matchers import (
     Equals,
     HasLength,
     Is,
+    KeysEqual,
     MatchesDict,
     MatchesException,
     MatchesListwise,
@@ -2372,6 +2373,37 @@ class TestMachineHandler(MAASServerTestCase):
         self.expectThat(
             node.distro_series, Equals(osystem["releases"][0]["name"]))
 
+    def test_action_many_performs_action_on_each_machine(self):
+        admin = factory.make_admin()
+        nodes = [
+            factory.make_Node(status=NODE_STATUS.ALLOCATED, owner=admin)
+            for _ in range(3)
+        ]
+        handler = MachineHandler(admin, {})
+        result = handler.action_many({
+            "system_ids": [node.system_id for node in nodes],
+            "action": "delete",
+        })
+        self.expectThat(result, Equals({
+            "system_ids": [node.system_id for node in nodes],
+            "errors": {},
+        }))
+        for node in nodes:
+            self.expectThat(reload_object(node), Is(None))
+
+    def test_action_many_reports_errors_per_machine(self):
+        admin = factory.make_admin()
+        node = factory.make_Node(status=NODE_STATUS.ALLOCATED, owner=admin)
+        missing = factory.make_name("system_id")
+        handler = MachineHandler(admin, {})
+        result = handler.action_many({
+            "system_ids": [missing, node.system_id],
+            "action": "delete",
+        })
+        self.expectThat(result["system_ids"], Equals([node.system_id]))
+        self.expectThat(result["errors"], KeysEqual(missing))
+        self.expectThat(reload_object(node), Is(None))
+
     def test_create_physical_creates_interface(self):
         user = factory.make_admin()
         node = factory.make_Node(interface=False)
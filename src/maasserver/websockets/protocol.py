@@ -26,6 +26,10 @@ from django.contrib.auth import (
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from maasserver.eventloop import services
+from maasserver.metrics import (
+    QueryAccounting,
+    UNKNOWN_NAME,
+)
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
 from maasserver.websockets import handlers
@@ -33,6 +37,7 @@ from maasserver.websockets.websockets import STATUSES
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.utils import typed
 from provisioningserver.utils.twisted import (
+    callOut,
     deferred,
     synchronous,
 )
@@ -70,6 +75,38 @@ class RESPONSE_TYPE:
     ERROR = 1
 
 
+class MSG_ENCODING:
+    #: Results are sent as-is. This is the default.
+    JSON = "json"
+
+    #: Results that are lists of objects with the same keys are sent as
+    #: ``{"columns": [key, ...], "rows": [[value, ...], ...]}``, and the
+    #: response is marked with ``"encoding": "columns"``. Other results are
+    #: sent as-is. Clients opt-in with ``encoding=columns`` in the query
+    #: string of the connection's URL.
+    COLUMNS = "columns"
+
+
+def encode_columns(result):
+    """Encode a list of objects as column names and rows of values.
+
+    :return: The encoded result, or `None` if `result` is not a non-empty
+        list of dicts that all have the same keys.
+    """
+    if not isinstance(result, list) or len(result) == 0:
+        return None
+    if not all(isinstance(obj, dict) for obj in result):
+        return None
+    columns = list(result[0])
+    keys = result[0].keys()
+    if any(obj.keys() != keys for obj in result):
+        return None
+    return {
+        "columns": columns,
+        "rows": [[obj[column] for column in columns] for obj in result],
+    }
+
+
 @typed
 def get_cookie(cookies: Optional[str], cookie_name: str) -> Optional[str]:
     """Return the sessionid value from `cookies`."""
@@ -92,9 +129,16 @@ class WebSocketProtocol(Protocol):
         self.messages = deque()
         self.user = None
         self.cache = {}
+        self.encoding = MSG_ENCODING.JSON
 
     def connectionMade(self):
         """Connection has been made to client."""
+        # The client may opt-in to a more compact encoding of results.
+        encodings = parse_qs(
+            urlparse(self.transport.uri).query).get(b'encoding')
+        if encodings is not None and b'columns' in encodings:
+            self.encoding = MSG_ENCODING.COLUMNS
+
         # Using the provided cookies on the connection request, authenticate
         # the client. If this fails or if the CSRF token can't be found, it
         # will call loseConnection. A websocket connection is only allowed
@@ -284,7 +328,14 @@ class WebSocketProtocol(Protocol):
             return None
 
         handler = self.buildHandler(handler_class)
-        d = handler.execute(method, message.get("params", {}))
+        if method in handler._meta.allowed_methods:
+            name = msg_method
+        else:
+            name = UNKNOWN_NAME  # Don't let the client choose the name.
+        accounting = QueryAccounting()
+        d = accounting.call(
+            handler.execute, method, message.get("params", {}))
+        d.addBoth(callOut, accounting.record, "websocket", name)
         d.addCallbacks(
             partial(self.sendResult, request_id),
             partial(self.sendError, request_id, handler, method))
@@ -307,6 +358,11 @@ class WebSocketProtocol(Protocol):
             "rtype": RESPONSE_TYPE.SUCCESS,
             "result": result,
             }
+        if self.encoding == MSG_ENCODING.COLUMNS:
+            columns = encode_columns(result)
+            if columns is not None:
+                result_msg["result"] = columns
+                result_msg["encoding"] = MSG_ENCODING.COLUMNS
         self.transport.write(json.dumps(
             result_msg, default=self._json_encode).encode("ascii"))
         return result
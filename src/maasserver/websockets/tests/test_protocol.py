@@ -8,6 +8,7 @@ from collections import deque
 import json
 import random
 from unittest.mock import (
+    ANY,
     MagicMock,
     sentinel,
 )
@@ -16,6 +17,11 @@ from apiclient.utils import ascii_url
 from crochet import wait_for
 from django.core.exceptions import ValidationError
 from maasserver.eventloop import services
+from maasserver.metrics import (
+    get_query_accounting,
+    QueryAccounting,
+    UNKNOWN_NAME,
+)
 from maasserver.testing.factory import factory as maas_factory
 from maasserver.testing.listener import FakePostgresListenerService
 from maasserver.testing.testcase import MAASTransactionServerTestCase
@@ -28,6 +34,8 @@ from maasserver.websockets.handlers import (
     MachineHandler,
 )
 from maasserver.websockets.protocol import (
+    encode_columns,
+    MSG_ENCODING,
     MSG_TYPE,
     RESPONSE_TYPE,
     WebSocketFactory,
@@ -44,8 +52,10 @@ from maastesting.twisted import TwistedLoggerFixture
 from provisioningserver.refresh.node_info_scripts import LSHW_OUTPUT_NAME
 from provisioningserver.utils.twisted import synchronous
 from testtools.matchers import (
+    Contains,
     Equals,
     Is,
+    Not,
 )
 from twisted.internet import defer
 from twisted.internet.defer import (
@@ -536,6 +546,60 @@ class TestWebSocketProtocol(MAASTransactionServerTestCase):
             protocol.cache[handler_name],
             handler_class.call_args[0][1])
 
+    def test_handleRequest_accounts_for_request(self):
+        protocol, factory = self.make_protocol()
+        protocol.user = sentinel.user
+        record = self.patch_autospec(QueryAccounting, "record")
+
+        handler_class = MagicMock()
+        handler_name = maas_factory.make_name("handler")
+        handler_class._meta.handler_name = handler_name
+        handler = handler_class.return_value
+        handler._meta.allowed_methods = ["get"]
+        handler.execute.side_effect = (
+            lambda method, params: succeed(get_query_accounting()))
+        factory.handlers[handler_name] = handler_class
+        sendResult = self.patch(protocol, "sendResult")
+
+        request_id = random.randint(1, 999999)
+        d = protocol.handleRequest({
+            "type": MSG_TYPE.REQUEST,
+            "request_id": request_id,
+            "method": "%s.get" % handler_name,
+        })
+
+        self.assertThat(d, IsFiredDeferred())
+        self.assertThat(record, MockCalledOnceWith(
+            ANY, "websocket", "%s.get" % handler_name))
+        # The handler was executed with the accounting in effect.
+        [accounting, _, _] = record.call_args[0]
+        self.assertThat(sendResult, MockCalledOnceWith(request_id, accounting))
+
+    def test_handleRequest_accounts_for_unknown_method_as_unknown(self):
+        protocol, factory = self.make_protocol()
+        protocol.user = sentinel.user
+        record = self.patch_autospec(QueryAccounting, "record")
+
+        handler_class = MagicMock()
+        handler_name = maas_factory.make_name("handler")
+        handler_class._meta.handler_name = handler_name
+        handler = handler_class.return_value
+        handler._meta.allowed_methods = ["get"]
+        handler.execute.return_value = succeed(None)
+        factory.handlers[handler_name] = handler_class
+        self.patch(protocol, "sendResult")
+
+        d = protocol.handleRequest({
+            "type": MSG_TYPE.REQUEST,
+            "request_id": random.randint(1, 999999),
+            "method": "%s.%s" % (
+                handler_name, maas_factory.make_name("method")),
+        })
+
+        self.assertThat(d, IsFiredDeferred())
+        self.assertThat(record, MockCalledOnceWith(
+            ANY, "websocket", UNKNOWN_NAME))
+
     @wait_for_reactor
     @inlineCallbacks
     def test_handleRequest_sends_response(self):
@@ -648,6 +712,49 @@ class TestWebSocketProtocol(MAASTransactionServerTestCase):
         self.expectThat(sent_obj["rtype"], Equals(RESPONSE_TYPE.ERROR))
         self.expectThat(sent_obj["error"], Equals("error"))
 
+    def test_connectionMade_defaults_to_json_encoding(self):
+        protocol, factory = self.make_protocol(
+            transport_uri=self.make_ws_uri(csrftoken="token"))
+        protocol.authenticate.return_value = defer.succeed(None)
+        protocol.connectionMade()
+        self.assertThat(protocol.encoding, Equals(MSG_ENCODING.JSON))
+
+    def test_connectionMade_opts_in_to_columns_encoding(self):
+        protocol, factory = self.make_protocol(
+            transport_uri=self.make_ws_uri(csrftoken="token") +
+            b"&encoding=columns")
+        protocol.authenticate.return_value = defer.succeed(None)
+        protocol.connectionMade()
+        self.assertThat(protocol.encoding, Equals(MSG_ENCODING.COLUMNS))
+
+    def test_sendResult_sends_json_by_default(self):
+        protocol, factory = self.make_protocol()
+        result = [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]
+        protocol.sendResult(1, result)
+        message = self.get_written_transport_message(protocol)
+        self.expectThat(message["result"], Equals(result))
+        self.expectThat(message, Not(Contains("encoding")))
+
+    def test_sendResult_sends_columns_when_opted_in(self):
+        protocol, factory = self.make_protocol()
+        protocol.encoding = MSG_ENCODING.COLUMNS
+        result = [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]
+        self.expectThat(protocol.sendResult(1, result), Is(result))
+        message = self.get_written_transport_message(protocol)
+        self.expectThat(message["encoding"], Equals(MSG_ENCODING.COLUMNS))
+        columns = message["result"]["columns"]
+        self.expectThat(
+            [dict(zip(columns, row)) for row in message["result"]["rows"]],
+            Equals(result))
+
+    def test_sendResult_sends_other_results_as_is_when_opted_in(self):
+        protocol, factory = self.make_protocol()
+        protocol.encoding = MSG_ENCODING.COLUMNS
+        protocol.sendResult(1, {"id": 1})
+        message = self.get_written_transport_message(protocol)
+        self.expectThat(message["result"], Equals({"id": 1}))
+        self.expectThat(message, Not(Contains("encoding")))
+
     def test_sendNotify_sends_correct_json(self):
         protocol, factory = self.make_protocol()
         name = maas_factory.make_name("name")
@@ -664,6 +771,20 @@ class TestWebSocketProtocol(MAASTransactionServerTestCase):
             message, self.get_written_transport_message(protocol))
 
 
+class TestEncodeColumns(MAASTestCase):
+
+    def test_encodes_list_of_objects(self):
+        self.assertThat(
+            encode_columns([{"a": 1, "b": 2}, {"b": 4, "a": 3}]),
+            Equals({"columns": ["a", "b"], "rows": [[1, 2], [3, 4]]}))
+
+    def test_returns_None_for_other_results(self):
+        self.expectThat(encode_columns([]), Is(None))
+        self.expectThat(encode_columns({"a": 1}), Is(None))
+        self.expectThat(encode_columns([{"a": 1}, 2]), Is(None))
+        self.expectThat(encode_columns([{"a": 1}, {"b": 2}]), Is(None))
+
+
 class MakeProtocolFactoryMixin:
 
     def make_factory(self, rpc_service=None):
@@ -12,15 +12,21 @@ HyBi-07 (http://tools.ietf.org/html/draft-ietf-hybi-thewebsocketprotocol-07),
 which are drafts of RFC 6455.
 """
 
+import zlib
+
 from maasserver.websockets.websockets import (
     _makeAccept,
     _makeFrame,
     _mask,
+    _parseExtensions,
     _parseFrames,
     _WSException,
+    _WSMessageTooBig,
     CONTROLS,
     IWebSocketsFrameReceiver,
     lookupProtocolForFactory,
+    negotiateDeflate,
+    PerMessageDeflate,
     STATUSES,
     WebSocketsProtocol,
     WebSocketsProtocolWrapper,
@@ -287,6 +293,51 @@ class TestFrameHelpers(MAASTestCase):
         error = self.assertRaises(_WSException, list, _parseFrames(frame))
         self.assertEqual("Reserved flag in frame (114)", str(error))
 
+    def test_parseCompressedFrameWithoutDeflate(self):
+        """
+        L{_parseFrames} raises a L{_WSException} error when the RSV1 flag is
+        set but permessage-deflate has not been negotiated.
+        """
+        frame = [b"\xc1\x05"]
+        error = self.assertRaises(_WSException, list, _parseFrames(frame))
+        self.assertEqual("Reserved flag in frame (193)", str(error))
+
+    def test_parseCompressedControlFrame(self):
+        """
+        L{_parseFrames} raises a L{_WSException} error when a control frame
+        claims to be compressed.
+        """
+        frame = [b"\xc9\x00"]
+        error = self.assertRaises(_WSException, list, _parseFrames(
+            frame, needMask=False, deflate=PerMessageDeflate()))
+        self.assertEqual("Compressed PING frame", str(error))
+
+    def test_parseCompressedText(self):
+        """
+        L{_parseFrames} decompresses messages when the RSV1 flag is set.
+        """
+        frame = [_makeFrame(
+            compress(b"Hello"), CONTROLS.TEXT, True, compressed=True)]
+        frames = list(_parseFrames(
+            frame, needMask=False, deflate=PerMessageDeflate()))
+        self.assertEqual([(CONTROLS.TEXT, b"Hello", True)], frames)
+
+    def test_parseCompressedTextFragments(self):
+        """
+        L{_parseFrames} decompresses fragmented messages, where only the
+        first frame has the RSV1 flag set.
+        """
+        data = compress(b"Hello World")
+        frame = [
+            _makeFrame(data[:4], CONTROLS.TEXT, False, compressed=True),
+            _makeFrame(data[4:], CONTROLS.CONTINUE, True),
+        ]
+        deflate = PerMessageDeflate()
+        frames = list(_parseFrames(frame, needMask=False, deflate=deflate))
+        self.assertEqual(
+            b"Hello World", b"".join(data for _, data, _ in frames))
+        self.assertFalse(deflate.receiving)
+
     def test_parseUnknownOpcode(self):
         """
         L{_parseFrames} raises a L{_WSException} error when the error uses an
@@ -339,6 +390,121 @@ class TestFrameHelpers(MAASTestCase):
         self.assertEqual(frame, buf)
 
 
+@implementer(IWebSocketsFrameReceiver)
+def compress(data, compressor=None):
+    """Compress `data` as a permessage-deflate client would."""
+    if compressor is None:
+        compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data[:-4]
+
+
+def decompress(data):
+    """Decompress `data` as a permessage-deflate client would."""
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    return decompressor.decompress(data + b"\x00\x00\xff\xff")
+
+
+class PerMessageDeflateTest(MAASTestCase):
+    """
+    Tests for L{PerMessageDeflate} and its negotiation.
+    """
+
+    def test_parseExtensions(self):
+        self.assertEqual(
+            [(b"permessage-deflate", [
+                (b"client_max_window_bits", None),
+                (b"server_max_window_bits", b"10")]),
+             (b"permessage-deflate", []),
+             (b"x-other", [])],
+            _parseExtensions([
+                b"permessage-deflate; client_max_window_bits; "
+                b'server_max_window_bits="10", permessage-deflate',
+                b"x-other"]))
+
+    def test_negotiateDeflate_accepts_first_acceptable_offer(self):
+        deflate = negotiateDeflate([
+            b"x-other, permessage-deflate; server_max_window_bits=8, "
+            b"permessage-deflate; server_max_window_bits=10"])
+        self.assertIsInstance(deflate, PerMessageDeflate)
+        self.assertEqual(10, deflate.serverMaxWindowBits)
+
+    def test_negotiateDeflate_returns_None_without_offer(self):
+        self.assertIsNone(negotiateDeflate([]))
+        self.assertIsNone(negotiateDeflate([b"x-other"]))
+
+    def test_fromOffer_declines_unknown_or_duplicate_params(self):
+        self.assertIsNone(PerMessageDeflate.fromOffer([(b"foo", None)]))
+        self.assertIsNone(PerMessageDeflate.fromOffer([
+            (b"client_no_context_takeover", None),
+            (b"client_no_context_takeover", None)]))
+        self.assertIsNone(PerMessageDeflate.fromOffer([
+            (b"server_no_context_takeover", b"1")]))
+        self.assertIsNone(PerMessageDeflate.fromOffer([
+            (b"client_max_window_bits", b"16")]))
+
+    def test_getResponse(self):
+        deflate = PerMessageDeflate.fromOffer([
+            (b"server_no_context_takeover", None),
+            (b"client_no_context_takeover", None),
+            (b"server_max_window_bits", b"12"),
+            (b"client_max_window_bits", None)])
+        self.assertEqual(
+            b"permessage-deflate; server_no_context_takeover; "
+            b"client_no_context_takeover; server_max_window_bits=12",
+            deflate.getResponse())
+
+    def test_getResponse_default(self):
+        self.assertEqual(
+            b"permessage-deflate", PerMessageDeflate().getResponse())
+
+    def test_compress_takes_over_context(self):
+        deflate = PerMessageDeflate()
+        message = b"Hello World" * 20
+        first = deflate.compress(message)
+        second = deflate.compress(message)
+        self.assertEqual(message, decompress(first))
+        self.assertLess(len(second), len(first))
+
+    def test_compress_without_context_takeover(self):
+        deflate = PerMessageDeflate(serverNoContextTakeover=True)
+        message = b"Hello World" * 20
+        first = deflate.compress(message)
+        second = deflate.compress(message)
+        self.assertEqual(first, second)
+        self.assertEqual(message, decompress(second))
+
+    def test_decompress_takes_over_context(self):
+        deflate = PerMessageDeflate()
+        compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        for message in (b"Hello", b"Hello", b"World"):
+            self.assertEqual(message, deflate.decompress(
+                compress(message, compressor), True))
+
+    def test_decompress_refuses_message_larger_than_maximumSize(self):
+        deflate = PerMessageDeflate()
+        deflate.maximumSize = 1000
+        self.assertEqual(
+            b"x" * 1000, deflate.decompress(compress(b"x" * 1000), True))
+        self.assertRaises(
+            _WSMessageTooBig, deflate.decompress,
+            compress(b"x" * 1001), True)
+
+    def test_decompress_limits_whole_fragmented_message(self):
+        deflate = PerMessageDeflate()
+        deflate.maximumSize = 1000
+        compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        first = compressor.compress(b"x" * 600)
+        first += compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.assertEqual(b"x" * 600, deflate.decompress(first, False))
+        self.assertRaises(
+            _WSMessageTooBig, deflate.decompress,
+            compress(b"x" * 500, compressor), True)
+
+
 @implementer(IWebSocketsFrameReceiver)
 class SavingEchoReceiver(object):
     """
@@ -412,6 +578,62 @@ class WebSocketsProtocolTest(MAASTestCase):
         self.protocol.dataReceived(b"\x72\x05")
         self.assertFalse(self.transport.connected)
 
+    def test_compressedFrameReceived(self):
+        """
+        With permessage-deflate negotiated, L{WebSocketsProtocol} decompresses
+        received messages and compresses large messages that it sends.
+        """
+        receiver = SavingEchoReceiver()
+        protocol = WebSocketsProtocol(receiver)
+        protocol.deflate = PerMessageDeflate()
+        transport = StringTransportWithDisconnection()
+        protocol.makeConnection(transport)
+        transport.protocol = protocol
+        message = b"Hello World" * 20
+        protocol.dataReceived(_makeFrame(
+            compress(message), CONTROLS.TEXT, True, mask=b"abcd",
+            compressed=True))
+        self.assertEqual([(CONTROLS.TEXT, message, True)], receiver.received)
+        [(opcode, data, fin)] = _parseFrames(
+            [transport.value()], needMask=False, deflate=PerMessageDeflate())
+        self.assertEqual((CONTROLS.TEXT, message, True), (opcode, data, fin))
+        self.assertEqual(0xc1, transport.value()[0])
+
+    def test_compressedMessageTooBig(self):
+        """
+        If a compressed message decompresses to more than
+        L{PerMessageDeflate.maximumSize}, L{WebSocketsProtocol} closes the
+        connection with C{MESSAGE_TOO_BIG}.
+        """
+        receiver = SavingEchoReceiver()
+        protocol = WebSocketsProtocol(receiver)
+        protocol.deflate = PerMessageDeflate()
+        protocol.deflate.maximumSize = 1000
+        transport = StringTransportWithDisconnection()
+        protocol.makeConnection(transport)
+        transport.protocol = protocol
+        protocol.dataReceived(_makeFrame(
+            compress(b"x" * 1001), CONTROLS.TEXT, True, mask=b"abcd",
+            compressed=True))
+        self.assertEqual([], receiver.received)
+        self.assertEqual(b"\x88\x02\x03\xf1", transport.value())
+        self.assertFalse(transport.connected)
+
+    def test_smallFramesAreNotCompressed(self):
+        """
+        Messages smaller than L{PerMessageDeflate.minimumSize} are sent
+        uncompressed.
+        """
+        receiver = SavingEchoReceiver()
+        protocol = WebSocketsProtocol(receiver)
+        protocol.deflate = PerMessageDeflate()
+        transport = StringTransportWithDisconnection()
+        protocol.makeConnection(transport)
+        transport.protocol = protocol
+        protocol.dataReceived(
+            _makeFrame(b"Hello", CONTROLS.TEXT, True, mask=b"abcd"))
+        self.assertEqual(b"\x81\x05Hello", transport.value())
+
 
 class WebSocketsTransportTest(MAASTestCase):
     """
@@ -620,6 +842,50 @@ class WebSocketsResourceTest(MAASTestCase):
         self.assertEqual(request.getHeader(b"cookie"), transport.cookies)
         self.assertEqual(request.uri, transport.uri)
 
+    def make_upgrade_request(self, headers=None):
+        request = DummyRequest(b"/")
+        request.requestHeaders = Headers()
+        transport = StringTransportWithDisconnection()
+        transport.protocol = Protocol()
+        request.transport = transport
+        self.update_headers(request, headers={
+            b"upgrade": b"Websocket",
+            b"connection": b"Upgrade",
+            b"sec-websocket-key": b"secure",
+            b"sec-websocket-version": b"13"})
+        if headers is not None:
+            self.update_headers(request, headers)
+        return request, transport
+
+    def test_renderNegotiatesDeflate(self):
+        """
+        L{WebSocketsResource} accepts permessage-deflate when it's offered,
+        and passes the extension to the protocol.
+        """
+        request, transport = self.make_upgrade_request({
+            b"sec-websocket-extensions":
+                b"permessage-deflate; client_max_window_bits"})
+        result = self.resource.render(request)
+        self.assertEqual(NOT_DONE_YET, result)
+        self.assertEqual(
+            [b"permessage-deflate"],
+            request.responseHeaders.getRawHeaders(
+                b"sec-websocket-extensions"))
+        self.assertIsInstance(transport.protocol.deflate, PerMessageDeflate)
+
+    def test_renderWithoutDeflate(self):
+        """
+        L{WebSocketsResource} ignores offers of permessage-deflate when
+        created with C{permessageDeflate=False}.
+        """
+        self.resource._permessageDeflate = False
+        request, transport = self.make_upgrade_request({
+            b"sec-websocket-extensions": b"permessage-deflate"})
+        self.resource.render(request)
+        self.assertIsNone(request.responseHeaders.getRawHeaders(
+            b"sec-websocket-extensions"))
+        self.assertIsNone(transport.protocol.deflate)
+
     def test_renderProtocol(self):
         """
         If protocols are specified via the C{Sec-WebSocket-Protocol} header,
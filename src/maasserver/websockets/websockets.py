@@ -1,4 +1,4 @@
-# Copyright 2015 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 #
 # Copyright (c) Twisted Matrix Laboratories.
@@ -11,7 +11,8 @@ factory.
 """
 
 __all__ = ["WebSocketsResource", "IWebSocketsFrameReceiver",
-           "lookupProtocolForFactory", "WebSocketsProtocol",
+           "lookupProtocolForFactory", "negotiateDeflate",
+           "PerMessageDeflate", "WebSocketsProtocol",
            "WebSocketsProtocolWrapper", "CONTROLS", "STATUSES"]
 
 
@@ -24,8 +25,10 @@ from struct import (
 )
 from typing import (
     List,
+    Optional,
     Sequence,
 )
+import zlib
 
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.utils import typed
@@ -54,6 +57,12 @@ class _WSException(Exception):
     """
 
 
+class _WSMessageTooBig(_WSException):
+    """
+    A compressed message decompressed to more than the allowed size.
+    """
+
+
 class CONTROLS(Values):
     """
     Control frame specifiers.
@@ -126,8 +135,187 @@ def _mask(buf: bytes, key: bytes) -> bytes:
     return bytes((b ^ k) for b, k in zip(buf, cycle(key)))
 
 
+# The trailing bytes that permessage-deflate strips from each compressed
+# message, and which are restored before decompression. See RFC 7692.
+_DEFLATE_TAIL = b"\x00\x00\xff\xff"
+
+
+class PerMessageDeflate(object):
+    """
+    The permessage-deflate extension (RFC 7692), as negotiated with a client.
+
+    @ivar serverNoContextTakeover: If C{True}, compress each message sent
+        without reference to those sent before.
+    @ivar clientNoContextTakeover: If C{True}, the client compresses each
+        message without reference to those sent before.
+    @ivar serverMaxWindowBits: The size, as a power of 2, of the sliding
+        window used to compress messages.
+    @ivar receiving: C{True} while receiving a fragmented, compressed message.
+    """
+
+    # Messages smaller than this are not worth compressing, and so are sent
+    # as-is. The extension allows a mix of compressed and plain messages.
+    minimumSize = 128
+
+    # Received messages may not decompress to more than this, so that a
+    # small compressed message cannot exhaust the region's memory.
+    maximumSize = 2 ** 24
+
+    def __init__(
+            self, serverNoContextTakeover=False,
+            clientNoContextTakeover=False, serverMaxWindowBits=15):
+        self.serverNoContextTakeover = serverNoContextTakeover
+        self.clientNoContextTakeover = clientNoContextTakeover
+        self.serverMaxWindowBits = serverMaxWindowBits
+        self.receiving = False
+        self._received = 0
+        self._compressor = None
+        self._decompressor = None
+
+    @classmethod
+    def fromOffer(cls, params):
+        """
+        Accept an offer of permessage-deflate from a client, if possible.
+
+        @type params: C{list} of C{(bytes, bytes or None)}
+        @param params: The offer's extension parameters.
+
+        @return: A new L{PerMessageDeflate}, or C{None} if the offer cannot
+            be accepted.
+        """
+        names = [name for name, _ in params]
+        if len(names) != len(set(names)):
+            return None
+        deflate = cls()
+        for name, value in params:
+            if name == b"server_no_context_takeover" and value is None:
+                deflate.serverNoContextTakeover = True
+            elif name == b"client_no_context_takeover" and value is None:
+                deflate.clientNoContextTakeover = True
+            elif name == b"server_max_window_bits":
+                # zlib cannot reliably produce a raw deflate stream with a
+                # window of 2 ** 8 bytes, so decline such offers.
+                if value is None or not value.isdigit():
+                    return None
+                elif 9 <= int(value) <= 15:
+                    deflate.serverMaxWindowBits = int(value)
+                else:
+                    return None
+            elif name == b"client_max_window_bits":
+                # The decompressor copes with any window size so there's no
+                # need to limit the client.
+                if value is not None and not (
+                        value.isdigit() and 8 <= int(value) <= 15):
+                    return None
+            else:
+                return None
+        return deflate
+
+    def getResponse(self) -> bytes:
+        """
+        Return the I{Sec-WebSocket-Extensions} value accepting the offer.
+        """
+        response = [b"permessage-deflate"]
+        if self.serverNoContextTakeover:
+            response.append(b"server_no_context_takeover")
+        if self.clientNoContextTakeover:
+            response.append(b"client_no_context_takeover")
+        if self.serverMaxWindowBits != 15:
+            response.append(
+                b"server_max_window_bits=%d" % self.serverMaxWindowBits)
+        return b"; ".join(response)
+
+    @typed
+    def compress(self, data: bytes) -> bytes:
+        """
+        Compress a whole message.
+        """
+        if self._compressor is None:
+            self._compressor = zlib.compressobj(
+                zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                -self.serverMaxWindowBits)
+        data = self._compressor.compress(data)
+        data += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.serverNoContextTakeover:
+            self._compressor = None
+        # A sync flush always ends with the tail; RFC 7692 says to strip it.
+        return data[:-len(_DEFLATE_TAIL)]
+
+    @typed
+    def decompress(self, data: bytes, fin: bool) -> bytes:
+        """
+        Decompress a frame of a compressed message.
+
+        @param fin: Whether or not this is the message's final frame.
+
+        @raise _WSMessageTooBig: If the message decompresses to more than
+            C{maximumSize} bytes.
+        """
+        if self._decompressor is None:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        if fin:
+            data += _DEFLATE_TAIL
+        # Ask for one byte more than the message may yet grow by; getting
+        # it, or leaving input unconsumed, means the message is too big.
+        remaining = self.maximumSize - self._received
+        data = self._decompressor.decompress(data, remaining + 1)
+        if len(data) > remaining or self._decompressor.unconsumed_tail:
+            self._decompressor = None
+            self._received = 0
+            raise _WSMessageTooBig(
+                "Message exceeds %d bytes" % self.maximumSize)
+        if fin:
+            if self.clientNoContextTakeover:
+                self._decompressor = None
+            self._received = 0
+        else:
+            self._received += len(data)
+        return data
+
+
 @typed
-def _makeFrame(buf: bytes, opcode, fin: bool, mask: bytes=None) -> bytes:
+def _parseExtensions(headers: Sequence) -> list:
+    """
+    Parse I{Sec-WebSocket-Extensions} header values.
+
+    @return: A C{list} of C{(name, params)} tuples, where C{params} is a list
+        of C{(name, value)} tuples, and the value is C{None} when missing.
+    """
+    extensions = []
+    for header in headers:
+        for offer in header.split(b","):
+            parts = [part.strip() for part in offer.split(b";")]
+            if len(parts[0]) == 0:
+                continue
+            params = []
+            for part in parts[1:]:
+                name, sep, value = part.partition(b"=")
+                value = value.strip().strip(b'"') if sep else None
+                params.append((name.strip(), value))
+            extensions.append((parts[0], params))
+    return extensions
+
+
+@typed
+def negotiateDeflate(headers: Sequence) -> Optional[PerMessageDeflate]:
+    """
+    Accept the first acceptable offer of permessage-deflate, if any.
+
+    @type headers: C{list} of C{bytes}
+    @param headers: The I{Sec-WebSocket-Extensions} header values.
+    """
+    for name, params in _parseExtensions(headers):
+        if name == b"permessage-deflate":
+            deflate = PerMessageDeflate.fromOffer(params)
+            if deflate is not None:
+                return deflate
+    return None
+
+
+@typed
+def _makeFrame(
+        buf: bytes, opcode, fin: bool, mask: bytes=None,
+        compressed: bool=False) -> bytes:
     """
     Make a frame.
 
@@ -146,6 +334,10 @@ def _makeFrame(buf: bytes, opcode, fin: bool, mask: bytes=None) -> bytes:
     @type mask: C{bytes} or C{NoneType}
     @param mask: If specified, the masking key to apply on the created frame.
 
+    @type compressed: C{bool}
+    @param compressed: Whether or not C{buf} was compressed with
+        permessage-deflate, in which case the RSV1 bit is set.
+
     @rtype: C{bytes}
     @return: A packed frame.
     """
@@ -169,6 +361,9 @@ def _makeFrame(buf: bytes, opcode, fin: bool, mask: bytes=None) -> bytes:
     else:
         header = 0x01
 
+    if compressed:
+        header |= 0x40
+
     header = bytes([header | opcode.value])
     if mask is not None:
         buf = b"%s%s" % (mask, _mask(buf, mask))
@@ -177,7 +372,9 @@ def _makeFrame(buf: bytes, opcode, fin: bool, mask: bytes=None) -> bytes:
 
 
 @typed
-def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
+def _parseFrames(
+        frameBuffer: List[bytes], needMask: bool=True,
+        deflate: Optional[PerMessageDeflate]=None):
     """
     Parse frames in a highly compliant manner. It modifies C{frameBuffer}
     removing the parsed content from it.
@@ -187,6 +384,10 @@ def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
 
     @param needMask: If C{True}, refuse any frame which is not masked.
     @type needMask: C{bool}
+
+    @param deflate: If permessage-deflate was negotiated, the extension.
+        Compressed messages are decompressed before they are returned.
+    @type deflate: L{PerMessageDeflate} or C{NoneType}
     """
     start = 0
     payload = b"".join(frameBuffer)
@@ -198,9 +399,10 @@ def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
 
         # Grab the header. This single byte holds some flags and an opcode
         header = payload[start]
-        if header & 0x70:
+        if header & 0x30 or (header & 0x40 and deflate is None):
             # At least one of the reserved flags is set. Pork chop sandwiches!
             raise _WSException("Reserved flag in frame (%d)" % (header,))
+        compressed = bool(header & 0x40)
 
         fin = header & 0x80
 
@@ -262,6 +464,21 @@ def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
         if masked:
             data = _mask(data, key)
 
+        if compressed:
+            # RSV1 marks the first frame of a compressed message; it's
+            # meaningless on control and continuation frames.
+            if opcode not in (CONTROLS.TEXT, CONTROLS.BINARY):
+                raise _WSException("Compressed %s frame" % opcode.name)
+            deflate.receiving = True
+        if deflate is not None and deflate.receiving:
+            if opcode in (CONTROLS.TEXT, CONTROLS.BINARY, CONTROLS.CONTINUE):
+                try:
+                    data = deflate.decompress(data, bool(fin))
+                except zlib.error as error:
+                    raise _WSException("Invalid compressed data: %s" % error)
+                if fin:
+                    deflate.receiving = False
+
         if opcode == CONTROLS.CLOSE:
             if len(data) >= 2:
                 # Gotta unpack the opcode and return usable data here.
@@ -322,14 +539,18 @@ class WebSocketsTransport(object):
 
     _disconnecting = False
 
-    def __init__(self, transport):
+    def __init__(self, transport, deflate=None):
         self._transport = transport
+        self._deflate = deflate
 
     @typed
     def sendFrame(self, opcode, data: bytes, fin: bool):
         """
         Build a frame packet and send it over the wire.
 
+        Whole data messages are compressed if permessage-deflate was
+        negotiated and they are large enough to be worth it.
+
         @type opcode: C{CONTROLS}
         @param opcode: The type of frame to send.
 
@@ -339,7 +560,14 @@ class WebSocketsTransport(object):
         @type fin: C{bool}
         @param fin: Whether or not we're sending a final frame.
         """
-        packet = _makeFrame(data, opcode, fin)
+        deflate = self._deflate
+        if (deflate is not None and fin and
+                opcode in (CONTROLS.TEXT, CONTROLS.BINARY) and
+                len(data) >= deflate.minimumSize):
+            packet = _makeFrame(
+                deflate.compress(data), opcode, fin, compressed=True)
+        else:
+            packet = _makeFrame(data, opcode, fin)
         self._transport.write(packet)
 
     @typed
@@ -383,9 +611,13 @@ class WebSocketsProtocol(Protocol):
     @ivar _buffer: The pending list of frames not processed yet.
     @type _buffer: C{list}
 
+    @ivar deflate: The permessage-deflate extension, if negotiated.
+    @type deflate: L{PerMessageDeflate} or C{NoneType}
+
     @since: 13.2
     """
     _buffer = None
+    deflate = None
 
     def __init__(self, receiver):
         self._receiver = receiver
@@ -397,13 +629,15 @@ class WebSocketsProtocol(Protocol):
         peer = self.transport.getPeer()
         log.debug("Opening connection with {peer}", peer=peer)
         self._buffer = []
-        self._receiver.makeConnection(WebSocketsTransport(self.transport))
+        self._receiver.makeConnection(
+            WebSocketsTransport(self.transport, self.deflate))
 
     def _parseFrames(self):
         """
         Find frames in incoming data and pass them to the underlying protocol.
         """
-        for opcode, data, fin in _parseFrames(self._buffer):
+        frames = _parseFrames(self._buffer, deflate=self.deflate)
+        for opcode, data, fin in frames:
             self._receiver.frameReceived(opcode, data, fin)
             if opcode == CONTROLS.CLOSE:
                 # The other side wants us to close.
@@ -433,6 +667,12 @@ class WebSocketsProtocol(Protocol):
         self._buffer.append(data)
         try:
             self._parseFrames()
+        except _WSMessageTooBig:
+            log.err()
+            self.transport.write(_makeFrame(
+                pack(">H", STATUSES.MESSAGE_TOO_BIG.value),
+                CONTROLS.CLOSE, True))
+            self.transport.loseConnection()
         except _WSException:
             # Couldn't parse all the frames, something went wrong, let's bail.
             log.err()
@@ -590,12 +830,17 @@ class WebSocketsResource(object):
         L{lookupProtocolForFactory}.
     @type lookupProtocol: C{callable}.
 
+    @param permessageDeflate: Whether or not to accept the permessage-deflate
+        extension when a client offers it.
+    @type permessageDeflate: C{bool}
+
     @since: 13.2
     """
     isLeaf = True
 
-    def __init__(self, lookupProtocol):
+    def __init__(self, lookupProtocol, permessageDeflate=True):
         self._lookupProtocol = lookupProtocol
+        self._permessageDeflate = permessageDeflate
 
     def getChildWithDefault(self, name, request):
         """
@@ -695,6 +940,15 @@ class WebSocketsResource(object):
         # 4.2.2.5.5 Optional codec declaration
         if protocolName:
             request.setHeader(b"Sec-WebSocket-Protocol", protocolName)
+        # RFC 7692: Compression extension, if the client offers it.
+        deflate = None
+        if self._permessageDeflate:
+            offers = request.requestHeaders.getRawHeaders(
+                b"Sec-WebSocket-Extensions", [])
+            deflate = negotiateDeflate(offers)
+            if deflate is not None:
+                request.setHeader(
+                    b"Sec-WebSocket-Extensions", deflate.getResponse())
 
         # Provoke request into flushing headers and finishing the handshake.
         request.write(b"")
@@ -713,6 +967,7 @@ class WebSocketsResource(object):
 
         if not isinstance(protocol, WebSocketsProtocol):
             protocol = WebSocketsProtocolWrapper(protocol)
+        protocol.deflate = deflate
 
         # Connect the transport to our factory, and make things go. We need to
         # do some stupid stuff here; see #3204, which could fix it.
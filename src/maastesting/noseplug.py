@@ -4,6 +4,7 @@
 """Nose plugins for MAAS."""
 
 __all__ = [
+    "Benchmark",
     "Crochet",
     "main",
     "Scenarios",
@@ -13,9 +14,12 @@ __all__ = [
 
 import inspect
 import io
+import json
 import logging
 import optparse
 import sys
+from time import monotonic
+import tracemalloc
 import unittest
 
 from nose.case import Test
@@ -41,6 +45,86 @@ def flattenTests(tests):
             yield test
 
 
+class Benchmark(Plugin):
+    """Record wall time, SQL queries, and peak memory for each test.
+
+    Results are written as JSON, keyed by test ID, so that runs of the same
+    tests -- for example those exercising the region's hot paths against
+    scaled sample data -- can be compared between versions.
+    """
+
+    name = "benchmark"
+    option_output = "%s_output" % name
+    log = logging.getLogger('nose.plugins.%s' % name)
+
+    def options(self, parser, env):
+        """Add options to Nose's parser.
+
+        :attention: This is part of the Nose plugin contract.
+        """
+        super(Benchmark, self).options(parser, env)
+        parser.add_option(
+            "--%s-output" % self.name, dest=self.option_output,
+            action="store", default="benchmark.json", help=(
+                "Write benchmark results to this file as JSON."
+            ),
+            metavar="FILE",
+        )
+
+    def configure(self, options, conf):
+        """Configure, based on the parsed options.
+
+        :attention: This is part of the Nose plugin contract.
+        """
+        super(Benchmark, self).configure(options, conf)
+        if self.enabled:
+            self.output = getattr(options, self.option_output)
+            self.results = {}
+            self._started = None
+            self._counter = None
+
+    def _makeQueryCounter(self):
+        """Return a query counter, or `None` if Django is not in use."""
+        if "django.db" not in sys.modules:
+            return None
+        from django.conf import settings
+        if not settings.configured:
+            return None
+        from maastesting.djangotestcase import CountQueries
+        return CountQueries()
+
+    def begin(self):
+        tracemalloc.start()
+
+    def startTest(self, test):
+        tracemalloc.clear_traces()
+        self._counter = self._makeQueryCounter()
+        if self._counter is not None:
+            self._counter.__enter__()
+        self._started = monotonic()
+
+    def stopTest(self, test):
+        wall_time = monotonic() - self._started
+        result = {"wall_time": wall_time}
+        if self._counter is not None:
+            self._counter.__exit__(None, None, None)
+            result["queries"] = self._counter.num_queries
+        _, result["peak_memory"] = tracemalloc.get_traced_memory()
+        self.results[test.id()] = result
+
+    def finalize(self, result):
+        tracemalloc.stop()
+        with open(self.output, "w") as stream:
+            json.dump(self.results, stream, indent=2, sort_keys=True)
+
+    def help(self):
+        """Used in the --help text.
+
+        :attention: This is part of the Nose plugin contract.
+        """
+        return inspect.getdoc(self)
+
+
 class Crochet(Plugin):
     """Start the Twisted reactor via Crochet."""
 
@@ -458,8 +542,9 @@ def main():
     """Invoke Nose's `TestProgram` with extra plugins.
 
     At the command-line it's still necessary to enable these with the flags
-    ``--with-crochet``, ``--with-resources``, ``--with-scenarios``, and so on.
+    ``--with-benchmark``, ``--with-crochet``, ``--with-resources``,
+    ``--with-scenarios``, and so on.
     """
     return TestProgram(addplugins=(
-        Crochet(), Resources(), Scenarios(), Select(), SelectBucket(),
-        Subunit()))
+        Benchmark(), Crochet(), Resources(), Scenarios(), Select(),
+        SelectBucket(), Subunit()))
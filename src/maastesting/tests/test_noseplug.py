@@ -5,6 +5,7 @@
 
 __all__ = []
 
+import json
 from optparse import OptionParser
 from os import (
     devnull,
@@ -30,6 +31,7 @@ from maastesting.matchers import (
     MockNotCalled,
 )
 from maastesting.noseplug import (
+    Benchmark,
     Crochet,
     Resources,
     Scenarios,
@@ -55,6 +57,51 @@ from testtools.matchers import (
 from twisted.python.filepath import FilePath
 
 
+class TestBenchmark(MAASTestCase):
+
+    def test__options_adds_options(self):
+        benchmark = Benchmark()
+        parser = OptionParser()
+        benchmark.options(parser=parser, env={})
+        self.assertThat(
+            parser.option_list[-2:],
+            MatchesListwise([
+                # The --with-benchmark option.
+                MatchesStructure.byEquality(
+                    action="store_true", default=None,
+                    dest="enable_plugin_benchmark",
+                ),
+                # The --benchmark-output option.
+                MatchesStructure.byEquality(
+                    action="store", default="benchmark.json",
+                    dest="benchmark_output", metavar="FILE",
+                    _short_opts=[], _long_opts=["--benchmark-output"],
+                )
+            ]))
+
+    def test__records_and_writes_results(self):
+        output = join(self.make_dir(), "benchmark.json")
+        benchmark = Benchmark()
+        parser = OptionParser()
+        benchmark.add_options(parser=parser, env={})
+        options, rest = parser.parse_args(
+            ["--with-benchmark", "--benchmark-output", output])
+        benchmark.configure(options, sentinel.conf)
+        self.patch(benchmark, "_makeQueryCounter").return_value = None
+
+        test = unittest.FunctionTestCase(lambda: None)
+        benchmark.begin()
+        benchmark.startTest(test)
+        benchmark.stopTest(test)
+        benchmark.finalize(sentinel.result)
+
+        with open(output, "r") as stream:
+            results = json.load(stream)
+        self.assertThat(results, HasLength(1))
+        self.assertThat(
+            sorted(results[test.id()]), Equals(["peak_memory", "wall_time"]))
+
+
 class TestCrochet(MAASTestCase):
 
     def test__options_adds_options(self):
@@ -492,10 +539,11 @@ class TestMain(MAASTestCase):
         noseplug.main()
         self.assertThat(
             noseplug.TestProgram,
-            MockCalledOnceWith(addplugins=(ANY, ANY, ANY, ANY, ANY, ANY)))
+            MockCalledOnceWith(
+                addplugins=(ANY, ANY, ANY, ANY, ANY, ANY, ANY)))
         plugins = noseplug.TestProgram.call_args[1]["addplugins"]
         self.assertThat(plugins, MatchesSetwise(
-            IsInstance(Crochet), IsInstance(Resources),
+            IsInstance(Benchmark), IsInstance(Crochet), IsInstance(Resources),
             IsInstance(Scenarios), IsInstance(Select),
             IsInstance(SelectBucket), IsInstance(Subunit),
         ))
@@ -16,19 +16,19 @@ __all__ = [
 
 import base64
 from datetime import datetime
-from functools import partial
 import http.client
-from io import BytesIO
 from itertools import chain
 import json
 from operator import itemgetter
 import os
-import tarfile
 import time
 
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponse
+from django.http import (
+    HttpResponse,
+    HttpResponseNotModified,
+)
 from django.shortcuts import get_object_or_404
 from formencode.validators import (
     Int,
@@ -87,6 +87,11 @@ from metadataserver.models import (
     Script,
     ScriptResult,
 )
+from metadataserver.script_archive import (
+    commissioning_archive_cache,
+    script_content_cache,
+    ScriptArchive,
+)
 from metadataserver.user_data import generate_user_data_for_poweroff
 from metadataserver.vendor_data import get_vendor_data
 from piston3.utils import rc
@@ -787,16 +792,15 @@ class CurtinUserDataHandler(MetadataViewHandler):
             content_type='application/octet-stream')
 
 
-def add_file_to_tar(tar, path, content, mtime, permission=0o755):
-    """Add a script to a tar."""
-    assert isinstance(content, bytes), "Script content must be binary."
-    tarinfo = tarfile.TarInfo(name=path)
-    tarinfo.size = len(content)
-    tarinfo.mode = permission
-    # Modification time defaults to Epoch, which elicits annoying
-    # warnings when decompressing.
-    tarinfo.mtime = mtime
-    tar.addfile(tarinfo, BytesIO(content))
+def matches_etag(if_none_match, etag):
+    """Does the `If-None-Match` header value match `etag`?"""
+    if if_none_match is None:
+        return False
+    candidates = (
+        candidate.strip() for candidate in if_none_match.split(","))
+    return any(
+        candidate in ("*", etag, "W/" + etag)
+        for candidate in candidates)
 
 
 class CommissioningScriptsHandler(MetadataViewHandler):
@@ -826,33 +830,52 @@ class CommissioningScriptsHandler(MetadataViewHandler):
             self._iter_user_scripts(),
         )
 
+    def _iter_files(self):
+        for name, content in sorted(self._iter_scripts()):
+            yield os.path.join("commissioning.d", name), content
+
     def _get_archive(self):
         """Produce a tar archive of all commissionig scripts.
 
-        Each of the scripts will be in the `ARCHIVE_PREFIX` directory.
+        Each of the scripts will be in the `ARCHIVE_PREFIX` directory. The
+        archive is the same for every node, so it's cached until one of the
+        user's commissioning scripts is added, changed, or removed.
+
+        :return: An ``(etag, archive)`` tuple.
         """
-        binary = BytesIO()
-        scripts = sorted(self._iter_scripts())
-        with tarfile.open(mode='w', fileobj=binary) as tarball:
-            add_script = partial(
-                add_file_to_tar, tarball, mtime=time.time())
-            for name, content in scripts:
-                add_script(os.path.join("commissioning.d", name), content)
-        return binary.getvalue()
+        key = tuple(
+            Script.objects.filter(script_type=SCRIPT_TYPE.COMMISSIONING)
+            .order_by('id').values_list('name', 'script_id'))
+        return commissioning_archive_cache.get(
+            key, self._iter_files, time.time())
 
     def read(self, request, version, mac=None):
         check_version(version)
-        return HttpResponse(
-            self._get_archive(), content_type='application/tar')
+        etag, archive = self._get_archive()
+        if matches_etag(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(archive, content_type='application/tar')
+        response['ETag'] = etag
+        return response
 
 
 class MAASScriptsHandler(OperationsHandler):
 
-    def _add_script_set_to_tar(self, script_set, tar, prefix, mtime):
+    def _add_script_set_to_tar(self, script_set, tar, prefix):
+        """Add the scripts of `script_set` that have yet to run to `tar`.
+
+        The content of each script comes from `script_content_cache`, so a
+        script's `VersionedTextFile` is only read the first time it's sent.
+
+        :param tar: A `ScriptArchive`.
+        :return: The meta-data of the scripts for ``index.json``.
+        """
         if script_set is None:
             return []
         meta_data = []
-        for script_result in script_set:
+        script_results = script_set.scriptresult_set.select_related('script')
+        for script_result in script_results:
             # Don't rerun Scripts which have already run.
             if script_result.status not in (
                     SCRIPT_STATUS.PENDING, SCRIPT_STATUS.RUNNING,
@@ -865,7 +888,9 @@ class MAASScriptsHandler(OperationsHandler):
                 # data from the source.
                 if script_result.name in NODE_INFO_SCRIPTS:
                     script = NODE_INFO_SCRIPTS[script_result.name]
-                    add_file_to_tar(tar, path, script['content'], mtime)
+                    tar.add(path, *script_content_cache.get(
+                        ('builtin', script_result.name),
+                        lambda: script['content']))
                     meta_data.append({
                         'name': script_result.name,
                         'path': path,
@@ -881,13 +906,15 @@ class MAASScriptsHandler(OperationsHandler):
                     script_result.delete()
                     continue
             else:
-                content = script_result.script.script.data.encode()
-                add_file_to_tar(tar, path, content, mtime)
+                script_version_id = script_result.script.script_id
+                tar.add(path, *script_content_cache.get(
+                    ('script', script_version_id),
+                    lambda: script_result.script.script.data.encode()))
                 meta_data.append({
                     'name': script_result.name,
                     'path': path,
                     'script_result_id': script_result.id,
-                    'script_version_id': script_result.script.script.id,
+                    'script_version_id': script_version_id,
                     'timeout_seconds': script_result.script.timeout.seconds,
                     'parallel': script_result.script.parallel,
                     'parameters': script_result.parameters,
@@ -906,33 +933,28 @@ class MAASScriptsHandler(OperationsHandler):
         will be returned.
         """
         node = get_queried_node(request)
-        binary = BytesIO()
-        mtime = time.time()
+        tar = ScriptArchive(time.time())
         tar_meta_data = {}
         # Responses are currently gzip compressed using
         # django.middleware.gzip.GZipMiddleware.
-        with tarfile.open(mode='w', fileobj=binary) as tar:
-            # Commissioning scripts should only be run during commissioning.
-            if node.status == NODE_STATUS.COMMISSIONING:
-                meta_data = self._add_script_set_to_tar(
-                    node.current_commissioning_script_set, tar,
-                    'commissioning', mtime)
-                if meta_data != []:
-                    tar_meta_data['commissioning_scripts'] = sorted(
-                        meta_data, key=itemgetter('name', 'script_result_id'))
-
-            # Always send testing scripts.
+        # Commissioning scripts should only be run during commissioning.
+        if node.status == NODE_STATUS.COMMISSIONING:
             meta_data = self._add_script_set_to_tar(
-                node.current_testing_script_set, tar, 'testing', mtime)
+                node.current_commissioning_script_set, tar, 'commissioning')
             if meta_data != []:
-                tar_meta_data['testing_scripts'] = sorted(
+                tar_meta_data['commissioning_scripts'] = sorted(
                     meta_data, key=itemgetter('name', 'script_result_id'))
 
-            add_file_to_tar(
-                tar, 'index.json', json.dumps({'1.0': tar_meta_data}).encode(),
-                mtime, 0o644)
-        return HttpResponse(
-            binary.getvalue(), content_type='application/x-tar')
+        # Always send testing scripts.
+        meta_data = self._add_script_set_to_tar(
+            node.current_testing_script_set, tar, 'testing')
+        if meta_data != []:
+            tar_meta_data['testing_scripts'] = sorted(
+                meta_data, key=itemgetter('name', 'script_result_id'))
+
+        tar.add_file(
+            'index.json', json.dumps({'1.0': tar_meta_data}).encode(), 0o644)
+        return HttpResponse(tar.getvalue(), content_type='application/x-tar')
 
 
 class EnlistMetaDataHandler(OperationsHandler):
@@ -78,7 +78,7 @@ SWITCH_HARDWARE = [
 SWITCH_OPENBMC_MAC = "02:00:00:00:00:02"
 
 
-def _create_default_physical_interface(node, ifname, mac):
+def _create_default_physical_interface(node, ifname, mac, vlan=None):
     """Assigns the specified interface to the specified Node.
 
     Creates or updates a PhysicalInterface that corresponds to the given MAC.
@@ -86,19 +86,35 @@ def _create_default_physical_interface(node, ifname, mac):
     :param node: Node model object
     :param ifname: the interface name (for example, 'eth0')
     :param mac: the Interface to update and associate
+    :param vlan: the VLAN for the interface; defaults to the default VLAN of
+        the default fabric.
     """
     # We don't yet have enough information to put this newly-created Interface
     # into the proper Fabric/VLAN. (We'll do this on a "best effort" basis
     # later, if we are able to determine that the interface is on a particular
     # subnet due to a DHCP reply during commissioning.)
-    fabric = Fabric.objects.get_default_fabric()
-    vlan = fabric.get_default_vlan()
+    if vlan is None:
+        fabric = Fabric.objects.get_default_fabric()
+        vlan = fabric.get_default_vlan()
     interface = PhysicalInterface.objects.create(
         mac_address=mac, name=ifname, node=node, vlan=vlan)
 
     return interface
 
 
+def _set_changed_fields(instance, **values):
+    """Set `values` on the model `instance`.
+
+    :return: The names of the fields whose values actually changed.
+    """
+    changed = []
+    for field, value in values.items():
+        if getattr(instance, field) != value:
+            setattr(instance, field, value)
+            changed.append(field)
+    return changed
+
+
 def update_node_network_information(node, output, exit_status):
     """Updates the network interfaces from the results of `IPADDR_SCRIPT`.
 
@@ -120,55 +136,66 @@ def update_node_network_information(node, output, exit_status):
     if node.skip_networking:
         return
 
-    # Get the MAC addresses of all connected interfaces.
+    # Get the MAC addresses of all connected interfaces. Ignore loopback
+    # interfaces, and OpenBMC interfaces on switches which all share the
+    # same, hard-coded OpenBMC MAC address.
     ip_addr_info = parse_ip_addr(output)
+    links = [
+        link for link in ip_addr_info.values()
+        if link.get('mac') not in (None, SWITCH_OPENBMC_MAC)
+    ]
+
+    # Load all the existing interfaces for these MACs in one query rather
+    # than one query per link.
+    existing_interfaces = {
+        str(interface.mac_address): interface
+        for interface in PhysicalInterface.objects.filter(
+            mac_address__in=[link['mac'] for link in links]).select_related(
+                'node', 'vlan')
+    }
+    default_vlan = None
     current_interfaces = set()
 
-    for link in ip_addr_info.values():
-        link_mac = link.get('mac')
-        # Ignore loopback interfaces.
-        if link_mac is None:
-            continue
-        elif link_mac == SWITCH_OPENBMC_MAC:
-            # Ignore OpenBMC interfaces on switches which all share the same,
-            # hard-coded OpenBMC MAC address.
-            continue
-        else:
-            ifname = link['name']
-            try:
-                interface = PhysicalInterface.objects.get(
-                    mac_address=link_mac)
-                if interface.node is not None and interface.node != node:
-                    logger.warning(
-                        "Interface with MAC %s moved from node %s to %s. "
-                        "(The existing interface will be deleted.)" %
-                        (interface.mac_address, interface.node.fqdn,
-                         node.fqdn))
-                    interface.delete()
-                    interface = _create_default_physical_interface(
-                        node, ifname, link_mac)
-                else:
-                    # Interface already exists on this Node, so just update
-                    # the name.
-                    if interface.name != ifname:
-                        interface.name = ifname
-                        interface.save(update_fields=['name', 'updated'])
-            except PhysicalInterface.DoesNotExist:
-                interface = _create_default_physical_interface(
-                    node, ifname, link_mac)
-
-            current_interfaces.add(interface)
-            ips = link.get('inet', []) + link.get('inet6', [])
-            interface.update_ip_addresses(ips)
-            if 'NO-CARRIER' in link.get('flags', []):
-                # This interface is now disconnected.
-                if interface.vlan is not None:
-                    interface.vlan = None
-                    interface.save(update_fields=['vlan', 'updated'])
-
-    for iface in Interface.objects.filter(node=node):
-        if iface not in current_interfaces:
-            iface.delete()
+    for link in links:
+        link_mac = link['mac']
+        ifname = link['name']
+        interface = existing_interfaces.get(link_mac)
+        if interface is not None and interface.node_id not in (
+                None, node.id):
+            logger.warning(
+                "Interface with MAC %s moved from node %s to %s. "
+                "(The existing interface will be deleted.)" %
+                (interface.mac_address, interface.node.fqdn, node.fqdn))
+            interface.delete()
+            interface = None
+        if interface is None:
+            if default_vlan is None:
+                fabric = Fabric.objects.get_default_fabric()
+                default_vlan = fabric.get_default_vlan()
+            interface = _create_default_physical_interface(
+                node, ifname, link_mac, vlan=default_vlan)
+            # The same MAC can be listed more than once, e.g. for bonds or
+            # SR-IOV virtual functions; those share this interface.
+            existing_interfaces[link_mac] = interface
+        elif interface.name != ifname:
+            # Interface already exists on this Node, so just update the name.
+            interface.name = ifname
+            interface.save(update_fields=['name', 'updated'])
+
+        current_interfaces.add(interface)
+        ips = link.get('inet', []) + link.get('inet6', [])
+        interface.update_ip_addresses(ips)
+        if 'NO-CARRIER' in link.get('flags', []):
+            # This interface is now disconnected.
+            if interface.vlan is not None:
+                interface.vlan = None
+                interface.save(update_fields=['vlan', 'updated'])
+
+    # Only load the interfaces that need deleting.
+    removed_interfaces = Interface.objects.filter(node=node).exclude(
+        id__in=[interface.id for interface in current_interfaces])
+    for iface in removed_interfaces:
+        iface.delete()
 
 
 def update_node_network_interface_tags(node, output, exit_status):
@@ -345,6 +372,15 @@ def update_node_physical_block_devices(node, output, exit_status):
         raise ValueError(e.message + ': ' + output)
     previous_block_devices = list(
         PhysicalBlockDevice.objects.filter(node=node).all())
+    names_in_use = {
+        block_device.id: block_device.name
+        for block_device in previous_block_devices
+    }
+    # Work out the difference between what's in the database and what was
+    # reported before touching anything, then apply it in as few writes as
+    # possible: unchanged block devices are not saved at all.
+    updated_block_devices = []
+    new_block_devices = []
     for block_info in blockdevs:
         # Skip the read-only devices. We keep them in the output for
         # the user to view but they do not get an entry in the database.
@@ -369,14 +405,11 @@ def update_node_physical_block_devices(node, output, exit_status):
             # ID doesn't change and if its set to the boot_disk that FK will
             # not need to be updated.
             previous_block_devices.remove(block_device)
-            block_device.name = name
-            block_device.model = model
-            block_device.serial = serial
-            block_device.id_path = id_path
-            block_device.size = size
-            block_device.block_size = block_size
-            block_device.tags = tags
-            block_device.save()
+            changed = _set_changed_fields(
+                block_device, name=name, model=model, serial=serial,
+                id_path=id_path, size=size, block_size=block_size, tags=tags)
+            if len(changed) > 0:
+                updated_block_devices.append(block_device)
         else:
             # MAAS doesn't allow disks smaller than 4MiB so skip them
             if size <= MIN_BLOCK_DEVICE_SIZE:
@@ -384,18 +417,9 @@ def update_node_physical_block_devices(node, output, exit_status):
             # Skip loopback devices as they won't be available on next boot
             if id_path.startswith('/dev/loop'):
                 continue
-
-            # First check if there is an existing device with the same name.
-            # If so, we need to rename it. Its name will be changed back later,
-            # when we loop around to it.
-            existing = PhysicalBlockDevice.objects.filter(
-                node=node, name=name).all()
-            for device in existing:
-                # Use the device ID to ensure a unique temporary name.
-                device.name = "%s.%d" % (device.name, device.id)
-                device.save()
-            # New block device. Create it on the node.
-            PhysicalBlockDevice.objects.create(
+            # New block device. It's created once the existing block devices
+            # have been updated, freeing up their old names.
+            new_block_devices.append(PhysicalBlockDevice(
                 node=node,
                 name=name,
                 id_path=id_path,
@@ -404,7 +428,7 @@ def update_node_physical_block_devices(node, output, exit_status):
                 tags=tags,
                 model=model,
                 serial=serial,
-                )
+                ))
 
     # Clear boot_disk if it is being removed.
     boot_disk = node.boot_disk
@@ -415,7 +439,8 @@ def update_node_physical_block_devices(node, output, exit_status):
         node.save()
 
     # Delete all the previous block devices that are no longer present
-    # on the commissioned node.
+    # on the commissioned node. This is done first so that their names are
+    # free to be used by the updated and new block devices.
     delete_block_device_ids = [
         bd.id
         for bd in previous_block_devices
@@ -423,6 +448,29 @@ def update_node_physical_block_devices(node, output, exit_status):
     if len(delete_block_device_ids) > 0:
         PhysicalBlockDevice.objects.filter(
             id__in=delete_block_device_ids).delete()
+        for block_device_id in delete_block_device_ids:
+            del names_in_use[block_device_id]
+
+    # Block devices that swapped names would conflict with each other when
+    # saved, so move those out of the way with a unique temporary name first.
+    # Their names are set to the reported ones when saved below.
+    wanted_names = {
+        block_device.name: block_device.id
+        for block_device in updated_block_devices
+    }
+    for block_device_id, name in names_in_use.items():
+        wanted_by = wanted_names.get(name)
+        if wanted_by is not None and wanted_by != block_device_id:
+            # Use the device ID to ensure a unique temporary name.
+            PhysicalBlockDevice.objects.filter(id=block_device_id).update(
+                name="%s.%d" % (name, block_device_id))
+    for block_device in updated_block_devices:
+        block_device.save()
+
+    # Finally create the new block devices; their names cannot conflict
+    # with any existing block device any more.
+    for block_device in new_block_devices:
+        block_device.save()
 
 
 def create_metadata_by_modalias(node, output: bytes, exit_status):
@@ -652,7 +700,6 @@ def retag_node_for_hardware_by_modalias(
             # we hadn't created the tag yet.
             parent_tag = Tag(name=parent_tag_name)
             parent_tag.save()
-        node.tags.add(parent_tag)
         tags_added.add(parent_tag)
         logger.info(
             "%s: Added tag '%s' for detected hardware type." % (
@@ -664,27 +711,30 @@ def retag_node_for_hardware_by_modalias(
             hw_tag, _ = Tag.objects.get_or_create(name=tag, defaults={
                 'comment': comment
             })
-            node.tags.add(hw_tag)
             tags_added.add(hw_tag)
             logger.info(
                 "%s: Added tag '%s' for detected hardware: %s "
                 "(Matched: %s)." % (node.hostname, tag, comment, matches))
     else:
         if parent_tag is not None:
-            node.tags.remove(parent_tag)
             tags_removed.add(parent_tag)
             logger.info(
                 "%s: Removed tag '%s'; machine does not match hardware "
                 "description." % (node.hostname, parent_tag_name))
-    for descriptor in ruled_out_hardware:
-        tag_name = descriptor['tag']
-        existing_tag = get_one(node.tags.filter(name=tag_name))
-        if existing_tag is not None:
-            node.tags.remove(existing_tag)
+    ruled_out_tag_names = [
+        descriptor['tag'] for descriptor in ruled_out_hardware]
+    if len(ruled_out_tag_names) > 0:
+        for existing_tag in node.tags.filter(name__in=ruled_out_tag_names):
             tags_removed.add(existing_tag)
             logger.info(
                 "%s: Removed tag '%s'; hardware is missing." % (
-                    node.hostname, tag_name))
+                    node.hostname, existing_tag.name))
+    # Apply the changes in one go so that the m2m_changed signals are sent
+    # once per node rather than once per tag.
+    if len(tags_added) > 0:
+        node.tags.add(*tags_added)
+    if len(tags_removed) > 0:
+        node.tags.remove(*tags_removed)
     return tags_added, tags_removed
 
 
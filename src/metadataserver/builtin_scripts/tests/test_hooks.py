@@ -26,6 +26,7 @@ from maasserver.models.vlan import VLAN
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
 from maasserver.utils.orm import reload_object
+from maastesting.djangotestcase import count_queries
 from metadataserver.builtin_scripts.hooks import (
     add_switch,
     add_switch_vendor_model_tags,
@@ -52,6 +53,7 @@ from testtools.matchers import (
     DocTestMatches,
     Equals,
     Is,
+    MatchesAny,
     MatchesStructure,
     Not,
 )
@@ -768,6 +770,40 @@ class TestUpdateNodePhysicalBlockDevices(MAASServerTestCase):
             ]
         self.assertItemsEqual(device_names, created_names)
 
+    def test__handles_swapped_block_device_names(self):
+        devices = [
+            self.make_block_device(name='sda', serial='first'),
+            self.make_block_device(name='sdb', serial='second'),
+        ]
+        node = factory.make_Node()
+        json_output = json.dumps(devices).encode('utf-8')
+        update_node_physical_block_devices(node, json_output, 0)
+        devices[0]['NAME'], devices[1]['NAME'] = 'sdb', 'sda'
+        json_output = json.dumps(devices).encode('utf-8')
+        update_node_physical_block_devices(node, json_output, 0)
+        self.assertItemsEqual(
+            [('sdb', 'first'), ('sda', 'second')],
+            PhysicalBlockDevice.objects.filter(
+                node=node).values_list('name', 'serial'))
+
+    def test__does_not_save_unchanged_block_devices(self):
+        node = factory.make_Node()
+
+        def count_queries_for_devices(count):
+            PhysicalBlockDevice.objects.filter(node=node).delete()
+            devices = [self.make_block_device() for _ in range(count)]
+            json_output = json.dumps(devices).encode('utf-8')
+            update_node_physical_block_devices(node, json_output, 0)
+            num_queries, _ = count_queries(
+                update_node_physical_block_devices, node, json_output, 0)
+            return num_queries
+
+        # Reprocessing identical output costs the same whatever the number
+        # of block devices: nothing is written.
+        self.assertThat(
+            count_queries_for_devices(5), Equals(
+                count_queries_for_devices(1)))
+
     def test__only_updates_physical_block_devices(self):
         devices = [self.make_block_device() for _ in range(3)]
         node = factory.make_Node()
@@ -1374,3 +1410,21 @@ class TestUpdateNodeNetworkInformation(MAASServerTestCase):
         node_interfaces = Interface.objects.filter(node=node)
         all_macs = [interface.mac_address for interface in node_interfaces]
         self.assertNotIn(SWITCH_OPENBMC_MAC, all_macs)
+
+    def test__handles_duplicate_macs(self):
+        node = factory.make_Node()
+        Interface.objects.filter(node_id=node.id).delete()
+        ip_addr_output = dedent("""\
+            2: eth0: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500
+                link/ether 00:00:00:00:00:01 brd ff:ff:ff:ff:ff:ff
+            3: eth1: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500
+                link/ether 00:00:00:00:00:01 brd ff:ff:ff:ff:ff:ff
+            """).encode("ascii")
+        update_node_network_information(node, ip_addr_output, 0)
+        # A single interface is created for the MAC, named after one of the
+        # links that list it.
+        [interface] = Interface.objects.filter(node=node)
+        self.assertThat(interface.mac_address, Equals(
+            MAC("00:00:00:00:00:01")))
+        self.assertThat(interface.name, MatchesAny(
+            Equals("eth0"), Equals("eth1")))
@@ -0,0 +1,175 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tar archives of scripts, assembled from cached members."""
+
+__all__ = [
+    'commissioning_archive_cache',
+    'ScriptArchive',
+    'ScriptContentCache',
+    'script_content_cache',
+    'SharedScriptArchiveCache',
+    ]
+
+from collections import OrderedDict
+from hashlib import sha256
+import tarfile
+from threading import Lock
+
+# The most memory that cached script content may use.
+max_script_cache_size = 32 * 1024 * 1024
+
+
+def _pad(content):
+    """Pad `content` with NULs to a whole number of tar blocks."""
+    remainder = len(content) % tarfile.BLOCKSIZE
+    if remainder == 0:
+        return content
+    else:
+        return content + tarfile.NUL * (tarfile.BLOCKSIZE - remainder)
+
+
+class ScriptContentCache:
+    """The content of scripts, padded ready to be written into tar archives.
+
+    Content is keyed by something that changes whenever the content does,
+    like the id of a script's `VersionedTextFile`, which is never modified,
+    only superseded. Entries therefore never go stale, and the least
+    recently used are evicted when the cache grows too large.
+
+    :ivar hits: The number of times content was found in the cache.
+    :ivar misses: The number of times content had to be fetched.
+    """
+
+    def __init__(self, max_size=max_script_cache_size):
+        super(ScriptContentCache, self).__init__()
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, key, get_content):
+        """Return the size and padded content for `key`.
+
+        :param get_content: A callable that returns the content as a byte
+            string; it's only called when `key` is not already cached.
+        :return: A ``(size, padded)`` tuple.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry
+            self.misses += 1
+        # Fetch the content without holding the lock; concurrent requests
+        # for the same key may each fetch it, which is harmless.
+        content = get_content()
+        assert isinstance(content, bytes), "Script content must be binary."
+        entry = len(content), _pad(content)
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = entry
+                self.size += len(entry[1])
+                while self.size > self.max_size and len(self.entries) > 1:
+                    _, (_, evicted) = self.entries.popitem(last=False)
+                    self.size -= len(evicted)
+        return entry
+
+    def clear(self):
+        """Forget all cached content."""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class ScriptArchive:
+    """An uncompressed tar archive, assembled from padded content.
+
+    Only each member's header is generated here; its content is written as
+    given, so content from a `ScriptContentCache` is never copied or
+    re-read. The result is the same as writing the files with `tarfile`.
+    """
+
+    def __init__(self, mtime):
+        super(ScriptArchive, self).__init__()
+        self.mtime = mtime
+        self.chunks = []
+
+    def add(self, path, size, padded, permission=0o755):
+        """Add a file at `path` with the given `size` and `padded` content."""
+        tarinfo = tarfile.TarInfo(name=path)
+        tarinfo.size = size
+        tarinfo.mode = permission
+        # Modification time defaults to Epoch, which elicits annoying
+        # warnings when decompressing.
+        tarinfo.mtime = self.mtime
+        self.chunks.append(tarinfo.tobuf(
+            tarfile.DEFAULT_FORMAT, tarfile.ENCODING, "surrogateescape"))
+        self.chunks.append(padded)
+
+    def add_file(self, path, content, permission=0o755):
+        """Add a file at `path` containing `content`."""
+        assert isinstance(content, bytes), "Script content must be binary."
+        self.add(path, len(content), _pad(content), permission)
+
+    def getvalue(self):
+        """Return the archive as a byte string."""
+        archive = b"".join(self.chunks)
+        # End the archive with two empty blocks, then pad it to a whole
+        # number of records, as `tarfile` does.
+        archive += tarfile.NUL * (tarfile.BLOCKSIZE * 2)
+        remainder = len(archive) % tarfile.RECORDSIZE
+        if remainder != 0:
+            archive += tarfile.NUL * (tarfile.RECORDSIZE - remainder)
+        return archive
+
+
+class SharedScriptArchiveCache:
+    """The most recent archive that is the same for every node.
+
+    The archive is identified by a key that changes whenever any of its
+    scripts do, and is given an ETag derived from the paths and content of
+    its files, so that it's the same in every region process.
+    """
+
+    def __init__(self):
+        super(SharedScriptArchiveCache, self).__init__()
+        # The key, ETag, and archive, replaced together so that concurrent
+        # requests never see a mixture of old and new.
+        self.cached = None, None, None
+
+    def get(self, key, get_files, mtime):
+        """Return the ETag and archive for `key`.
+
+        :param get_files: A callable that returns ``(path, content)`` pairs
+            for the archive's files; it's only called when `key` is not the
+            key of the cached archive.
+        :param mtime: The modification time for files in a new archive.
+        :return: An ``(etag, archive)`` tuple.
+        """
+        cached_key, etag, archive = self.cached
+        if key != cached_key:
+            builder = ScriptArchive(mtime)
+            digest = sha256()
+            for path, content in get_files():
+                builder.add_file(path, content)
+                digest.update(path.encode("utf-8") + b"\0")
+                digest.update(sha256(content).digest())
+            etag = '"%s"' % digest.hexdigest()
+            archive = builder.getvalue()
+            self.cached = key, etag, archive
+        return etag, archive
+
+    def clear(self):
+        """Forget the cached archive."""
+        self.cached = None, None, None
+
+
+# Script content shared by all requests in this process.
+script_content_cache = ScriptContentCache()
+
+# The archive served by the deprecated commissioning scripts endpoint.
+commissioning_archive_cache = SharedScriptArchiveCache()
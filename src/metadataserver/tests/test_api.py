@@ -93,6 +93,10 @@ from metadataserver.models import (
     NodeUserData,
 )
 from metadataserver.nodeinituser import get_node_init_user
+from metadataserver.script_archive import (
+    ScriptContentCache,
+    SharedScriptArchiveCache,
+)
 from netaddr import IPNetwork
 from provisioningserver.events import (
     EVENT_DETAILS,
@@ -1093,6 +1097,29 @@ class TestInstallingAPI(MAASServerTestCase):
 
 class TestMAASScripts(MAASServerTestCase):
 
+    def test__reads_script_content_once(self):
+        cache = self.patch(api, "script_content_cache", ScriptContentCache())
+        node = factory.make_Node(
+            status=NODE_STATUS.TESTING, with_empty_script_sets=True)
+        factory.make_ScriptResult(
+            script_set=node.current_testing_script_set,
+            script=factory.make_Script(script_type=SCRIPT_TYPE.TESTING),
+            status=SCRIPT_STATUS.PENDING)
+        script_count = (
+            node.current_testing_script_set.scriptresult_set.filter(
+                status=SCRIPT_STATUS.PENDING).count())
+        client = make_node_client(node=node)
+        first = client.get(reverse('maas-scripts', args=['latest']))
+        second = client.get(reverse('maas-scripts', args=['latest']))
+        self.expectThat(cache.misses, Equals(script_count))
+        self.expectThat(cache.hits, Equals(script_count))
+        self.expectThat(
+            tarfile.open(mode='r', fileobj=BytesIO(second.content))
+            .getnames(),
+            Equals(
+                tarfile.open(mode='r', fileobj=BytesIO(first.content))
+                .getnames()))
+
     def extract_and_validate_file(
             self, tar, path, start_time, end_time, content):
         member = tar.getmember(path)
@@ -1403,6 +1430,30 @@ class TestCommissioningAPI(MAASServerTestCase):
             text_script.script.data,
             archive.extractfile(path).read().decode('utf-8'))
 
+    def test_commissioning_scripts_sets_etag(self):
+        self.patch(
+            api, "commissioning_archive_cache", SharedScriptArchiveCache())
+        client = make_node_client()
+        url = reverse('commissioning-scripts', args=['latest'])
+        response = client.get(url)
+        etag = response['ETag']
+        self.expectThat(response.status_code, Equals(http.client.OK))
+        self.expectThat(client.get(url)['ETag'], Equals(etag))
+        self.expectThat(
+            client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            Equals(http.client.NOT_MODIFIED))
+
+    def test_commissioning_scripts_etag_changes_with_scripts(self):
+        self.patch(
+            api, "commissioning_archive_cache", SharedScriptArchiveCache())
+        client = make_node_client()
+        url = reverse('commissioning-scripts', args=['latest'])
+        etag = client.get(url)['ETag']
+        factory.make_Script(script_type=SCRIPT_TYPE.COMMISSIONING)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.expectThat(response.status_code, Equals(http.client.OK))
+        self.expectThat(response['ETag'], Not(Equals(etag)))
+
     def test_other_user_than_node_cannot_signal_commissioning_result(self):
         node = factory.make_Node(status=NODE_STATUS.COMMISSIONING)
         client = MAASSensibleOAuthClient(factory.make_User())
@@ -0,0 +1,111 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `metadataserver.script_archive`."""
+
+__all__ = []
+
+from io import BytesIO
+import tarfile
+from unittest.mock import Mock
+
+from maastesting.factory import factory
+from maastesting.matchers import MockCalledOnceWith
+from maastesting.testcase import MAASTestCase
+from metadataserver.script_archive import (
+    ScriptArchive,
+    ScriptContentCache,
+    SharedScriptArchiveCache,
+)
+from testtools.matchers import (
+    Equals,
+    Not,
+)
+
+
+class TestScriptContentCache(MAASTestCase):
+    """Tests for `ScriptContentCache`."""
+
+    def test_get_fetches_and_caches_padded_content(self):
+        get_content = Mock(return_value=b"script")
+        cache = ScriptContentCache()
+        size, padded = cache.get(("script", 1), get_content)
+        self.expectThat(size, Equals(6))
+        self.expectThat(len(padded), Equals(tarfile.BLOCKSIZE))
+        self.expectThat(padded, Equals(b"script".ljust(512, b"\0")))
+        self.expectThat(
+            cache.get(("script", 1), get_content), Equals((size, padded)))
+        self.expectThat(get_content, MockCalledOnceWith())
+        self.expectThat((cache.hits, cache.misses), Equals((1, 1)))
+
+    def test_get_evicts_least_recently_used_content(self):
+        cache = ScriptContentCache(max_size=tarfile.BLOCKSIZE * 2)
+        cache.get("a", lambda: b"a")
+        cache.get("b", lambda: b"b")
+        cache.get("a", lambda: b"a")
+        cache.get("c", lambda: b"c")
+        self.expectThat(list(cache.entries), Equals(["a", "c"]))
+        self.expectThat(cache.size, Equals(tarfile.BLOCKSIZE * 2))
+
+
+class TestScriptArchive(MAASTestCase):
+    """Tests for `ScriptArchive`."""
+
+    def test_getvalue_returns_tar_archive(self):
+        mtime = factory.pick_int(1, 2 ** 30)
+        cache = ScriptContentCache()
+        archive = ScriptArchive(mtime)
+        archive.add("testing/script", *cache.get(1, lambda: b"x" * 1000))
+        archive.add_file("index.json", b"{}", 0o644)
+        tar = tarfile.open(mode="r", fileobj=BytesIO(archive.getvalue()))
+        self.assertThat(
+            [(member.name, member.size, member.mode, member.mtime)
+             for member in tar.getmembers()],
+            Equals([
+                ("testing/script", 1000, 0o755, mtime),
+                ("index.json", 2, 0o644, mtime),
+            ]))
+        self.expectThat(
+            tar.extractfile("testing/script").read(), Equals(b"x" * 1000))
+        self.expectThat(tar.extractfile("index.json").read(), Equals(b"{}"))
+
+    def test_getvalue_pads_to_whole_records(self):
+        archive = ScriptArchive(0)
+        archive.add_file("script", b"content")
+        self.assertThat(
+            len(archive.getvalue()) % tarfile.RECORDSIZE, Equals(0))
+
+
+class TestSharedScriptArchiveCache(MAASTestCase):
+    """Tests for `SharedScriptArchiveCache`."""
+
+    def test_get_builds_archive_once_per_key(self):
+        get_files = Mock(return_value=[("script", b"content")])
+        cache = SharedScriptArchiveCache()
+        etag, archive = cache.get((1,), get_files, 0)
+        self.expectThat(cache.get((1,), get_files, 0), Equals((etag, archive)))
+        self.expectThat(get_files, MockCalledOnceWith())
+        tar = tarfile.open(mode="r", fileobj=BytesIO(archive))
+        self.expectThat(tar.extractfile("script").read(), Equals(b"content"))
+
+    def test_get_rebuilds_archive_when_key_changes(self):
+        cache = SharedScriptArchiveCache()
+        etag1, _ = cache.get((1,), lambda: [("script", b"one")], 0)
+        etag2, _ = cache.get((2,), lambda: [("script", b"two")], 0)
+        self.assertThat(etag1, Not(Equals(etag2)))
+
+    def test_etag_depends_on_files_not_mtime(self):
+        get_files = Mock(return_value=[("script", b"content")])
+        etag1, _ = SharedScriptArchiveCache().get((1,), get_files, 1)
+        etag2, _ = SharedScriptArchiveCache().get((2,), get_files, 2)
+        self.assertThat(etag1, Equals(etag2))
+
+    def test_clear_forgets_archive(self):
+        get_files = Mock(return_value=[])
+        cache = SharedScriptArchiveCache()
+        cache.get((1,), get_files, 0)
+        cache.clear()
+        self.expectThat(cache.cached, Equals((None, None, None)))
+        get_files.reset_mock()
+        cache.get((2,), get_files, 0)
+        self.expectThat(get_files, MockCalledOnceWith())
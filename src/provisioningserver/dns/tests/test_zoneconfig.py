@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for BIND zone config generation."""
@@ -8,9 +8,16 @@ __all__ = []
 from itertools import chain
 import os.path
 import random
+from unittest.mock import (
+    call,
+    Mock,
+)
 
 from maastesting.factory import factory
-from maastesting.matchers import MockNotCalled
+from maastesting.matchers import (
+    MockCallsMatch,
+    MockNotCalled,
+)
 from maastesting.testcase import MAASTestCase
 from netaddr import (
     IPAddress,
@@ -23,6 +30,8 @@ from provisioningserver.dns.zoneconfig import (
     DNSForwardZoneConfig,
     DNSReverseZoneConfig,
     DomainInfo,
+    encode_records,
+    StreamingMapping,
 )
 from testtools.matchers import (
     Contains,
@@ -31,6 +40,7 @@ from testtools.matchers import (
     FileContains,
     HasLength,
     MatchesStructure,
+    Not,
 )
 from twisted.python.filepath import FilePath
 
@@ -67,6 +77,45 @@ class HostnameRRsetMapping:
         return self.__dict__ == other.__dict__
 
 
+class TestStreamingMapping(MAASTestCase):
+    """Tests for `StreamingMapping`."""
+
+    def test_items_are_generated_for_network(self):
+        items = [(factory.make_name("host"), HostnameIPMapping())]
+        get_items = Mock(return_value=items)
+        mapping = StreamingMapping(get_items)
+        network = factory.make_ipv4_network()
+        self.assertEqual(items, mapping.items(network))
+        self.assertThat(get_items, MockCallsMatch(call(network)))
+
+    def test_behaves_as_mapping(self):
+        hostname = factory.make_name("host")
+        info = HostnameIPMapping(ttl=30)
+        mapping = StreamingMapping(lambda network: iter([(hostname, info)]))
+        self.expectThat(mapping, Equals({hostname: info}))
+        self.expectThat(mapping[hostname], Equals(info))
+        self.expectThat(list(mapping), Equals([hostname]))
+        self.expectThat(mapping, HasLength(1))
+        self.assertRaises(KeyError, lambda: mapping[factory.make_name()])
+
+
+class TestEncodeRecords(MAASTestCase):
+    """Tests for `encode_records`."""
+
+    def test_encodes_records_in_batches(self):
+        records = [
+            ("host%d" % index, 30, "A", "10.0.0.%d" % index)
+            for index in range(5)
+        ]
+        self.assertEqual(
+            [
+                b"host0 30 IN A 10.0.0.0\nhost1 30 IN A 10.0.0.1\n",
+                b"host2 30 IN A 10.0.0.2\nhost3 30 IN A 10.0.0.3\n",
+                b"host4 30 IN A 10.0.0.4\n",
+            ],
+            list(encode_records(iter(records), batch_size=2)))
+
+
 class TestDNSForwardZoneConfig(MAASTestCase):
     """Tests for DNSForwardZoneConfig."""
 
@@ -242,6 +291,21 @@ class TestDNSForwardZoneConfig(MAASTestCase):
             )
         )
 
+    def test_writes_dns_zone_config_from_streaming_mapping(self):
+        target_dir = patch_dns_config_path(self)
+        domain = factory.make_string()
+        hostname = factory.make_name('host')
+        ip = factory.make_ipv4_address()
+        mapping = StreamingMapping(lambda network: iter([
+            (hostname, HostnameIPMapping(None, 30, {ip})),
+        ]))
+        dns_zone_config = DNSForwardZoneConfig(
+            domain, serial=random.randint(1, 100), mapping=mapping)
+        dns_zone_config.write_config()
+        self.assertThat(
+            os.path.join(target_dir, 'zone.%s' % domain),
+            FileContains(matcher=Contains('%s 30 IN A %s' % (hostname, ip))))
+
     def test_writes_dns_zone_config_with_NS_record(self):
         target_dir = patch_dns_config_path(self)
         addr_ttl = random.randint(10, 100)
@@ -526,6 +590,27 @@ class TestDNSReverseZoneConfig(MAASTestCase):
                 os.path.join(target_dir, reverse_file_name),
                 FileContains(matcher=expected))
 
+    def test_streams_mapping_for_each_reverse_zone(self):
+        target_dir = patch_dns_config_path(self)
+        hostname = factory.make_name('host')
+        get_items = Mock(return_value=[
+            (hostname, HostnameIPMapping(None, 30, {'192.168.1.5'})),
+        ])
+        dns_zone_config = DNSReverseZoneConfig(
+            factory.make_string(), serial=random.randint(1, 100),
+            network=IPNetwork('192.168.0.0/23'),
+            mapping=StreamingMapping(get_items))
+        dns_zone_config.write_config()
+        self.assertThat(get_items, MockCallsMatch(
+            call(IPNetwork('192.168.0.0/24')),
+            call(IPNetwork('192.168.1.0/24'))))
+        self.assertThat(
+            os.path.join(target_dir, 'zone.0.168.192.in-addr.arpa'),
+            FileContains(matcher=Not(Contains(hostname))))
+        self.assertThat(
+            os.path.join(target_dir, 'zone.1.168.192.in-addr.arpa'),
+            FileContains(matcher=Contains('5 30 IN PTR %s.' % hostname)))
+
     def test_writes_reverse_dns_zone_config_for_small_network(self):
         target_dir = patch_dns_config_path(self)
         domain = factory.make_string()
@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Classes for generating BIND zone config files."""
@@ -7,9 +7,12 @@ __all__ = [
     'DNSForwardZoneConfig',
     'DNSReverseZoneConfig',
     'DomainInfo',
+    'StreamingMapping',
     ]
 
+from collections.abc import Mapping
 from datetime import datetime
+from functools import partial
 from itertools import chain
 
 from netaddr import (
@@ -39,13 +42,58 @@ def get_fqdn_or_ip_address(target):
         return target.rstrip('.') + '.'
 
 
-def enumerate_ip_mapping(mapping):
+# The number of records to encode and write to a zone file at a time.
+RECORDS_PER_WRITE = 1000
+
+
+class StreamingMapping(Mapping):
+    """A mapping of host names to info about the host, generated on demand.
+
+    Zone configs only ever iterate over their mappings, so a large mapping
+    can be generated afresh, from a database cursor for example, each time
+    a zone file is written, rather than held in memory.
+
+    Lookups and `len` iterate over the whole mapping, so are slow.
+
+    :param get_items: A callable that returns an iterable of ``(hostname,
+        info)`` pairs. It's called with the network for which a reverse zone
+        is being written, or with `None`, and may return hosts outside that
+        network; they're filtered out later.
+    """
+
+    def __init__(self, get_items):
+        super(StreamingMapping, self).__init__()
+        self.get_items = get_items
+
+    def items(self, network=None):
+        return self.get_items(network)
+
+    def __iter__(self):
+        return (hostname for hostname, _ in self.items())
+
+    def __getitem__(self, key):
+        for hostname, info in self.items():
+            if hostname == key:
+                return info
+        raise KeyError(key)
+
+    def __len__(self):
+        return sum(1 for _ in self.items())
+
+
+def enumerate_ip_mapping(mapping, network=None):
     """Generate `(hostname, ttl, value)` tuples from `mapping`.
 
     :param mapping: A dict mapping host names to info about the host:
         .ttl: ttl for the RRset, .ips: list of ip addresses.
+    :param network: Optional; the network of interest, passed on to a
+        `StreamingMapping` so it can leave out hosts outside it.
     """
-    for hostname, info in mapping.items():
+    if isinstance(mapping, StreamingMapping):
+        items = mapping.items(network)
+    else:
+        items = mapping.items()
+    for hostname, info in items:
         for value in info.ips:
             yield hostname, info.ttl, value
 
@@ -61,6 +109,21 @@ def enumerate_rrset_mapping(mapping):
             yield hostname, value[0], value[1], value[2]
 
 
+def encode_records(records, batch_size=RECORDS_PER_WRITE):
+    """Generate encoded zone file lines for `records`, a batch at a time.
+
+    :param records: An iterable of ``(name, ttl, rrtype, rrdata)`` tuples.
+    """
+    lines = []
+    for record in records:
+        lines.append("%s %s IN %s %s\n" % record)
+        if len(lines) >= batch_size:
+            yield "".join(lines).encode("utf-8")
+            lines = []
+    if len(lines) > 0:
+        yield "".join(lines).encode("utf-8")
+
+
 def get_details_for_ip_range(ip_range):
     """For a given IPRange, return all subnets, a useable prefix and the
     reverse DNS suffix calculated from that IP range.
@@ -164,21 +227,28 @@ class DomainConfigBase:
         }
 
     @classmethod
-    def write_zone_file(cls, output_file, *parameters):
+    def write_zone_file(cls, output_file, *parameters, records=None):
         """Write a zone file based on the zone file template.
 
         There is a subtlety with zone files: their filesystem timestamp must
         increase with every rewrite.  Some filesystems (ext3?) only seem to
         support a resolution of one second, and so this method may set an
         unexpected modification time in order to maintain that property.
+
+        :param records: Optional; a callable that returns an iterable of
+            ``(name, ttl, rrtype, rrdata)`` tuples. These are written after
+            the rendered template as they are generated, so a large zone is
+            never held in memory all at once.
         """
         if not isinstance(output_file, list):
             output_file = [output_file]
         for outfile in output_file:
             content = render_dns_template(cls.template_file_name, *parameters)
+            chunks = [content.encode("utf-8")]
+            if records is not None:
+                chunks = chain(chunks, encode_records(records()))
             with report_missing_config_dir():
-                incremental_write(content.encode("utf-8"), outfile, mode=0o644)
-        pass
+                incremental_write(chunks, outfile, mode=0o644)
 
 
 class DNSForwardZoneConfig(DomainConfigBase):
@@ -292,6 +362,19 @@ class DNSForwardZoneConfig(DomainConfigBase):
         return sorted(
             generate_directives, key=lambda directive: directive[2])
 
+    def get_records(self):
+        """Generate ``(name, ttl, rrtype, rrdata)`` tuples for the zone.
+
+        These are the A and AAAA records for the hosts in the mapping, in a
+        single pass over it, followed by the other records.
+        """
+        for hostname, ttl, ip in enumerate_ip_mapping(self._mapping):
+            if IPAddress(ip).version == 4:
+                yield hostname, ttl, 'A', ip
+            else:
+                yield hostname, ttl, 'AAAA', ip
+        yield from enumerate_rrset_mapping(self._other_mapping)
+
     def write_config(self):
         """Write the zone file."""
         # Create GENERATE directives for IPv4 ranges.
@@ -305,18 +388,11 @@ class DNSForwardZoneConfig(DomainConfigBase):
             self.write_zone_file(
                 zi.target_path, self.make_parameters(),
                 {
-                    'mappings': {
-                        'A': self.get_A_mapping(
-                            self._mapping, self._ipv4_ttl),
-                        'AAAA': self.get_AAAA_mapping(
-                            self._mapping, self._ipv6_ttl),
-                    },
-                    'other_mapping': enumerate_rrset_mapping(
-                        self._other_mapping),
                     'generate_directives': {
                         'A': generate_directives,
                     }
-                })
+                },
+                records=self.get_records)
 
 
 class DNSReverseZoneConfig(DomainConfigBase):
@@ -460,7 +536,7 @@ class DNSReverseZoneConfig(DomainConfigBase):
             return ()
         return (
             (short_name(ip, network), ttl, '%s.' % (hostname))
-            for hostname, ttl, ip in enumerate_ip_mapping(mapping)
+            for hostname, ttl, ip in enumerate_ip_mapping(mapping, network)
             # Filter out the IP addresses that are not in `network`.
             if IPAddress(ip) in network
         )
@@ -530,6 +606,13 @@ class DNSReverseZoneConfig(DomainConfigBase):
                 generate_directives.add((iterator, '${0,1,x}', hostname))
         return sorted(generate_directives)
 
+    def get_records(self, network):
+        """Generate ``(name, ttl, rrtype, rrdata)`` tuples for the PTR
+        records of the hosts in `network`."""
+        for short_name, ttl, hostname in self.get_PTR_mapping(
+                self._mapping, network):
+            yield short_name, ttl, 'PTR', hostname
+
     def write_config(self):
         """Write the zone file."""
         # Create GENERATE directives for IPv4 ranges.
@@ -546,11 +629,6 @@ class DNSReverseZoneConfig(DomainConfigBase):
             self.write_zone_file(
                 zi.target_path, self.make_parameters(),
                 {
-                    'mappings': {
-                        'PTR': self.get_PTR_mapping(
-                            self._mapping, zi.subnetwork),
-                    },
-                    'other_mapping': [],
                     'generate_directives': {
                         'PTR': generate_directives,
                         'CNAME': self.get_rfc2317_GENERATE_directives(
@@ -558,5 +636,6 @@ class DNSReverseZoneConfig(DomainConfigBase):
                             self._rfc2317_ranges,
                             self.domain),
                     }
-                }
+                },
+                records=partial(self.get_records, zi.subnetwork)
             )
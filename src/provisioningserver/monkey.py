@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """
@@ -29,6 +29,9 @@ def fix_tftp_requests():
 
        Specifically, look at addr[0] and pass iface to listenUDP based on that.
 
+       Read sessions also negotiate the ``windowsize`` option from RFC 7440;
+       see `WindowedRemoteOriginReadSession`.
+
        See https://bugs.launchpad.net/ubuntu/+source/python-tx-tftp/1614581
     """
     import tftp.protocol
@@ -43,10 +46,7 @@ def fix_tftp_requests():
         OP_RRQ,
         ERR_FILE_NOT_FOUND
     )
-    from tftp.bootstrap import (
-        RemoteOriginWriteSession,
-        RemoteOriginReadSession,
-    )
+    from tftp.bootstrap import RemoteOriginWriteSession
     from tftp.netascii import NetasciiReceiverProxy, NetasciiSenderProxy
     from twisted.internet import reactor
     from twisted.internet.defer import inlineCallbacks, returnValue
@@ -59,6 +59,7 @@ def fix_tftp_requests():
         FileNotFound,
     )
     from netaddr import IPAddress
+    from provisioningserver.utils.tftp import WindowedRemoteOriginReadSession
 
     @inlineCallbacks
     def new_startSession(self, datagram, addr, mode):
@@ -110,7 +111,7 @@ def fix_tftp_requests():
             elif datagram.opcode == OP_RRQ:
                 if mode == b'netascii':
                     fs_interface = NetasciiSenderProxy(fs_interface)
-                session = RemoteOriginReadSession(
+                session = WindowedRemoteOriginReadSession(
                     addr, fs_interface, datagram.options, _clock=self._clock)
                 reactor.listenUDP(0, session, iface)
                 returnValue(session)
@@ -1,19 +1,308 @@
-# Copyright 2015 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Twisted Application Plugin for the MAAS Boot Image server"""
 
 __all__ = [
+    "BootImageCache",
     "BootImageEndpointService",
+    "BootImageMetricsResource",
+    "BootImageResource",
+    "BootImageTransfers",
     ]
 
+from collections import (
+    Counter,
+    OrderedDict,
+)
+from io import BytesIO
+
+from provisioningserver.logger import LegacyLogger
 from provisioningserver.utils.twisted import reducedWebLogFormatter
 from twisted.application.internet import StreamServerEndpointService
+from twisted.internet.defer import succeed
+from twisted.internet.threads import deferToThread
+from twisted.web import http
 from twisted.web.resource import Resource
-from twisted.web.server import Site
+from twisted.web.server import (
+    NOT_DONE_YET,
+    Site,
+)
 from twisted.web.static import File
 
 
+log = LegacyLogger()
+
+# Files up to this size are candidates for the in-memory cache. This covers
+# bootloaders, kernels, and most of their configuration, but not initrds or
+# root filesystem images.
+max_cached_file_size = 16 * 1024 * 1024
+
+# The most memory the cache of boot image files may use.
+max_cache_size = 128 * 1024 * 1024
+
+# The number of concurrent transfers allowed to a single client.
+max_transfers_per_client = 8
+
+
+class BootImageCache:
+    """Small, frequently served boot image files, held in memory.
+
+    Entries are keyed by path and validated against the file's inode, size,
+    and modification time, so a replaced file is read afresh. The least
+    recently used entries are evicted first.
+
+    :ivar hits: The number of times a file was served from memory.
+    :ivar misses: The number of times a cacheable file was read from disk.
+    """
+
+    def __init__(
+            self, max_file_size=max_cached_file_size,
+            max_size=max_cache_size):
+        super(BootImageCache, self).__init__()
+        self.max_file_size = max_file_size
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, filepath):
+        """Return the contents of the file at `filepath`, or `None`.
+
+        Files that are not in the cache are read in a thread, so as not to
+        block the reactor.
+
+        :param filepath: A `FilePath`, recently stat'ed.
+        :return: A `Deferred` that fires with the contents as a byte string,
+            or with `None` if the file is too large to be cached, or changed
+            while it was being read.
+        """
+        size = filepath.getsize()
+        if size > self.max_file_size:
+            return succeed(None)
+        path = filepath.path
+        version = _get_version(filepath)
+        entry = self.entries.get(path)
+        if entry is not None:
+            if entry[0] == version:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return succeed(entry[1])
+            else:
+                self.discard(path)
+        self.misses += 1
+        d = deferToThread(_read_file, path, self.max_file_size + 1)
+        d.addCallback(self._add, path, version, size)
+        return d
+
+    def _add(self, content, path, version, size):
+        if len(content) == size:
+            # Another read of this file may have finished first.
+            self.discard(path)
+            self.entries[path] = version, content
+            self.size += len(content)
+            while self.size > self.max_size:
+                self.discard(next(iter(self.entries)))
+            return content
+        else:
+            # The file changed since it was stat'ed; don't trust it.
+            return None
+
+    def discard(self, path):
+        """Forget the cached contents of the file at `path`."""
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+class BootImageTransfers:
+    """Track transfers of boot image files, and limit them per client.
+
+    :ivar active: A `Counter` of in-progress transfers, keyed by client.
+    :ivar requests: The number of transfers started.
+    :ivar rejected: The number of transfers refused for being over limit.
+    :ivar not_modified: The number of requests answered with 304.
+    :ivar bytes_sent: The number of bytes sent by completed transfers.
+    """
+
+    def __init__(self, limit=max_transfers_per_client):
+        super(BootImageTransfers, self).__init__()
+        self.limit = limit
+        self.active = Counter()
+        self.requests = 0
+        self.rejected = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+
+    def start(self, client):
+        """Start a transfer to `client`, if it's within its limit.
+
+        :return: True if the transfer may proceed, False otherwise.
+        """
+        if self.active[client] >= self.limit:
+            self.rejected += 1
+            return False
+        else:
+            self.active[client] += 1
+            self.requests += 1
+            return True
+
+    def finish(self, client, sent):
+        """Finish a transfer to `client` that sent `sent` bytes."""
+        self.active[client] -= 1
+        if self.active[client] <= 0:
+            del self.active[client]
+        self.bytes_sent += sent
+
+
+def _read_file(path, limit):
+    """Read at most `limit` bytes from the file at `path`."""
+    with open(path, "rb") as fd:
+        return fd.read(limit)
+
+
+def _get_version(filepath):
+    """Return the inode, size, and modification time of `filepath`.
+
+    These change when the file is modified or replaced.
+    """
+    return (
+        filepath.getInodeNumber(), filepath.getsize(),
+        int(filepath.getModificationTime() * 1000000))
+
+
+def _matches_etag(if_none_match, etag):
+    """Does the `If-None-Match` header value match `etag`?"""
+    if if_none_match is None:
+        return False
+    candidates = (
+        candidate.strip() for candidate in if_none_match.split(b","))
+    return any(
+        candidate in (b"*", etag, b"W/" + etag)
+        for candidate in candidates)
+
+
+class BootImageResource(File):
+    """Serve boot image files.
+
+    This extends Twisted's `File` resource, which already supports ranges,
+    with:
+
+    - strong ETags, and ``If-None-Match`` requests answered with 304;
+
+    - small files served from a shared `BootImageCache`, which reads them
+      in a thread, so the response is rendered asynchronously;
+
+    - a limit on concurrent transfers per client, beyond which requests are
+      answered with 503 and a ``Retry-After`` header.
+    """
+
+    def __init__(self, path, *args, cache=None, transfers=None, **kwargs):
+        super(BootImageResource, self).__init__(path, *args, **kwargs)
+        self.cache = BootImageCache() if cache is None else cache
+        self.transfers = (
+            BootImageTransfers() if transfers is None else transfers)
+        self.cached_content = None
+
+    def createSimilarFile(self, path):
+        child = super(BootImageResource, self).createSimilarFile(path)
+        child.cache, child.transfers = self.cache, self.transfers
+        return child
+
+    def getETag(self):
+        """Return a strong ETag for this file."""
+        return b'"%x-%x-%x"' % _get_version(self)
+
+    def openForReading(self):
+        if self.cached_content is None:
+            return super(BootImageResource, self).openForReading()
+        else:
+            return BytesIO(self.cached_content)
+
+    def render_GET(self, request):
+        self.restat(False)
+        if not self.isfile():
+            # Let `File` deal with directories and missing files.
+            return super(BootImageResource, self).render_GET(request)
+
+        etag = self.getETag()
+        request.setHeader(b"etag", etag)
+        if _matches_etag(request.getHeader(b"if-none-match"), etag):
+            self.transfers.not_modified += 1
+            request.setResponseCode(http.NOT_MODIFIED)
+            return b""
+
+        client = request.getClientIP()
+        if not self.transfers.start(client):
+            request.setResponseCode(http.SERVICE_UNAVAILABLE)
+            request.setHeader(b"retry-after", b"1")
+            return b""
+
+        def finished(_):
+            self.transfers.finish(client, request.sentLength)
+
+        done = request.notifyFinish()
+        done.addBoth(finished)
+        d = self.cache.get(self)
+        # Serve from disk if the file can't be read into the cache.
+        d.addErrback(log.err, "Failed to read boot image file into cache.")
+        d.addCallback(self._render_content, request, done)
+        return NOT_DONE_YET
+
+    def _render_content(self, content, request, done):
+        if done.called:
+            return  # The client went away.
+        self.cached_content = content
+        body = super(BootImageResource, self).render_GET(request)
+        if body is not NOT_DONE_YET:
+            request.write(body)
+            request.finish()
+
+
+class BootImageMetricsResource(Resource):
+    """Render boot image transfer metrics in Prometheus' text format."""
+
+    isLeaf = True
+
+    def __init__(self, cache, transfers):
+        super(BootImageMetricsResource, self).__init__()
+        self.cache = cache
+        self.transfers = transfers
+
+    def render_GET(self, request):
+        request.setHeader(
+            b"Content-Type", b"text/plain; version=0.0.4; charset=utf-8")
+        metrics = (
+            ("maas_rack_image_transfers_total", "counter",
+             "Boot image transfers started.", self.transfers.requests),
+            ("maas_rack_image_transfers_active", "gauge",
+             "Boot image transfers in progress.",
+             sum(self.transfers.active.values())),
+            ("maas_rack_image_transfers_rejected_total", "counter",
+             "Boot image transfers refused for exceeding a client's limit.",
+             self.transfers.rejected),
+            ("maas_rack_image_not_modified_total", "counter",
+             "Boot image requests answered with 304 Not Modified.",
+             self.transfers.not_modified),
+            ("maas_rack_image_sent_bytes_total", "counter",
+             "Bytes sent by completed boot image transfers.",
+             self.transfers.bytes_sent),
+            ("maas_rack_image_cache_hits_total", "counter",
+             "Boot image files served from memory.", self.cache.hits),
+            ("maas_rack_image_cache_misses_total", "counter",
+             "Cacheable boot image files read from disk.", self.cache.misses),
+            ("maas_rack_image_cache_bytes", "gauge",
+             "Memory used by cached boot image files.", self.cache.size),
+        )
+        lines = []
+        for name, kind, documentation, value in metrics:
+            lines.append("# HELP %s %s" % (name, documentation))
+            lines.append("# TYPE %s %s" % (name, kind))
+            lines.append("%s %d" % (name, value))
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
 class BootImageEndpointService(StreamServerEndpointService):
     """Service for serving images to the TFTP server via HTTP
 
@@ -27,7 +316,11 @@ class BootImageEndpointService(StreamServerEndpointService):
         :param endpoint: The endpoint on which the server should listen.
 
         """
+        cache, transfers = BootImageCache(), BootImageTransfers()
         resource = Resource()
-        resource.putChild(b'images', File(resource_root))
+        resource.putChild(b'images', BootImageResource(
+            resource_root, cache=cache, transfers=transfers))
+        resource.putChild(
+            b'metrics', BootImageMetricsResource(cache, transfers))
         self.site = Site(resource, logFormatter=reducedWebLogFormatter)
         super(BootImageEndpointService, self).__init__(endpoint, self.site)
@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Service to periodically check that all the other services that MAAS depends
@@ -54,12 +54,22 @@ class ServiceMonitorService(TimerService, object):
 
     check_interval = timedelta(minutes=1).total_seconds()
 
+    # Between checks only the services whose status has changed are reported.
+    # Every service is reported at least this often, in case the region's
+    # record of them has been changed some other way.
+    full_report_interval = timedelta(minutes=10).total_seconds()
+
     def __init__(self, client_service, clock):
         # Call self.monitorServices() every self.check_interval.
         super(ServiceMonitorService, self).__init__(
             self.check_interval, self.monitorServices)
         self.client_service = client_service
         self.clock = clock
+        # The services last reported to the region, by name, when every
+        # service was last reported, and the client they were reported with.
+        self._reported = {}
+        self._reported_all_at = None
+        self._reported_to = None
 
     def monitorServices(self):
         """Monitors all of the external services and makes sure they
@@ -90,12 +100,45 @@ class ServiceMonitorService(TimerService, object):
             maaslog.error(
                 "Can't update service statuses, no RPC "
                 "connection to region.")
+            # The region may have marked the services dead meanwhile.
+            self._forgetReported()
             return
+        if client != self._reported_to:
+            # This is a different connection, perhaps to another region, which
+            # may have marked the services dead when the last one was lost.
+            self._forgetReported()
         services = yield self._buildServices(services)
-        yield client(
-            UpdateServices,
-            system_id=client.localIdent,
-            services=services)
+        now = self.clock.seconds()
+        report_all = (
+            self._reported_all_at is None or
+            now - self._reported_all_at >= self.full_report_interval)
+        if not report_all:
+            services = [
+                service for service in services
+                if self._reported.get(service["name"]) != service
+            ]
+            if len(services) == 0:
+                return
+        try:
+            yield client(
+                UpdateServices,
+                system_id=client.localIdent,
+                services=services)
+        except:
+            self._forgetReported()
+            raise
+        else:
+            self._reported.update(
+                (service["name"], service) for service in services)
+            self._reported_to = client
+            if report_all:
+                self._reported_all_at = now
+
+    def _forgetReported(self):
+        """Report every service next time."""
+        self._reported.clear()
+        self._reported_all_at = None
+        self._reported_to = None
 
     @inlineCallbacks
     def _buildServices(self, services):
@@ -0,0 +1,286 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `provisioningserver.rackdservices.image`."""
+
+__all__ = []
+
+import os
+
+from maastesting.factory import factory
+from maastesting.testcase import (
+    MAASTestCase,
+    MAASTwistedRunTest,
+)
+from maastesting.twisted import (
+    extract_result,
+    TwistedLoggerFixture,
+)
+from provisioningserver.rackdservices import image as image_module
+from provisioningserver.rackdservices.image import (
+    BootImageCache,
+    BootImageMetricsResource,
+    BootImageResource,
+    BootImageTransfers,
+)
+from testtools.matchers import (
+    Contains,
+    Equals,
+    Is,
+    IsInstance,
+    Not,
+)
+from twisted.internet.address import IPv4Address
+from twisted.internet.defer import (
+    Deferred,
+    inlineCallbacks,
+    returnValue,
+)
+from twisted.python.filepath import FilePath
+from twisted.web import http
+from twisted.web.server import NOT_DONE_YET
+from twisted.web.test.requesthelper import DummyRequest
+
+
+def make_request(client="192.168.1.10", headers=None):
+    request = DummyRequest([b""])
+    request.client = IPv4Address("TCP", client, 12345)
+    request.sentLength = 0
+    for name, value in ({} if headers is None else headers).items():
+        request.requestHeaders.setRawHeaders(name, [value])
+    return request
+
+
+@inlineCallbacks
+def render(resource, request):
+    """Render `resource` and return the body that was written."""
+    result = resource.render(request)
+    if result is NOT_DONE_YET:
+        if not request.finished:
+            yield request.notifyFinish()
+    else:
+        request.write(result)
+        request.finish()
+    returnValue(b"".join(request.written))
+
+
+class TestBootImageCache(MAASTestCase):
+    """Tests for `BootImageCache`."""
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    @inlineCallbacks
+    def test_get_reads_and_caches_file(self):
+        contents = factory.make_bytes()
+        filepath = FilePath(self.make_file(contents=contents))
+        cache = BootImageCache()
+        self.expectThat((yield cache.get(filepath)), Equals(contents))
+        self.expectThat((yield cache.get(filepath)), Equals(contents))
+        self.expectThat(cache.misses, Equals(1))
+        self.expectThat(cache.hits, Equals(1))
+        self.expectThat(cache.size, Equals(len(contents)))
+
+    def test_get_reads_files_in_a_thread(self):
+        deferToThread = self.patch(image_module, "deferToThread")
+        deferToThread.return_value = Deferred()
+        filepath = FilePath(self.make_file(contents=b"boot image"))
+        cache = BootImageCache()
+        d = cache.get(filepath)
+        self.expectThat(d.called, Is(False))
+        deferToThread.return_value.callback(b"boot image")
+        self.expectThat(d.result, Equals(b"boot image"))
+        self.expectThat(cache.size, Equals(10))
+
+    def test_get_serves_cached_files_without_a_thread(self):
+        filepath = FilePath(self.make_file(contents=b"boot image"))
+        cache = BootImageCache()
+        cache._add(
+            b"boot image", filepath.path,
+            image_module._get_version(filepath), 10)
+        deferToThread = self.patch(image_module, "deferToThread")
+        self.expectThat(cache.get(filepath).result, Equals(b"boot image"))
+        self.expectThat(deferToThread.called, Is(False))
+
+    @inlineCallbacks
+    def test_get_rereads_modified_file(self):
+        path = self.make_file(contents=b"old")
+        cache = BootImageCache()
+        yield cache.get(FilePath(path))
+        with open(path, "wb") as fd:
+            fd.write(b"newer")
+        os.utime(path, (0, 0))
+        self.expectThat((yield cache.get(FilePath(path))), Equals(b"newer"))
+        self.expectThat(cache.misses, Equals(2))
+        self.expectThat(cache.size, Equals(5))
+
+    @inlineCallbacks
+    def test_get_does_not_cache_large_files(self):
+        filepath = FilePath(self.make_file(contents=b"x" * 11))
+        cache = BootImageCache(max_file_size=10)
+        self.expectThat((yield cache.get(filepath)), Is(None))
+        self.expectThat(cache.entries, Equals({}))
+
+    @inlineCallbacks
+    def test_get_evicts_least_recently_used_files(self):
+        paths = [FilePath(self.make_file(contents=b"x" * 4)) for _ in "abc"]
+        cache = BootImageCache(max_file_size=4, max_size=8)
+        yield cache.get(paths[0])
+        yield cache.get(paths[1])
+        yield cache.get(paths[0])
+        yield cache.get(paths[2])
+        self.expectThat(
+            list(cache.entries), Equals([paths[0].path, paths[2].path]))
+        self.expectThat(cache.size, Equals(8))
+
+
+class TestBootImageTransfers(MAASTestCase):
+    """Tests for `BootImageTransfers`."""
+
+    def test_start_limits_transfers_per_client(self):
+        transfers = BootImageTransfers(limit=2)
+        self.expectThat(transfers.start("a"), Is(True))
+        self.expectThat(transfers.start("a"), Is(True))
+        self.expectThat(transfers.start("a"), Is(False))
+        self.expectThat(transfers.start("b"), Is(True))
+        self.expectThat(transfers.requests, Equals(3))
+        self.expectThat(transfers.rejected, Equals(1))
+
+    def test_finish_frees_slot_and_counts_bytes(self):
+        transfers = BootImageTransfers(limit=1)
+        transfers.start("a")
+        transfers.finish("a", 1234)
+        self.expectThat(transfers.active, Equals({}))
+        self.expectThat(transfers.bytes_sent, Equals(1234))
+        self.expectThat(transfers.start("a"), Is(True))
+
+
+class TestBootImageResource(MAASTestCase):
+    """Tests for `BootImageResource`."""
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def make_resource(self, contents=b"boot image", **kwargs):
+        root = self.make_dir()
+        factory.make_file(root, "bootx64.efi", contents)
+        resource = BootImageResource(root, **kwargs)
+        return resource.getChild(b"bootx64.efi", make_request())
+
+    def test_children_share_cache_and_transfers(self):
+        resource = self.make_resource()
+        self.expectThat(resource, IsInstance(BootImageResource))
+        self.expectThat(resource.cache, IsInstance(BootImageCache))
+        self.expectThat(resource.transfers, IsInstance(BootImageTransfers))
+        child = resource.createSimilarFile(resource.path)
+        self.expectThat(child.cache, Is(resource.cache))
+        self.expectThat(child.transfers, Is(resource.transfers))
+
+    @inlineCallbacks
+    def test_serves_file_from_cache_with_etag(self):
+        resource = self.make_resource(contents=b"boot image")
+        request = make_request()
+        self.expectThat(
+            (yield render(resource, request)), Equals(b"boot image"))
+        self.expectThat(
+            request.responseHeaders.getRawHeaders(b"etag"),
+            Equals([resource.getETag()]))
+        yield render(resource, make_request())
+        self.expectThat(resource.cache.hits, Equals(1))
+
+    def test_does_not_block_while_reading_file(self):
+        deferToThread = self.patch(image_module, "deferToThread")
+        deferToThread.return_value = Deferred()
+        resource = self.make_resource(contents=b"boot image")
+        request = make_request()
+        self.expectThat(resource.render(request), Is(NOT_DONE_YET))
+        self.expectThat(request.written, Equals([]))
+        deferToThread.return_value.callback(b"boot image")
+        self.expectThat(request.written, Equals([b"boot image"]))
+        self.expectThat(request.finished, Equals(1))
+
+    def test_does_not_render_after_client_goes_away(self):
+        deferToThread = self.patch(image_module, "deferToThread")
+        deferToThread.return_value = Deferred()
+        resource = self.make_resource(contents=b"boot image")
+        request = make_request()
+        resource.render(request)
+        request.processingFailed(Exception("Connection lost."))
+        deferToThread.return_value.callback(b"boot image")
+        self.expectThat(request.written, Equals([]))
+        self.expectThat(resource.transfers.active, Equals({}))
+
+    @inlineCallbacks
+    def test_serves_file_from_disk_when_cache_read_fails(self):
+        deferToThread = self.patch(image_module, "deferToThread")
+        deferToThread.return_value = Deferred()
+        resource = self.make_resource(contents=b"boot image")
+        request = make_request()
+        d = render(resource, request)
+        with TwistedLoggerFixture() as logger:
+            deferToThread.return_value.errback(OSError("Disk on fire."))
+        self.expectThat((yield d), Equals(b"boot image"))
+        self.expectThat(logger.output, Contains(
+            "Failed to read boot image file into cache."))
+
+    @inlineCallbacks
+    def test_serves_ranges(self):
+        resource = self.make_resource(contents=b"boot image")
+        request = make_request(headers={b"range": b"bytes=5-9"})
+        self.expectThat((yield render(resource, request)), Equals(b"image"))
+        self.expectThat(request.responseCode, Equals(http.PARTIAL_CONTENT))
+
+    @inlineCallbacks
+    def test_answers_matching_if_none_match_with_not_modified(self):
+        resource = self.make_resource()
+        request = make_request(headers={
+            b"if-none-match": b'"other", ' + resource.getETag()})
+        self.expectThat((yield render(resource, request)), Equals(b""))
+        self.expectThat(request.responseCode, Equals(http.NOT_MODIFIED))
+        self.expectThat(resource.transfers.not_modified, Equals(1))
+
+    @inlineCallbacks
+    def test_serves_file_when_if_none_match_does_not_match(self):
+        resource = self.make_resource(contents=b"boot image")
+        request = make_request(headers={b"if-none-match": b'"other"'})
+        self.expectThat(
+            (yield render(resource, request)), Equals(b"boot image"))
+        self.expectThat(request.responseCode, Not(Equals(http.NOT_MODIFIED)))
+
+    @inlineCallbacks
+    def test_refuses_clients_over_their_limit(self):
+        transfers = BootImageTransfers(limit=1)
+        resource = self.make_resource(transfers=transfers)
+        transfers.start("192.168.1.10")
+        request = make_request(client="192.168.1.10")
+        self.expectThat((yield render(resource, request)), Equals(b""))
+        self.expectThat(
+            request.responseCode, Equals(http.SERVICE_UNAVAILABLE))
+        self.expectThat(
+            request.responseHeaders.getRawHeaders(b"retry-after"),
+            Equals([b"1"]))
+        self.expectThat(
+            (yield render(resource, make_request(client="192.168.1.11"))),
+            Equals(b"boot image"))
+
+    @inlineCallbacks
+    def test_frees_transfer_slot_when_finished(self):
+        resource = self.make_resource()
+        yield render(resource, make_request())
+        self.expectThat(resource.transfers.requests, Equals(1))
+        self.expectThat(resource.transfers.active, Equals({}))
+
+
+class TestBootImageMetricsResource(MAASTestCase):
+    """Tests for `BootImageMetricsResource`."""
+
+    def test_renders_metrics(self):
+        cache, transfers = BootImageCache(), BootImageTransfers()
+        transfers.start("192.168.1.10")
+        transfers.finish("192.168.1.10", 1234)
+        resource = BootImageMetricsResource(cache, transfers)
+        content = extract_result(
+            render(resource, make_request())).decode("utf-8")
+        self.expectThat(content, Contains(
+            "# TYPE maas_rack_image_transfers_total counter\n"
+            "maas_rack_image_transfers_total 1\n"))
+        self.expectThat(content, Contains(
+            "maas_rack_image_sent_bytes_total 1234\n"))
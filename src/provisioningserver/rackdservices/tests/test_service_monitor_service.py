@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for
@@ -34,7 +34,11 @@ from provisioningserver.utils.service_monitor import (
     SERVICE_STATE,
     ServiceState,
 )
-from testtools.matchers import MatchesStructure
+from testtools import ExpectedException
+from testtools.matchers import (
+    Equals,
+    MatchesStructure,
+)
 from twisted.internet.defer import (
     fail,
     inlineCallbacks,
@@ -148,6 +152,87 @@ class TestServiceMonitorService(MAASTestCase):
                 system_id=client.localIdent,
                 services=expected_services))
 
+    def make_monitor_service_and_client(self):
+        client = Mock()
+        client.return_value = succeed(None)
+        rpc_service = Mock()
+        rpc_service.getClientNow.return_value = succeed(client)
+        monitor_service = sms.ServiceMonitorService(rpc_service, Clock())
+        return monitor_service, client
+
+    def get_reported_services(self, client):
+        [_, _, kwargs] = client.mock_calls[-1]
+        return kwargs["services"]
+
+    @inlineCallbacks
+    def test__updateRegion_reports_only_changed_services(self):
+        monitor_service, client = self.make_monitor_service_and_client()
+        service = self.pick_service()
+        yield monitor_service._updateRegion({
+            service.name: ServiceState(SERVICE_STATE.ON, "running")})
+        self.assertThat(client.call_count, Equals(1))
+        # Nothing has changed, so nothing is reported.
+        yield monitor_service._updateRegion({
+            service.name: ServiceState(SERVICE_STATE.ON, "running")})
+        self.assertThat(client.call_count, Equals(1))
+        # Only the changed service is reported.
+        yield monitor_service._updateRegion({
+            service.name: ServiceState(SERVICE_STATE.DEAD, "Result: fail")})
+        self.assertThat(client.call_count, Equals(2))
+        self.assertThat(
+            [reported["name"]
+             for reported in self.get_reported_services(client)],
+            Equals([service.name]))
+
+    @inlineCallbacks
+    def test__updateRegion_reports_all_services_periodically(self):
+        monitor_service, client = self.make_monitor_service_and_client()
+        service = self.pick_service()
+        services = {service.name: ServiceState(SERVICE_STATE.ON, "running")}
+        yield monitor_service._updateRegion(services)
+        monitor_service.clock.advance(monitor_service.full_report_interval)
+        yield monitor_service._updateRegion(services)
+        self.assertThat(client.call_count, Equals(2))
+        expected_services = yield monitor_service._buildServices(services)
+        self.assertThat(
+            self.get_reported_services(client), Equals(expected_services))
+
+    @inlineCallbacks
+    def test__updateRegion_reports_all_services_after_failure(self):
+        monitor_service, client = self.make_monitor_service_and_client()
+        service = self.pick_service()
+        services = {service.name: ServiceState(SERVICE_STATE.ON, "running")}
+        yield monitor_service._updateRegion(services)
+        client.return_value = fail(factory.make_exception())
+        with ExpectedException(Exception):
+            yield monitor_service._updateRegion({
+                service.name: ServiceState(SERVICE_STATE.OFF, "dead")})
+        client.return_value = succeed(None)
+        yield monitor_service._updateRegion(services)
+        self.assertThat(client.call_count, Equals(3))
+        expected_services = yield monitor_service._buildServices(services)
+        self.assertThat(
+            self.get_reported_services(client), Equals(expected_services))
+
+    @inlineCallbacks
+    def test__updateRegion_reports_all_services_after_reconnecting(self):
+        monitor_service, client = self.make_monitor_service_and_client()
+        service = self.pick_service()
+        services = {service.name: ServiceState(SERVICE_STATE.ON, "running")}
+        yield monitor_service._updateRegion(services)
+        # The same services are reported over a new connection.
+        new_client = Mock()
+        new_client.return_value = succeed(None)
+        monitor_service.client_service.getClientNow.return_value = (
+            succeed(new_client))
+        yield monitor_service._updateRegion(services)
+        self.assertThat(client.call_count, Equals(1))
+        self.assertThat(new_client.call_count, Equals(1))
+        expected_services = yield monitor_service._buildServices(services)
+        self.assertThat(
+            self.get_reported_services(new_client),
+            Equals(expected_services))
+
     @inlineCallbacks
     def test__buildServices_includes_always_running_services(self):
         monitor_service = sms.ServiceMonitorService(
@@ -1,4 +1,4 @@
-# Copyright 2012-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2012-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for the maastftp Twisted plugin."""
@@ -29,7 +29,10 @@ from maastesting.testcase import (
     MAASTestCase,
     MAASTwistedRunTest,
 )
-from maastesting.twisted import TwistedLoggerFixture
+from maastesting.twisted import (
+    extract_result,
+    TwistedLoggerFixture,
+)
 from netaddr import IPNetwork
 from netaddr.ip import (
     IPV4_LINK_LOCAL,
@@ -40,7 +43,9 @@ from provisioningserver.boot.pxe import PXEBootMethod
 from provisioningserver.boot.tests.test_pxe import compose_config_path
 from provisioningserver.events import EVENT_TYPES
 from provisioningserver.rackdservices import tftp as tftp_module
+from provisioningserver.rackdservices.image import BootImageCache
 from provisioningserver.rackdservices.tftp import (
+    CachedFileReader,
     get_boot_image,
     log_request,
     Port,
@@ -66,7 +71,10 @@ from testtools.matchers import (
     MatchesAll,
     MatchesStructure,
 )
-from tftp.backend import IReader
+from tftp.backend import (
+    FilesystemReader,
+    IReader,
+)
 from tftp.errors import (
     BackendError,
     FileNotFound,
@@ -244,6 +252,30 @@ class TestTFTPBackend(MAASTestCase):
         self.assertEqual(data, reader.read(len(data)))
         self.assertEqual(b"", reader.read(1))
 
+    @inlineCallbacks
+    def test_get_reader_serves_small_files_from_cache(self):
+        self.patch(tftp_module, 'get_remote_mac')
+        data = factory.make_string().encode("ascii")
+        temp_file = self.make_file(name="example", contents=data)
+        backend = TFTPBackend(os.path.dirname(temp_file), Mock())
+        yield backend.get_reader(b"example")
+        reader = yield backend.get_reader(b"example")
+        self.addCleanup(reader.finish)
+        self.assertThat(reader, IsInstance(CachedFileReader))
+        self.assertEqual(data, reader.read(len(data)))
+        self.assertEqual(1, backend.file_cache.hits)
+
+    @inlineCallbacks
+    def test_get_reader_serves_large_files_from_filesystem(self):
+        self.patch(tftp_module, 'get_remote_mac')
+        temp_file = self.make_file(name="example", contents=b"x" * 11)
+        backend = TFTPBackend(
+            os.path.dirname(temp_file), Mock(),
+            file_cache=BootImageCache(max_file_size=10))
+        reader = yield backend.get_reader(b"example")
+        self.addCleanup(reader.finish)
+        self.assertThat(reader, IsInstance(FilesystemReader))
+
     @inlineCallbacks
     def test_get_reader_handles_backslashes_in_path(self):
         self.patch(tftp_module, 'get_remote_mac')
@@ -639,6 +671,54 @@ class TestTFTPBackend(MAASTestCase):
             backend.fetcher, MockCalledOnceWith(
                 client, GetBootConfig, **params_okay))
 
+    def test_get_kernel_params_caches_boot_config(self):
+        params = {
+            name.decode("ascii"): factory.make_name("value")
+            for name, _ in GetBootConfig.arguments
+        }
+
+        client = Mock()
+        client.localIdent = params["system_id"]
+        client_service = Mock()
+        client_service.getClientNow.return_value = succeed(client)
+
+        backend = TFTPBackend(self.make_dir(), client_service)
+        kernel_params = make_kernel_parameters()
+        backend.fetcher = Mock(return_value=succeed(kernel_params._asdict()))
+        self.patch(backend, "get_boot_image").side_effect = (
+            lambda params, client, remote_ip: params)
+
+        first = extract_result(backend.get_kernel_params(dict(params)))
+        second = extract_result(backend.get_kernel_params(dict(params)))
+
+        self.expectThat(backend.fetcher, MockCalledOnceWith(
+            client, GetBootConfig, **params))
+        self.expectThat(first, Equals(kernel_params))
+        self.expectThat(second, Equals(kernel_params))
+
+    def test_get_kernel_params_refetches_after_invalidation(self):
+        params = {
+            name.decode("ascii"): factory.make_name("value")
+            for name, _ in GetBootConfig.arguments
+        }
+
+        client = Mock()
+        client.localIdent = params["system_id"]
+        client_service = Mock()
+        client_service.getClientNow.return_value = succeed(client)
+
+        backend = TFTPBackend(self.make_dir(), client_service)
+        backend.fetcher = Mock(side_effect=lambda *args, **kwargs: succeed(
+            make_kernel_parameters()._asdict()))
+        self.patch(backend, "get_boot_image").side_effect = (
+            lambda params, client, remote_ip: params)
+
+        extract_result(backend.get_kernel_params(dict(params)))
+        backend.boot_config_cache.invalidate([params["mac"]])
+        extract_result(backend.get_kernel_params(dict(params)))
+
+        self.assertThat(backend.fetcher.call_count, Equals(2))
+
 
 class TestTFTPService(MAASTestCase):
 
@@ -1,9 +1,10 @@
-# Copyright 2012-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2012-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Twisted Application Plugin for the MAAS TFTP server."""
 
 __all__ = [
+    "CachedFileReader",
     "TFTPBackend",
     "TFTPService",
     ]
@@ -17,6 +18,7 @@ from socket import (
 from netaddr import IPAddress
 from provisioningserver.boot import (
     BootMethodRegistry,
+    BytesReader,
     get_remote_mac,
 )
 from provisioningserver.drivers import ArchitectureRegistry
@@ -30,6 +32,11 @@ from provisioningserver.logger import (
     get_maas_logger,
     LegacyLogger,
 )
+from provisioningserver.rackdservices.image import BootImageCache
+from provisioningserver.rpc.boot_config import (
+    boot_config_cache,
+    BootConfigCache,
+)
 from provisioningserver.rpc.boot_images import list_boot_images
 from provisioningserver.rpc.exceptions import BootConfigNoResponse
 from provisioningserver.rpc.region import (
@@ -46,7 +53,10 @@ from provisioningserver.utils.twisted import (
     deferred,
     RPCFetcher,
 )
-from tftp.backend import FilesystemSynchronousBackend
+from tftp.backend import (
+    FilesystemReader,
+    FilesystemSynchronousBackend,
+)
 from tftp.errors import (
     BackendError,
     FileNotFound,
@@ -67,6 +77,7 @@ from twisted.internet.defer import (
     inlineCallbacks,
     maybeDeferred,
     returnValue,
+    succeed,
 )
 from twisted.internet.task import deferLater
 from twisted.python.filepath import FilePath
@@ -134,12 +145,25 @@ def log_request(mac_address, file_name, clock=reactor):
     d.addErrback(log.err, "Logging TFTP request failed.")
 
 
+class CachedFileReader(BytesReader):
+    """Read a static file from memory.
+
+    :ivar file_path: The `FilePath` of the file that was cached.
+    """
+
+    def __init__(self, file_path, data):
+        super(CachedFileReader, self).__init__(data)
+        self.file_path = file_path
+
+
 class TFTPBackend(FilesystemSynchronousBackend):
     """A partially dynamic read-only TFTP server.
 
     Static files such as kernels and initrds, as well as any non-MAAS files
     that the system may already be set up to serve, are served up normally.
-    But PXE configurations are generated on the fly.
+    But PXE configurations are generated on the fly. Small static files, such
+    as bootloaders and their modules, are served from a shared in-memory
+    `BootImageCache`.
 
     When a PXE configuration file is requested, the server asynchronously
     requests the appropriate parameters from the API (at a configurable
@@ -155,10 +179,16 @@ class TFTPBackend(FilesystemSynchronousBackend):
     fetch files at many similar paths which must not be passed on.
     """
 
-    def __init__(self, base_path, client_service):
+    def __init__(
+            self, base_path, client_service, boot_config_cache=None,
+            file_cache=None):
         """
         :param base_path: The root directory for this TFTP server.
         :param client_service: The RPC client service for the rack controller.
+        :param boot_config_cache: The `BootConfigCache` for responses to
+            `GetBootConfig`. A new cache is created by default.
+        :param file_cache: The `BootImageCache` for static files. A new cache
+            is created by default.
         """
         if not isinstance(base_path, FilePath):
             base_path = FilePath(base_path)
@@ -166,6 +196,12 @@ class TFTPBackend(FilesystemSynchronousBackend):
             base_path, can_read=True, can_write=False)
         self.client_service = client_service
         self.fetcher = RPCFetcher()
+        if boot_config_cache is None:
+            boot_config_cache = BootConfigCache()
+        self.boot_config_cache = boot_config_cache
+        if file_cache is None:
+            file_cache = BootImageCache()
+        self.file_cache = file_cache
 
     @inlineCallbacks
     @typed
@@ -254,7 +290,8 @@ class TFTPBackend(FilesystemSynchronousBackend):
 
         def fetch(client, params):
             params["system_id"] = client.localIdent
-            d = self.fetcher(client, GetBootConfig, **params)
+            d = self.boot_config_cache.fetch(params, partial(
+                self.fetcher, client, GetBootConfig, **params))
             d.addCallback(self.get_boot_image, client, params['remote_ip'])
             d.addCallback(lambda data: KernelParameters(**data))
             return d
@@ -277,6 +314,29 @@ class TFTPBackend(FilesystemSynchronousBackend):
 
         return self.get_kernel_params(params).addCallback(generate)
 
+    def get_cached_reader(self, reader):
+        """Replace a `FilesystemReader` with one that reads from memory.
+
+        The file is cached if it's small enough; otherwise `reader` is
+        returned unaltered.
+
+        :return: A `Deferred` that fires with the reader to use.
+        """
+        def use_cached(data):
+            if data is None:
+                return reader
+            else:
+                reader.finish()
+                return CachedFileReader(reader.file_path, data)
+
+        if isinstance(reader, FilesystemReader):
+            d = self.file_cache.get(reader.file_path)
+            # Serve from disk if the file can't be read into the cache.
+            d.addErrback(log.err, "Failed to read TFTP file into cache.")
+            return d.addCallback(use_cached)
+        else:
+            return succeed(reader)
+
     @staticmethod
     def no_response_errback(failure, file_name):
         failure.trap(BootConfigNoResponse)
@@ -288,7 +348,9 @@ class TFTPBackend(FilesystemSynchronousBackend):
     def handle_boot_method(self, file_name: TFTPPath, result):
         boot_method, params = result
         if boot_method is None:
-            return super(TFTPBackend, self).get_reader(file_name)
+            d = maybeDeferred(
+                super(TFTPBackend, self).get_reader, file_name)
+            return d.addCallback(self.get_cached_reader)
 
         # Map pxe namespace architecture names to MAAS's.
         arch = params.get("arch")
@@ -400,7 +462,8 @@ class TFTPService(MultiService, object):
         :param client_service: The RPC client service for the rack controller.
         """
         super(TFTPService, self).__init__()
-        self.backend = TFTPBackend(resource_root, client_service)
+        self.backend = TFTPBackend(
+            resource_root, client_service, boot_config_cache)
         self.port = port
         # Establish a periodic call to self.updateServers() every 45
         # seconds, so that this service eventually converges on truth.
@@ -1,4 +1,4 @@
-# Copyright 2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2016-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """TFTP offload server.
@@ -20,6 +20,7 @@ import shutil
 import tempfile
 
 from provisioningserver.logger import LegacyLogger
+from provisioningserver.rackdservices.tftp import CachedFileReader
 from provisioningserver.utils.twisted import (
     call,
     callOut,
@@ -168,7 +169,8 @@ class TFTPOffloadProtocol(protocol.Protocol):
             d.addErrback(log.err, "Failure in TFTP back-end.")
 
     def prepareWriteResponse(self, reader):
-        if isinstance(reader, tftp.backend.FilesystemReader):
+        if isinstance(
+                reader, (tftp.backend.FilesystemReader, CachedFileReader)):
             d = maybeDeferred(self.writeFileResponse, reader)
         else:
             d = maybeDeferred(self.writeStreamedResponse, reader)
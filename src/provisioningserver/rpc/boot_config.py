@@ -0,0 +1,159 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Cache of boot configurations obtained from the region.
+
+Every PXE configuration file served by the rack needs a `GetBootConfig` call
+to the region. During reboot storms the same configuration is requested
+again and again for the same machine, so responses are kept for a short time.
+The region tells the rack to forget responses when something that affects
+them changes; see `InvalidateBootConfigs`.
+"""
+
+__all__ = [
+    "boot_config_cache",
+    "BootConfigCache",
+    "invalidate_boot_configs",
+    ]
+
+from collections import (
+    defaultdict,
+    OrderedDict,
+)
+
+from twisted.internet import reactor
+from twisted.internet.defer import (
+    maybeDeferred,
+    succeed,
+)
+
+# Seconds for which a boot configuration is cached. This is short because
+# invalidation is best-effort: the region cannot tell a rack that it's not
+# connected to, and older regions don't send invalidations at all.
+BOOT_CONFIG_TTL = 30
+
+# Maximum number of boot configurations cached.
+BOOT_CONFIG_CACHE_SIZE = 10000
+
+
+def normalise_mac(mac):
+    """Return `mac` in the region's format, e.g. "00:11:22:aa:bb:cc".
+
+    TFTP paths carry MAC addresses with hyphens rather than colons.
+    """
+    if mac is None:
+        return None
+    else:
+        return mac.replace("-", ":").lower()
+
+
+class BootConfigCache:
+    """Time-limited cache of `GetBootConfig` responses.
+
+    Responses are keyed by the MAC address, architecture, subarchitecture,
+    and BIOS boot method of the booting machine, and by the local IP address
+    on which the request was received because the region embeds that in the
+    response.
+
+    :ivar generation: Incremented by every invalidation. Responses that were
+        requested before an invalidation are not cached when they arrive.
+    """
+
+    def __init__(
+            self, ttl=BOOT_CONFIG_TTL, size=BOOT_CONFIG_CACHE_SIZE,
+            clock=reactor):
+        super(BootConfigCache, self).__init__()
+        self.ttl = ttl
+        self.size = size
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.keys_by_mac = defaultdict(set)
+        self.generation = 0
+
+    @staticmethod
+    def make_key(params):
+        """Return the cache key for the given `GetBootConfig` arguments."""
+        return (
+            normalise_mac(params.get("mac")),
+            params.get("arch"),
+            params.get("subarch"),
+            params.get("bios_boot_method"),
+            params.get("local_ip"),
+        )
+
+    def get(self, key):
+        """Return a copy of the cached response for `key`, or `None`."""
+        try:
+            expires, response = self.entries[key]
+        except KeyError:
+            return None
+        if expires <= self.clock.seconds():
+            self._discard(key)
+            return None
+        else:
+            return dict(response)
+
+    def set(self, key, response):
+        """Cache a copy of `response` for `key`."""
+        self._discard(key)
+        while len(self.entries) >= self.size:
+            oldest = next(iter(self.entries))
+            self._discard(oldest)
+        expires = self.clock.seconds() + self.ttl
+        self.entries[key] = expires, dict(response)
+        self.keys_by_mac[key[0]].add(key)
+
+    def fetch(self, params, fetcher):
+        """Return the response for `params`, calling `fetcher` on a miss.
+
+        :param params: The arguments for `GetBootConfig`.
+        :param fetcher: A no-argument callable that makes the RPC call.
+        :return: A `Deferred` that fires with a copy of the response, which
+            the caller is free to modify.
+        """
+        key = self.make_key(params)
+        response = self.get(key)
+        if response is not None:
+            return succeed(response)
+        generation = self.generation
+        d = maybeDeferred(fetcher)
+        d.addCallback(self._store, key, generation)
+        return d
+
+    def _store(self, response, key, generation):
+        # Don't cache a response that may predate an invalidation.
+        if generation == self.generation:
+            self.set(key, response)
+        return dict(response)
+
+    def _discard(self, key):
+        if self.entries.pop(key, None) is not None:
+            mac = key[0]
+            keys = self.keys_by_mac[mac]
+            keys.discard(key)
+            if len(keys) == 0:
+                del self.keys_by_mac[mac]
+
+    def invalidate(self, macs=None):
+        """Forget the cached responses for `macs`, or all responses.
+
+        :param macs: An iterable of MAC addresses, or `None` to forget every
+            response, including those for requests without a MAC address.
+        """
+        self.generation += 1
+        if macs is None:
+            self.entries.clear()
+            self.keys_by_mac.clear()
+        else:
+            for mac in macs:
+                for key in list(self.keys_by_mac.get(normalise_mac(mac), ())):
+                    self._discard(key)
+
+
+# The cache used by the rack's TFTP service.
+boot_config_cache = BootConfigCache()
+
+
+def invalidate_boot_configs(macs=None):
+    """Forget cached boot configurations; see `BootConfigCache.invalidate`."""
+    boot_config_cache.invalidate(macs)
@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """RPC relating to boot images."""
@@ -141,11 +141,17 @@ def _import_boot_images(sources, http_proxy=None, https_proxy=None):
 
     Helper for `import_boot_images`.
     """
+    # Avoid circular imports.
+    from provisioningserver.rpc.capabilities import (
+        push_rack_capabilities_to_regions,
+    )
+
     proxies = dict(http_proxy=http_proxy, https_proxy=https_proxy)
     imported = yield deferToThread(_run_import, sources, **proxies)
     if imported:
         yield touch_last_image_sync_timestamp().addErrback(
             log.err, "Failure touching last image sync timestamp.")
+        yield push_rack_capabilities_to_regions()
 
 
 def is_import_boot_images_running():
@@ -0,0 +1,91 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Report this rack controller's capabilities to the region.
+
+The region needs to know which operating systems, boot images, and power
+drivers each rack controller supports. Rather than have it ask every rack
+controller each time, the rack controller reports them with
+`UpdateRackCapabilities` when it connects to a region and whenever they
+change.
+"""
+
+__all__ = [
+    "get_rack_capabilities",
+    "push_rack_capabilities",
+    "push_rack_capabilities_to_regions",
+]
+
+import provisioningserver
+from provisioningserver.drivers.power.registry import PowerDriverRegistry
+from provisioningserver.logger import LegacyLogger
+from provisioningserver.rpc.boot_images import list_boot_images
+from provisioningserver.rpc.osystems import gen_operating_systems
+from provisioningserver.rpc.region import UpdateRackCapabilities
+from provisioningserver.utils.env import get_maas_id
+from twisted.internet.defer import (
+    DeferredList,
+    maybeDeferred,
+)
+from twisted.internet.error import ConnectionClosed
+from twisted.protocols.amp import UnhandledCommand
+
+
+log = LegacyLogger()
+
+
+def get_rack_capabilities():
+    """Return this rack controller's capabilities.
+
+    :return: A dict of arguments for `UpdateRackCapabilities`, without the
+        system ID.
+    """
+    osystems = [
+        dict(osystem, releases=list(osystem["releases"]))
+        for osystem in gen_operating_systems()
+    ]
+    return {
+        "osystems": osystems,
+        "images": list_boot_images(),
+        "power_types": list(PowerDriverRegistry.get_schema()),
+    }
+
+
+def push_rack_capabilities(client):
+    """Report this rack controller's capabilities to the region via `client`.
+
+    Regions that predate `UpdateRackCapabilities`, and connections that are
+    lost in the meantime, are ignored: the region will ask for what it needs
+    in those cases. Other failures are logged.
+
+    :param client: A :class:`common.Client` connected to a region.
+    :return: A `Deferred` that always succeeds.
+    """
+    def push(capabilities):
+        return client(
+            UpdateRackCapabilities, system_id=get_maas_id(), **capabilities)
+
+    def ignore_unsupported_or_closed(failure):
+        failure.trap(UnhandledCommand, ConnectionClosed)
+
+    d = maybeDeferred(get_rack_capabilities)
+    d.addCallback(push)
+    d.addErrback(ignore_unsupported_or_closed)
+    d.addErrback(
+        log.err, "Failed to report rack controller capabilities to "
+        "region (via %s)." % client.ident)
+    return d
+
+
+def push_rack_capabilities_to_regions():
+    """Report this rack controller's capabilities to every connected region.
+
+    :return: A `Deferred` that always succeeds.
+    """
+    try:
+        rpc_service = provisioningserver.services.getServiceNamed('rpc')
+    except KeyError:
+        clients = []
+    else:
+        clients = rpc_service.getAllClients()
+    return DeferredList(map(push_rack_capabilities, clients))
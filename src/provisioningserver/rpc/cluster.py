@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """RPC declarations for clusters.
@@ -18,9 +18,11 @@ __all__ = [
     "DescribeNOSTypes",
     "GetPreseedData",
     "Identify",
+    "InvalidateBootConfigs",
     "ListBootImages",
     "ListOperatingSystems",
     "ListSupportedArchitectures",
+    "PowerChangeMany",
     "PowerCycle",
     "PowerDriverCheck",
     "PowerOff",
@@ -312,6 +314,41 @@ class PowerCycle(_Power):
     """
 
 
+class PowerChangeMany(amp.Command):
+    """Change the power state of many nodes.
+
+    Each change is validated and started as for `PowerOn`, `PowerOff`, or
+    `PowerCycle`, but changes to nodes that share a BMC are made with
+    bounded concurrency. This returns once every change has been started;
+    the outcome of each is reported to the region as it completes, as for
+    a single node.
+
+    Like any AMP value, the encoded list of nodes may not exceed
+    `amp.MAX_VALUE_LENGTH` bytes, so callers must split large batches.
+
+    :since: 2.3
+    """
+
+    arguments = [
+        # One of "on", "off", or "cycle".
+        (b"power_change", amp.Unicode()),
+        (b"nodes", AmpList([
+            (b"system_id", amp.Unicode()),
+            (b"hostname", amp.Unicode()),
+            (b"power_type", amp.Unicode()),
+            (b"context", StructureAsJSON()),
+        ])),
+    ]
+    response = [
+        # A result for each node; `error` is only present when the change
+        # could not be started.
+        (b"results", AmpList([
+            (b"system_id", amp.Unicode()),
+            (b"error", amp.Unicode(optional=True)),
+        ])),
+    ]
+
+
 class _ConfigureDHCP(amp.Command):
     """Configure a DHCP server.
 
@@ -584,6 +621,23 @@ class IsImportBootImagesRunning(amp.Command):
     errors = {}
 
 
+class InvalidateBootConfigs(amp.Command):
+    """Forget cached boot configurations.
+
+    The rack caches responses to `GetBootConfig` for a short time. The region
+    calls this when something that affects those responses changes.
+
+    :since: 2.3
+    """
+    arguments = [
+        # The MAC addresses of the machines whose boot configurations have
+        # changed. When omitted, all cached boot configurations are dropped.
+        (b"macs", amp.ListOf(amp.Unicode(), optional=True)),
+    ]
+    response = []
+    errors = {}
+
+
 class RefreshRackControllerInfo(amp.Command):
     """Refresh the rack controller's hardware and network details.
 
@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """RPC implementation for clusters."""
@@ -58,11 +58,13 @@ from provisioningserver.rpc import (
     pods,
     region,
 )
+from provisioningserver.rpc.boot_config import invalidate_boot_configs
 from provisioningserver.rpc.boot_images import (
     import_boot_images,
     is_import_boot_images_running,
     list_boot_images,
 )
+from provisioningserver.rpc.capabilities import push_rack_capabilities
 from provisioningserver.rpc.common import RPCProtocol
 from provisioningserver.rpc.interfaces import IConnectionToRegion
 from provisioningserver.rpc.osystems import (
@@ -74,6 +76,7 @@ from provisioningserver.rpc.osystems import (
 from provisioningserver.rpc.power import (
     get_power_state,
     maybe_change_power_state,
+    maybe_change_power_states,
 )
 from provisioningserver.rpc.tags import evaluate_tag
 from provisioningserver.security import (
@@ -305,6 +308,16 @@ class Cluster(RPCProtocol):
         """
         return {"running": is_import_boot_images_running()}
 
+    @cluster.InvalidateBootConfigs.responder
+    def invalidate_boot_configs(self, macs=None):
+        """invalidate_boot_configs(macs=None)
+
+        Implementation of
+        :py:class:`~provisioningserver.rpc.cluster.InvalidateBootConfigs`.
+        """
+        invalidate_boot_configs(macs)
+        return {}
+
     @cluster.DescribePowerTypes.responder
     def describe_power_types(self):
         """describe_power_types()
@@ -405,6 +418,13 @@ class Cluster(RPCProtocol):
         d.addCallback(lambda _: {})
         return d
 
+    @cluster.PowerChangeMany.responder
+    def power_change_many(self, power_change, nodes):
+        """Change the power state of many nodes."""
+        d = maybe_change_power_states(power_change, nodes)
+        d.addCallback(lambda results: {"results": results})
+        return d
+
     @cluster.PowerQuery.responder
     def power_query(self, system_id, hostname, power_type, context):
         d = get_power_state(
@@ -843,6 +863,8 @@ class ClusterClient(Cluster):
             if registered:
                 self.service.connections[self.eventloop] = self
                 self.ready.set(self.eventloop)
+                # The region reads these from memory rather than asking.
+                push_rack_capabilities(common.Client(self))
             else:
                 self.transport.loseConnection()
                 self.ready.fail(
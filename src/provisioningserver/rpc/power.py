@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Power control."""
@@ -7,8 +7,10 @@ __all__ = [
     "power_action_registry",
     "power_state_update",
     "maybe_change_power_state",
+    "maybe_change_power_states",
 ]
 
+from collections import defaultdict
 from datetime import timedelta
 from functools import partial
 import sys
@@ -62,6 +64,10 @@ log = LegacyLogger()
 # meant to cope with broken BMCs.
 CHANGE_POWER_STATE_TIMEOUT = timedelta(minutes=5).total_seconds()
 
+# The most power changes that `maybe_change_power_states` will make at once
+# through a single BMC, like a chassis or a virsh host.
+CHANGE_POWER_STATES_PER_BMC = 4
+
 # We could use a Registry here, but it seems kind of like overkill.
 power_action_registry = {}
 
@@ -187,7 +193,7 @@ def power_change_starting(system_id, hostname, power_change):
 @deferred  # Always return a Deferred.
 def maybe_change_power_state(
         system_id, hostname, power_type, power_change, context,
-        clock=reactor):
+        clock=reactor, semaphore=None):
     """Attempt to change the power state of a node.
 
     If there is no power action already in progress, register this
@@ -198,6 +204,8 @@ def maybe_change_power_state(
     errors will be raised promptly, before any work is done to power the
     node on.
 
+    :param semaphore: An optional `DeferredSemaphore` that the power change
+        must acquire before it is made, once it has been accepted.
     :raises: PowerActionAlreadyInProgress if there's already a power
         action in progress for this node.
     """
@@ -225,10 +233,13 @@ def maybe_change_power_state(
         # wait, because it might take a long time. We set a timeout so that if
         # the power action doesn't return in a timely fashion (or fails
         # silently or some such) it doesn't block other actions on the node.
-        d = deferLater(
-            clock, 0, deferWithTimeout, CHANGE_POWER_STATE_TIMEOUT,
+        change = partial(
+            deferWithTimeout, CHANGE_POWER_STATE_TIMEOUT,
             change_power_state, system_id, hostname, power_type, power_change,
             context, clock)
+        if semaphore is not None:
+            change = partial(semaphore.run, change)
+        d = deferLater(clock, 0, change)
 
         power_action_registry[system_id] = power_change, d
 
@@ -265,6 +276,58 @@ def maybe_change_power_state(
             (power_change, hostname))
 
 
+def get_bmc_key(power_type, context):
+    """Return a key that's the same for nodes that share a BMC.
+
+    Nodes are considered to share a BMC when they have the same power type
+    and power address, e.g. virtual machines on the same virsh host.
+    """
+    return power_type, context.get("power_address")
+
+
+@asynchronous
+def maybe_change_power_states(
+        power_change, nodes, max_concurrency=CHANGE_POWER_STATES_PER_BMC,
+        clock=reactor):
+    """Attempt to change the power state of many nodes.
+
+    Each change is started with `maybe_change_power_state`, but at most
+    `max_concurrency` changes are made at once through each BMC.
+
+    :param nodes: An iterable of dicts with "system_id", "hostname",
+        "power_type", and "context" keys.
+    :return: A `Deferred` that fires with a list of dicts, one for each
+        node, with "system_id" and, if the change could not be started, an
+        "error" message.
+    """
+    semaphores = defaultdict(partial(DeferredSemaphore, max_concurrency))
+
+    def started(_, node):
+        return {"system_id": node["system_id"]}
+
+    def not_started(failure, node):
+        return {
+            "system_id": node["system_id"],
+            "error": failure.getErrorMessage(),
+        }
+
+    changes = []
+    for node in nodes:
+        semaphore = semaphores[
+            get_bmc_key(node["power_type"], node["context"])]
+        d = maybe_change_power_state(
+            node["system_id"], node["hostname"], node["power_type"],
+            power_change, node["context"], clock=clock, semaphore=semaphore)
+        d.addCallbacks(
+            started, not_started, callbackArgs=(node, ),
+            errbackArgs=(node, ))
+        changes.append(d)
+
+    d = DeferredList(changes)
+    d.addCallback(lambda results: [result for _, result in results])
+    return d
+
+
 @asynchronous
 @inlineCallbacks
 def change_power_state(
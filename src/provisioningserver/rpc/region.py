@@ -33,11 +33,13 @@ __all__ = [
     "UpdateInterfaces",
     "UpdateLastImageSync",
     "UpdateNodePowerState",
+    "UpdateRackCapabilities",
 ]
 
 from provisioningserver.rpc.arguments import (
     AmpList,
     Bytes,
+    CompressedAmpList,
     ParsedURL,
     StructureAsJSON,
 )
@@ -595,3 +597,46 @@ class GetTimeConfiguration(amp.Command):
     errors = {
         NoSuchNode: b"NoSuchNode",
     }
+
+
+class UpdateRackCapabilities(amp.Command):
+    """Report the operating systems, boot images, and power drivers that
+    this rack controller supports.
+
+    The region keeps these in memory so that it needn't ask every rack
+    controller each time it needs them. Rack controllers report again when
+    any of them change.
+
+    :since: 2.3
+    """
+
+    arguments = [
+        (b"system_id", amp.Unicode()),
+        # As in the response to `ListOperatingSystems`.
+        (b"osystems", CompressedAmpList([
+            (b"name", amp.Unicode()),
+            (b"title", amp.Unicode()),
+            (b"releases", AmpList([
+                (b"name", amp.Unicode()),
+                (b"title", amp.Unicode()),
+                (b"requires_license_key", amp.Boolean()),
+                (b"can_commission", amp.Boolean()),
+            ])),
+            (b"default_release", amp.Unicode(optional=True)),
+            (b"default_commissioning_release", amp.Unicode(optional=True)),
+        ])),
+        # As in the response to `ListBootImagesV2`.
+        (b"images", CompressedAmpList(
+            [(b"osystem", amp.Unicode()),
+             (b"architecture", amp.Unicode()),
+             (b"subarchitecture", amp.Unicode()),
+             (b"release", amp.Unicode()),
+             (b"label", amp.Unicode()),
+             (b"purpose", amp.Unicode()),
+             (b"xinstall_type", amp.Unicode()),
+             (b"xinstall_path", amp.Unicode())])),
+        # As in the response to `DescribePowerTypes`.
+        (b"power_types", StructureAsJSON()),
+    ]
+    response = []
+    errors = []
@@ -0,0 +1,175 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `provisioningserver.rpc.boot_config`."""
+
+__all__ = []
+
+from unittest.mock import Mock
+
+from maastesting.factory import factory
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
+from maastesting.testcase import MAASTestCase
+from provisioningserver.rpc import boot_config
+from provisioningserver.rpc.boot_config import (
+    BootConfigCache,
+    invalidate_boot_configs,
+)
+from testtools.matchers import (
+    Equals,
+    HasLength,
+    Is,
+)
+from twisted.internet.defer import (
+    Deferred,
+    succeed,
+)
+from twisted.internet.task import Clock
+
+
+def make_params(**params):
+    defaults = {
+        "system_id": factory.make_name("system_id"),
+        "local_ip": factory.make_ipv4_address(),
+        "remote_ip": factory.make_ipv4_address(),
+        "arch": factory.make_name("arch"),
+        "subarch": factory.make_name("subarch"),
+        "mac": factory.make_mac_address("-"),
+        "bios_boot_method": factory.make_name("method"),
+    }
+    defaults.update(params)
+    return defaults
+
+
+def make_response():
+    return {
+        "hostname": factory.make_name("hostname"),
+        "purpose": factory.make_name("purpose"),
+    }
+
+
+class TestBootConfigCache(MAASTestCase):
+    """Tests for `BootConfigCache`."""
+
+    def make_cache(self, **kwargs):
+        clock = Clock()
+        return BootConfigCache(clock=clock, **kwargs), clock
+
+    def fetch(self, cache, params, response):
+        fetcher = Mock(return_value=succeed(response))
+        result = []
+        cache.fetch(params, fetcher).addCallback(result.append)
+        return fetcher, result[0]
+
+    def test_make_key_ignores_remote_ip_and_system_id(self):
+        params = make_params()
+        other = dict(
+            params, remote_ip=factory.make_ipv4_address(),
+            system_id=factory.make_name("system_id"))
+        self.assertThat(
+            BootConfigCache.make_key(params),
+            Equals(BootConfigCache.make_key(other)))
+
+    def test_make_key_normalises_mac(self):
+        key = BootConfigCache.make_key({"mac": "AA-BB-CC-DD-EE-FF"})
+        self.assertThat(key[0], Equals("aa:bb:cc:dd:ee:ff"))
+
+    def test_fetch_calls_fetcher_on_miss(self):
+        cache, _ = self.make_cache()
+        response = make_response()
+        fetcher, result = self.fetch(cache, make_params(), response)
+        self.expectThat(fetcher, MockCalledOnceWith())
+        self.expectThat(result, Equals(response))
+
+    def test_fetch_returns_cached_response_on_hit(self):
+        cache, _ = self.make_cache()
+        params = make_params()
+        response = make_response()
+        self.fetch(cache, params, response)
+        fetcher, result = self.fetch(cache, params, make_response())
+        self.expectThat(fetcher, MockNotCalled())
+        self.expectThat(result, Equals(response))
+
+    def test_fetch_returns_copies(self):
+        cache, _ = self.make_cache()
+        params = make_params()
+        response = make_response()
+        _, result = self.fetch(cache, params, response)
+        result.clear()
+        _, result = self.fetch(cache, params, make_response())
+        self.assertThat(result, Equals(response))
+
+    def test_fetch_calls_fetcher_after_ttl(self):
+        cache, clock = self.make_cache(ttl=10)
+        params = make_params()
+        self.fetch(cache, params, make_response())
+        clock.advance(10)
+        response = make_response()
+        fetcher, result = self.fetch(cache, params, response)
+        self.expectThat(fetcher, MockCalledOnceWith())
+        self.expectThat(result, Equals(response))
+
+    def test_fetch_does_not_cache_failures(self):
+        cache, _ = self.make_cache()
+        params = make_params()
+        fetcher = Mock(side_effect=factory.make_exception())
+        d = cache.fetch(params, fetcher)
+        d.addErrback(lambda failure: None)
+        self.assertThat(cache.entries, HasLength(0))
+
+    def test_fetch_does_not_cache_response_arriving_after_invalidation(self):
+        cache, _ = self.make_cache()
+        params = make_params()
+        response = Deferred()
+        cache.fetch(params, lambda: response)
+        cache.invalidate([params["mac"]])
+        response.callback(make_response())
+        self.assertThat(cache.entries, HasLength(0))
+
+    def test_set_evicts_oldest_when_full(self):
+        cache, _ = self.make_cache(size=2)
+        keys = [BootConfigCache.make_key(make_params()) for _ in range(3)]
+        for key in keys:
+            cache.set(key, make_response())
+        self.expectThat(list(cache.entries), Equals(keys[1:]))
+        self.expectThat(cache.keys_by_mac, HasLength(2))
+
+    def test_invalidate_forgets_responses_for_macs(self):
+        cache, _ = self.make_cache()
+        mac = factory.make_mac_address(":")
+        params_pxe = make_params(mac=mac.replace(":", "-"))
+        params_other_arch = dict(params_pxe, arch=factory.make_name("arch"))
+        params_other_mac = make_params()
+        for params in (params_pxe, params_other_arch, params_other_mac):
+            self.fetch(cache, params, make_response())
+        cache.invalidate([mac.upper()])
+        self.expectThat(
+            list(cache.entries),
+            Equals([BootConfigCache.make_key(params_other_mac)]))
+        self.expectThat(cache.keys_by_mac, HasLength(1))
+
+    def test_invalidate_forgets_all_responses(self):
+        cache, _ = self.make_cache()
+        self.fetch(cache, make_params(), make_response())
+        self.fetch(cache, make_params(mac=None), make_response())
+        cache.invalidate()
+        self.expectThat(cache.entries, HasLength(0))
+        self.expectThat(cache.keys_by_mac, HasLength(0))
+
+    def test_get_returns_None_when_not_cached(self):
+        cache, _ = self.make_cache()
+        key = BootConfigCache.make_key(make_params())
+        self.assertThat(cache.get(key), Is(None))
+
+
+class TestInvalidateBootConfigs(MAASTestCase):
+    """Tests for `invalidate_boot_configs`."""
+
+    def test_invalidates_global_cache(self):
+        invalidate = self.patch(boot_config.boot_config_cache, "invalidate")
+        macs = [factory.make_mac_address()]
+        invalidate_boot_configs(macs)
+        self.assertThat(invalidate, MockCalledOnceWith(macs))
@@ -26,6 +26,7 @@ from provisioningserver.boot import tftppath
 from provisioningserver.import_images import boot_resources
 from provisioningserver.rpc import (
     boot_images,
+    capabilities,
     region,
 )
 from provisioningserver.rpc.boot_images import (
@@ -334,6 +335,25 @@ class TestImportBootImages(MAASTestCase):
         self.assertThat(getRegionClient, MockNotCalled())
         self.assertThat(get_maas_id, MockNotCalled())
 
+    @inlineCallbacks
+    def test_pushes_rack_capabilities_after_import(self):
+        touch = self.patch(boot_images, "touch_last_image_sync_timestamp")
+        touch.return_value = succeed(None)
+        push = self.patch(capabilities, "push_rack_capabilities_to_regions")
+        push.return_value = succeed(None)
+        _run_import = self.patch_autospec(boot_images, '_run_import')
+        _run_import.return_value = True
+        yield boot_images._import_boot_images(sentinel.sources)
+        self.assertThat(push, MockCalledOnceWith())
+
+    @inlineCallbacks
+    def test_does_not_push_rack_capabilities_when_nothing_imported(self):
+        push = self.patch(capabilities, "push_rack_capabilities_to_regions")
+        _run_import = self.patch_autospec(boot_images, '_run_import')
+        _run_import.return_value = False
+        yield boot_images._import_boot_images(sentinel.sources)
+        self.assertThat(push, MockNotCalled())
+
     @inlineCallbacks
     def test_update_last_image_sync_end_to_end(self):
         get_maas_id = self.patch(boot_images, "get_maas_id")
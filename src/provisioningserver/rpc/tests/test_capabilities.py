@@ -0,0 +1,143 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `provisioningserver.rpc.capabilities`."""
+
+__all__ = []
+
+from unittest.mock import (
+    call,
+    Mock,
+    sentinel,
+)
+
+from maastesting.factory import factory
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockCallsMatch,
+)
+from maastesting.testcase import (
+    MAASTestCase,
+    MAASTwistedRunTest,
+)
+from maastesting.twisted import (
+    extract_result,
+    TwistedLoggerFixture,
+)
+import provisioningserver
+from provisioningserver.drivers.power.registry import PowerDriverRegistry
+from provisioningserver.rpc import capabilities
+from provisioningserver.rpc.capabilities import (
+    get_rack_capabilities,
+    push_rack_capabilities,
+    push_rack_capabilities_to_regions,
+)
+from provisioningserver.rpc.region import UpdateRackCapabilities
+from testtools.matchers import (
+    Equals,
+    Is,
+)
+from twisted.internet.defer import (
+    fail,
+    succeed,
+)
+from twisted.internet.error import ConnectionDone
+from twisted.protocols.amp import UnhandledCommand
+
+
+def make_client(result=None):
+    client = Mock(return_value=succeed({}) if result is None else result)
+    client.ident = factory.make_name("eventloop")
+    return client
+
+
+class TestGetRackCapabilities(MAASTestCase):
+    """Tests for `get_rack_capabilities`."""
+
+    def test_returns_osystems_images_and_power_types(self):
+        name, title = factory.make_name("name"), factory.make_name("title")
+        releases = [{"name": factory.make_name("release")}]
+        self.patch(capabilities, "gen_operating_systems").return_value = [
+            {"name": name, "title": title, "releases": iter(releases)}]
+        self.patch(capabilities, "list_boot_images").return_value = (
+            sentinel.images)
+        self.assertThat(get_rack_capabilities(), Equals({
+            "osystems": [
+                {"name": name, "title": title, "releases": releases},
+            ],
+            "images": sentinel.images,
+            "power_types": list(PowerDriverRegistry.get_schema()),
+        }))
+
+
+class TestPushRackCapabilities(MAASTestCase):
+    """Tests for `push_rack_capabilities`."""
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def setUp(self):
+        super(TestPushRackCapabilities, self).setUp()
+        self.system_id = factory.make_name("system_id")
+        self.patch(capabilities, "get_maas_id").return_value = self.system_id
+        self.capabilities = {
+            "osystems": [], "images": [], "power_types": [],
+        }
+        self.patch(capabilities, "get_rack_capabilities").return_value = (
+            self.capabilities)
+
+    def test_calls_UpdateRackCapabilities(self):
+        client = make_client()
+        extract_result(push_rack_capabilities(client))
+        self.assertThat(client, MockCalledOnceWith(
+            UpdateRackCapabilities, system_id=self.system_id,
+            **self.capabilities))
+
+    def test_ignores_region_without_support(self):
+        client = make_client(fail(UnhandledCommand()))
+        with TwistedLoggerFixture() as logger:
+            result = extract_result(push_rack_capabilities(client))
+        self.expectThat(result, Is(None))
+        self.expectThat(logger.output, Equals(""))
+
+    def test_ignores_closed_connection(self):
+        client = make_client(fail(ConnectionDone()))
+        with TwistedLoggerFixture() as logger:
+            result = extract_result(push_rack_capabilities(client))
+        self.expectThat(result, Is(None))
+        self.expectThat(logger.output, Equals(""))
+
+    def test_logs_other_failures(self):
+        client = make_client(fail(factory.make_exception()))
+        with TwistedLoggerFixture() as logger:
+            result = extract_result(push_rack_capabilities(client))
+        self.expectThat(result, Is(None))
+        self.assertDocTestMatches(
+            """\
+            Failed to report rack controller capabilities to region (via %s).
+            Traceback (most recent call last):
+            ...
+            """ % client.ident, logger.output)
+
+
+class TestPushRackCapabilitiesToRegions(MAASTestCase):
+    """Tests for `push_rack_capabilities_to_regions`."""
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def test_pushes_to_every_region(self):
+        clients = [make_client(), make_client()]
+        services = self.patch(provisioningserver, "services")
+        services.getServiceNamed.return_value.getAllClients.return_value = (
+            clients)
+        push = self.patch(capabilities, "push_rack_capabilities")
+        push.return_value = succeed(None)
+        extract_result(push_rack_capabilities_to_regions())
+        self.expectThat(services.getServiceNamed, MockCalledOnceWith("rpc"))
+        self.expectThat(push, MockCallsMatch(*map(call, clients)))
+
+    def test_does_nothing_without_rpc_service(self):
+        services = self.patch(provisioningserver, "services")
+        services.getServiceNamed.side_effect = KeyError
+        push = self.patch(capabilities, "push_rack_capabilities")
+        extract_result(push_rack_capabilities_to_regions())
+        self.assertThat(push.call_count, Equals(0))
@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for the cluster's RPC implementation."""
@@ -398,6 +398,34 @@ class TestClusterProtocol_IsImportBootImagesRunning(MAASTestCase):
         self.assertEqual({"running": True}, response)
 
 
+class TestClusterProtocol_InvalidateBootConfigs(MAASTestCase):
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def test_invalidate_boot_configs_is_registered(self):
+        protocol = Cluster()
+        responder = protocol.locateResponder(
+            cluster.InvalidateBootConfigs.commandName)
+        self.assertIsNotNone(responder)
+
+    @inlineCallbacks
+    def test_invalidate_boot_configs_invalidates_macs(self):
+        invalidate = self.patch(clusterservice, "invalidate_boot_configs")
+        macs = [factory.make_mac_address() for _ in range(3)]
+        response = yield call_responder(
+            Cluster(), cluster.InvalidateBootConfigs, {"macs": macs})
+        self.assertEqual({}, response)
+        self.assertThat(invalidate, MockCalledOnceWith(macs))
+
+    @inlineCallbacks
+    def test_invalidate_boot_configs_invalidates_all(self):
+        invalidate = self.patch(clusterservice, "invalidate_boot_configs")
+        response = yield call_responder(
+            Cluster(), cluster.InvalidateBootConfigs, {})
+        self.assertEqual({}, response)
+        self.assertThat(invalidate, MockCalledOnceWith(None))
+
+
 class TestClusterProtocol_DescribePowerTypes(MAASTestCase):
 
     run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
@@ -1018,6 +1046,9 @@ class TestClusterClient(MAASTestCase):
         self.get_maas_id = self.patch(clusterservice, "get_maas_id")
         self.get_maas_id.side_effect = get_maas_id
 
+        self.push_rack_capabilities = self.patch(
+            clusterservice, "push_rack_capabilities")
+
     def make_running_client(self):
         client = clusterservice.ClusterClient(
             address=("example.com", 1234), eventloop="eventloop:pid=12345",
@@ -1080,6 +1111,22 @@ class TestClusterClient(MAASTestCase):
             client.service.connections,
             {client.eventloop: client})
 
+    def test_connecting_pushes_rack_capabilities(self):
+        client = self.make_running_client()
+        self.patch_authenticate_for_success(client)
+        self.patch_register_for_success(client)
+        client.connectionMade()
+        self.assertThat(self.push_rack_capabilities, MockCalledOnceWith(ANY))
+        [rpc_client] = self.push_rack_capabilities.call_args[0]
+        self.assertThat(rpc_client._conn, Is(client))
+
+    def test_connecting_does_not_push_capabilities_when_rejected(self):
+        client = self.make_running_client()
+        self.patch_authenticate_for_success(client)
+        self.patch_register_for_failure(client)
+        client.connectionMade()
+        self.assertThat(self.push_rack_capabilities, MockNotCalled())
+
     def test_disconnects_when_there_is_an_existing_connection(self):
         client = self.make_running_client()
 
@@ -1861,6 +1908,43 @@ class TestClusterProtocol_PowerOn_PowerOff_PowerCycle(MAASTestCase):
         return d.addErrback(check)
 
 
+class TestClusterProtocol_PowerChangeMany(MAASTestCase):
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def test_is_registered(self):
+        protocol = Cluster()
+        responder = protocol.locateResponder(
+            cluster.PowerChangeMany.commandName)
+        self.assertIsNotNone(responder)
+
+    @inlineCallbacks
+    def test_executes_maybe_change_power_states(self):
+        nodes = [
+            {
+                "system_id": factory.make_name("system_id"),
+                "hostname": factory.make_name("hostname"),
+                "power_type": factory.make_name("power_type"),
+                "context": {"power_address": factory.make_ip_address()},
+            }
+            for _ in range(3)
+        ]
+        results = [
+            {"system_id": nodes[0]["system_id"]},
+            {"system_id": nodes[1]["system_id"]},
+            {"system_id": nodes[2]["system_id"], "error": "Broken"},
+        ]
+        maybe_change_power_states = self.patch(
+            clusterservice, "maybe_change_power_states")
+        maybe_change_power_states.return_value = succeed(results)
+        response = yield call_responder(
+            Cluster(), cluster.PowerChangeMany,
+            {"power_change": "on", "nodes": nodes})
+        self.assertThat(
+            maybe_change_power_states, MockCalledOnceWith("on", nodes))
+        self.assertThat(response, Equals({"results": results}))
+
+
 class TestClusterProtocol_PowerQuery(MAASTestCase):
 
     run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for :py:module:`~provisioningserver.rpc.power`."""
@@ -51,6 +51,7 @@ from testtools import ExpectedException
 from testtools.deferredruntest import assert_fails_with
 from testtools.matchers import (
     Equals,
+    HasLength,
     IsInstance,
     Not,
 )
@@ -660,6 +661,78 @@ class TestMaybeChangePowerState(MAASTestCase):
                 context, power.reactor))
 
 
+class TestMaybeChangePowerStates(MAASTestCase):
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def setUp(self):
+        super(TestMaybeChangePowerStates, self).setUp()
+        self.patch(power, 'power_action_registry', {})
+        for _, power_driver in PowerDriverRegistry:
+            self.patch(
+                power_driver, "detect_missing_packages").return_value = []
+        self.useFixture(EventTypesAllRegistered())
+        # Make power changes directly, without timeouts.
+        self.patch(
+            power, "deferWithTimeout",
+            lambda timeout, func, *args: func(*args))
+        # Power changes are left in progress until the test completes them.
+        self.changes = []
+        self.patch_autospec(power, 'change_power_state').side_effect = (
+            self.change_power_state)
+
+    def change_power_state(self, *args, **kwargs):
+        d = Deferred()
+        self.changes.append(d)
+        return d
+
+    def make_node(self, power_type="virsh", power_address=None):
+        if power_address is None:
+            power_address = factory.make_name("power_address")
+        return {
+            "system_id": factory.make_name("system_id"),
+            "hostname": factory.make_name("hostname"),
+            "power_type": power_type,
+            "context": {"power_address": power_address},
+        }
+
+    def test_returns_result_for_each_node(self):
+        clock = Clock()
+        node1, node2 = self.make_node(), self.make_node()
+        # A conflicting change is in progress for the second node.
+        power.power_action_registry[node2["system_id"]] = "off", Deferred()
+        results = extract_result(power.maybe_change_power_states(
+            "on", [node1, node2], clock=clock))
+        self.assertThat(results, Equals([
+            {"system_id": node1["system_id"]},
+            {"system_id": node2["system_id"], "error": (
+                "Unable to change power state to 'on' for node %s: another "
+                "action is already in progress for that node." % (
+                    node2["hostname"]))},
+        ]))
+
+    def test_limits_concurrency_per_bmc(self):
+        clock = Clock()
+        shared = [self.make_node(power_address="shared") for _ in range(5)]
+        other = self.make_node()
+        extract_result(power.maybe_change_power_states(
+            "on", shared + [other], max_concurrency=2, clock=clock))
+        clock.advance(0)
+        # Two of the nodes sharing a BMC, and the other node.
+        self.assertThat(self.changes, HasLength(3))
+        for _ in range(3):
+            self.changes[0].callback(None)
+            del self.changes[0]
+        # As changes complete, more are made, up to the limit.
+        self.assertThat(self.changes, HasLength(2))
+        self.changes[0].callback(None)
+        del self.changes[0]
+        self.assertThat(self.changes, HasLength(2))
+        for change in self.changes:
+            change.callback(None)
+        self.assertThat(power.power_action_registry, Equals({}))
+
+
 class TestPowerQuery(MAASTestCase):
 
     run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
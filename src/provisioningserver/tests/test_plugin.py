@@ -1,4 +1,4 @@
-# Copyright 2012-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2012-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for the ``maasrackd`` TAP."""
@@ -24,7 +24,11 @@ from provisioningserver.plugin import (
 from provisioningserver.rackdservices.dhcp_probe_service import (
     DHCPProbeService,
 )
-from provisioningserver.rackdservices.image import BootImageEndpointService
+from provisioningserver.rackdservices.image import (
+    BootImageEndpointService,
+    BootImageMetricsResource,
+    BootImageResource,
+)
 from provisioningserver.rackdservices.image_download_service import (
     ImageDownloadService,
 )
@@ -213,6 +217,10 @@ class TestProvisioningServiceMaker(MAASTestCase):
         resource = image_service.site.resource
         root = resource.getChildWithDefault(b"images", request=None)
         self.assertThat(root, IsInstance(FilePath))
+        self.assertThat(root, IsInstance(BootImageResource))
+        self.assertThat(
+            resource.getChildWithDefault(b"metrics", request=None),
+            IsInstance(BootImageMetricsResource))
 
         with ClusterConfiguration.open() as config:
             resource_root = FilePath(config.tftp_root)
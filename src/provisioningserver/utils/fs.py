@@ -1,4 +1,4 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Generic utilities for dealing with files and the filesystem."""
@@ -8,6 +8,7 @@ __all__ = [
     'atomic_delete',
     'atomic_symlink',
     'atomic_write',
+    'atomic_write_chunks',
     'FileLock',
     'get_library_script_path',
     'incremental_write',
@@ -99,8 +100,8 @@ def get_library_script_path(name):
         return os.path.join(get_path("/usr/lib/maas"), name)
 
 
-def _write_temp_file(content, filename):
-    """Write the given `content` in a temporary file next to `filename`."""
+def _write_temp_file(chunks, filename):
+    """Write the given `chunks` in a temporary file next to `filename`."""
     # Write the file to a temporary place (next to the target destination,
     # to ensure that it is on the same filesystem).
     directory = os.path.dirname(filename)
@@ -115,18 +116,28 @@ def _write_temp_file(content, filename):
                 directory, prefix + "XXXXXX" + suffix)
         raise
     else:
-        with os.fdopen(temp_fd, "wb") as f:
-            f.write(content)
-            # Finish writing this file to the filesystem, and then, tell the
-            # filesystem to push it down onto persistent storage.  This
-            # prevents a nasty hazard in aggressively optimized filesystems
-            # where you replace an old but consistent file with a new one that
-            # is still in cache, and lose power before the new file can be made
-            # fully persistent.
-            # This was a particular problem with ext4 at one point; it may
-            # still be.
-            f.flush()
-            os.fsync(f)
+        try:
+            with os.fdopen(temp_fd, "wb") as f:
+                for chunk in chunks:
+                    if not isinstance(chunk, bytes):
+                        raise TypeError(
+                            "Content must be bytes, got: %r" % (chunk, ))
+                    f.write(chunk)
+                # Finish writing this file to the filesystem, and then, tell
+                # the filesystem to push it down onto persistent storage.
+                # This prevents a nasty hazard in aggressively optimized
+                # filesystems where you replace an old but consistent file
+                # with a new one that is still in cache, and lose power before
+                # the new file can be made fully persistent.
+                # This was a particular problem with ext4 at one point; it may
+                # still be.
+                f.flush()
+                os.fsync(f)
+        except:
+            # Don't leave a partially written file behind, e.g. when the
+            # chunks come from a generator that fails.
+            os.remove(temp_file)
+            raise
         return temp_file
 
 
@@ -144,8 +155,17 @@ def atomic_write(content, filename, overwrite=True, mode=0o600):
     """
     if not isinstance(content, bytes):
         raise TypeError("Content must be bytes, got: %r" % (content, ))
+    atomic_write_chunks([content], filename, overwrite=overwrite, mode=mode)
+
 
-    temp_file = _write_temp_file(content, filename)
+def atomic_write_chunks(chunks, filename, overwrite=True, mode=0o600):
+    """Write `chunks` into the file `filename` in an atomic fashion.
+
+    This is like `atomic_write`, but the content is given as an iterable of
+    byte strings, written in turn, so it never needs to be held in memory
+    all at once.
+    """
+    temp_file = _write_temp_file(chunks, filename)
     os.chmod(temp_file, mode)
 
     # Copy over ownership attributes if file exists
@@ -271,7 +291,7 @@ def incremental_write(content, filename, mode=0o600):
     """Write the given `content` into the file `filename`.  In the past, this
     would potentially change modification time to arbitrary values.
 
-    :type content: `bytes`
+    :type content: `bytes`, or an iterable of `bytes` chunks.
     :param mode: Access permissions for the file.
     """
     # We used to change modification time on the files, in an attempt to out
@@ -287,7 +307,10 @@ def incremental_write(content, filename, mode=0o600):
     # granularity are no longer supported by MAAS.  The good news is that since
     # 2.6, linux has supported nanosecond-granular time.  As of bind9
     # 1:9.10.3.dfsg.P2-5, BIND even uses it.
-    atomic_write(content, filename, mode=mode)
+    if isinstance(content, bytes):
+        atomic_write(content, filename, mode=mode)
+    else:
+        atomic_write_chunks(content, filename, mode=mode)
 
 
 def _with_dev_python(*command):
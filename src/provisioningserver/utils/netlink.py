@@ -0,0 +1,154 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Listen to the kernel's rtnetlink for network configuration changes."""
+
+__all__ = [
+    "NetlinkListener",
+]
+
+import errno
+import socket
+import struct
+
+from provisioningserver.logger import LegacyLogger
+from twisted.internet import reactor
+from twisted.internet.interfaces import IReadDescriptor
+from zope.interface import implementer
+
+
+log = LegacyLogger()
+
+# Multicast groups, from <linux/rtnetlink.h>.
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+
+# Message types, from <linux/rtnetlink.h>.
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+
+# The groups this listener joins: everything that contributes to the
+# definition returned by `get_all_interfaces_definition`.
+GROUPS = (
+    RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE |
+    RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE)
+
+# The message types that signal a change to one of those.
+CHANGE_TYPES = frozenset({
+    RTM_NEWLINK, RTM_DELLINK,
+    RTM_NEWADDR, RTM_DELADDR,
+    RTM_NEWROUTE, RTM_DELROUTE,
+})
+
+# struct nlmsghdr: length, type, flags, sequence number, and port ID.
+NLMSG_HEADER = struct.Struct("=LHHLL")
+
+
+def get_message_types(datagram):
+    """Yield the type of each netlink message in `datagram`."""
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(datagram):
+        length, message_type, _, _, _ = NLMSG_HEADER.unpack_from(
+            datagram, offset)
+        if length < NLMSG_HEADER.size:
+            break  # Malformed; ignore the rest.
+        yield message_type
+        # Messages are aligned to 4 bytes.
+        offset += (length + 3) & ~3
+
+
+@implementer(IReadDescriptor)
+class NetlinkListener:
+    """Call `callback` when the kernel reports a network change.
+
+    Changes to links, addresses, and routes are reported. The messages are
+    not otherwise interpreted: the callback is expected to re-read whatever
+    it needs. It's called once for each batch of messages read, and also
+    when messages have been lost because the socket's buffer overflowed.
+
+    If the socket fails, `onLost` -- if given -- is called once the reactor
+    has stopped reading from it; no further changes will be reported.
+    """
+
+    # Read at most this many bytes from the socket at a time.
+    bufsize = 65536
+
+    def __init__(self, callback, onLost=None, reactor=reactor):
+        super(NetlinkListener, self).__init__()
+        self.callback = callback
+        self.onLost = onLost
+        self.reactor = reactor
+        self.socket = None
+
+    def startListening(self):
+        """Open the netlink socket and start reading from it.
+
+        :raise OSError: If the socket cannot be opened, for example because
+            this is not Linux.
+        """
+        if not hasattr(socket, "AF_NETLINK"):
+            raise OSError(
+                errno.EAFNOSUPPORT, "Netlink sockets are not supported.")
+        sock = socket.socket(
+            socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        try:
+            sock.bind((0, GROUPS))
+            sock.setblocking(False)
+        except:
+            sock.close()
+            raise
+        self.socket = sock
+        self.reactor.addReader(self)
+
+    def stopListening(self):
+        """Stop reading from, and close, the netlink socket."""
+        if self.socket is not None:
+            self.reactor.removeReader(self)
+            self.socket.close()
+            self.socket = None
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def logPrefix(self):
+        return "netlink"
+
+    def doRead(self):
+        changed = False
+        while True:
+            try:
+                datagram = self.socket.recv(self.bufsize)
+            except BlockingIOError:
+                break
+            except OSError as error:
+                if error.errno == errno.ENOBUFS:
+                    # Messages were dropped; assume the worst.
+                    changed = True
+                    continue
+                else:
+                    raise
+            else:
+                if not CHANGE_TYPES.isdisjoint(get_message_types(datagram)):
+                    changed = True
+        if changed:
+            try:
+                self.callback()
+            except:
+                log.err(None, "Failed to handle a network change.")
+
+    def connectionLost(self, reason):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        if self.onLost is not None:
+            try:
+                self.onLost()
+            except:
+                log.err(None, "Failed to handle losing netlink.")
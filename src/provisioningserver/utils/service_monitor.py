@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Services monitor ensures services are in their expected state."""
@@ -194,6 +194,9 @@ class ServiceMonitor:
         "failed": SERVICE_STATE.DEAD,
     }
 
+    # The systemd properties from which a service's state is derived.
+    SYSTEMD_PROPERTIES = ("LoadState", "ActiveState", "SubState", "Result")
+
     # Used to convert the supervisor state to the `SERVICE_STATE` enum.
     SUPERVISOR_TO_STATE = {
         "STARTING": SERVICE_STATE.ON,
@@ -219,6 +222,9 @@ class ServiceMonitor:
         }
         self._serviceStates = defaultdict(ServiceState)
         self._serviceLocks = defaultdict(DeferredLock)
+        # States loaded together by `ensureServices`, each to be used once
+        # by `_ensureService` instead of loading it again.
+        self._freshStates = {}
 
     def _getServiceLock(self, name):
         """Return the lock for the named service."""
@@ -284,13 +290,40 @@ class ServiceMonitor:
             d.addCallback(cb_ensureService, service_name)
             return d
 
+        def eb_refreshServiceStates(failure):
+            # Each service's state will be loaded on its own instead.
+            maaslog.warning(
+                "Unable to load the state of all services at once: %s",
+                failure.value)
+
+        def cb_ensureServices(_):
+            return DeferredList(map(ensureService, self._services))
+
         def cb_buildResult(results):
             return dict(result for _, result in results)
 
-        d = DeferredList(map(ensureService, self._services))
+        d = maybeDeferred(self._refreshServiceStates)
+        d.addErrback(eb_refreshServiceStates)
+        d.addCallback(cb_ensureServices)
         d.addCallback(cb_buildResult)
         return d
 
+    @inlineCallbacks
+    def _refreshServiceStates(self):
+        """Load the state of every service with a single command.
+
+        This is only possible with systemd; under supervisor each service's
+        state is loaded when it's ensured.
+        """
+        self._freshStates.clear()
+        if not snappy.running_in_snap():
+            states = yield self._loadSystemDServiceStates(
+                list(self._services.values()))
+            for name, state in states.items():
+                if not isinstance(state, Exception):
+                    self._freshStates[name] = self._updateServiceState(
+                        name, *state)
+
     @asynchronous
     def ensureService(self, name):
         """Ensures that a service is in its desired state."""
@@ -385,6 +418,29 @@ class ServiceMonitor:
         d = getProcessOutputAndValue(cmd[0], cmd[1:], env=env)
         return d.addCallback(decode)
 
+    @asynchronous
+    def _execSystemDShow(self, service_names):
+        """Show the properties needed to find the state of many services.
+
+        `systemctl show` is read-only so, unlike the actions, it's not run
+        with sudo.
+
+        :return: tuple (exit code, std-output, std-error)
+        """
+        env = select_c_utf8_bytes_locale()
+        cmd = [
+            "systemctl", "show",
+            "--property=" + ",".join(self.SYSTEMD_PROPERTIES),
+        ]
+        cmd.extend(service_names)
+
+        def decode(result):
+            out, err, code = result
+            return code, out.decode("utf-8"), err.decode("utf-8")
+
+        d = getProcessOutputAndValue(cmd[0], cmd[1:], env=env)
+        return d.addCallback(decode)
+
     @asynchronous
     def _execSupervisorServiceAction(self, service_name, action):
         """Perform the action with the run-supervisorctl command.
@@ -486,6 +542,72 @@ class ServiceMonitor:
             "Unable to parse the output from systemd for service '%s'." % (
                 service.service_name))
 
+    @inlineCallbacks
+    def _loadSystemDServiceStates(self, services):
+        """Return the status of all `services` from systemd.
+
+        :return: A dict mapping each service's name to its active and process
+            states, or to the exception that explains why they're not known.
+        """
+        exit_code, output, error = yield self._execSystemDShow(
+            [service.service_name for service in services])
+        # `systemctl show` prints a block of "Property=value" lines for each
+        # unit, in the order given, separated by empty lines. Units are not
+        # otherwise identified: the "Id" of an aliased unit is its target's.
+        #
+        # output for two services looks like:
+        #   LoadState=loaded
+        #   ActiveState=active
+        #   SubState=running
+        #   Result=success
+        #
+        #   LoadState=not-found
+        #   ActiveState=inactive
+        #   SubState=dead
+        #   Result=success
+        blocks = [
+            dict(
+                line.split("=", 1) for line in block.splitlines()
+                if "=" in line)
+            for block in output.strip().split("\n\n")
+        ]
+        if len(blocks) != len(services):
+            raise ServiceParsingError(
+                "Unable to parse the output from systemd; expected the "
+                "properties of %d services, got %d: %s" % (
+                    len(services), len(blocks), error))
+        states = {}
+        for service, properties in zip(services, blocks):
+            try:
+                states[service.name] = self._getSystemDServiceState(
+                    service, properties)
+            except (ServiceParsingError, ServiceUnknownError) as e:
+                states[service.name] = e
+        returnValue(states)
+
+    def _getSystemDServiceState(self, service, properties):
+        """Return the status of `service` from its systemd `properties`."""
+        if "LoadState" not in properties or "ActiveState" not in properties:
+            raise ServiceParsingError(
+                "Unable to parse the output from systemd for service '%s'." % (
+                    service.service_name))
+        if properties["LoadState"] != "loaded":
+            raise ServiceUnknownError("'%s' is unknown to systemd." % (
+                service.service_name))
+        active_state = properties["ActiveState"]
+        active_state_enum = self.SYSTEMD_TO_STATE.get(active_state)
+        if active_state_enum is None:
+            raise ServiceParsingError(
+                "Unable to parse the active state from systemd for "
+                "service '%s', active state reported as '%s'." % (
+                    service.service_name, active_state))
+        # Match the process state that `systemctl status` reports.
+        if active_state == "failed":
+            process_state = "Result: %s" % properties.get("Result")
+        else:
+            process_state = properties.get("SubState")
+        return active_state_enum, process_state
+
     @inlineCallbacks
     def _loadSupervisorServiceState(self, service):
         """Return service status from supervisor."""
@@ -537,7 +659,9 @@ class ServiceMonitor:
         else:
             expected_states = [expected_state]
 
-        state = yield self.getServiceState(service.name, now=True)
+        state = self._freshStates.pop(service.name, None)
+        if state is None:
+            state = yield self.getServiceState(service.name, now=True)
         if state.active_state in expected_states:
             expected_process_state = (
                 self.PROCESS_STATE[state.active_state])
@@ -43,6 +43,7 @@ from provisioningserver.utils.fs import (
     get_maas_common_command,
     NamedLock,
 )
+from provisioningserver.utils.netlink import NetlinkListener
 from provisioningserver.utils.network import (
     enumerate_ipv4_addresses,
     get_all_interfaces_definition,
@@ -59,6 +60,7 @@ from twisted.application.service import MultiService
 from twisted.internet import reactor
 from twisted.internet.defer import (
     Deferred,
+    DeferredLock,
     inlineCallbacks,
     maybeDeferred,
 )
@@ -946,11 +948,23 @@ class NetworksMonitoringService(MultiService, metaclass=ABCMeta):
     Parse ``/etc/network/interfaces`` and the output from ``ip addr show`` to
     update MAAS's records of network interfaces on this host.
 
+    Where the kernel's rtnetlink can be listened to, the interfaces are only
+    read again once a change is reported and things have settled, or every
+    `resync_interval` in case a change was missed. Otherwise they're read
+    every `interval`.
+
     :param clock: An `IReactor` instance.
     """
 
     interval = timedelta(seconds=30).total_seconds()
 
+    # How often to read the interfaces when notified of changes by netlink.
+    resync_interval = timedelta(minutes=10).total_seconds()
+
+    # How long to wait after the last reported change before reading the
+    # interfaces, so that a burst of changes is recorded in one go.
+    settle_interval = timedelta(seconds=2).total_seconds()
+
     def __init__(
             self, clock=None, enable_monitoring=True, enable_beaconing=True):
         # Order is very important here. First we set the clock to the passed-in
@@ -983,6 +997,17 @@ class NetworksMonitoringService(MultiService, metaclass=ABCMeta):
         self.interface_monitor.clock = self.clock
         self.interface_monitor.setServiceParent(self)
         self.beaconing_protocol = None
+        # Listens for changes to the interfaces while the service is running.
+        self._netlink = None
+        # Whether the interfaces may have changed since they were last read,
+        # and when that was.
+        self._changed = True
+        self._last_read = None
+        self._settle_call = None
+        self._update_lock = DeferredLock()
+
+    def _getClock(self):
+        return reactor if self.clock is None else self.clock
 
     @inlineCallbacks
     def updateInterfaces(self):
@@ -994,15 +1019,80 @@ class NetworksMonitoringService(MultiService, metaclass=ABCMeta):
         responsible = self._assumeSoleResponsibility()
         if responsible:
             interfaces = None
+            yield self._update_lock.acquire()
             try:
-                interfaces = yield maybeDeferred(self.getInterfaces)
+                if self._mayHaveChanged():
+                    self._changed = False
+                    self._last_read = self._getClock().seconds()
+                    interfaces = yield maybeDeferred(self.getInterfaces)
+                else:
+                    interfaces = self._recorded
                 yield self._updateInterfaces(interfaces)
             except BaseException as e:
+                # Read the interfaces again next time.
+                self._changed = True
                 msg = (
                     "Failed to update and/or record network interface "
                     "configuration: %s; interfaces: %r" % (e, interfaces)
                 )
                 log.err(None, msg)
+            finally:
+                self._update_lock.release()
+
+    def _mayHaveChanged(self):
+        """Return whether the interfaces need to be read again."""
+        if self._netlink is None or self._changed or self._recorded is None:
+            return True
+        else:
+            elapsed = self._getClock().seconds() - self._last_read
+            return elapsed >= self.resync_interval
+
+    def _interfacesChanged(self):
+        """Called when netlink reports a change to the interfaces.
+
+        The interfaces are updated once no further changes have been reported
+        for `settle_interval` seconds.
+        """
+        self._changed = True
+        if self._settle_call is not None and self._settle_call.active():
+            self._settle_call.reset(self.settle_interval)
+        else:
+            self._settle_call = self._getClock().callLater(
+                self.settle_interval, self.updateInterfaces)
+
+    def _netlinkLost(self):
+        """Called when the netlink socket fails.
+
+        Changes will no longer be reported, so the interfaces are read again
+        every `interval` from now on.
+        """
+        log.msg(
+            "Stopped listening for network changes; checking network "
+            "interfaces every %d seconds." % self.interval)
+        self._netlink = None
+        self._changed = True
+
+    def _startNetlink(self):
+        """Start listening for changes to the interfaces, if possible."""
+        netlink = NetlinkListener(
+            self._interfacesChanged, onLost=self._netlinkLost)
+        try:
+            netlink.startListening()
+        except OSError as error:
+            log.msg(
+                "Cannot listen for network changes (%s); checking network "
+                "interfaces every %d seconds." % (error, self.interval))
+        else:
+            self._netlink = netlink
+
+    def _stopNetlink(self):
+        """Stop listening for changes to the interfaces."""
+        if self._settle_call is not None and self._settle_call.active():
+            self._settle_call.cancel()
+        self._settle_call = None
+        if self._netlink is not None:
+            self._netlink.stopListening()
+            self._netlink = None
 
     def getInterfaces(self):
         """Get the current network interfaces configuration.
@@ -1045,11 +1135,21 @@ class NetworksMonitoringService(MultiService, metaclass=ABCMeta):
             log.msg("Received beacon: %r" % beacon)
             self.beaconing_protocol.beaconReceived(beacon)
 
+    def startService(self):
+        """Start the service.
+
+        Starts listening for changes before the interfaces are first read, so
+        that none are missed.
+        """
+        self._startNetlink()
+        super().startService()
+
     def stopService(self):
         """Stop the service.
 
         Ensures that sole responsibility for monitoring networks is released.
         """
+        self._stopNetlink()
         d = super().stopService()
         if self.beaconing_protocol is not None:
             self.beaconing_protocol.stopProtocol()
@@ -49,6 +49,7 @@ from provisioningserver.utils.fs import (
     atomic_delete,
     atomic_symlink,
     atomic_write,
+    atomic_write_chunks,
     FileLock,
     get_library_script_path,
     get_maas_common_command,
@@ -201,6 +202,43 @@ class TestAtomicWrite(MAASTestCase):
             factory.make_string())
 
 
+class TestAtomicWriteChunks(MAASTestCase):
+    """Test `atomic_write_chunks`."""
+
+    def test_atomic_write_chunks_writes_chunks_in_order(self):
+        chunks = [factory.make_bytes() for _ in range(3)]
+        filename = self.make_file(contents=factory.make_string())
+        atomic_write_chunks(iter(chunks), filename)
+        self.assertThat(filename, FileContains(b"".join(chunks)))
+
+    def test_atomic_write_chunks_rejects_non_bytes_chunks(self):
+        content = factory.make_bytes()
+        filename = self.make_file(contents=content)
+        self.assertRaises(
+            TypeError, atomic_write_chunks,
+            [factory.make_bytes(), factory.make_string()], filename)
+        self.assertThat(filename, FileContains(content))
+        self.assertItemsEqual(
+            [os.path.basename(filename)],
+            os.listdir(os.path.dirname(filename)))
+
+    def test_atomic_write_chunks_removes_temp_file_on_failure(self):
+        content = factory.make_bytes()
+        filename = self.make_file(contents=content)
+        exception = factory.make_exception_type()
+
+        def gen_chunks():
+            yield factory.make_bytes()
+            raise exception()
+
+        self.assertRaises(
+            exception, atomic_write_chunks, gen_chunks(), filename)
+        self.assertThat(filename, FileContains(content))
+        self.assertItemsEqual(
+            [os.path.basename(filename)],
+            os.listdir(os.path.dirname(filename)))
+
+
 class TestAtomicCopy(MAASTestCase):
 
     def test_integration(self):
@@ -362,6 +400,12 @@ class TestIncrementalWrite(MAASTestCase):
         self.assertAlmostEqual(
             os.stat(filename).st_mtime, new_time, delta=2.0)
 
+    def test_incremental_write_writes_chunks(self):
+        chunks = [factory.make_bytes() for _ in range(3)]
+        filename = self.make_file(contents=factory.make_string())
+        incremental_write(iter(chunks), filename)
+        self.assertThat(filename, FileContains(b"".join(chunks)))
+
     def test_incremental_write_sets_permissions(self):
         atomic_file = self.make_file()
         mode = 0o323
@@ -0,0 +1,158 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `provisioningserver.utils.netlink`."""
+
+__all__ = []
+
+import errno
+import socket
+from unittest.mock import (
+    Mock,
+    sentinel,
+)
+
+from maastesting.matchers import (
+    DocTestMatches,
+    MockCalledOnceWith,
+    MockNotCalled,
+)
+from maastesting.testcase import MAASTestCase
+from maastesting.twisted import TwistedLoggerFixture
+from provisioningserver.utils import netlink
+from provisioningserver.utils.netlink import (
+    get_message_types,
+    NetlinkListener,
+    NLMSG_HEADER,
+    RTM_DELADDR,
+    RTM_NEWLINK,
+)
+from testtools.matchers import (
+    Equals,
+    Is,
+)
+
+
+NLMSG_DONE = 3
+
+
+def make_message(message_type, payload=b""):
+    return NLMSG_HEADER.pack(
+        NLMSG_HEADER.size + len(payload), message_type, 0, 0, 0) + payload
+
+
+class TestGetMessageTypes(MAASTestCase):
+    """Tests for `get_message_types`."""
+
+    def test__yields_type_of_each_message(self):
+        datagram = b"".join((
+            make_message(RTM_NEWLINK, b"\x01\x02\x03\x04"),
+            # Messages are padded to a multiple of 4 bytes.
+            make_message(RTM_DELADDR, b"\x01\x02") + b"\0\0",
+            make_message(NLMSG_DONE),
+        ))
+        self.assertThat(
+            list(get_message_types(datagram)),
+            Equals([RTM_NEWLINK, RTM_DELADDR, NLMSG_DONE]))
+
+    def test__ignores_truncated_messages(self):
+        datagram = make_message(RTM_NEWLINK) + b"\x01\x02"
+        self.assertThat(
+            list(get_message_types(datagram)), Equals([RTM_NEWLINK]))
+
+    def test__stops_at_malformed_message(self):
+        datagram = NLMSG_HEADER.pack(0, RTM_NEWLINK, 0, 0, 0)
+        self.assertThat(list(get_message_types(datagram)), Equals([]))
+
+
+class TestNetlinkListener(MAASTestCase):
+    """Tests for `NetlinkListener`."""
+
+    def make_listener(self, *results):
+        callback = Mock()
+        listener = NetlinkListener(callback, reactor=Mock())
+        listener.socket = Mock()
+        listener.socket.recv.side_effect = results + (BlockingIOError(),)
+        return listener, callback
+
+    def test_doRead_calls_callback_once_for_changes(self):
+        listener, callback = self.make_listener(
+            make_message(RTM_NEWLINK), make_message(RTM_DELADDR))
+        listener.doRead()
+        self.assertThat(callback, MockCalledOnceWith())
+
+    def test_doRead_ignores_other_messages(self):
+        listener, callback = self.make_listener(make_message(NLMSG_DONE))
+        listener.doRead()
+        self.assertThat(callback, MockNotCalled())
+
+    def test_doRead_calls_callback_when_messages_are_lost(self):
+        listener, callback = self.make_listener(
+            OSError(errno.ENOBUFS, "No buffer space available"))
+        listener.doRead()
+        self.assertThat(callback, MockCalledOnceWith())
+
+    def test_doRead_logs_callback_errors(self):
+        listener, callback = self.make_listener(make_message(RTM_NEWLINK))
+        callback.side_effect = ZeroDivisionError()
+        with TwistedLoggerFixture() as logger:
+            listener.doRead()
+        self.assertThat(logger.output, DocTestMatches(
+            "Failed to handle a network change.\n..."))
+
+    def test_startListening_adds_reader(self):
+        sock = self.patch(netlink.socket, "socket").return_value
+        listener = NetlinkListener(sentinel.callback, reactor=Mock())
+        listener.startListening()
+        self.assertThat(
+            netlink.socket.socket, MockCalledOnceWith(
+                socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE))
+        self.assertThat(sock.bind, MockCalledOnceWith((0, netlink.GROUPS)))
+        self.assertThat(listener.socket, Is(sock))
+        self.assertThat(
+            listener.reactor.addReader, MockCalledOnceWith(listener))
+
+    def test_startListening_closes_socket_on_error(self):
+        sock = self.patch(netlink.socket, "socket").return_value
+        sock.bind.side_effect = PermissionError()
+        listener = NetlinkListener(sentinel.callback, reactor=Mock())
+        self.assertRaises(PermissionError, listener.startListening)
+        self.assertThat(sock.close, MockCalledOnceWith())
+        self.assertThat(listener.socket, Is(None))
+
+    def test_stopListening_does_not_call_onLost(self):
+        onLost = Mock()
+        listener = NetlinkListener(
+            sentinel.callback, onLost=onLost, reactor=Mock())
+        listener.socket = Mock()
+        listener.stopListening()
+        self.assertThat(onLost, MockNotCalled())
+
+    def test_connectionLost_closes_socket_and_calls_onLost(self):
+        onLost = Mock()
+        listener = NetlinkListener(
+            sentinel.callback, onLost=onLost, reactor=Mock())
+        sock = listener.socket = Mock()
+        listener.connectionLost(sentinel.reason)
+        self.assertThat(sock.close, MockCalledOnceWith())
+        self.assertThat(listener.socket, Is(None))
+        self.assertThat(onLost, MockCalledOnceWith())
+
+    def test_connectionLost_logs_onLost_errors(self):
+        onLost = Mock(side_effect=ZeroDivisionError())
+        listener = NetlinkListener(
+            sentinel.callback, onLost=onLost, reactor=Mock())
+        listener.socket = Mock()
+        with TwistedLoggerFixture() as logger:
+            listener.connectionLost(sentinel.reason)
+        self.assertThat(logger.output, DocTestMatches(
+            "Failed to handle losing netlink.\n..."))
+
+    def test_stopListening_removes_reader_and_closes_socket(self):
+        listener = NetlinkListener(sentinel.callback, reactor=Mock())
+        sock = listener.socket = Mock()
+        listener.stopListening()
+        self.assertThat(
+            listener.reactor.removeReader, MockCalledOnceWith(listener))
+        self.assertThat(sock.close, MockCalledOnceWith())
+        self.assertThat(listener.socket, Is(None))
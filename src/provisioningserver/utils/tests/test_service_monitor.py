@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for `provisioningserver.service_monitor`."""
@@ -42,6 +42,7 @@ from testtools import ExpectedException
 from testtools.matchers import (
     Contains,
     Equals,
+    IsInstance,
 )
 from twisted.internet import reactor
 from twisted.internet.defer import (
@@ -274,6 +275,7 @@ class TestServiceMonitor(MAASTestCase):
             expected_states[service.name] = ServiceState(
                 active_state, process_state)
         service_monitor = self.make_service_monitor(fake_services)
+        self.patch(service_monitor, "_refreshServiceStates")
         self.patch(service_monitor, "ensureService").side_effect = (
             lambda name: succeed(expected_states[name]))
         observed = yield service_monitor.ensureServices()
@@ -293,6 +295,7 @@ class TestServiceMonitor(MAASTestCase):
         service_monitor._serviceStates.update(service_states)
 
         # Make both service monitor checks fail with a distinct error.
+        self.patch(service_monitor, "_refreshServiceStates")
         self.patch(service_monitor, "ensureService")
 
         def raise_exception(service_name):
@@ -317,6 +320,76 @@ class TestServiceMonitor(MAASTestCase):
                 "While monitoring service '%s' an error was encountered: "
                 "%s broke" % (service.name, service.name)))
 
+    @inlineCallbacks
+    def test__ensureServices_uses_states_loaded_together(self):
+        services = [make_fake_service(SERVICE_STATE.ON) for _ in range(3)]
+        service_monitor = self.make_service_monitor(services)
+        mock_loadSystemDServiceStates = self.patch(
+            service_monitor, "_loadSystemDServiceStates")
+        mock_loadSystemDServiceStates.return_value = succeed({
+            service.name: (SERVICE_STATE.ON, "running")
+            for service in services
+        })
+        mock_getServiceState = self.patch(service_monitor, "getServiceState")
+        observed = yield service_monitor.ensureServices()
+        self.assertThat(
+            observed, Equals({
+                service.name: ServiceState(SERVICE_STATE.ON, "running")
+                for service in services
+            }))
+        self.assertThat(mock_loadSystemDServiceStates, MockCalledOnceWith(
+            list(service_monitor._services.values())))
+        self.assertThat(mock_getServiceState, MockNotCalled())
+        self.assertThat(service_monitor._freshStates, Equals({}))
+
+    @inlineCallbacks
+    def test__ensureServices_loads_unknown_states_individually(self):
+        service = make_fake_service(SERVICE_STATE.ON)
+        service_monitor = self.make_service_monitor([service])
+        mock_loadSystemDServiceStates = self.patch(
+            service_monitor, "_loadSystemDServiceStates")
+        mock_loadSystemDServiceStates.return_value = succeed(
+            {service.name: ServiceParsingError()})
+        mock_getServiceState = self.patch(service_monitor, "getServiceState")
+        mock_getServiceState.return_value = succeed(
+            ServiceState(SERVICE_STATE.ON, "running"))
+        yield service_monitor.ensureServices()
+        self.assertThat(
+            mock_getServiceState, MockCalledOnceWith(service.name, now=True))
+
+    @inlineCallbacks
+    def test__ensureServices_loads_states_individually_after_error(self):
+        service = make_fake_service(SERVICE_STATE.ON)
+        service_monitor = self.make_service_monitor([service])
+        mock_loadSystemDServiceStates = self.patch(
+            service_monitor, "_loadSystemDServiceStates")
+        mock_loadSystemDServiceStates.side_effect = (
+            factory.make_exception("broken"))
+        mock_getServiceState = self.patch(service_monitor, "getServiceState")
+        mock_getServiceState.return_value = succeed(
+            ServiceState(SERVICE_STATE.ON, "running"))
+        with FakeLogger("maas.service_monitor") as logger:
+            yield service_monitor.ensureServices()
+        self.assertThat(
+            mock_getServiceState, MockCalledOnceWith(service.name, now=True))
+        self.assertThat(logger.output, Contains(
+            "Unable to load the state of all services at once: broken"))
+
+    @inlineCallbacks
+    def test__ensureServices_loads_states_individually_in_snap(self):
+        self.run_under_snappy()
+        service = make_fake_service(SERVICE_STATE.ON)
+        service_monitor = self.make_service_monitor([service])
+        mock_loadSystemDServiceStates = self.patch(
+            service_monitor, "_loadSystemDServiceStates")
+        mock_getServiceState = self.patch(service_monitor, "getServiceState")
+        mock_getServiceState.return_value = succeed(
+            ServiceState(SERVICE_STATE.ON, "running"))
+        yield service_monitor.ensureServices()
+        self.assertThat(mock_loadSystemDServiceStates, MockNotCalled())
+        self.assertThat(
+            mock_getServiceState, MockCalledOnceWith(service.name, now=True))
+
     @inlineCallbacks
     def test__ensureServices_calls__ensureService(self):
         fake_service = make_fake_service()
@@ -501,6 +574,39 @@ class TestServiceMonitor(MAASTestCase):
         self.assertThat(stdout, Equals(example_stdout))
         self.assertThat(stderr, Equals(example_stderr))
 
+    @inlineCallbacks
+    def test___execSystemDShow_calls_systemctl_show_once(self):
+        service_monitor = self.make_service_monitor()
+        service_names = [factory.make_name("service") for _ in range(3)]
+        mock_getProcessOutputAndValue = self.patch(
+            service_monitor_module, "getProcessOutputAndValue")
+        mock_getProcessOutputAndValue.return_value = succeed((b"", b"", 0))
+        yield service_monitor._execSystemDShow(service_names)
+        cmd = [
+            "systemctl", "show",
+            "--property=LoadState,ActiveState,SubState,Result",
+        ] + service_names
+        self.assertThat(
+            mock_getProcessOutputAndValue, MockCalledOnceWith(
+                # The environment contains LC_ALL and LANG too.
+                cmd[0], cmd[1:], env=select_c_utf8_bytes_locale()))
+
+    @inlineCallbacks
+    def test___execSystemDShow_does_not_use_sudo(self):
+        # The sudoers files allow only the service actions; `systemctl show`
+        # is read-only and needs no privileges.
+        service_monitor = self.make_service_monitor()
+        mock_getProcessOutputAndValue = self.patch(
+            service_monitor_module, "getProcessOutputAndValue")
+        mock_getProcessOutputAndValue.return_value = succeed((b"", b"", 0))
+        yield service_monitor._execSystemDShow(["maas-dhcpd", "maas-proxy"])
+        self.assertThat(
+            mock_getProcessOutputAndValue, MockCalledOnceWith(
+                "systemctl", [
+                    "show", "--property=LoadState,ActiveState,SubState,Result",
+                    "maas-dhcpd", "maas-proxy",
+                ], env=select_c_utf8_bytes_locale()))
+
     @inlineCallbacks
     def test___execSupervisorServiceAction_calls_supervisorctl(self):
         snap_path = factory.make_name("path")
@@ -776,6 +882,66 @@ class TestServiceMonitor(MAASTestCase):
         with ExpectedException(ServiceParsingError):
             yield service_monitor._loadSystemDServiceState(service)
 
+    @inlineCallbacks
+    def test___loadSystemDServiceStates_parses_each_service(self):
+        services = [
+            make_fake_service(SERVICE_STATE.ON)
+            for _ in range(5)
+        ]
+        service_monitor = self.make_service_monitor(services)
+        systemd_show_output = dedent("""\
+            LoadState=loaded
+            ActiveState=active
+            SubState=running
+            Result=success
+
+            LoadState=loaded
+            ActiveState=inactive
+            SubState=dead
+            Result=success
+
+            LoadState=loaded
+            ActiveState=failed
+            SubState=failed
+            Result=exit-code
+
+            LoadState=not-found
+            ActiveState=inactive
+            SubState=dead
+            Result=success
+
+            LoadState=loaded
+            ActiveState=activating
+            SubState=start
+            Result=success
+            """)
+        mock_execSystemDShow = self.patch(service_monitor, "_execSystemDShow")
+        mock_execSystemDShow.return_value = (0, systemd_show_output, "")
+        states = yield service_monitor._loadSystemDServiceStates(services)
+        self.assertThat(mock_execSystemDShow, MockCalledOnceWith(
+            [service.service_name for service in services]))
+        self.assertThat(
+            [states[service.name] for service in services[:3]],
+            Equals([
+                (SERVICE_STATE.ON, "running"),
+                (SERVICE_STATE.OFF, "dead"),
+                (SERVICE_STATE.DEAD, "Result: exit-code"),
+            ]))
+        self.assertThat(
+            states[services[3].name], IsInstance(ServiceUnknownError))
+        self.assertThat(
+            states[services[4].name], IsInstance(ServiceParsingError))
+
+    @inlineCallbacks
+    def test___loadSystemDServiceStates_raises_error_for_bad_output(self):
+        services = [make_fake_service() for _ in range(2)]
+        service_monitor = self.make_service_monitor(services)
+        mock_execSystemDShow = self.patch(service_monitor, "_execSystemDShow")
+        mock_execSystemDShow.return_value = (
+            1, "", "Failed to connect to bus")
+        with ExpectedException(ServiceParsingError):
+            yield service_monitor._loadSystemDServiceStates(services)
+
     @inlineCallbacks
     def test___loadSupervisorServiceState_status_calls_supervisorctl(self):
         service = make_fake_service(SERVICE_STATE.ON)
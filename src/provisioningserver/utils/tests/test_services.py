@@ -1,4 +1,4 @@
-# Copyright 2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2016-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for services."""
@@ -239,6 +239,100 @@ class TestNetworksMonitoringService(MAASTestCase):
             yield service.updateInterfaces()
             self.assertThat(recordInterfaces, MockNotCalled())
 
+    @inlineCallbacks
+    def test_does_not_read_unchanged_interfaces_when_listening(self):
+        get_interfaces = self.patch(services, "get_all_interfaces_definition")
+        get_interfaces.return_value = {}
+        service = self.makeService(clock=Clock())
+        service._netlink = Mock()
+        yield service.updateInterfaces()
+        yield service.updateInterfaces()
+        self.assertThat(get_interfaces, MockCalledOnceWith())
+        self.assertThat(service.interfaces, Equals([{}]))
+
+    @inlineCallbacks
+    def test_reads_interfaces_once_changes_settle(self):
+        get_interfaces = self.patch(services, "get_all_interfaces_definition")
+        get_interfaces.side_effect = [sentinel.config1, sentinel.config2]
+        clock = Clock()
+        service = self.makeService(clock=clock)
+        service._netlink = Mock()
+        yield service.updateInterfaces()
+        # Several changes in quick succession are recorded together.
+        service._interfacesChanged()
+        clock.advance(service.settle_interval - 1)
+        service._interfacesChanged()
+        clock.advance(service.settle_interval - 1)
+        self.assertThat(get_interfaces, MockCalledOnceWith())
+        clock.advance(1)
+        yield service.iterations.get()
+        yield service.iterations.get()
+        self.assertThat(get_interfaces, MockCallsMatch(call(), call()))
+        self.assertThat(service.interfaces, Equals(
+            [sentinel.config1, sentinel.config2]))
+
+    @inlineCallbacks
+    def test_reads_interfaces_after_resync_interval_when_listening(self):
+        get_interfaces = self.patch(services, "get_all_interfaces_definition")
+        get_interfaces.return_value = {}
+        clock = Clock()
+        service = self.makeService(clock=clock)
+        service._netlink = Mock()
+        yield service.updateInterfaces()
+        clock.advance(service.resync_interval)
+        yield service.updateInterfaces()
+        self.assertThat(get_interfaces, MockCallsMatch(call(), call()))
+
+    @inlineCallbacks
+    def test_listens_for_changes_while_running(self):
+        self.patch(services, "get_all_interfaces_definition").return_value = {}
+        listener = self.patch(services, "NetlinkListener").return_value
+        service = self.makeService(clock=Clock())
+        yield service.startService()
+        self.assertThat(service._netlink, Is(listener))
+        self.assertThat(listener.startListening, MockCalledOnceWith())
+        yield service.stopService()
+        self.assertThat(service._netlink, Is(None))
+        self.assertThat(listener.stopListening, MockCalledOnceWith())
+
+    @inlineCallbacks
+    def test_polls_once_it_stops_listening_for_changes(self):
+        get_interfaces = self.patch(services, "get_all_interfaces_definition")
+        get_interfaces.return_value = {}
+        NetlinkListener = self.patch(services, "NetlinkListener")
+        clock = Clock()
+        service = self.makeService(clock=clock)
+        yield service.startService()
+        self.addCleanup(service.stopService)
+        yield service.iterations.get()
+        self.assertThat(get_interfaces, MockCalledOnceWith())
+        # The netlink socket fails; the listener reports that it's lost.
+        [_, kwargs] = NetlinkListener.call_args
+        with TwistedLoggerFixture() as logger:
+            kwargs["onLost"]()
+        self.assertThat(service._netlink, Is(None))
+        self.assertThat(logger.output, DocTestMatches(
+            "Stopped listening for network changes...every 30 seconds."))
+        # The interfaces are now read on every tick.
+        clock.advance(service.interval)
+        yield service.iterations.get()
+        clock.advance(service.interval)
+        yield service.iterations.get()
+        self.assertThat(get_interfaces, MockCallsMatch(call(), call(), call()))
+
+    @inlineCallbacks
+    def test_polls_when_it_cannot_listen_for_changes(self):
+        self.patch(services, "get_all_interfaces_definition").return_value = {}
+        listener = self.patch(services, "NetlinkListener").return_value
+        listener.startListening.side_effect = OSError()
+        service = self.makeService(clock=Clock())
+        with TwistedLoggerFixture() as logger:
+            yield service.startService()
+        self.addCleanup(service.stopService)
+        self.assertThat(service._netlink, Is(None))
+        self.assertThat(logger.output, DocTestMatches(
+            "Cannot listen for network changes...every 30 seconds."))
+
     @inlineCallbacks
     def test_assumes_sole_responsibility_before_updating(self):
         # A filesystem lock is used to prevent multiple network monitors from
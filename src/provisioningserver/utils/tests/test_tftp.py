@@ -1,13 +1,30 @@
-# Copyright 2015 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for ``provisioningserver.utils.tftp``."""
 
 __all__ = []
 
+from collections import OrderedDict
+import struct
+
 from maastesting.factory import factory
 from maastesting.testcase import MAASTestCase
+from provisioningserver.boot import BytesReader
 from provisioningserver.utils import tftp
+from provisioningserver.utils.tftp import (
+    WindowedReadSession,
+    WindowedRemoteOriginReadSession,
+)
+from testtools.matchers import (
+    Equals,
+    Is,
+)
+from tftp.datagram import (
+    ACKDatagram,
+    OACKDatagram,
+)
+from twisted.internet.task import Clock
 from twisted.python.context import call
 
 
@@ -45,3 +62,148 @@ class TestAddressFunctions(MAASTestCase):
     def test__blows_up_when_tuple_has_one_element(self):
         context = {self.context_key: (factory.make_hostname(),)}
         self.assertRaises(AssertionError, call, context, self.get_address)
+
+
+class FakeTransport:
+    """A connected datagram transport that records what's written."""
+
+    def __init__(self):
+        super(FakeTransport, self).__init__()
+        self.written = []
+        self.listening = True
+
+    def connect(self, host, port):
+        pass
+
+    def write(self, datagram):
+        self.written.append(datagram)
+
+    def stopListening(self):
+        self.listening = False
+
+
+def block_numbers(datagrams):
+    """Return the block numbers of the given DATA datagrams."""
+    return [struct.unpack("!HH", datagram[:4])[1] for datagram in datagrams]
+
+
+class TestWindowedReadSession(MAASTestCase):
+    """Tests for `WindowedReadSession`."""
+
+    def make_session(self, blocks, window_size):
+        # Each block is 4 bytes, and the last block is short.
+        reader = BytesReader(b"x" * (4 * blocks - 1))
+        session = WindowedReadSession(reader, _clock=Clock())
+        session.block_size = 4
+        session.window_size = window_size
+        session.transport = FakeTransport()
+        session.startProtocol()
+        return session
+
+    def test_sends_a_window_of_blocks(self):
+        session = self.make_session(blocks=10, window_size=4)
+        self.assertThat(
+            block_numbers(session.transport.written), Equals([1, 2, 3, 4]))
+
+    def test_ack_of_last_block_in_window_sends_next_window(self):
+        session = self.make_session(blocks=10, window_size=4)
+        session.transport.written.clear()
+        session.tftp_ACK(ACKDatagram(4))
+        self.assertThat(
+            block_numbers(session.transport.written), Equals([5, 6, 7, 8]))
+
+    def test_ack_of_earlier_block_restarts_window_after_it(self):
+        session = self.make_session(blocks=10, window_size=4)
+        session.transport.written.clear()
+        session.tftp_ACK(ACKDatagram(2))
+        self.assertThat(
+            block_numbers(session.transport.written), Equals([3, 4, 5, 6]))
+
+    def test_ignores_acks_outside_of_window(self):
+        session = self.make_session(blocks=10, window_size=4)
+        session.tftp_ACK(ACKDatagram(4))
+        session.transport.written.clear()
+        session.tftp_ACK(ACKDatagram(4))
+        self.assertThat(session.transport.written, Equals([]))
+
+    def test_completes_when_last_block_is_acknowledged(self):
+        session = self.make_session(blocks=3, window_size=4)
+        self.expectThat(
+            block_numbers(session.transport.written), Equals([1, 2, 3]))
+        session.tftp_ACK(ACKDatagram(3))
+        self.expectThat(session.completed, Is(True))
+        self.expectThat(session.transport.listening, Is(False))
+
+    def test_resends_window_on_timeout_then_gives_up(self):
+        session = self.make_session(blocks=10, window_size=2)
+        session.timeout = (1, 1, 1)
+        session._startTimeout(session.timeout)
+        session._clock.advance(1)
+        session._clock.advance(1)
+        self.expectThat(
+            block_numbers(session.transport.written),
+            Equals([1, 2, 1, 2, 1, 2]))
+        self.expectThat(session.transport.listening, Is(True))
+        session._clock.advance(1)
+        self.expectThat(session.transport.listening, Is(False))
+
+    def test_block_numbers_wrap_around(self):
+        session = self.make_session(blocks=10, window_size=4)
+        session.blocks_read = 65534
+        session.window.clear()
+        session.transport.written.clear()
+        session.nextBlock()
+        self.assertThat(
+            block_numbers(session.transport.written), Equals([65535, 0, 1, 2]))
+
+
+class TestWindowedRemoteOriginReadSession(MAASTestCase):
+    """Tests for `WindowedRemoteOriginReadSession`."""
+
+    def make_session(self, data=b"", options=None):
+        return WindowedRemoteOriginReadSession(
+            ("127.0.0.1", 69), BytesReader(data), options, _clock=Clock())
+
+    def test_uses_windowed_read_session(self):
+        session = self.make_session()
+        self.assertIsInstance(session.session, WindowedReadSession)
+
+    def test_option_windowsize_accepts_window_size(self):
+        session = self.make_session()
+        self.expectThat(session.option_windowsize(b"8"), Equals(b"8"))
+        self.expectThat(session.window_size, Equals(8))
+
+    def test_option_windowsize_limits_window_size(self):
+        session = self.make_session()
+        self.expectThat(session.option_windowsize(b"1000"), Equals(b"64"))
+        self.expectThat(session.window_size, Equals(64))
+
+    def test_option_windowsize_rejects_invalid_values(self):
+        session = self.make_session()
+        for value in (b"0", b"65536", factory.make_name("size").encode()):
+            self.expectThat(session.option_windowsize(value), Is(None))
+        self.expectThat(session.window_size, Equals(1))
+
+    def test_negotiates_windowsize_and_sends_windows(self):
+        # Options arrive as python-tx-tftp parses them from an RRQ.
+        options = OrderedDict([(b"blksize", b"8"), (b"windowsize", b"4")])
+        session = self.make_session(b"x" * (8 * 10 - 1), options)
+        session.transport = FakeTransport()
+        session.startProtocol()
+        # The client is sent an OACK with both options.
+        self.expectThat(session.options, Equals(options))
+        self.expectThat(
+            session.transport.written,
+            Equals([OACKDatagram(options).to_wire()]))
+        # Acknowledging the OACK starts the transfer, a window at a time.
+        session.transport.written.clear()
+        session.datagramReceived(ACKDatagram(0).to_wire(), session.remote)
+        self.expectThat(
+            block_numbers(session.transport.written), Equals([1, 2, 3, 4]))
+        self.expectThat(
+            [len(datagram) - 4 for datagram in session.transport.written],
+            Equals([8, 8, 8, 8]))
+        session.transport.written.clear()
+        session.datagramReceived(ACKDatagram(4).to_wire(), session.remote)
+        self.expectThat(
+            block_numbers(session.transport.written), Equals([5, 6, 7, 8]))
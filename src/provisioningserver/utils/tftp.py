@@ -1,4 +1,4 @@
-# Copyright 2015 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Utilities for working with TFTP and ``python-tx-tftp``."""
@@ -7,10 +7,29 @@ __all__ = [
     "get_local_address",
     "get_remote_address",
     "TFTPPath",
+    "WindowedReadSession",
+    "WindowedRemoteOriginReadSession",
 ]
 
+from collections import deque
+
+from provisioningserver.logger import LegacyLogger
+from tftp.bootstrap import RemoteOriginReadSession
+from tftp.datagram import (
+    DATADatagram,
+    ERR_NOT_DEFINED,
+    ERRORDatagram,
+)
+from tftp.session import ReadSession
+from twisted.internet.defer import (
+    inlineCallbacks,
+    maybeDeferred,
+)
 from twisted.python.context import get
 
+
+log = LegacyLogger()
+
 # Paths in TFTP are always byte strings.
 TFTPPath = bytes
 
@@ -56,3 +75,147 @@ def extract_address(addr):
         raise AssertionError(
             "The address tuple must contain at least 2 "
             "elements, got: %r" % (addr,))
+
+
+class WindowedReadSession(ReadSession):
+    """A read session that sends a window of blocks per acknowledgement.
+
+    This implements the sending side of RFC 7440. Up to `window_size` DATA
+    datagrams are sent before waiting for an ACK. An ACK for the last block
+    in the window moves the window on; an ACK for an earlier block means
+    that later blocks were lost, so the next window starts after it. Block
+    numbers wrap around after 65535.
+
+    With a `window_size` of 1 this is lock-step, like `ReadSession`.
+    """
+
+    window_size = 1
+
+    def __init__(self, reader, _clock=None):
+        super(WindowedReadSession, self).__init__(reader, _clock=_clock)
+        # Blocks sent but not yet acknowledged, as (number, datagram) pairs,
+        # oldest first. Numbers count from 1 and do not wrap.
+        self.window = deque()
+        self.blocks_read = 0
+        self.reading = False
+        self.exhausted = False
+        self.window_timeout = None
+
+    def nextBlock(self):
+        """Fill the window from the reader then send it."""
+        if not self.reading:
+            self.reading = True
+            d = self._fillWindow()
+            d.addCallbacks(self._sendWindow, self._readFailed)
+
+    @inlineCallbacks
+    def _fillWindow(self):
+        try:
+            while not self.exhausted and len(self.window) < self.window_size:
+                data = yield maybeDeferred(self.reader.read, self.block_size)
+                self.blocks_read += 1
+                datagram = DATADatagram(self.blocks_read % 65536, data)
+                self.window.append((self.blocks_read, datagram.to_wire()))
+                if len(data) < self.block_size:
+                    self.exhausted = True
+        finally:
+            self.reading = False
+
+    def _sendWindow(self, _=None):
+        for _, datagram in self.window:
+            self.transport.write(datagram)
+        self._startTimeout(self.timeout)
+
+    def _readFailed(self, failure):
+        log.err(failure, "Reading from the back-end failed.")
+        self.transport.write(ERRORDatagram.from_code(
+            ERR_NOT_DEFINED, b"Read failed").to_wire())
+        self._stop()
+
+    def tftp_ACK(self, datagram):
+        """Acknowledge a block in the window, then send the next window.
+
+        ACKs for blocks outside of the window are duplicates, and ignored.
+        """
+        for index, (number, _) in enumerate(self.window):
+            if number % 65536 == datagram.blocknum:
+                break
+        else:
+            return
+        for _ in range(index + 1):
+            self.window.popleft()
+        self._cancelTimeout()
+        if self.exhausted and len(self.window) == 0:
+            self.completed = True
+            self._stop()
+        else:
+            self.nextBlock()
+
+    def _startTimeout(self, delays):
+        self._cancelTimeout()
+        delay, *delays = delays
+        self.window_timeout = self._clock.callLater(
+            delay, self._windowTimedOut, delays)
+
+    def _cancelTimeout(self):
+        if self.window_timeout is not None:
+            if self.window_timeout.active():
+                self.window_timeout.cancel()
+            self.window_timeout = None
+
+    def _windowTimedOut(self, delays):
+        self.window_timeout = None
+        if len(delays) == 0:
+            log.msg("Timed-out waiting for acknowledgement; giving up.")
+            self._stop()
+        else:
+            self._sendWindow()
+            self._startTimeout(delays)
+
+    def _stop(self):
+        self._cancelTimeout()
+        self.transport.stopListening()
+
+    def stopProtocol(self):
+        self._cancelTimeout()
+        super(WindowedReadSession, self).stopProtocol()
+
+
+class WindowedRemoteOriginReadSession(RemoteOriginReadSession):
+    """A `RemoteOriginReadSession` that negotiates ``windowsize``.
+
+    The client's requested window size is accepted up to `max_window_size`.
+    Without that option, transfers are lock-step as before.
+    """
+
+    # Option names are byte strings, as python-tx-tftp parses them.
+    supported_options = (
+        RemoteOriginReadSession.supported_options + (b"windowsize",))
+
+    # Larger windows gain little once the client's receive buffer is full.
+    max_window_size = 64
+
+    # Negotiated by `option_windowsize`.
+    window_size = 1
+
+    def __init__(self, remote, reader, options=None, _clock=None):
+        # Options are processed by the superclass, before there's a session
+        # to configure, so the negotiated window size is applied here.
+        super(WindowedRemoteOriginReadSession, self).__init__(
+            remote, reader, options, _clock=_clock)
+        self.session = WindowedReadSession(reader, self._clock)
+        self.session.window_size = self.window_size
+
+    def option_windowsize(self, val):
+        """Accept a window size between 1 and `max_window_size`."""
+        try:
+            window_size = int(val)
+        except ValueError:
+            return None
+        if window_size < 1 or window_size > 65535:
+            return None
+        window_size = min(window_size, self.max_window_size)
+        self.window_size = window_size
+        # Reply in kind; option values may be byte or Unicode strings.
+        value = "%d" % window_size
+        return value.encode("ascii") if isinstance(val, bytes) else value